@@ -8,29 +8,127 @@ Bot rewritten by F1zzTao (https://github.com/F1zzTao)
 
 from __future__ import annotations
 
-from bot.db import create_tables
+import asyncio
+from typing import Optional
+
+from bot.middlewares.dedup import DeduplicationMiddleware, load_recent_messages, save_recent_messages
 from bot.middlewares.register import RegistrationMiddleware, BotMessageReturnHandler
+from bot.sender import SendPriorityMiddleware
 from loguru import logger
 
+from bot.backfill import backfill_usernames_in_background
+from bot.backup import backup_periodically, refresh_replica_periodically
+from bot.core.config import settings
 from bot.core.loader import bot
+from bot.core.log import setup_logging, shutdown_logging, worker_log_path
 from bot.handlers import get_handlers_labelers
+from bot.metrics import setup_metrics, shutdown_metrics
+from bot.services.users import expire_bans_periodically, refresh_registries_periodically
+from bot.slow_queries import setup_slow_query_log, shutdown_slow_query_log
+from bot.storage import close_storage, create_tables
+from bot.warmup import default_steps, run_warmup
 
 
-async def on_startup() -> None:
-    logger.info("bot starting...")
+# Фоновые задачи бота (снятие банов и т.п.), отменяются в on_shutdown
+_background_tasks: set[asyncio.Task] = set()
 
-    await create_tables()
 
+def _start_background(coro) -> None:
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+def configure_logging(worker: Optional[int] = None) -> None:
+    setup_logging(
+        worker_log_path(settings.LOG_PATH, worker),
+        level=settings.LOG_LEVEL,
+        json_lines=settings.LOG_JSON,
+        rotation_size_mb=settings.LOG_ROTATION_SIZE_MB,
+        rotation_hours=settings.LOG_ROTATION_HOURS,
+        retention=settings.LOG_RETENTION,
+        compression=settings.LOG_COMPRESSION,
+        debug_sampling=settings.LOG_DEBUG_SAMPLING,
+    )
+
+
+def start_send_queue(worker: Optional[int] = None) -> None:
+    """Очередь исходящих сообщений; воркеры Callback API делят лимит VK поровну"""
+    workers = settings.CALLBACK_WORKERS if worker is not None else 1
+    bot.api.start_send_queue(
+        settings.SEND_RATE_PER_SECOND / workers,
+        max(1.0, settings.SEND_BURST / workers),
+        settings.SEND_CONCURRENCY,
+        max_attempts=settings.SEND_MAX_ATTEMPTS,
+        retry_base=settings.SEND_RETRY_BASE_SECONDS,
+        retry_cap=settings.SEND_RETRY_MAX_SECONDS,
+    )
+
+
+async def prepare_bot(worker: Optional[int] = None) -> None:
+    """Прогрев и сборка хендлеров; в режиме Callback API — в каждом воркере"""
+    await run_warmup(default_steps(settings.WARMUP_RECENT_PLAYERS), settings.WARMUP_BUDGET_SECONDS)
+    if not worker:
+        # В пуле воркеров истёкшие баны снимает и базу копирует только первый
+        _start_background(expire_bans_periodically())
+        if settings.DB_BACKEND == "sqlite" and settings.BACKUP_INTERVAL_MINUTES > 0:
+            _start_background(backup_periodically(settings.BACKUP_INTERVAL_MINUTES * 60))
+        if settings.DB_BACKEND == "sqlite" and settings.REPLICA_REFRESH_SECONDS > 0:
+            _start_background(refresh_replica_periodically(settings.REPLICA_REFRESH_SECONDS))
+        if settings.USERNAME_BACKFILL_ON_START:
+            _start_background(backfill_usernames_in_background(bot.api))
+    if worker is not None and settings.CALLBACK_WORKERS > 1:
+        _start_background(refresh_registries_periodically(settings.CALLBACK_REGISTRY_REFRESH_SECONDS))
+    setup_slow_query_log(
+        settings.database_path,
+        settings.SLOW_QUERY_THRESHOLD_MS,
+        settings.SLOW_QUERY_RATE_LIMIT,
+        worker_log_path(settings.SLOW_QUERY_LOG_PATH, worker),
+    )
+
+    start_send_queue(worker)
     bot.labeler.load(get_handlers_labelers())
+    if settings.METRICS_ENABLED:
+        # До RegistrationMiddleware, чтобы считались и события от забаненных.
+        # Каждый воркер отдаёт метрики на своём порту: METRICS_PORT + номер
+        port = settings.METRICS_PORT + (worker or 0)
+        await setup_metrics(bot.labeler.message_view, settings.METRICS_HOST, port)
+    # Повторы отбрасываются до регистрации и любых запросов к базе
+    if settings.DEDUP_STATE_PATH:
+        load_recent_messages(worker_log_path(settings.DEDUP_STATE_PATH, worker))
+    bot.labeler.message_view.register_middleware(DeduplicationMiddleware)
+    bot.labeler.message_view.register_middleware(SendPriorityMiddleware)
     bot.labeler.message_view.register_middleware(RegistrationMiddleware)
     bot.labeler.message_view.handler_return_manager = BotMessageReturnHandler()
 
+
+async def on_startup() -> None:
+    logger.info("bot starting...")
+
+    await create_tables()
+    if settings.DB_BACKEND == "sqlite" and (settings.BACKUP_INTERVAL_MINUTES > 0 or settings.REPLICA_REFRESH_SECONDS > 0):
+        # Снимок и реплика под нагрузкой возможны только в WAL, см. bot.backup
+        from bot.db import enable_wal
+
+        mode = await enable_wal()
+        if mode.lower() != "wal":
+            logger.warning(f"Could not switch database to WAL (journal_mode={mode}), backups and replica refreshes may fail under load")
+    await prepare_bot()
+
     logger.info("Gym Legend Bot is running!")
 
 
 async def on_shutdown() -> None:
     logger.info("bot stopping...")
 
+    for task in tuple(_background_tasks):
+        task.cancel()
+    await bot.api.stop_send_queue(settings.SEND_SHUTDOWN_TIMEOUT_SECONDS)
+    await shutdown_metrics()
+    await shutdown_slow_query_log()
+    save_recent_messages()
+    await close_storage()
+
     """
     await dp.storage.close()
     await dp.fsm.storage.close()
@@ -39,16 +137,17 @@ async def on_shutdown() -> None:
     """
 
     logger.info("bot stopped")
+    await shutdown_logging()
 
 
 def main() -> None:
-    logger.add(
-        "logs/vk_bot.log",
-        level="DEBUG",
-        format="{time} | {level} | {module}:{function}:{line} | {message}",
-        rotation="100 KB",
-        compression="zip",
-    )
+    configure_logging()
+
+    if settings.CALLBACK_ENABLED:
+        from bot.callback import run_callback_server
+
+        run_callback_server()
+        return
 
     bot.loop_wrapper.on_startup.append(on_startup())
     bot.loop_wrapper.on_shutdown.append(on_shutdown())
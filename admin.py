@@ -1,12 +1,28 @@
-from datetime import datetime, timedelta
+import os
+import time
 
+from typing import Any, Dict, List, Optional
+
+from vkbottle import Keyboard, Text
 from vkbottle.bot import BotLabeler, Message
 from vkbottle.dispatch.rules import ABCRule
 
+from bot.backup import create_snapshot
 from bot.core.config import settings
-from bot.db import (
+from bot.keyboards import (
+    CMD_CLAN_LOG,
+    CMD_CLAN_MEMBERS,
+    CMD_DELETE_CANCEL,
+    CMD_DELETE_CONFIRM,
+    CMD_RESET_CANCEL,
+    CMD_RESET_CONFIRM,
+    confirm_keyboard,
+    payload as button_payload,
+)
+from bot.storage import (
     add_magnesia,
     ban_player,
+    clan_member_cursor,
     count_admins,
     count_banned_players,
     count_clans,
@@ -17,8 +33,8 @@ from bot.db import (
     delete_clan,
     delete_player,
     delete_promo_code,
+    get_clan_by_id,
     get_clan_by_tag,
-    get_clan_member_count,
     get_clan_members,
     get_clan_treasury_log,
     get_player,
@@ -34,14 +50,17 @@ from bot.db import (
     set_total_lifts,
     sum_column,
     sum_promo_uses,
+    treasury_log_cursor,
     unban_player,
     update_clan_name,
     update_player_balance,
     update_username,
 )
 from bot.services.clans import get_clan_bonuses
-from bot.services.users import is_admin
-from bot.utils import format_number, pointer_to_screen_name
+from bot.services.leaderboards import invalidate_clan_top
+from bot.services.profiles import resolve_user_id
+from bot.services.users import get_admin_level, is_admin
+from bot.utils import days_from_now, days_since, format_number, format_ts, now_ts
 
 
 class IsAdmin(ABCRule[Message]):
@@ -56,6 +75,23 @@ admin_labeler.auto_rules = [IsAdmin()]
 PENDING_DELETIONS = {}
 PENDING_RESETS = {}
 
+# Сброс сезона идёт порциями; второй сброс поверх первого не запускаем
+RESET_STATE = {"running": False}
+RESET_PROGRESS_SECONDS = 5
+RESET_TABLE_TITLES = {
+    "players": "игроки",
+    "clans": "кланы",
+    "transactions": "транзакции",
+    "dumbbell_uses": "подъёмы гантелей",
+    "promo_uses": "активации промокодов",
+    "clan_members": "участники кланов",
+    "clan_treasury_log": "лог казны кланов",
+    "clan_invites": "приглашения в кланы",
+}
+
+CLAN_MEMBERS_PAGE = 20
+CLAN_LOG_PAGE = 10
+
 # ======================
 # АДМИН КОМАНДЫ КЛАНОВ (без изменений)
 # ======================
@@ -87,6 +123,7 @@ async def admin_rename_clan_command(message: Message, cmd_args: str):
     result = await update_clan_name(tag, new_name, user_id)
 
     if result["success"]:
+        invalidate_clan_top()
         return (
             f"✅ Название клана изменено!\n\n"
             f"🔰 Тег: [{tag.upper()}]\n"
@@ -121,6 +158,7 @@ async def admin_delete_clan_command(message: Message, tag: str):
 
         if result["success"]:
             del PENDING_DELETIONS[tag.upper()]
+            invalidate_clan_top()
 
             return (
                 f"🗑️ Клан удален!\n\n"
@@ -137,19 +175,17 @@ async def admin_delete_clan_command(message: Message, tag: str):
         PENDING_DELETIONS[tag.upper()] = {
             "admin_id": user_id,
             "clan_name": clan["name"],
-            "timestamp": datetime.now(),
+            "timestamp": now_ts(),
         }
 
-        member_count = await get_clan_member_count(clan["id"])
-
         response_text = (
             f"⚠️ ПОДТВЕРЖДЕНИЕ УДАЛЕНИЯ КЛАНА\n\n"
             f"🔰 Тег: [{tag.upper()}]\n"
             f"🏷️ Название: {clan['name']}\n"
             f"👑 Владелец: ID: [id{clan['owner_id']}|{clan['owner_id']}]\n"
-            f"👥 Участников: {member_count}\n"
+            f"👥 Участников: {clan['member_count']}\n"
             f"💰 Казна: {format_number(clan['treasury'])} монет\n"
-            f"📅 Существует: {(datetime.now() - datetime.fromisoformat(clan['created_at'])).days} дней\n\n"
+            f"📅 Существует: {days_since(clan['created_at'])} дней\n\n"
             f"❗ ВНИМАНИЕ!\n"
             f"• Все участники будут исключены\n"
             f"• Казна будет утеряна\n"
@@ -172,8 +208,8 @@ async def admin_clan_info_command(message: Message, tag: str):
     if not clan:
         return f"❌ Клан с тегом [{tag.upper()}] не найден!"
 
-    # Получаем участников
-    members = await get_clan_members(clan["id"], 50)
+    # Первые страницы участников и лога; число участников хранится в самом клане
+    members = await get_clan_members(clan["id"], 15)
 
     # Получаем владельца
     owner = await get_player(clan["owner_id"])
@@ -184,46 +220,14 @@ async def admin_clan_info_command(message: Message, tag: str):
     # Получаем бонусы клана
     clan_bonuses = get_clan_bonuses(clan["level"])
 
-    # Форматируем информацию об участниках
-    members_text = ""
-    for i, member in enumerate(members[:15], 1):
-        role_emoji = (
-            "👑"
-            if member["role"] == "owner"
-            else ("⭐" if member["role"] == "officer" else "👤")
-        )
-        join_date = datetime.fromisoformat(member["joined_at"]).strftime("%d.%m")
-        members_text += f"{i}. {role_emoji} {member['username']} (ID: {member['user_id']}) - {format_number(member['contributions'])} монет ({join_date})\n"
-
-    # Форматируем лог операций
-    log_text = ""
-    for entry in log:
-        action_emoji = (
-            "➕"
-            if entry["action_type"] == "deposit"
-            else (
-                "⬆️"
-                if entry["action_type"] == "upgrade"
-                else (
-                    "💰"
-                    if entry["action_type"] == "lift_income"
-                    else (
-                        "🏦"
-                        if entry["action_type"] == "business_income"
-                        else ("📊" if entry["action_type"] == "distribution" else "📝")
-                    )
-                )
-            )
-        )
-        username = entry["username"] or "Система"
-        time_str = datetime.fromisoformat(entry["created_at"]).strftime("%d.%m %H:%M")
-        log_text += (
-            f"• {action_emoji} {entry['description']} - {username} ({time_str})\n"
-        )
+    members_text = "".join(
+        _format_member_line(i, member) for i, member in enumerate(members, 1)
+    )
+    log_text = "".join(_format_log_line(entry) for entry in log)
 
     # Форматируем даты
-    created_date = datetime.fromisoformat(clan["created_at"]).strftime("%d.%m.%Y %H:%M")
-    days_exist = (datetime.now() - datetime.fromisoformat(clan["created_at"])).days
+    created_date = format_ts(clan["created_at"], "%d.%m.%Y %H:%M")
+    days_exist = days_since(clan["created_at"])
 
     response_text = (
         f"📊 ДЕТАЛЬНАЯ ИНФОРМАЦИЯ О КЛАНЕ [{clan['tag']}]\n\n"
@@ -231,7 +235,7 @@ async def admin_clan_info_command(message: Message, tag: str):
         f"👑 Владелец: {owner['username'] if owner else 'Не найден'} (ID: [id{owner['owner_id']}|{clan['owner_id']}])\n"
         f"⭐ Уровень: {clan['level']}\n"
         f"💰 Казна: {format_number(clan['treasury'])} монет\n"
-        f"👥 Участников: {len(members)}\n"
+        f"👥 Участников: {clan['member_count']}\n"
         f"📈 Доход/час: {format_number(clan['total_income_per_hour'])} магнезии\n"
         f"💪 Всего поднятий: {format_number(clan['total_lifts'])}\n"
         f"📅 Создан: {created_date} ({days_exist} дней)\n"
@@ -241,24 +245,160 @@ async def admin_clan_info_command(message: Message, tag: str):
         f"🏆 Участники (топ-15):\n{members_text}\n"
         f"📜 Последние операции с казной:\n{log_text}\n"
         f"👮 Административные команды:\n"
+        f"• /акучастники {clan['tag']}\n"
+        f"• /аклог {clan['tag']}\n"
         f"• /аксменить {clan['tag']} [новое_название]\n"
         f"• /акудалить {clan['tag']}"
     )
 
-    await message.answer(response_text, disable_mentions=True)
+    keyboard = (
+        Keyboard(inline=True)
+        .add(Text("👥 Участники", payload=button_payload(CMD_CLAN_MEMBERS, clan=clan["id"])))
+        .add(Text("📜 Лог казны", payload=button_payload(CMD_CLAN_LOG, clan=clan["id"])))
+    )
+    await message.answer(response_text, disable_mentions=True, keyboard=keyboard.get_json())
 
 
 # ======================
-# ОСТАЛЬНЫЕ АДМИН КОМАНДЫ
+# СТРАНИЦЫ УЧАСТНИКОВ И ЛОГА КАЗНЫ
 # ======================
+# Страницы листаются по курсору (последняя строка предыдущей страницы), а не
+# по OFFSET: курсор лежит в payload кнопки «Дальше», номер первой строки — в n.
 
 
-async def get_admin_level(user_id: int) -> int:
-    if user_id in settings.ADMIN_USERS:
-        # ? We're lying for now, so maybe there's a better approach...?
-        return 2
-    player = await get_player(user_id)
-    return player.get("admin_level", 0) if player else 0
+def _format_member_line(i: int, member: Dict[str, Any]) -> str:
+    role_emoji = (
+        "👑"
+        if member["role"] == "owner"
+        else ("⭐" if member["role"] == "officer" else "👤")
+    )
+    join_date = format_ts(member["joined_at"], "%d.%m")
+    return f"{i}. {role_emoji} {member['username']} (ID: {member['user_id']}) - {format_number(member['contributions'])} монет ({join_date})\n"
+
+
+LOG_ACTION_EMOJI = {
+    "deposit": "➕",
+    "upgrade": "⬆️",
+    "lift_income": "💰",
+    "business_income": "🏦",
+    "distribution": "📊",
+}
+
+
+def _format_log_line(entry: Dict[str, Any]) -> str:
+    action_emoji = LOG_ACTION_EMOJI.get(entry["action_type"], "📝")
+    username = entry["username"] or "Система"
+    time_str = format_ts(entry["created_at"], "%d.%m %H:%M")
+    return f"• {action_emoji} {entry['description']} - {username} ({time_str})\n"
+
+
+def _page_keyboard(payload: Dict[str, Any], next_payload: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Кнопки «Дальше» (если есть следующая страница) и «В начало» (если это не первая)"""
+    keyboard = Keyboard(inline=True)
+    has_buttons = False
+    if next_payload is not None:
+        keyboard.add(Text("Дальше ▶", payload=next_payload))
+        has_buttons = True
+    if payload.get("n", 1) > 1:
+        keyboard.add(Text("В начало", payload=button_payload(payload["cmd"], clan=payload["clan"])))
+        has_buttons = True
+    return keyboard.get_json() if has_buttons else None
+
+
+async def _send_members_page(message: Message, clan: Dict[str, Any], payload: Dict[str, Any]) -> None:
+    after = payload.get("after")
+    start = payload.get("n", 1)
+    # Берём на одну строку больше, чтобы узнать, есть ли следующая страница
+    members: List[Dict[str, Any]] = await get_clan_members(
+        clan["id"], CLAN_MEMBERS_PAGE + 1, tuple(after) if after else None
+    )
+    has_next = len(members) > CLAN_MEMBERS_PAGE
+    members = members[:CLAN_MEMBERS_PAGE]
+
+    if not members:
+        await message.answer(f"👥 В клане [{clan['tag']}] больше нет участников.")
+        return
+
+    next_payload = None
+    if has_next:
+        next_payload = button_payload(
+            CMD_CLAN_MEMBERS,
+            clan=clan["id"],
+            after=list(clan_member_cursor(members[-1])),
+            n=start + len(members),
+        )
+
+    text = f"👥 УЧАСТНИКИ КЛАНА [{clan['tag']}] ({start}–{start + len(members) - 1}):\n\n" + "".join(
+        _format_member_line(i, member) for i, member in enumerate(members, start)
+    )
+    await message.answer(text, disable_mentions=True, keyboard=_page_keyboard(payload, next_payload))
+
+
+async def _send_log_page(message: Message, clan: Dict[str, Any], payload: Dict[str, Any]) -> None:
+    before = payload.get("before")
+    start = payload.get("n", 1)
+    log = await get_clan_treasury_log(clan["id"], CLAN_LOG_PAGE + 1, tuple(before) if before else None)
+    has_next = len(log) > CLAN_LOG_PAGE
+    log = log[:CLAN_LOG_PAGE]
+
+    if not log:
+        await message.answer(f"📜 В логе казны клана [{clan['tag']}] больше нет операций.")
+        return
+
+    next_payload = None
+    if has_next:
+        next_payload = button_payload(
+            CMD_CLAN_LOG,
+            clan=clan["id"],
+            before=list(treasury_log_cursor(log[-1])),
+            n=start + len(log),
+        )
+
+    text = f"📜 ЛОГ КАЗНЫ КЛАНА [{clan['tag']}] ({start}–{start + len(log) - 1}):\n\n" + "".join(
+        _format_log_line(entry) for entry in log
+    )
+    await message.answer(text, disable_mentions=True, keyboard=_page_keyboard(payload, next_payload))
+
+
+@admin_labeler.message(text=["акучастники <tag>", "/акучастники <tag>"])
+async def admin_clan_members_command(message: Message, tag: str):
+    """Участники клана постранично"""
+    clan = await get_clan_by_tag(tag)
+    if not clan:
+        return f"❌ Клан с тегом [{tag.upper()}] не найден!"
+    await _send_members_page(message, clan, button_payload(CMD_CLAN_MEMBERS, clan=clan["id"]))
+
+
+@admin_labeler.message(text=["аклог <tag>", "/аклог <tag>"])
+async def admin_clan_log_command(message: Message, tag: str):
+    """Лог казны клана постранично"""
+    clan = await get_clan_by_tag(tag)
+    if not clan:
+        return f"❌ Клан с тегом [{tag.upper()}] не найден!"
+    await _send_log_page(message, clan, button_payload(CMD_CLAN_LOG, clan=clan["id"]))
+
+
+@admin_labeler.message(payload_contains={"cmd": CMD_CLAN_MEMBERS})
+async def admin_clan_members_page(message: Message):
+    payload = message.get_payload_json() or {}
+    clan = await get_clan_by_id(payload.get("clan"))
+    if not clan:
+        return "❌ Клан не найден!"
+    await _send_members_page(message, clan, payload)
+
+
+@admin_labeler.message(payload_contains={"cmd": CMD_CLAN_LOG})
+async def admin_clan_log_page(message: Message):
+    payload = message.get_payload_json() or {}
+    clan = await get_clan_by_id(payload.get("clan"))
+    if not clan:
+        return "❌ Клан не найден!"
+    await _send_log_page(message, clan, payload)
+
+
+# ======================
+# ОСТАЛЬНЫЕ АДМИН КОМАНДЫ
+# ======================
 
 
 @admin_labeler.message(
@@ -308,9 +448,7 @@ async def create_promo_handler(message: Message, cmd_args: str):
         code, uses_total, reward_type, reward_amount, user_id, expires_days
     ):
         if expires_days:
-            expires_date = (datetime.now() + timedelta(days=expires_days)).strftime(
-                "%d.%m.%Y"
-            )
+            expires_date = format_ts(days_from_now(expires_days))
             expires_text = f"⏳ Срок действия: {expires_days} дней (до {expires_date})"
         else:
             expires_text = "⏳ Срок действия: Не ограничен"
@@ -369,8 +507,7 @@ async def admin_panel_handler(message: Message):
 
     admin_since = "Не назначен"
     if player.get("admin_since"):
-        admin_since_date = datetime.fromisoformat(player["admin_since"])
-        admin_since = admin_since_date.strftime("%d.%m.%Y %H:%M")
+        admin_since = format_ts(player["admin_since"], "%d.%m.%Y %H:%M")
 
     admin_nickname = player.get("admin_nickname", "Не установлен")
     if admin_nickname != "Не установлен":
@@ -438,10 +575,9 @@ async def make_admin_handler(message: Message, cmd_args: str):
     if len(parts) < 2:
         return "❌ Укажите айди игрока и уровень!\n📝 Использование: /назначить [айди] [уровень]\nУровни: 1 (админ), 2 (создатель)"
 
-    try:
-        target_id = int(pointer_to_screen_name(parts[0]))
-    except ValueError:
-        return "❌ Айди игрока должно быть числом!"
+    target_id = await resolve_user_id(parts[0])
+    if target_id is None:
+        return "❌ Игрок не найден! Укажите айди, упоминание или ссылку на страницу"
 
     try:
         new_admin_level = int(parts[1])
@@ -487,10 +623,9 @@ async def remove_admin_handler(message: Message, cmd_args: str):
     if not await is_admin(user_id):
         return "❌ Только администраторы могут использовать эту команду!"
 
-    try:
-        target_id = int(pointer_to_screen_name(cmd_args))
-    except ValueError:
-        return "❌ Айди игрока должно быть числом!"
+    target_id = await resolve_user_id(cmd_args)
+    if target_id is None:
+        return "❌ Игрок не найден! Укажите айди, упоминание или ссылку на страницу"
 
     admin_level = await get_admin_level(user_id)
     if admin_level < 2:
@@ -536,10 +671,9 @@ async def set_dumbbell_handler(message: Message, cmd_args: str):
     if len(parts) < 2:
         return "❌ Укажите айди игрока и уровень гантели!\n📝 Использование: /лгантеля [айди] [уровень (1-20)]"
 
-    try:
-        target_id = int(pointer_to_screen_name(parts[0]))
-    except ValueError:
-        return "❌ Айди игрока должно быть числом!"
+    target_id = await resolve_user_id(parts[0])
+    if target_id is None:
+        return "❌ Игрок не найден! Укажите айди, упоминание или ссылку на страницу"
 
     try:
         new_level = int(parts[1])
@@ -583,10 +717,9 @@ async def remove_balance_handler(message: Message, cmd_args: str):
             "❌ Укажите айди игрока и сумму!\n📝 Использование: /-баланс [айди] [сумма]"
         )
 
-    try:
-        target_id = int(pointer_to_screen_name(parts[0]))
-    except ValueError:
-        return "❌ Айди игрока должно быть числом!"
+    target_id = await resolve_user_id(parts[0])
+    if target_id is None:
+        return "❌ Игрок не найден! Укажите айди, упоминание или ссылку на страницу"
 
     try:
         amount = int(parts[1])
@@ -634,10 +767,9 @@ async def add_balance_handler(message: Message, cmd_args: str):
             "❌ Укажите айди игрока и сумму!\n📝 Использование: /+баланс [айди] [сумма]"
         )
 
-    try:
-        target_id = int(pointer_to_screen_name(parts[0]))
-    except ValueError:
-        return "❌ Айди игрока должно быть числом!"
+    target_id = await resolve_user_id(parts[0])
+    if target_id is None:
+        return "❌ Игрок не найден! Укажите айди, упоминание или ссылку на страницу"
 
     try:
         amount = int(parts[1])
@@ -685,10 +817,9 @@ async def ban_handler(message: Message, cmd_args: str):
     if len(parts) < 3:
         return "❌ Укажите айди игрока, дни и причину!\n📝 Использование: /бан [айди] [дни] [причина]\nПример: /бан 1234567 7 Оскорбления"
 
-    try:
-        target_id = int(pointer_to_screen_name(parts[0]))
-    except ValueError:
-        return "❌ Айди игрока должно быть числом!"
+    target_id = await resolve_user_id(parts[0])
+    if target_id is None:
+        return "❌ Игрок не найден! Укажите айди, упоминание или ссылку на страницу"
 
     try:
         days = int(parts[1])
@@ -715,7 +846,7 @@ async def ban_handler(message: Message, cmd_args: str):
     await ban_player(target_id, days, reason, user_id)
     await increment_admin_stat(user_id, "bans")
 
-    ban_until = (datetime.now() + timedelta(days=days)).strftime("%d.%m.%Y")
+    ban_until = format_ts(days_from_now(days))
 
     return (
         f"🚫 Игрок забанен!\n\n"
@@ -737,10 +868,9 @@ async def permaban_handler(message: Message, cmd_args: str):
     if len(parts) < 2:
         return "❌ Укажите айди игрока и причину!\n📝 Использование: /пермбан [айди] [причина]"
 
-    try:
-        target_id = int(pointer_to_screen_name(parts[0]))
-    except ValueError:
-        return "❌ Айди игрока должно быть числом!"
+    target_id = await resolve_user_id(parts[0])
+    if target_id is None:
+        return "❌ Игрок не найден! Укажите айди, упоминание или ссылку на страницу"
 
     reason = " ".join(parts[1:])
 
@@ -811,10 +941,9 @@ async def delete_player_handler(message: Message, cmd_args: str):
     if len(parts) < 2:
         return "❌ Укажите айди игрока и причину!\n📝 Использование: /удалить [айди] [причина]"
 
-    try:
-        target_id = int(pointer_to_screen_name(parts[0]))
-    except ValueError:
-        return "❌ Айди игрока должно быть числом!"
+    target_id = await resolve_user_id(parts[0])
+    if target_id is None:
+        return "❌ Игрок не найден! Укажите айди, упоминание или ссылку на страницу"
 
     reason = " ".join(parts[1:])
 
@@ -835,18 +964,14 @@ async def delete_player_handler(message: Message, cmd_args: str):
         "admin_id": user_id,
         "username": target_username,
         "reason": reason,
-        "timestamp": datetime.now(),
+        "timestamp": now_ts(),
     }
 
     # Получаем статистику игрока
-    created_date = datetime.fromisoformat(target_player["created_at"]).strftime(
-        "%d.%m.%Y"
-    )
-    days_exist = (
-        datetime.now() - datetime.fromisoformat(target_player["created_at"])
-    ).days
+    created_date = format_ts(target_player["created_at"])
+    days_exist = days_since(target_player["created_at"])
 
-    return (
+    await message.answer(
         f"⚠️ ПОДТВЕРЖДЕНИЕ УДАЛЕНИЯ ИГРОКА\n\n"
         f"👤 Игрок: [id{target_id}|{target_username}]\n"
         f"🆔 ID: {target_id}\n"
@@ -859,10 +984,12 @@ async def delete_player_handler(message: Message, cmd_args: str):
         f"• Аккаунт будет полностью удален\n"
         f"• Баланс и прогресс будут утеряны\n\n"
         f"✅ Для подтверждения: /удалить+\n"
-        f"❌ Для отмены: /удалить-"
+        f"❌ Для отмены: /удалить-",
+        keyboard=confirm_keyboard(CMD_DELETE_CONFIRM, CMD_DELETE_CANCEL),
     )
 
 
+@admin_labeler.message(payload_contains={"cmd": CMD_DELETE_CONFIRM})
 @admin_labeler.message(text="/удалить+")
 async def confirm_delete_handler(message: Message):
     user_id = message.from_id
@@ -896,6 +1023,7 @@ async def confirm_delete_handler(message: Message):
     )
 
 
+@admin_labeler.message(payload_contains={"cmd": CMD_DELETE_CANCEL})
 @admin_labeler.message(text="/удалить-")
 async def cancel_delete_handler(message: Message):
     user_id = message.from_id
@@ -934,10 +1062,9 @@ async def change_player_username_handler(message: Message, cmd_args: str):
     if len(parts) < 2:
         return "❌ Укажите айди игрока и новый ник!\n📝 Использование: /сгник [айди] [новый_ник]"
 
-    try:
-        target_id = int(pointer_to_screen_name(parts[0]))
-    except ValueError:
-        return "❌ Айди игрока должно быть числом!"
+    target_id = await resolve_user_id(parts[0])
+    if target_id is None:
+        return "❌ Игрок не найден! Укажите айди, упоминание или ссылку на страницу"
 
     new_username = " ".join(parts[1:])
 
@@ -977,10 +1104,9 @@ async def set_lifts_handler(message: Message, cmd_args: str):
     if len(parts) < 2:
         return "❌ Укажите айди игрока и количество поднятий!\n📝 Использование: /поднятия [айди] [количество]"
 
-    try:
-        target_id = int(pointer_to_screen_name(parts[0]))
-    except ValueError:
-        return "❌ Айди игрока должно быть числом!"
+    target_id = await resolve_user_id(parts[0])
+    if target_id is None:
+        return "❌ Игрок не найден! Укажите айди, упоминание или ссылку на страницу"
 
     try:
         new_total = int(parts[1])
@@ -1018,10 +1144,9 @@ async def set_custom_income_handler(message: Message, cmd_args: str):
     if len(parts) < 2:
         return "❌ Укажите айди игрока и сумму дохода!\n📝 Использование: /заработок [айди] [сумма]\nДля сброса: /заработок [айди] сброс"
 
-    try:
-        target_id = int(pointer_to_screen_name(parts[0]))
-    except ValueError:
-        return "❌ Айди игрока должно быть числом!"
+    target_id = await resolve_user_id(parts[0])
+    if target_id is None:
+        return "❌ Игрок не найден! Укажите айди, упоминание или ссылку на страницу"
 
     income_str = parts[1]
 
@@ -1062,10 +1187,9 @@ async def add_magnesia_handler(message: Message, cmd_args: str):
     if len(parts) < 2:
         return "❌ Укажите айди игрока и количество банок!\n📝 Использование: /банки [айди] [количество]"
 
-    try:
-        target_id = int(pointer_to_screen_name(parts[0]))
-    except ValueError:
-        return "❌ Айди игрока должно быть числом!"
+    target_id = await resolve_user_id(parts[0])
+    if target_id is None:
+        return "❌ Игрок не найден! Укажите айди, упоминание или ссылку на страницу"
 
     try:
         amount = int(parts[1])
@@ -1128,7 +1252,7 @@ async def bot_statistics_handler(message: Message):
 
     recent_text = ""
     for i, (username, created_at) in enumerate(recent_players, 1):
-        date_str = datetime.fromisoformat(created_at).strftime("%d.%m %H:%M")
+        date_str = format_ts(created_at, "%d.%m %H:%M")
         recent_text += f"{i}. {username} ({date_str})\n"
 
     stats_text = (
@@ -1165,12 +1289,12 @@ async def reset_all_accounts_handler(message: Message):
         return "❌ Только администраторы 2+ уровня могут сбрасывать все аккаунты!"
 
     # Сохраняем запрос на сброс
-    PENDING_RESETS[user_id] = {"timestamp": datetime.now()}
+    PENDING_RESETS[user_id] = {"timestamp": now_ts()}
 
     regular_players = await count_players(regular_only=True)
     total_clans = await count_clans()
 
-    return (
+    await message.answer(
         f"⚠️ ПОДТВЕРЖДЕНИЕ СБРОСА ВСЕХ АККАУНТОВ\n\n"
         f"📊 Статистика:\n"
         f"├─ Обычных игроков: {regular_players}\n"
@@ -1183,10 +1307,12 @@ async def reset_all_accounts_handler(message: Message):
         f"• Администраторы НЕ будут удалены\n"
         f"• Действие НЕОБРАТИМО!\n\n"
         f"✅ Для подтверждения: /сбросвсех+\n"
-        f"❌ Для отмены: /сбросвсех-"
+        f"❌ Для отмены: /сбросвсех-",
+        keyboard=confirm_keyboard(CMD_RESET_CONFIRM, CMD_RESET_CANCEL),
     )
 
 
+@admin_labeler.message(payload_contains={"cmd": CMD_RESET_CONFIRM})
 @admin_labeler.message(text="/сбросвсех+")
 async def confirm_reset_all_handler(message: Message):
     user_id = message.from_id
@@ -1201,28 +1327,90 @@ async def confirm_reset_all_handler(message: Message):
     if user_id not in PENDING_RESETS:
         return "❌ Нет ожидающих подтверждения сбросов!"
 
-    # Считаем статистику перед удалением
-    deleted_players = await count_players(regular_only=True)
-    deleted_clans = await count_clans()
+    if RESET_STATE["running"]:
+        return "⏳ Сброс уже выполняется, дождитесь его окончания!"
 
+    # Считаем статистику перед удалением
     deleted_balance = await count_total_balance()
 
-    await reset_all()
-
     # Удаляем запрос на сброс
     del PENDING_RESETS[user_id]
 
+    if settings.DB_BACKEND == "sqlite":
+        await message.answer("⏳ Сохраняю архив сезона...")
+        try:
+            archive = await create_snapshot("season")
+        except Exception as e:
+            return f"❌ Не удалось сохранить архив сезона, сброс отменен: {e}"
+        await message.answer(f"📦 Архив сезона: {os.path.basename(archive.path)} ({archive.size_bytes / 1024 / 1024:.1f} МБ)")
+
+    await message.answer(
+        "⏳ Сброс начат. Данные удаляются порциями, бот продолжает работать.\n"
+        f"Прогресс будет приходить раз в {RESET_PROGRESS_SECONDS} сек."
+    )
+
+    last_report = time.monotonic()
+
+    async def report_progress(table: str, deleted: int) -> None:
+        nonlocal last_report
+        now = time.monotonic()
+        if now - last_report >= RESET_PROGRESS_SECONDS:
+            last_report = now
+            await message.answer(
+                f"⏳ Сброс: {RESET_TABLE_TITLES.get(table, table)} — удалено {format_number(deleted)}"
+            )
+
+    RESET_STATE["running"] = True
+    started = time.monotonic()
+    try:
+        deleted = await reset_all(report_progress)
+    finally:
+        RESET_STATE["running"] = False
+    invalidate_clan_top()
+
     return (
         f"🔄 Все аккаунты сброшены!\n\n"
         f"📊 Статистика удаления:\n"
-        f"├─ Удалено игроков: {deleted_players}\n"
-        f"├─ Удалено кланов: {deleted_clans}\n"
+        f"├─ Удалено игроков: {deleted['players']}\n"
+        f"├─ Удалено кланов: {deleted['clans']}\n"
+        f"├─ Удалено записей истории: {format_number(sum(deleted.values()) - deleted['players'] - deleted['clans'])}\n"
+        f"├─ Время: {time.monotonic() - started:.1f} сек.\n"
         f"├─ Утеряно монет: {format_number(deleted_balance)}\n"
         f"└─ Администраторы: Сохранены\n\n"
         f"✅ Бот готов к новому сезону!"
     )
 
 
+@admin_labeler.message(text=["бэкап", "/бэкап"])
+async def backup_handler(message: Message):
+    """Снимок базы по команде администратора"""
+    user_id = message.from_id
+    if not await is_admin(user_id):
+        return "❌ Только администраторы могут использовать эту команду!"
+
+    admin_level = await get_admin_level(user_id)
+    if admin_level < 2:
+        return "❌ Только администраторы 2+ уровня могут делать снимки базы!"
+
+    if settings.DB_BACKEND != "sqlite":
+        return "❌ Снимки делаются только для SQLite, для PostgreSQL используйте pg_dump!"
+
+    await message.answer("⏳ Снимаю базу, бот продолжает работать...")
+    try:
+        result = await create_snapshot()
+    except Exception as e:
+        return f"❌ Не удалось снять базу: {e}"
+
+    return (
+        f"✅ Снимок базы готов!\n\n"
+        f"📁 Файл: {os.path.basename(result.path)}\n"
+        f"💾 Размер: {result.size_bytes / 1024 / 1024:.1f} МБ ({result.pages} страниц)\n"
+        f"⏱️ Время: {result.seconds:.1f} сек., порций: {result.steps}\n"
+        f"🔁 Перезапусков копирования: {result.restarts}"
+    )
+
+
+@admin_labeler.message(payload_contains={"cmd": CMD_RESET_CANCEL})
 @admin_labeler.message(text="/сбросвсех-")
 async def cancel_reset_all_handler(message: Message):
     user_id = message.from_id
@@ -1249,10 +1437,9 @@ async def send_message_handler(message: Message, cmd_args: str):
     if len(parts) < 2:
         return "❌ Укажите айди игрока и сообщение!\n📝 Использование: /связь [айди] [сообщение]"
 
-    try:
-        target_id = int(pointer_to_screen_name(parts[0]))
-    except ValueError:
-        return "❌ Айди игрока должно быть числом!"
+    target_id = await resolve_user_id(parts[0])
+    if target_id is None:
+        return "❌ Игрок не найден! Укажите айди, упоминание или ссылку на страницу"
 
     message_text = " ".join(parts[1:])
 
@@ -1331,6 +1518,7 @@ async def admin_help_handler(message: Message):
         "├── /назначить [айди] [уровень] - назначить админа",
         "├── /снять [айди] - снять с должности администратора",
         "├── /статистика - статистика бота (только создатель)",
+        "├── /бэкап - снимок базы без остановки бота",
         "├── /сбросвсех - сбросить все аккаунты (только создатель)",
         "├── /сбросвсех+ - подтвердить сброс",
         "└── /сбросвсех- - отменить сброс\n",
@@ -0,0 +1,186 @@
+"""
+Имена игроков из профилей VK.
+
+До появления bot.services.profiles игрок получал ник, равный его айди. Эта
+задача проходит такие строки players по возрастанию user_id (курсор — айди
+последнего просмотренного игрока), берёт имена пачками по 1000 через
+users.get не чаще USERNAME_BACKFILL_RATE_PER_SECOND раз в секунду и пишет их
+executemany транзакциями по USERNAME_BACKFILL_CHUNK_ROWS строк. Ник,
+сменённый через /гник, не перезаписывается.
+
+После каждой пачки курсор сохраняется в USERNAME_BACKFILL_STATE_PATH, и
+прерванный проход продолжается с того же места, не запрашивая заново
+удалённые и неизвестные VK страницы. После полного прохода курсор удаляется,
+и следующий проход начнётся с начала. Проход из консоли:
+    python -m bot.backfill --dry-run
+    python -m bot.backfill
+    python -m bot.backfill --restart
+С USERNAME_BACKFILL_ON_START=true тот же проход идёт в фоне при запуске бота.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+from vkbottle import API, VKAPIError
+
+from bot.core.config import settings
+from bot.sender import TokenBucket, is_retriable, retry_delay
+from bot.services.profiles import INVALID_USER_ID, MAX_IDS_PER_CALL, display_name
+from bot.storage import get_unnamed_player_ids, set_usernames
+
+
+@dataclass
+class BackfillProgress:
+    after_user_id: int = 0
+    checked: int = 0
+    renamed: int = 0
+    # Страницы удалены, заблокированы или неизвестны VK
+    skipped: int = 0
+    api_calls: int = 0
+    started: float = 0.0
+
+    def describe(self) -> str:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return (
+            f"checked {self.checked}, renamed {self.renamed}, skipped {self.skipped}, "
+            f"{self.api_calls} users.get calls, {self.checked / elapsed:.0f} players/s, "
+            f"cursor user_id > {self.after_user_id}"
+        )
+
+
+def load_cursor(path: str) -> int:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return int(json.load(f)["after_user_id"])
+    except FileNotFoundError:
+        return 0
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.warning(f"Could not read backfill cursor from {path}, starting over: {e}")
+        return 0
+
+
+def save_cursor(path: str, after_user_id: int) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    partial_path = path + ".part"
+    with open(partial_path, "w", encoding="utf-8") as f:
+        json.dump({"after_user_id": after_user_id}, f)
+    os.replace(partial_path, path)
+
+
+async def fetch_names(api: API, user_ids: List[int], max_attempts: int) -> Dict[int, str]:
+    """Имена для пачки айди одним users.get; повторяет «слишком много запросов»"""
+    for attempt in range(1, max_attempts + 1):
+        try:
+            users = await api.users.get(user_ids=user_ids)
+            break
+        except VKAPIError[INVALID_USER_ID]:
+            return {}
+        except Exception as e:
+            if not is_retriable(e) or attempt == max_attempts:
+                raise
+            delay = retry_delay(attempt, settings.SEND_RETRY_BASE_SECONDS, settings.SEND_RETRY_MAX_SECONDS)
+            logger.warning(f"users.get failed ({e}), retry {attempt} in {delay:.2f} s")
+            await asyncio.sleep(delay)
+
+    return {
+        user.id: display_name({"id": user.id, "first_name": user.first_name, "last_name": user.last_name})
+        for user in users
+        if not getattr(user, "deactivated", None)
+    }
+
+
+async def backfill_usernames(
+    api: API,
+    rate: float,
+    chunk_rows: int,
+    state_path: Optional[str],
+    dry_run: bool = False,
+    restart: bool = False,
+    batch_size: int = MAX_IDS_PER_CALL,
+) -> BackfillProgress:
+    """Проходит игроков с ником-айди и записывает имена из VK"""
+    progress = BackfillProgress(started=time.monotonic())
+    if state_path and not restart:
+        progress.after_user_id = load_cursor(state_path)
+    bucket = TokenBucket(rate, 1)
+
+    while True:
+        user_ids = await get_unnamed_player_ids(progress.after_user_id, batch_size)
+        if not user_ids:
+            break
+
+        await bucket.acquire()
+        names = await fetch_names(api, user_ids, settings.SEND_MAX_ATTEMPTS)
+        progress.api_calls += 1
+        progress.checked += len(user_ids)
+        progress.skipped += len(user_ids) - len(names)
+
+        rows: List[Tuple[int, str]] = list(names.items())
+        if dry_run:
+            progress.renamed += len(rows)
+            for user_id, name in rows[:3]:
+                logger.info(f"[dry run] {user_id} -> {name}")
+        else:
+            for start in range(0, len(rows), chunk_rows):
+                progress.renamed += await set_usernames(rows[start : start + chunk_rows])
+
+        progress.after_user_id = user_ids[-1]
+        if state_path and not dry_run:
+            save_cursor(state_path, progress.after_user_id)
+        logger.info(f"Username backfill{' (dry run)' if dry_run else ''}: {progress.describe()}")
+
+    if state_path and not dry_run and os.path.exists(state_path):
+        os.remove(state_path)
+    logger.info(f"Username backfill finished{' (dry run)' if dry_run else ''}: {progress.describe()}")
+    return progress
+
+
+async def backfill_usernames_in_background(api: API) -> None:
+    try:
+        await backfill_usernames(
+            api,
+            settings.USERNAME_BACKFILL_RATE_PER_SECOND,
+            settings.USERNAME_BACKFILL_CHUNK_ROWS,
+            settings.USERNAME_BACKFILL_STATE_PATH,
+        )
+    except Exception as e:
+        logger.exception(f"Username backfill stopped, it will resume from the saved cursor: {e}")
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Имена игроков с ником-айди из профилей VK")
+    parser.add_argument("--dry-run", action="store_true", help="запросить имена, но ничего не записывать")
+    parser.add_argument("--restart", action="store_true", help="начать с первого игрока, не с сохранённого курсора")
+    parser.add_argument(
+        "--rate", type=float, default=settings.USERNAME_BACKFILL_RATE_PER_SECOND, help="запросов users.get в секунду"
+    )
+    parser.add_argument(
+        "--chunk-rows", type=int, default=settings.USERNAME_BACKFILL_CHUNK_ROWS, help="строк в одной транзакции"
+    )
+    parser.add_argument("--state", default=settings.USERNAME_BACKFILL_STATE_PATH, help="файл курсора")
+    args = parser.parse_args(argv)
+
+    from bot.core.loader import bot
+    from bot.storage import close_storage
+
+    async def run() -> None:
+        try:
+            await backfill_usernames(bot.api, args.rate, args.chunk_rows, args.state, args.dry_run, args.restart)
+        finally:
+            await close_storage()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+Снимки базы SQLite без остановки бота.
+
+Снимок копируется через backup API SQLite порциями по BACKUP_PAGES_PER_STEP
+страниц с паузой BACKUP_STEP_PAUSE_SECONDS после каждой, в отдельном потоке —
+event loop не блокируется, а диск не забивается одним большим копированием.
+
+В режиме WAL копирование идёт внутри одной транзакции чтения: снимок
+согласован на момент её начала, писатели в WAL читателю не мешают, и
+копирование не перезапускается. В режиме rollback journal такая транзакция
+остановила бы всех писателей, поэтому блокировка держится только на время
+порции; если базу меняют между порциями, SQLite начинает копирование заново,
+и после BACKUP_MAX_RESTARTS перезапусков снимок отменяется. Поэтому при
+включённых фоновых снимках бот при запуске переводит базу в WAL.
+
+Снимки называются <имя базы>-ГГГГММДД-ЧЧММСС.db и лежат в BACKUP_DIR; хранятся
+BACKUP_KEEP последних. Архивы сезона (<имя базы>-season-...) не удаляются.
+Тем же копированием раз в REPLICA_REFRESH_SECONDS строится реплика для отчётов.
+
+Работа со снимками из консоли (бот при восстановлении должен быть остановлен):
+    python -m bot.backup create
+    python -m bot.backup list
+    python -m bot.backup restore backups/gym_legend-20260101-030000.db
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional
+from urllib.parse import quote
+
+from loguru import logger
+
+from bot.core.config import settings
+
+
+@dataclass
+class SnapshotResult:
+    path: str
+    size_bytes: int
+    pages: int
+    # Страниц скопировано всего, с учётом перезапусков
+    pages_copied: int
+    steps: int
+    restarts: int
+    seconds: float
+
+
+class _Restart(Exception):
+    """Источник изменился, копирование начнётся заново"""
+
+
+def _snapshot_prefix(database_path: str) -> str:
+    return os.path.splitext(os.path.basename(database_path))[0] + "-"
+
+
+def snapshot_path(database_path: str, directory: str, label: Optional[str] = None) -> str:
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    name = _snapshot_prefix(database_path) + (f"{label}-" if label else "") + stamp + ".db"
+    return os.path.join(directory, name)
+
+
+def list_snapshots(database_path: str, directory: str) -> List[str]:
+    """Обычные снимки базы, от старых к новым (архивы сезона не входят)"""
+    if not os.path.isdir(directory):
+        return []
+    prefix = _snapshot_prefix(database_path)
+    names = sorted(
+        name
+        for name in os.listdir(directory)
+        if name.startswith(prefix) and name.endswith(".db") and name[len(prefix) : len(prefix) + 1].isdigit()
+    )
+    return [os.path.join(directory, name) for name in names]
+
+
+def prune_snapshots(database_path: str, directory: str, keep: int) -> List[str]:
+    """Удаляет снимки сверх keep последних, возвращает удалённые пути"""
+    snapshots = list_snapshots(database_path, directory)
+    removed = snapshots[: max(0, len(snapshots) - keep)]
+    for path in removed:
+        os.remove(path)
+    return removed
+
+
+def copy_database(
+    source_path: str,
+    target_path: str,
+    pages: int,
+    pause: float,
+    max_restarts: int,
+    journal_mode: Optional[str] = None,
+) -> SnapshotResult:
+    """Копирует базу через backup API порциями; выполняется в рабочем потоке.
+
+    journal_mode переключает режим журнала копии: копия WAL-базы тоже в WAL.
+    """
+    started = time.perf_counter()
+    partial_path = target_path + ".part"
+    steps = restarts = pages_copied = 0
+
+    source = sqlite3.connect(source_path, isolation_level=None)
+    try:
+        wal = source.execute("PRAGMA journal_mode").fetchone()[0].lower() == "wal"
+        if wal:
+            # Держим снимок базы на всё время копирования
+            source.execute("BEGIN")
+            source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+
+        while True:
+            remaining_before: Optional[int] = None
+
+            def progress(status: int, remaining: int, total: int) -> None:
+                nonlocal remaining_before, steps, pages_copied
+                steps += 1
+                if remaining_before is not None and remaining > remaining_before:
+                    raise _Restart
+                pages_copied += (total if remaining_before is None else remaining_before) - remaining
+                remaining_before = remaining
+                if remaining:
+                    # sleep= у backup() срабатывает только на SQLITE_BUSY, паузу держим сами
+                    time.sleep(pause)
+
+            target = sqlite3.connect(partial_path)
+            try:
+                source.backup(target, pages=pages, progress=progress)
+                if journal_mode:
+                    target.execute(f"PRAGMA journal_mode={journal_mode}")
+                break
+            except _Restart:
+                restarts += 1
+                if restarts > max_restarts:
+                    raise RuntimeError(
+                        f"the database changed during all {restarts} backup attempts, "
+                        "switch it to WAL to back it up under load"
+                    ) from None
+            finally:
+                target.close()
+
+        total_pages = source.execute("PRAGMA page_count").fetchone()[0]
+        if wal:
+            source.execute("COMMIT")
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    finally:
+        source.close()
+
+    os.replace(partial_path, target_path)
+    return SnapshotResult(
+        path=target_path,
+        size_bytes=os.path.getsize(target_path),
+        pages=total_pages,
+        pages_copied=pages_copied,
+        steps=steps,
+        restarts=restarts,
+        seconds=time.perf_counter() - started,
+    )
+
+
+# Одновременно снимается только один снимок
+_snapshot_lock = asyncio.Lock()
+
+
+async def create_snapshot(label: Optional[str] = None) -> SnapshotResult:
+    """Снимок текущей базы в BACKUP_DIR; обычные снимки сверх BACKUP_KEEP удаляются"""
+    database_path = settings.database_path
+    os.makedirs(settings.BACKUP_DIR, exist_ok=True)
+    async with _snapshot_lock:
+        result = await asyncio.to_thread(
+            copy_database,
+            database_path,
+            snapshot_path(database_path, settings.BACKUP_DIR, label),
+            settings.BACKUP_PAGES_PER_STEP,
+            settings.BACKUP_STEP_PAUSE_SECONDS,
+            settings.BACKUP_MAX_RESTARTS,
+        )
+        if label is None:
+            for path in prune_snapshots(database_path, settings.BACKUP_DIR, settings.BACKUP_KEEP):
+                logger.info(f"Removed old backup {path}")
+
+    logger.info(
+        f"Backup {result.path}: {result.size_bytes} bytes, {result.pages} pages "
+        f"({result.pages_copied} copied in {result.steps} steps, {result.restarts} restarts) "
+        f"in {result.seconds:.2f} s"
+    )
+    return result
+
+
+async def backup_periodically(interval: float) -> None:
+    """Снимает базу раз в interval секунд"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await create_snapshot()
+        except Exception as e:
+            logger.exception(f"Backup failed: {e}")
+
+
+# ==============================
+# РЕПЛИКА ДЛЯ ОТЧЁТОВ
+# ==============================
+# Статистика и топы читают копию базы (см. db.connect_replica), чтобы тяжёлые
+# запросы не делили с прокачкой ни блокировки, ни кеш страниц. Копия в режиме
+# DELETE: её открывают только на чтение, а WAL требует файлов -wal и -shm.
+
+
+async def refresh_replica() -> SnapshotResult:
+    """Перестраивает реплику; её возраст считается от начала копирования"""
+    started = time.time()
+    result = await asyncio.to_thread(
+        copy_database,
+        settings.database_path,
+        settings.replica_path,
+        settings.BACKUP_PAGES_PER_STEP,
+        settings.BACKUP_STEP_PAUSE_SECONDS,
+        settings.BACKUP_MAX_RESTARTS,
+        "delete",
+    )
+    os.utime(result.path, (started, started))
+    logger.debug(f"Replica {result.path} refreshed in {result.seconds:.2f} s ({result.restarts} restarts)")
+    return result
+
+
+async def refresh_replica_periodically(interval: float) -> None:
+    """Строит реплику сразу и затем раз в interval секунд"""
+    while True:
+        try:
+            await refresh_replica()
+        except Exception as e:
+            logger.exception(f"Replica refresh failed: {e}")
+        await asyncio.sleep(interval)
+
+
+# ==============================
+# КОНСОЛЬ
+# ==============================
+
+
+def restore_snapshot(snapshot: str, database_path: str) -> str:
+    """Заменяет базу снимком; прежний файл сохраняется рядом как .before-restore"""
+    check = sqlite3.connect(f"file:{quote(snapshot)}?mode=ro", uri=True)
+    try:
+        result = check.execute("PRAGMA quick_check").fetchone()[0]
+    finally:
+        check.close()
+    if result != "ok":
+        raise ValueError(f"snapshot {snapshot} is damaged: {result}")
+
+    saved = database_path + ".before-restore"
+    if os.path.exists(database_path):
+        _copy_whole(database_path, saved)
+    _copy_whole(snapshot, database_path)
+    return saved
+
+
+def _copy_whole(source_path: str, target_path: str) -> None:
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Снимки базы SQLite")
+    parser.add_argument("--db", default=None, help="файл базы (по умолчанию DB_PATH)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("create", help="снять базу сейчас")
+    commands.add_parser("list", help="показать снимки")
+    restore = commands.add_parser("restore", help="восстановить базу из снимка (бот должен быть остановлен)")
+    restore.add_argument("snapshot")
+    args = parser.parse_args(argv)
+
+    if args.db:
+        settings.DB_PATH = args.db
+    database_path = settings.database_path
+
+    if args.command == "create":
+        result = asyncio.run(create_snapshot())
+        print(f"{result.path}: {result.size_bytes} bytes in {result.seconds:.2f} s")
+    elif args.command == "list":
+        for path in list_snapshots(database_path, settings.BACKUP_DIR):
+            print(f"{path}\t{os.path.getsize(path)} bytes")
+    else:
+        saved = restore_snapshot(args.snapshot, database_path)
+        print(f"restored {database_path} from {args.snapshot}, previous file saved as {saved}")
+
+
+if __name__ == "__main__":
+    main()
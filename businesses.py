@@ -2,7 +2,8 @@ from bot.utils import format_number
 from vkbottle.bot import BotLabeler, Message
 
 from bot.core.config import settings
-from bot.db import (
+from bot.income import business_income
+from bot.storage import (
     buy_business,
     create_player,
     get_player,
@@ -13,6 +14,7 @@ from bot.services.clans import (
     calculate_business_income_with_clan,
     get_clan_bonuses,
 )
+from bot.services.profiles import get_display_name
 
 
 business_labeler = BotLabeler()
@@ -31,7 +33,7 @@ async def show_all_businesses_handler(message: Message):
     player = await get_player(user_id)
 
     if not player:
-        player = await create_player(user_id, str(message.from_id))
+        player = await create_player(user_id, await get_display_name(user_id))
 
     business_list = []
     total_clan_income = 0
@@ -39,10 +41,7 @@ async def show_all_businesses_handler(message: Message):
     for business_id, business in settings.BUSINESSES.items():
         business_level = player.get(f"business_{business_id}_level", 0)
         if business_level > 0:
-            income = (
-                business["base_income"]
-                + (business_level - 1) * business["income_increase"]
-            )
+            income = business_income(business_id, business_level)
             business_list.append(
                 f"{business_id}. ✅ {business['name']}\n   ⏳ Доход: {format_number(income)} магнезии/час"
             )
@@ -90,7 +89,7 @@ async def buy_business_handler(message: Message, business_id: str):
     player = await get_player(user_id)
 
     if not player:
-        player = await create_player(user_id, str(message.from_id))
+        player = await create_player(user_id, await get_display_name(user_id))
 
     business = settings.BUSINESSES[business_id]
     business_level = player.get(f"business_{business_id}_level", 0)
@@ -146,7 +145,7 @@ async def upgrade_business_handler(message: Message, cmd_args: str):
     player = await get_player(user_id)
 
     if not player:
-        player = await create_player(user_id, str(message.from_id))
+        player = await create_player(user_id, await get_display_name(user_id))
 
     business = settings.BUSINESSES[business_id]
     business_level = player.get(f"business_{business_id}_level", 0)
@@ -181,7 +180,7 @@ async def upgrade_business_handler(message: Message, cmd_args: str):
     )
 
     if completed_upgrades + 1 >= 5:
-        message_text += f"\n\n🎉 ВСЕ 5 УЛУЧШЕНИЙ ЗАВЕРШЕНЫ!\n🏢 Уровень бизнеса повышен до {business_level + 1}\n💎 Доход увеличен до {business['base_income'] + business_level * business['income_increase']} банок магнезии в час!"
+        message_text += f"\n\n🎉 ВСЕ 5 УЛУЧШЕНИЙ ЗАВЕРШЕНЫ!\n🏢 Уровень бизнеса повышен до {business_level + 1}\n💎 Доход увеличен до {business_income(business_id, business_level + 1)} банок магнезии в час!"
 
     return message_text
 
@@ -193,7 +192,7 @@ async def show_business_shop_handler(message: Message):
     player = await get_player(user_id)
 
     if not player:
-        player = await create_player(user_id, str(message.from_id))
+        player = await create_player(user_id, await get_display_name(user_id))
 
     shop_items = []
     for business_id, business in settings.BUSINESSES.items():
@@ -242,7 +241,7 @@ async def get_business_info_handler(message: Message, business_id: str):
     player = await get_player(user_id)
 
     if not player:
-        player = await create_player(user_id, str(message.from_id))
+        player = await create_player(user_id, await get_display_name(user_id))
 
     business = settings.BUSINESSES[business_id]
     business_level = player.get(f"business_{business_id}_level", 0)
@@ -252,9 +251,7 @@ async def get_business_info_handler(message: Message, business_id: str):
         return f"❌ Вы не владеете бизнесом #{business_id}!\n💡 Купите его: /б {business_id} купить"
 
     # Базовый доход бизнеса
-    base_income = (
-        business["base_income"] + (business_level - 1) * business["income_increase"]
-    )
+    base_income = business_income(business_id, business_level)
 
     # Рассчитываем доход с учетом клана
     income_calculation = await calculate_business_income_with_clan(
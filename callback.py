@@ -0,0 +1,367 @@
+"""
+Режим Callback API: HTTP-приёмник и пул процессов-обработчиков.
+
+Long polling обрабатывает все события в одном процессе. В этом режиме
+(CALLBACK_ENABLED=true) основной процесс только принимает POST от VK, сразу
+отвечает "ok" и передаёт событие в очередь одного из CALLBACK_WORKERS
+процессов. Воркер выбирается по from_id (from_id % число воркеров), поэтому
+все события одного пользователя обрабатываются одним процессом и в порядке
+поступления; события разных пользователей внутри воркера идут параллельно
+(до CALLBACK_WORKER_CONCURRENCY одновременно).
+
+Общая база: перед запуском воркеров база SQLite переводится в WAL, чтобы
+процессы читали параллельно с записью (с DB_BACKEND=postgres у каждого
+воркера свой пул соединений). Реестры админов и банов в каждом воркере
+перечитываются раз в CALLBACK_REGISTRY_REFRESH_SECONDS, логи каждый воркер
+пишет в свой файл (vk_bot.worker0.log, ...).
+
+Проверка локально — сервер с заглушкой VK API и отправка событий:
+    python -m bot.callback serve --stub-api
+    python -m bot.callback replay events.jsonl
+    python -m bot.callback replay --synthetic 2000 --users 100
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import time
+from typing import Any, Optional
+
+from loguru import logger
+
+from bot.core.config import settings
+
+_STOP = None
+
+
+def partition_key(event: dict[str, Any]) -> int:
+    """Пользователь, к которому относится событие (0, если его нет)"""
+    obj = event.get("object") or {}
+    message = obj.get("message") if isinstance(obj.get("message"), dict) else obj
+    for key in ("from_id", "user_id", "peer_id"):
+        value = message.get(key) or obj.get(key)
+        if isinstance(value, int):
+            return value
+    return 0
+
+
+def choose_worker(event: dict[str, Any], workers: int) -> int:
+    return partition_key(event) % workers
+
+
+# ==============================
+# ВОРКЕР
+# ==============================
+
+
+class _PerUserOrder:
+    """Параллельная обработка событий с сохранением порядка для каждого пользователя"""
+
+    def __init__(self, concurrency: int) -> None:
+        self._locks: dict[int, asyncio.Lock] = {}
+        self._waiting: dict[int, int] = {}
+        self._slots = asyncio.Semaphore(concurrency)
+        self.tasks: set[asyncio.Task] = set()
+
+    def submit(self, key: int, coro_factory) -> None:
+        task = asyncio.create_task(self._run(key, coro_factory))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, key: int, coro_factory) -> None:
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._waiting[key] = self._waiting.get(key, 0) + 1
+        try:
+            # Задачи стартуют в порядке submit(), а Lock отдаётся по очереди
+            async with lock, self._slots:
+                await coro_factory()
+        finally:
+            self._waiting[key] -= 1
+            if not self._waiting[key]:
+                del self._waiting[key]
+                del self._locks[key]
+
+
+async def _worker_loop(index: int, queue, stub_api_latency: Optional[float]) -> None:
+    from bot.__main__ import on_shutdown, prepare_bot
+    from bot.core.loader import bot
+
+    if stub_api_latency is not None:
+        from bot.loadtest import _make_stub_client
+
+        bot.api.http_client = _make_stub_client(stub_api_latency)
+
+    await prepare_bot(worker=index)
+    router = bot.router
+    order = _PerUserOrder(settings.CALLBACK_WORKER_CONCURRENCY)
+    logger.info(f"Callback worker {index} ready (pid {os.getpid()})")
+
+    async def route(event: dict[str, Any]) -> None:
+        try:
+            await router.route(event, bot.api)
+        except Exception as e:
+            logger.exception(f"Failed to handle event {event.get('event_id')}: {e}")
+
+    while True:
+        raw = await asyncio.to_thread(queue.get)
+        if raw is _STOP:
+            break
+        event = json.loads(raw)
+        order.submit(partition_key(event), lambda event=event: route(event))
+
+    if order.tasks:
+        await asyncio.gather(*order.tasks, return_exceptions=True)
+    await on_shutdown()
+
+
+def _worker_main(index: int, queue, stub_api_latency: Optional[float]) -> None:
+    # Ctrl+C получает вся группа процессов; воркер останавливает основной процесс
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    from bot.__main__ import configure_logging
+
+    configure_logging(worker=index)
+    asyncio.run(_worker_loop(index, queue, stub_api_latency))
+
+
+# ==============================
+# ПРИЁМНИК
+# ==============================
+
+
+class CallbackServer:
+    def __init__(
+        self,
+        workers: int,
+        confirmation_code: str = "",
+        secret: Optional[str] = None,
+        stub_api_latency: Optional[float] = None,
+    ) -> None:
+        self.workers = max(1, workers)
+        self.confirmation_code = confirmation_code
+        self.secret = secret
+        self.stub_api_latency = stub_api_latency
+        self._context = multiprocessing.get_context("spawn")
+        self.queues = [self._context.Queue() for _ in range(self.workers)]
+        self.processes: list = [None] * self.workers
+        self._supervisor: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def _spawn(self, index: int) -> None:
+        process = self._context.Process(
+            target=_worker_main,
+            args=(index, self.queues[index], self.stub_api_latency),
+            name=f"gymlegend-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        self.processes[index] = process
+
+    async def _supervise(self) -> None:
+        """Перезапускает упавшие воркеры; их очередь сохраняется"""
+        while not self._stopping:
+            await asyncio.sleep(1)
+            for index, process in enumerate(self.processes):
+                if not self._stopping and not process.is_alive():
+                    logger.error(f"Callback worker {index} exited with {process.exitcode}, restarting")
+                    self._spawn(index)
+
+    async def handle(self, request):
+        from aiohttp import web
+
+        try:
+            event = json.loads(await request.read())
+        except ValueError:
+            return web.Response(status=400, text="bad request")
+
+        if self.secret and event.get("secret") != self.secret:
+            return web.Response(status=403, text="forbidden")
+        if event.get("type") == "confirmation":
+            return web.Response(text=self.confirmation_code)
+
+        # Секрет дальше не нужен, в очередь кладём уже без него
+        event.pop("secret", None)
+        self.queues[choose_worker(event, self.workers)].put(json.dumps(event, ensure_ascii=False))
+        return web.Response(text="ok")
+
+    async def on_startup(self, app) -> None:
+        from bot.storage import close_storage, create_tables
+
+        await create_tables()
+        # Приёмнику база больше не нужна, соединения держат только воркеры
+        await close_storage()
+        if settings.DB_BACKEND == "sqlite":
+            from bot.db import enable_wal
+
+            mode = await enable_wal()
+            if mode.lower() != "wal":
+                logger.warning(f"Could not switch database to WAL (journal_mode={mode})")
+
+        for index in range(self.workers):
+            self._spawn(index)
+        self._supervisor = asyncio.create_task(self._supervise())
+        logger.info(f"Callback API: {self.workers} workers started")
+
+    async def on_cleanup(self, app) -> None:
+        self._stopping = True
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+        for queue in self.queues:
+            queue.put(_STOP)
+
+        def join_all() -> None:
+            deadline = time.monotonic() + 30
+            for process in self.processes:
+                process.join(max(0.0, deadline - time.monotonic()))
+                if process.is_alive():
+                    process.terminate()
+
+        await asyncio.to_thread(join_all)
+        logger.info("Callback API: workers stopped")
+
+    def make_app(self, path: str):
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_post(path, self.handle)
+        app.on_startup.append(self.on_startup)
+        app.on_cleanup.append(self.on_cleanup)
+        return app
+
+
+def run_callback_server(stub_api_latency: Optional[float] = None) -> None:
+    from aiohttp import web
+
+    from bot.core.log import shutdown_logging
+
+    server = CallbackServer(
+        settings.CALLBACK_WORKERS,
+        settings.CALLBACK_CONFIRMATION_CODE,
+        settings.CALLBACK_SECRET,
+        stub_api_latency,
+    )
+    app = server.make_app(settings.CALLBACK_PATH)
+
+    async def flush_logs(app) -> None:
+        await shutdown_logging()
+
+    app.on_cleanup.append(flush_logs)
+    logger.info(
+        f"Callback API listening on http://{settings.CALLBACK_HOST}:{settings.CALLBACK_PORT}{settings.CALLBACK_PATH}"
+    )
+    web.run_app(app, host=settings.CALLBACK_HOST, port=settings.CALLBACK_PORT, print=None, access_log=None)
+
+
+# ==============================
+# ОТПРАВКА ЗАПИСАННЫХ СОБЫТИЙ
+# ==============================
+
+
+def load_events(path: str) -> list[dict[str, Any]]:
+    """События из JSONL-файла (по одному JSON-объекту на строку)"""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def synthetic_events(count: int, users: int, seed: int) -> list[dict[str, Any]]:
+    import random
+
+    from bot.loadtest import DEFAULT_MIX, make_event, make_text
+
+    rng = random.Random(seed)
+    kinds = list(DEFAULT_MIX)
+    weights = [DEFAULT_MIX[k] for k in kinds]
+    user_ids = [10_000_000 + i for i in range(users)]
+    events = []
+    for i in range(count):
+        user_id = rng.choice(user_ids)
+        kind = rng.choices(kinds, weights)[0]
+        events.append(make_event(user_id, make_text(kind, user_id, user_ids, rng), i + 1))
+    return events
+
+
+async def replay(url: str, events: list[dict[str, Any]], concurrency: int, secret: Optional[str]) -> None:
+    import aiohttp
+
+    latencies: list[float] = []
+    failures: dict[str, int] = {}
+    cursor = 0
+
+    async def sender(session) -> None:
+        nonlocal cursor
+        while cursor < len(events):
+            event = dict(events[cursor])
+            cursor += 1
+            if secret:
+                event["secret"] = secret
+            started = time.perf_counter()
+            try:
+                async with session.post(url, json=event) as response:
+                    body = await response.text()
+                    if response.status != 200 or body != "ok":
+                        key = f"{response.status} {body[:40]}"
+                        failures[key] = failures.get(key, 0) + 1
+            except aiohttp.ClientError as e:
+                failures[type(e).__name__] = failures.get(type(e).__name__, 0) + 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(sender(session) for _ in range(max(1, concurrency))))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p = lambda q: latencies[min(len(latencies) - 1, int(q * (len(latencies) - 1)))] * 1000  # noqa: E731
+    print(f"sent:      {len(events)} in {elapsed:.2f}s ({len(events) / elapsed:.1f} events/s)")
+    print(f"ack ms:    p50={p(0.5):.2f} p99={p(0.99):.2f} max={latencies[-1] * 1000:.2f}")
+    print(f"failures:  {sum(failures.values())} {failures or ''}")
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Callback API: сервер и отправка записанных событий")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve = sub.add_parser("serve", help="запустить приёмник с пулом воркеров")
+    serve.add_argument("--workers", type=int, default=None)
+    serve.add_argument("--stub-api", action="store_true", help="отвечать на вызовы VK API локально")
+    serve.add_argument("--api-latency", type=float, default=0.05)
+
+    send = sub.add_parser("replay", help="отправить события на приёмник")
+    send.add_argument("events", nargs="?", help="JSONL-файл с событиями")
+    send.add_argument("--synthetic", type=int, default=0, help="сгенерировать N событий message_new")
+    send.add_argument("--users", type=int, default=100)
+    send.add_argument("--seed", type=int, default=1)
+    send.add_argument("--concurrency", type=int, default=20)
+    send.add_argument(
+        "--url",
+        default=f"http://{settings.CALLBACK_HOST}:{settings.CALLBACK_PORT}{settings.CALLBACK_PATH}",
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        from bot.__main__ import configure_logging
+
+        if args.workers is not None:
+            settings.CALLBACK_WORKERS = args.workers
+            os.environ["CALLBACK_WORKERS"] = str(args.workers)
+        configure_logging()
+        run_callback_server(args.api_latency if args.stub_api else None)
+        return
+
+    if args.events:
+        events = load_events(args.events)
+    elif args.synthetic:
+        events = synthetic_events(args.synthetic, args.users, args.seed)
+    else:
+        parser.error("укажите файл событий или --synthetic N")
+        return
+    asyncio.run(replay(args.url, events, args.concurrency, settings.CALLBACK_SECRET))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
 from typing import Any, Dict
 
 from bot.core.config import settings
-from bot.db import (
+from bot.income import business_income
+from bot.services.leaderboards import invalidate_clan_top, note_treasury_change
+from bot.storage import (
     add_power,
     add_treasury,
     get_clan_by_id,
@@ -33,6 +35,17 @@ def get_clan_bonuses(clan_level: int) -> Dict[str, Any]:
     }
 
 
+def get_additional_clan_bonus(dumbbell_level: int) -> int:
+    """Дополнительный бонус в казну клана за поднятие (зависит от уровня гантели)"""
+    if dumbbell_level <= 4:
+        return 1
+    elif dumbbell_level <= 9:
+        return 2
+    elif dumbbell_level <= 14:
+        return 3
+    return 4
+
+
 async def calculate_business_income_with_clan(player: Dict[str, Any], business_id: int, base_income: int) -> Dict[str, Any]:
     """Расчет дохода от бизнеса с учетом клана (НОВАЯ СИСТЕМА)"""
     clan = await get_player_clan(player['user_id'])
@@ -84,15 +97,7 @@ async def calculate_dumbbell_income_with_clan(player: Dict[str, Any], base_incom
     clan_bonuses = get_clan_bonuses(clan['level'])
     
     # Определяем дополнительный бонус в казну клана (зависит от уровня гантели)
-    additional_clan_bonus = 0
-    if player['dumbbell_level'] <= 4:
-        additional_clan_bonus = 1
-    elif player['dumbbell_level'] <= 9:
-        additional_clan_bonus = 2
-    elif player['dumbbell_level'] <= 14:
-        additional_clan_bonus = 3
-    else:
-        additional_clan_bonus = 4
+    additional_clan_bonus = get_additional_clan_bonus(player['dumbbell_level'])
     
     # НОВАЯ СИСТЕМА:
     # 1. Игрок получает: базовый доход + бонус клана
@@ -126,23 +131,8 @@ async def collect_clan_income_hourly():
         if not clan_id:
             continue
         
-        # Рассчитываем общий доход от всех бизнесов игрока
-        total_business_income = 0
-        
-        # Бизнес 1
-        if player[1] > 0:
-            business_income = BUSINESSES[1]['base_income'] + (player[1] - 1) * BUSINESSES[1]['income_increase']
-            total_business_income += business_income
-        
-        # Бизнес 2
-        if player[2] > 0:
-            business_income = BUSINESSES[2]['base_income'] + (player[2] - 1) * BUSINESSES[2]['income_increase']
-            total_business_income += business_income
-        
-        # Бизнес 3
-        if player[3] > 0:
-            business_income = BUSINESSES[3]['base_income'] + (player[3] - 1) * BUSINESSES[3]['income_increase']
-            total_business_income += business_income
+        # Рассчитываем общий доход от всех бизнесов игрока (уровни в player[1..3])
+        total_business_income = sum(business_income(business_id, player[business_id]) for business_id in (1, 2, 3))
         
         if total_business_income > 0:
             # Получаем клан игрока
@@ -174,6 +164,9 @@ async def collect_clan_income_hourly():
                 'Ежечасный сбор с бизнесов участников'
             )
     
+    if clan_collections:
+        invalidate_clan_top()
+
     #self.db.conn.commit()
     return total_collected
 
@@ -210,6 +203,7 @@ async def process_dumbbell_lift_with_clan(user_id: int) -> Dict[str, Any]:
             income_calculation['clan_income'],
             True
         )
+        note_treasury_change(clan, income_calculation['clan_income'])
         
         # Логируем вклад в казну
         await log_collection_with_user(
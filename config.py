@@ -1,6 +1,8 @@
 from __future__ import annotations
 
+import os
 from pathlib import Path
+from urllib.parse import quote
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -18,17 +20,132 @@ class BotSettings(EnvBaseSettings):
 
 
 class DBSettings(EnvBaseSettings):
-    # Left for future compatibility with postgresql
-    # DB_HOST: str = "postgres"
-    # DB_PORT: int = 5432
-    # DB_USER: str = "postgres"
-    # DB_PASS: str | None = None
-    # DB_NAME: str = "postgres"
+    # Бэкенд хранилища: "sqlite" (файл DB_PATH) или "postgres" (нужен extra postgres)
+    DB_BACKEND: str = "sqlite"
+
+    DB_HOST: str = "postgres"
+    DB_PORT: int = 5432
+    DB_USER: str = "postgres"
+    DB_PASS: str | None = None
+    DB_NAME: str = "postgres"
+    DB_POOL_MIN_SIZE: int = 2
+    DB_POOL_MAX_SIZE: int = 20
+
+    DB_PATH: str | None = None
+
+    # Сброс сезона: строк за одну транзакцию и пауза между транзакциями
+    RESET_CHUNK_ROWS: int = 5000
+    RESET_CHUNK_PAUSE_SECONDS: float = 0.05
+
+    # Журнал медленных запросов (0 — выключен)
+    SLOW_QUERY_THRESHOLD_MS: float = 100
+    SLOW_QUERY_RATE_LIMIT: float = 300
+    SLOW_QUERY_LOG_PATH: str = "logs/slow_queries.log"
+
+    # Реплика только для чтения для статистики и топов, см. bot.backup (0 — выключена).
+    # Старше REPLICA_MAX_STALENESS_SECONDS реплика не читается, запросы идут в основную базу
+    REPLICA_REFRESH_SECONDS: float = 0
+    REPLICA_MAX_STALENESS_SECONDS: float = 300
+    REPLICA_PATH: str | None = None
 
     @property
     def database_path(self) -> str: 
+        if self.DB_PATH:
+            return self.DB_PATH
         return "/home/timur/Documents/Languages/Python/Freelance/tutikovstanislav1/GymLegend/gym_legend.db"
 
+    @property
+    def replica_path(self) -> str:
+        if self.REPLICA_PATH:
+            return self.REPLICA_PATH
+        root, ext = os.path.splitext(self.database_path)
+        return f"{root}-replica{ext or '.db'}"
+
+    @property
+    def postgres_dsn(self) -> str:
+        password = f":{quote(self.DB_PASS, safe='')}" if self.DB_PASS else ""
+        return f"postgresql://{self.DB_USER}{password}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+
+
+class MetricsSettings(EnvBaseSettings):
+    METRICS_ENABLED: bool = False
+    METRICS_HOST: str = "127.0.0.1"
+    METRICS_PORT: int = 9105
+
+
+class CallbackSettings(EnvBaseSettings):
+    # Callback API вместо long polling: HTTP-приёмник и пул процессов-обработчиков
+    CALLBACK_ENABLED: bool = False
+    CALLBACK_HOST: str = "127.0.0.1"
+    CALLBACK_PORT: int = 8080
+    CALLBACK_PATH: str = "/callback"
+    CALLBACK_CONFIRMATION_CODE: str = ""
+    CALLBACK_SECRET: str | None = None
+    CALLBACK_WORKERS: int = 4
+    CALLBACK_WORKER_CONCURRENCY: int = 64
+    CALLBACK_REGISTRY_REFRESH_SECONDS: float = 5
+
+
+class SendSettings(EnvBaseSettings):
+    # Очередь исходящих сообщений, см. bot.sender. VK пускает 20 запросов сообщества в секунду,
+    # а за любую секунду уходит не больше SEND_RATE_PER_SECOND + SEND_BURST сообщений
+    SEND_RATE_PER_SECOND: float = 18
+    SEND_BURST: float = 2
+    SEND_CONCURRENCY: int = 8
+    SEND_MAX_ATTEMPTS: int = 5
+    SEND_RETRY_BASE_SECONDS: float = 0.5
+    SEND_RETRY_MAX_SECONDS: float = 10
+    SEND_SHUTDOWN_TIMEOUT_SECONDS: float = 10
+
+
+class BackfillSettings(EnvBaseSettings):
+    # Имена игроков с ником-айди из профилей VK, см. bot.backfill. users.get делит с
+    # отправкой сообщений лимит в 20 запросов сообщества в секунду
+    USERNAME_BACKFILL_ON_START: bool = False
+    USERNAME_BACKFILL_RATE_PER_SECOND: float = 1
+    USERNAME_BACKFILL_CHUNK_ROWS: int = 500
+    USERNAME_BACKFILL_STATE_PATH: str = "state/username_backfill.json"
+
+
+class BackupSettings(EnvBaseSettings):
+    # Снимки базы SQLite через backup API, см. bot.backup (0 — фоновые снимки выключены)
+    BACKUP_INTERVAL_MINUTES: float = 0
+    BACKUP_DIR: str = "backups"
+    BACKUP_KEEP: int = 24
+    BACKUP_PAGES_PER_STEP: int = 256
+    BACKUP_STEP_PAUSE_SECONDS: float = 0.01
+    BACKUP_MAX_RESTARTS: int = 3
+
+
+class CacheSettings(EnvBaseSettings):
+    # Прогрев при запуске: общий лимит времени и сколько активных игроков читать
+    WARMUP_BUDGET_SECONDS: float = 15
+    WARMUP_RECENT_PLAYERS: int = 1000
+
+    TOP_CACHE_SECONDS: float = 30
+
+    # Повторно доставленные сообщения, см. bot.middlewares.dedup (пустой путь — не сохранять при остановке)
+    DEDUP_TTL_SECONDS: float = 600
+    DEDUP_MAX_MESSAGES: int = 100_000
+    DEDUP_STATE_PATH: str = ""
+
+    # Имена и короткие адреса из VK, см. bot.services.profiles
+    PROFILE_CACHE_SECONDS: float = 3600
+    PROFILE_CACHE_MAX: int = 100_000
+    PROFILE_BATCH_DELAY_SECONDS: float = 0.05
+
+
+class LogSettings(EnvBaseSettings):
+    LOG_PATH: str = "logs/vk_bot.log"
+    LOG_LEVEL: str = "DEBUG"
+    LOG_JSON: bool = False
+    LOG_ROTATION_SIZE_MB: float = 100
+    LOG_ROTATION_HOURS: float = 24
+    LOG_RETENTION: int = 30
+    LOG_COMPRESSION: str | None = "gz"
+    # Доля DEBUG-сообщений, которые пишутся, по префиксу модуля
+    LOG_DEBUG_SAMPLING: dict[str, float] = {"vkbottle": 0.01}
+
 
 class GameSettings(EnvBaseSettings):
     # ==============================
@@ -115,6 +232,9 @@ class GameSettings(EnvBaseSettings):
         }
     }
 
+    # Доход бизнесов начисляется не больше чем за столько последних часов; 0 — без ограничения
+    MAGNESIA_MAX_OFFLINE_HOURS: float = 0
+
     # ==============================
     # КОНСТАНТЫ КЛАНОВ
     # ==============================
@@ -129,7 +249,18 @@ class GameSettings(EnvBaseSettings):
     ADMIN_USERS: list[int] = [1, 322615766, 768764050]
 
 
-class Settings(BotSettings, DBSettings, GameSettings):
+class Settings(
+    BotSettings,
+    DBSettings,
+    MetricsSettings,
+    CallbackSettings,
+    SendSettings,
+    BackfillSettings,
+    BackupSettings,
+    CacheSettings,
+    LogSettings,
+    GameSettings,
+):
     DEBUG: bool = False
 
 
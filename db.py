@@ -1,21 +1,164 @@
+import asyncio
 import json
-from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional, Tuple
+import os
+import re
+import sqlite3
+from functools import lru_cache
+from time import perf_counter, time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote
 
 import aiosqlite
+from loguru import logger
 
 from bot.core.config import settings
+from bot.income import accrual_sql, earliest_accrual, magnesia_rate_sql, owed_magnesia
+from bot.registries import AdminRegistry, BanRegistry, PlayerRegistry
+from bot.utils import days_from_now, now_ts
+
+# Наблюдатели запросов: observer(sql, parameters, elapsed_seconds, rowcount)
+QueryObserver = Callable[[str, Any, float, int], None]
+_query_observers: List[QueryObserver] = []
+
+
+def add_query_observer(observer: QueryObserver) -> None:
+    """Register a callback that is called after every executed statement"""
+    _query_observers.append(observer)
+
+
+def remove_query_observer(observer: QueryObserver) -> None:
+    """Unregister a query observer"""
+    if observer in _query_observers:
+        _query_observers.remove(observer)
+
+
+_SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SQL_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(sql: str) -> str:
+    """Collapse whitespace and replace inline literals with ? to group equal statements"""
+    return _SQL_WHITESPACE.sub(" ", _SQL_LITERALS.sub("?", sql)).strip()
+
+
+class _ObservedConnection(aiosqlite.Connection):
+    """aiosqlite connection that reports executed statements to query observers.
+
+    The hook sits in the coroutine that awaits the worker thread, so observers
+    run in the caller's task (context variables work) and see the latency the
+    event loop actually waited, including the queue time. sqlite3 steps a
+    statement once inside execute(), so sorting, grouping and aggregates are
+    already included in the measured time.
+
+    A statement that returns rows is reported once the caller is done with
+    them: rowcount is the number of rows actually fetched, counted when the
+    cursor is exhausted, closed or reused, or when the connection closes.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        # Курсоры sqlite3, строки которых ещё читаются: [sql, parameters, elapsed, fetched]
+        self._reading: Dict[sqlite3.Cursor, list] = {}
+
+    def _report(self, sql: str, parameters: Any, elapsed: float, rowcount: int) -> None:
+        for observer in tuple(_query_observers):
+            observer(sql, parameters, elapsed, rowcount)
+
+    def _finish_reading(self, cursor: Any) -> None:
+        entry = self._reading.pop(cursor, None)
+        if entry is not None:
+            self._report(*entry)
+
+    async def _execute(self, fn, *args, **kwargs):
+        name = getattr(fn, "__name__", "")
+        if name in ("fetchone", "fetchmany", "fetchall", "close") and self._reading:
+            return await self._execute_fetch(fn, name, *args, **kwargs)
+        if not _query_observers or name not in ("execute", "executemany"):
+            return await super()._execute(fn, *args, **kwargs)
+
+        # Курсор выполняет новый запрос, предыдущий прочитан
+        self._finish_reading(getattr(fn, "__self__", None))
+        started = perf_counter()
+        cursor = None
+        try:
+            cursor = await super()._execute(fn, *args, **kwargs)
+            return cursor
+        finally:
+            elapsed = perf_counter() - started
+            parameters = args[1] if len(args) > 1 else ()
+            if cursor is not None and cursor.description is not None:
+                self._reading[cursor] = [args[0], parameters, elapsed, 0]
+            else:
+                # rowcount: затронутые строки для INSERT/UPDATE/DELETE
+                self._report(args[0], parameters, elapsed, cursor.rowcount if cursor is not None else -1)
+
+    async def _execute_fetch(self, fn, name: str, *args, **kwargs):
+        cursor = getattr(fn, "__self__", None)
+        result = await super()._execute(fn, *args, **kwargs)
+        entry = self._reading.get(cursor)
+        if entry is None:
+            return result
+        if name == "fetchone":
+            if result is not None:
+                entry[3] += 1
+                return result
+        elif name != "close":
+            entry[3] += len(result)
+            # fetchmany возвращает меньше строк, чем просили, только в конце результата
+            if name == "fetchmany" and len(result) == (args[0] if args else cursor.arraysize):
+                return result
+        self._finish_reading(cursor)
+        return result
+
+    async def close(self) -> None:
+        for cursor in tuple(self._reading):
+            self._finish_reading(cursor)
+        await super().close()
+
+
+def connect() -> aiosqlite.Connection:
+    """Open a connection to the game database"""
+    database_path = settings.database_path
+    return _ObservedConnection(lambda: sqlite3.connect(database_path), iter_chunk_size=64)
+
+
+def _connect_read_only(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(f"file:{quote(path)}?mode=ro", uri=True)
+    conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+def connect_replica() -> aiosqlite.Connection:
+    """Open a read-only connection to the analytics replica for statistics and tops.
+
+    Falls back to the game database when the replica is disabled, missing or
+    older than REPLICA_MAX_STALENESS_SECONDS.
+    """
+    if settings.REPLICA_REFRESH_SECONDS > 0:
+        replica_path = settings.replica_path
+        try:
+            age = time() - os.path.getmtime(replica_path)
+        except OSError:
+            age = None
+        if age is not None and age <= settings.REPLICA_MAX_STALENESS_SECONDS:
+            return _ObservedConnection(lambda: _connect_read_only(replica_path), iter_chunk_size=64)
+    return connect()
+
+
+# Даты — целые секунды Unix epoch (UTC), см. bot.utils.now_ts
+SQL_NOW = "(CAST(strftime('%s', 'now') AS INTEGER))"
 
 # Основная таблица игроков
-SQL_PLAYERS_TABLE = """
+SQL_PLAYERS_TABLE = f"""
     CREATE TABLE IF NOT EXISTS players (
         user_id INTEGER PRIMARY KEY,
         username TEXT,
         balance INTEGER DEFAULT 1,
         power INTEGER DEFAULT 0,
         magnesia INTEGER DEFAULT 0,
-        last_dumbbell_use TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_dumbbell_use INTEGER DEFAULT 0,
+        created_at INTEGER DEFAULT {SQL_NOW},
         is_new INTEGER DEFAULT 1,
         dumbbell_level INTEGER DEFAULT 1,
         dumbbell_name TEXT DEFAULT 'Гантеля 1кг',
@@ -24,7 +167,7 @@ SQL_PLAYERS_TABLE = """
         custom_income INTEGER DEFAULT NULL,
         admin_level INTEGER DEFAULT 0,
         admin_nickname TEXT DEFAULT NULL,
-        admin_since TIMESTAMP DEFAULT NULL,
+        admin_since INTEGER DEFAULT NULL,
         admin_id TEXT DEFAULT NULL,
         bans_given INTEGER DEFAULT 0,
         permabans_given INTEGER DEFAULT 0,
@@ -33,20 +176,22 @@ SQL_PLAYERS_TABLE = """
         nickname_changes_given INTEGER DEFAULT 0,
         is_banned INTEGER DEFAULT 0,
         ban_reason TEXT,
-        ban_until TIMESTAMP DEFAULT NULL,
+        ban_until INTEGER DEFAULT NULL,
         business_1_level INTEGER DEFAULT 0,
-        business_1_upgrades TEXT DEFAULT '{}',
+        business_1_upgrades TEXT DEFAULT '{{}}',
         business_2_level INTEGER DEFAULT 0,
-        business_2_upgrades TEXT DEFAULT '{}',
+        business_2_upgrades TEXT DEFAULT '{{}}',
         business_3_level INTEGER DEFAULT 0,
-        business_3_upgrades TEXT DEFAULT '{}',
+        business_3_upgrades TEXT DEFAULT '{{}}',
         clan_id INTEGER DEFAULT NULL,
-        used_promo_codes TEXT DEFAULT '[]'
+        used_promo_codes TEXT DEFAULT '[]',
+        magnesia_per_hour INTEGER DEFAULT 0,
+        magnesia_accrued_at INTEGER DEFAULT 0
     )
 """
 
 # Таблица транзакций
-SQL_TRANSACTIONS_TABLE = """
+SQL_TRANSACTIONS_TABLE = f"""
     CREATE TABLE IF NOT EXISTS transactions (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         user_id INTEGER,
@@ -55,37 +200,37 @@ SQL_TRANSACTIONS_TABLE = """
         description TEXT,
         admin_id INTEGER DEFAULT NULL,
         target_user_id INTEGER DEFAULT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        created_at INTEGER DEFAULT {SQL_NOW}
     )
 """
 
 # Таблица использований гантелей
-SQL_DUMBBELL_USES_TABLE = """
+SQL_DUMBBELL_USES_TABLE = f"""
     CREATE TABLE IF NOT EXISTS dumbbell_uses (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         user_id INTEGER,
         dumbbell_level INTEGER,
         income INTEGER,
         power_gained INTEGER,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        created_at INTEGER DEFAULT {SQL_NOW},
         FOREIGN KEY (user_id) REFERENCES players (user_id)
     )
 """
 
 # Таблица админ действий
-SQL_ADMIN_ACTIONS_TABLE = """
+SQL_ADMIN_ACTIONS_TABLE = f"""
     CREATE TABLE IF NOT EXISTS admin_actions (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         admin_id INTEGER,
         action_type TEXT,
         target_user_id INTEGER,
         details TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        created_at INTEGER DEFAULT {SQL_NOW}
     )
 """
 
 # Таблица промокодов
-SQL_PROMO_CODES_TABLE = """
+SQL_PROMO_CODES_TABLE = f"""
     CREATE TABLE IF NOT EXISTS promo_codes (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         code TEXT UNIQUE NOT NULL,
@@ -94,27 +239,27 @@ SQL_PROMO_CODES_TABLE = """
         reward_type TEXT NOT NULL,
         reward_amount INTEGER NOT NULL,
         created_by INTEGER NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        expires_at TIMESTAMP DEFAULT NULL,
+        created_at INTEGER DEFAULT {SQL_NOW},
+        expires_at INTEGER DEFAULT NULL,
         is_active INTEGER DEFAULT 1,
         FOREIGN KEY (created_by) REFERENCES players (user_id)
     )
 """
 
 # Таблица использований промокодов
-SQL_PROMO_USES_TABLE = """
+SQL_PROMO_USES_TABLE = f"""
     CREATE TABLE IF NOT EXISTS promo_uses (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         user_id INTEGER NOT NULL,
         promo_code TEXT NOT NULL,
-        used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        used_at INTEGER DEFAULT {SQL_NOW},
         FOREIGN KEY (user_id) REFERENCES players (user_id),
         FOREIGN KEY (promo_code) REFERENCES promo_codes (code)
     )
 """
 
 # Таблица кланов
-SQL_CLANS_TABLE = """
+SQL_CLANS_TABLE = f"""
     CREATE TABLE IF NOT EXISTS clans (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         tag TEXT UNIQUE NOT NULL,
@@ -122,21 +267,22 @@ SQL_CLANS_TABLE = """
         owner_id INTEGER NOT NULL,
         level INTEGER DEFAULT 1,
         treasury INTEGER DEFAULT 0,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        created_at INTEGER DEFAULT {SQL_NOW},
         total_income_per_hour INTEGER DEFAULT 0,
         total_lifts INTEGER DEFAULT 0,
+        member_count INTEGER DEFAULT 0,
         FOREIGN KEY (owner_id) REFERENCES players (user_id)
     )
 """
 
 # Таблица участников кланов
-SQL_CLAN_MEMBERS_TABLE = """
+SQL_CLAN_MEMBERS_TABLE = f"""
     CREATE TABLE IF NOT EXISTS clan_members (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         clan_id INTEGER NOT NULL,
         user_id INTEGER UNIQUE NOT NULL,
         role TEXT DEFAULT 'member',
-        joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        joined_at INTEGER DEFAULT {SQL_NOW},
         contributions INTEGER DEFAULT 0,
         FOREIGN KEY (clan_id) REFERENCES clans (id),
         FOREIGN KEY (user_id) REFERENCES players (user_id)
@@ -144,7 +290,7 @@ SQL_CLAN_MEMBERS_TABLE = """
 """
 
 # Таблица лога казны клана
-SQL_CLAN_TREASURY_LOG_TABLE = """
+SQL_CLAN_TREASURY_LOG_TABLE = f"""
     CREATE TABLE IF NOT EXISTS clan_treasury_log (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         clan_id INTEGER NOT NULL,
@@ -152,52 +298,174 @@ SQL_CLAN_TREASURY_LOG_TABLE = """
         action_type TEXT,
         amount INTEGER,
         description TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        created_at INTEGER DEFAULT {SQL_NOW},
         FOREIGN KEY (clan_id) REFERENCES clans (id),
         FOREIGN KEY (user_id) REFERENCES players (user_id)
     )
 """
 
 # Таблица приглашений в кланы
-SQL_CLAN_INVITES_TABLE = """
+SQL_CLAN_INVITES_TABLE = f"""
     CREATE TABLE IF NOT EXISTS clan_invites (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         clan_id INTEGER NOT NULL,
         inviter_id INTEGER NOT NULL,
         invitee_id INTEGER NOT NULL,
         status TEXT DEFAULT 'pending',
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        expires_at TIMESTAMP,
+        created_at INTEGER DEFAULT {SQL_NOW},
+        expires_at INTEGER,
         FOREIGN KEY (clan_id) REFERENCES clans (id),
         FOREIGN KEY (inviter_id) REFERENCES players (user_id),
         FOREIGN KEY (invitee_id) REFERENCES players (user_id)
     )
 """
 
+SQL_CLAN_MEMBERS_ORDER_INDEX = """
+    CREATE INDEX IF NOT EXISTS idx_clan_members_order
+    ON clan_members(clan_id, role, contributions, user_id)
+"""
+
+SQL_CLAN_TREASURY_LOG_ORDER_INDEX = """
+    CREATE INDEX IF NOT EXISTS idx_clan_treasury_log_order
+    ON clan_treasury_log(clan_id, created_at DESC, id DESC)
+"""
+
+SQL_CLANS_TOP_INDEX = """
+    CREATE INDEX IF NOT EXISTS idx_clans_top
+    ON clans(total_income_per_hour DESC, treasury DESC)
+"""
+
+SQL_TABLES = {
+    "players": SQL_PLAYERS_TABLE,
+    "transactions": SQL_TRANSACTIONS_TABLE,
+    "dumbbell_uses": SQL_DUMBBELL_USES_TABLE,
+    "admin_actions": SQL_ADMIN_ACTIONS_TABLE,
+    "promo_codes": SQL_PROMO_CODES_TABLE,
+    "promo_uses": SQL_PROMO_USES_TABLE,
+    "clans": SQL_CLANS_TABLE,
+    "clan_members": SQL_CLAN_MEMBERS_TABLE,
+    "clan_treasury_log": SQL_CLAN_TREASURY_LOG_TABLE,
+    "clan_invites": SQL_CLAN_INVITES_TABLE,
+}
+
+# Столбцы с датами. До версии схемы 1 в них лежал текст: CURRENT_TIMESTAMP
+# по UTC или datetime.now().isoformat() по местному времени
+DATE_COLUMNS: Dict[str, Tuple[str, ...]] = {
+    "players": ("last_dumbbell_use", "created_at", "admin_since", "ban_until"),
+    "transactions": ("created_at",),
+    "dumbbell_uses": ("created_at",),
+    "admin_actions": ("created_at",),
+    "promo_codes": ("created_at", "expires_at"),
+    "promo_uses": ("used_at",),
+    "clans": ("created_at",),
+    "clan_members": ("joined_at",),
+    "clan_treasury_log": ("created_at",),
+    "clan_invites": ("created_at", "expires_at"),
+}
+
+# PRAGMA user_version: 1 — даты в секундах epoch
+SCHEMA_VERSION = 1
+
+
+async def _add_clan_member_count(db: aiosqlite.Connection) -> None:
+    """Add clans.member_count to databases created before it and fill it once"""
+    async with db.execute("PRAGMA table_info(clans)") as cur:
+        columns = {row[1] for row in await cur.fetchall()}
+    if "member_count" in columns:
+        return
+    await db.execute("ALTER TABLE clans ADD COLUMN member_count INTEGER DEFAULT 0")
+    await db.execute(
+        "UPDATE clans SET member_count = (SELECT COUNT(*) FROM clan_members WHERE clan_id = clans.id)"
+    )
+
+
+async def _add_magnesia_accrual(db: aiosqlite.Connection) -> None:
+    """Add business income columns to players created before them, see bot.income"""
+    async with db.execute("PRAGMA table_info(players)") as cur:
+        columns = {row[1] for row in await cur.fetchall()}
+    if "magnesia_per_hour" in columns:
+        return
+    await db.execute("ALTER TABLE players ADD COLUMN magnesia_per_hour INTEGER DEFAULT 0")
+    await db.execute("ALTER TABLE players ADD COLUMN magnesia_accrued_at INTEGER DEFAULT 0")
+    # Доход до обновления не начислялся, начинаем считать с момента миграции
+    await db.execute(f"UPDATE players SET magnesia_per_hour = {magnesia_rate_sql()}, magnesia_accrued_at = {SQL_NOW}")
+
+
+def _epoch_sql(column: str) -> str:
+    """SQL expression converting an old text date in column to epoch seconds"""
+    # isoformat() отличается от CURRENT_TIMESTAMP буквой T и записан по местному времени
+    return (
+        f"CASE WHEN {column} IS NULL OR {column} = '' THEN NULL"
+        f" WHEN typeof({column}) = 'integer' THEN {column}"
+        f" WHEN instr({column}, 'T') > 0 THEN CAST(strftime('%s', {column}, 'utc') AS INTEGER)"
+        f" ELSE CAST(strftime('%s', {column}) AS INTEGER) END"
+    )
+
+
+async def _migrate_epoch_dates(db: aiosqlite.Connection) -> None:
+    """Rebuild tables with text dates into INTEGER epoch columns, in one transaction"""
+    async with db.execute("PRAGMA user_version") as cur:
+        if (await cur.fetchone())[0] >= SCHEMA_VERSION:
+            return
+
+    await db.execute("BEGIN")
+    for table, create_sql in SQL_TABLES.items():
+        async with db.execute(f"PRAGMA table_info({table})") as cur:
+            columns = {row[1]: row[2] for row in await cur.fetchall()}
+        if all(columns[column] == "INTEGER" for column in DATE_COLUMNS[table]):
+            continue
+        # SQLite не меняет тип и значение по умолчанию столбца, поэтому таблица
+        # пересоздаётся; индексы create_tables построит заново
+        logger.info(f"Converting dates in {table} to epoch seconds")
+        select = ", ".join(_epoch_sql(column) if column in DATE_COLUMNS[table] else column for column in columns)
+        await db.execute(create_sql.replace(f"IF NOT EXISTS {table} (", f"{table}_epoch ("))
+        await db.execute(f"INSERT INTO {table}_epoch ({', '.join(columns)}) SELECT {select} FROM {table}")
+        await db.execute(f"DROP TABLE {table}")
+        await db.execute(f"ALTER TABLE {table}_epoch RENAME TO {table}")
+    await db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    await db.commit()
+
 
 async def create_tables() -> None:
-    """Create all database tables if they don't exist"""
+    """Create all database tables if they don't exist and migrate older schemas"""
+    if sqlite3.sqlite_version_info < (3, 35, 0):
+        # create_player использует INSERT ... RETURNING
+        raise RuntimeError(f"SQLite 3.35+ is required, found {sqlite3.sqlite_version}")
     # Creating database file if it doesn't exist
     with open(settings.database_path, "a"):
         pass
 
-    async with aiosqlite.connect(settings.database_path) as db:
-        await db.execute(SQL_PLAYERS_TABLE)
-        await db.execute(SQL_TRANSACTIONS_TABLE)
-        await db.execute(SQL_DUMBBELL_USES_TABLE)
-        await db.execute(SQL_ADMIN_ACTIONS_TABLE)
-        await db.execute(SQL_PROMO_CODES_TABLE)
-        await db.execute(SQL_PROMO_USES_TABLE)
-        await db.execute(SQL_CLANS_TABLE)
-        await db.execute(SQL_CLAN_MEMBERS_TABLE)
-        await db.execute(SQL_CLAN_TREASURY_LOG_TABLE)
-        await db.execute(SQL_CLAN_INVITES_TABLE)
+    async with connect() as db:
+        for create_sql in SQL_TABLES.values():
+            await db.execute(create_sql)
+        await _add_clan_member_count(db)
+        await _add_magnesia_accrual(db)
         await db.commit()
+        await _migrate_epoch_dates(db)
+        # Частичные индексы для загрузки реестров администраторов и банов
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_players_admins ON players(user_id) WHERE admin_level > 0")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_players_banned ON players(user_id) WHERE is_banned = 1")
+        # Последние зарегистрированные для статистики, см. get_recent_players
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_players_created_at ON players(created_at)")
+        # Недавно активные для прогрева реестра игроков, см. get_recently_active_player_ids
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_players_last_dumbbell_use ON players(last_dumbbell_use)")
+        # Порядок страниц участников и лога казны, см. get_clan_members/get_clan_treasury_log
+        await db.execute(SQL_CLAN_MEMBERS_ORDER_INDEX)
+        await db.execute(SQL_CLAN_TREASURY_LOG_ORDER_INDEX)
+        await db.execute(SQL_CLANS_TOP_INDEX)
+        await db.commit()
+
+
+async def enable_wal() -> str:
+    """Switch the database to WAL so several processes can read while one writes"""
+    async with connect() as db:
+        async with db.execute("PRAGMA journal_mode=WAL") as cur:
+            return (await cur.fetchone())[0]
 
 
 async def initialize_admin_ids() -> bool:
     """Initialize admin IDs for existing admins without an ID"""
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         async with db.execute(
             'SELECT user_id, admin_since FROM players WHERE admin_level > 0 AND (admin_id IS NULL OR admin_id = "") ORDER BY admin_since ASC'
         ) as cur:
@@ -216,88 +484,141 @@ async def initialize_admin_ids() -> bool:
         return True
 
 
-async def get_player(user_id: int) -> Optional[Dict[str, Any]]:
-    """Get player data by user_id"""
-    async with aiosqlite.connect(settings.database_path) as db:
-        async with db.execute(
-            """
-            SELECT user_id, username, balance, power, magnesia, last_dumbbell_use, is_new,
-                   dumbbell_level, dumbbell_name, total_lifts, total_earned,
-                   custom_income, admin_level, admin_nickname, admin_since,
-                   admin_id, bans_given, permabans_given, deletions_given,
-                   dumbbell_sets_given, nickname_changes_given,
-                   is_banned, ban_reason, ban_until, created_at,
-                   business_1_level, business_1_upgrades,
-                   business_2_level, business_2_upgrades,
-                   business_3_level, business_3_upgrades,
-                   clan_id, used_promo_codes
-            FROM players WHERE user_id = ?
-        """,
-            (user_id,),
-        ) as cur:
-            row = await cur.fetchone()
+# Уровни администраторов, баны и айди игроков в памяти, см. bot.registries
+_admins = AdminRegistry()
+_bans = BanRegistry()
+_players = PlayerRegistry()
+# Новички регистрируются по одному: SQLite всё равно пишет одним писателем, а
+# ожидание в asyncio дешевле, чем сотни соединений в busy timeout
+_registration_lock = asyncio.Lock()
 
-        if not row:
-            return
 
-        business_1_upgrades = row[26] if row[26] else "{}"
-        business_2_upgrades = row[28] if row[28] else "{}"
-        business_3_upgrades = row[30] if row[30] else "{}"
-        used_promo_codes = row[32] if row[32] else "[]"
+async def load_admin_levels() -> Dict[int, int]:
+    """Load admin levels of all admins into memory"""
+    async with connect() as db:
+        async with db.execute("SELECT user_id, admin_level FROM players WHERE admin_level > 0") as cur:
+            rows = await cur.fetchall()
+    return _admins.load(rows)
+
+
+async def get_admin_levels() -> Dict[int, int]:
+    """Admin levels from memory, loaded from the database on first use"""
+    if not _admins.loaded:
+        return await load_admin_levels()
+    return _admins.levels
+
+
+_PLAYER_COLUMNS = """
+    user_id, username, balance, power, magnesia, last_dumbbell_use, is_new,
+    dumbbell_level, dumbbell_name, total_lifts, total_earned,
+    custom_income, admin_level, admin_nickname, admin_since,
+    admin_id, bans_given, permabans_given, deletions_given,
+    dumbbell_sets_given, nickname_changes_given,
+    is_banned, ban_reason, ban_until, created_at,
+    business_1_level, business_1_upgrades,
+    business_2_level, business_2_upgrades,
+    business_3_level, business_3_upgrades,
+    clan_id, used_promo_codes,
+    magnesia_per_hour, magnesia_accrued_at
+"""
 
-        return {
-            "user_id": row[0],
-            "username": row[1],
-            "balance": row[2],
-            "power": row[3],
-            "magnesia": row[4],
-            "last_dumbbell_use": row[5],
-            "is_new": row[6],
-            "dumbbell_level": row[7],
-            "dumbbell_name": row[8],
-            "total_lifts": row[9],
-            "total_earned": row[10],
-            "custom_income": row[11],
-            "admin_level": row[12],
-            "admin_nickname": row[13],
-            "admin_since": row[14],
-            "admin_id": row[15],
-            "bans_given": row[16],
-            "permabans_given": row[17],
-            "deletions_given": row[18],
-            "dumbbell_sets_given": row[19],
-            "nickname_changes_given": row[20],
-            "is_banned": row[21],
-            "ban_reason": row[22],
-            "ban_until": row[23],
-            "created_at": row[24],
-            "business_1_level": row[25] or 0,
-            "business_1_upgrades": json.loads(business_1_upgrades),
-            "business_2_level": row[27] or 0,
-            "business_2_upgrades": json.loads(business_2_upgrades),
-            "business_3_level": row[29] or 0,
-            "business_3_upgrades": json.loads(business_3_upgrades),
-            "clan_id": row[31],
-            "used_promo_codes": json.loads(used_promo_codes),
-        }
+
+def forget_player_ids() -> None:
+    """Forget known player ids, they are checked in the database again on next use"""
+    _players.clear()
+
+
+async def player_exists(user_id: int) -> bool:
+    """Check whether a player is registered; known players are answered from memory"""
+    if _players.contains(user_id):
+        return True
+    async with connect() as db:
+        async with db.execute("SELECT 1 FROM players WHERE user_id = ?", (user_id,)) as cur:
+            found = await cur.fetchone() is not None
+    if found:
+        _players.add(user_id)
+    return found
+
+
+def _player_from_row(row) -> Dict[str, Any]:
+    business_1_upgrades = row[26] if row[26] else "{}"
+    business_2_upgrades = row[28] if row[28] else "{}"
+    business_3_upgrades = row[30] if row[30] else "{}"
+    used_promo_codes = row[32] if row[32] else "[]"
+
+    return {
+        "user_id": row[0],
+        "username": row[1],
+        "balance": row[2],
+        "power": row[3],
+        # Вместе с доходом бизнесов, ещё не записанным в базу
+        "magnesia": row[4] + owed_magnesia(row[33], row[34], now_ts()),
+        "last_dumbbell_use": row[5],
+        "is_new": row[6],
+        "dumbbell_level": row[7],
+        "dumbbell_name": row[8],
+        "total_lifts": row[9],
+        "total_earned": row[10],
+        "custom_income": row[11],
+        "admin_level": row[12],
+        "admin_nickname": row[13],
+        "admin_since": row[14],
+        "admin_id": row[15],
+        "bans_given": row[16],
+        "permabans_given": row[17],
+        "deletions_given": row[18],
+        "dumbbell_sets_given": row[19],
+        "nickname_changes_given": row[20],
+        "is_banned": row[21],
+        "ban_reason": row[22],
+        "ban_until": row[23],
+        "created_at": row[24],
+        "business_1_level": row[25] or 0,
+        "business_1_upgrades": json.loads(business_1_upgrades),
+        "business_2_level": row[27] or 0,
+        "business_2_upgrades": json.loads(business_2_upgrades),
+        "business_3_level": row[29] or 0,
+        "business_3_upgrades": json.loads(business_3_upgrades),
+        "clan_id": row[31],
+        "used_promo_codes": json.loads(used_promo_codes),
+        "magnesia_per_hour": row[33] or 0,
+        "magnesia_accrued_at": row[34] or 0,
+    }
+
+
+async def get_player(user_id: int) -> Optional[Dict[str, Any]]:
+    """Get player data by user_id"""
+    async with connect() as db:
+        async with db.execute(f"SELECT {_PLAYER_COLUMNS} FROM players WHERE user_id = ?", (user_id,)) as cur:
+            row = await cur.fetchone()
+    return _player_from_row(row) if row else None
 
 
 async def create_player(user_id: int, username: str) -> Optional[Dict[str, Any]]:
-    """Create a new player"""
-    async with aiosqlite.connect(settings.database_path) as db:
-        await db.execute(
-            """INSERT OR IGNORE INTO players 
-               (user_id, username, dumbbell_level, dumbbell_name) 
-               VALUES (?, ?, 1, 'Гантеля 1кг')""",
+    """Create a new player; an existing player is returned unchanged"""
+    async with _registration_lock, connect() as db:
+        # Новый игрок — одна команда: строка приходит из RETURNING, без второго чтения
+        async with db.execute(
+            f"""INSERT INTO players (user_id, username, dumbbell_level, dumbbell_name)
+                VALUES (?, ?, 1, 'Гантеля 1кг')
+                ON CONFLICT (user_id) DO NOTHING
+                RETURNING {_PLAYER_COLUMNS}""",
             (user_id, username),
-        )
+        ) as cur:
+            row = await cur.fetchone()
         await db.commit()
-    return await get_player(user_id)
+        if row is None:
+            async with db.execute(f"SELECT {_PLAYER_COLUMNS} FROM players WHERE user_id = ?", (user_id,)) as cur:
+                row = await cur.fetchone()
+    if row is None:
+        return None
+    _players.add(user_id)
+    return _player_from_row(row)
 
 
 async def update_username(user_id: int, new_username: str) -> bool:
     """Update player username"""
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         await db.execute(
             "UPDATE players SET username = ? WHERE user_id = ?", (new_username, user_id)
         )
@@ -314,7 +635,7 @@ async def update_player_balance(
     target_user_id: Optional[int] = None,
 ) -> bool:
     """Update player balance and log transaction"""
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         await db.execute(
             "UPDATE players SET balance = balance + ? WHERE user_id = ?",
             (amount, user_id),
@@ -341,7 +662,7 @@ async def set_player_balance(user_id: int, new_balance: int, admin_id: int) -> b
     player = await get_player(user_id)
     old_balance = player["balance"] if player else 0
 
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         await db.execute(
             "UPDATE players SET balance = ? WHERE user_id = ?", (new_balance, user_id)
         )
@@ -361,7 +682,7 @@ async def set_player_balance(user_id: int, new_balance: int, admin_id: int) -> b
 
 async def add_power(user_id: int, amount: int) -> bool:
     """Add power to player"""
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         await db.execute(
             "UPDATE players SET power = power + ? WHERE user_id = ?", (amount, user_id)
         )
@@ -371,7 +692,7 @@ async def add_power(user_id: int, amount: int) -> bool:
 
 async def set_power(user_id: int, new_power: int, admin_id: int) -> bool:
     """Set player power to a specific value"""
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         await db.execute(
             "UPDATE players SET power = ? WHERE user_id = ?", (new_power, user_id)
         )
@@ -388,7 +709,7 @@ async def add_magnesia(
     user_id: int, amount: int, admin_id: Optional[int] = None
 ) -> bool:
     """Add magnesia to player"""
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         await db.execute(
             "UPDATE players SET magnesia = magnesia + ? WHERE user_id = ?",
             (amount, user_id),
@@ -414,7 +735,7 @@ async def update_dumbbell_level(
     user_id: int, new_level: int, dumbbell_name: str
 ) -> bool:
     """Update player dumbbell level"""
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         await db.execute(
             "UPDATE players SET dumbbell_level = ?, dumbbell_name = ? WHERE user_id = ?",
             (new_level, dumbbell_name, user_id),
@@ -430,7 +751,7 @@ async def set_dumbbell_level(user_id: int, new_level: int, admin_id: int) -> boo
 
     dumbbell_info = settings.DUMBBELL_LEVELS[new_level]
 
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         await db.execute(
             "UPDATE players SET dumbbell_level = ?, dumbbell_name = ? WHERE user_id = ?",
             (new_level, dumbbell_info["name"], user_id),
@@ -458,10 +779,10 @@ async def set_dumbbell_level(user_id: int, new_level: int, admin_id: int) -> boo
 
 async def update_dumbbell_use_time(user_id: int) -> bool:
     """Update the last dumbbell use time"""
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         await db.execute(
             "UPDATE players SET last_dumbbell_use = ? WHERE user_id = ?",
-            (datetime.now().isoformat(), user_id),
+            (now_ts(), user_id),
         )
         await db.commit()
     return True
@@ -469,7 +790,7 @@ async def update_dumbbell_use_time(user_id: int) -> bool:
 
 async def increment_total_lifts(user_id: int) -> bool:
     """Increment total lifts counter"""
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         await db.execute(
             "UPDATE players SET total_lifts = total_lifts + 1 WHERE user_id = ?",
             (user_id,),
@@ -480,7 +801,7 @@ async def increment_total_lifts(user_id: int) -> bool:
 
 async def set_total_lifts(user_id: int, new_total: int, admin_id: int) -> bool:
     """Set total lifts to a specific value"""
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         await db.execute(
             "UPDATE players SET total_lifts = ? WHERE user_id = ?", (new_total, user_id)
         )
@@ -502,7 +823,7 @@ async def set_custom_income(
     user_id: int, custom_income: Optional[int], admin_id: int
 ) -> bool:
     """Set custom income for player"""
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         await db.execute(
             "UPDATE players SET custom_income = ? WHERE user_id = ?",
             (custom_income, user_id),
@@ -521,27 +842,40 @@ async def set_custom_income(
     return True
 
 
+# Доход бизнесов, накопленный к :now, для UPDATE players, см. bot.income
+_OWED_MAGNESIA_SQL, _MAGNESIA_ACCRUED_AT_SQL = accrual_sql(":now", ":earliest")
+
+
+def _accrual_params() -> Dict[str, int]:
+    now = now_ts()
+    return {"now": now, "earliest": earliest_accrual(now)}
+
+
 async def buy_business(
     user_id: int, business_id: int, business_info: Dict[str, Any]
 ) -> bool:
     """Buy a business for player"""
-    async with aiosqlite.connect(settings.database_path) as db:
-        if business_info["currency"] == "монет":
-            await db.execute(
-                "UPDATE players SET balance = balance - ? WHERE user_id = ?",
-                (business_info["base_price"], user_id),
-            )
-        else:
-            await db.execute(
-                "UPDATE players SET magnesia = magnesia - ? WHERE user_id = ?",
-                (business_info["base_price"], user_id),
-            )
-
-        column = f"business_{business_id}_level"
+    price = business_info["base_price"]
+    coins = price if business_info["currency"] == "монет" else 0
+    column = f"business_{business_id}_level"
+    async with connect() as db:
+        # Накопленное по прежнему доходу зачисляется тем же запросом, что меняет доход
         await db.execute(
-            f"UPDATE players SET {column} = 1 WHERE user_id = ?", (user_id,)
+            f"""UPDATE players SET
+                    balance = balance - :coins,
+                    magnesia = magnesia + {_OWED_MAGNESIA_SQL} - :magnesia,
+                    magnesia_accrued_at = {_MAGNESIA_ACCRUED_AT_SQL},
+                    magnesia_per_hour = magnesia_per_hour + :income,
+                    {column} = 1
+                WHERE user_id = :user_id""",
+            {
+                "coins": coins,
+                "magnesia": price - coins,
+                "income": business_info["base_income"],
+                "user_id": user_id,
+                **_accrual_params(),
+            },
         )
-
         await db.commit()
     return True
 
@@ -555,6 +889,7 @@ async def upgrade_business(
         return False
 
     upgrades_column = f"business_{business_id}_upgrades"
+    level_column = f"business_{business_id}_level"
     current_upgrades = player[upgrades_column]
 
     if str(upgrade_num) not in current_upgrades:
@@ -562,46 +897,40 @@ async def upgrade_business(
     else:
         current_upgrades[str(upgrade_num)] += 1
 
-    async with aiosqlite.connect(settings.database_path) as db:
+    level_up = sum(1 for v in current_upgrades.values() if v > 0) >= 5
+    if level_up:
+        for key in current_upgrades:
+            current_upgrades[key] = 0
+
+    business_info = settings.BUSINESSES[business_id]
+    coins = price if business_info["upgrade_currency"] == "монет" else 0
+    async with connect() as db:
         await db.execute(
-            f"UPDATE players SET {upgrades_column} = ? WHERE user_id = ?",
-            (json.dumps(current_upgrades), user_id),
+            f"""UPDATE players SET
+                    {upgrades_column} = :upgrades,
+                    balance = balance - :coins,
+                    magnesia = magnesia + {_OWED_MAGNESIA_SQL} - :magnesia,
+                    magnesia_accrued_at = {_MAGNESIA_ACCRUED_AT_SQL},
+                    magnesia_per_hour = magnesia_per_hour + :income,
+                    {level_column} = {level_column} + :levels
+                WHERE user_id = :user_id""",
+            {
+                "upgrades": json.dumps(current_upgrades),
+                "coins": coins,
+                "magnesia": price - coins,
+                "income": business_info["income_increase"] if level_up else 0,
+                "levels": 1 if level_up else 0,
+                "user_id": user_id,
+                **_accrual_params(),
+            },
         )
-
-        business_info = settings.BUSINESSES[business_id]
-        if business_info["upgrade_currency"] == "монет":
-            await db.execute(
-                "UPDATE players SET balance = balance - ? WHERE user_id = ?",
-                (price, user_id),
-            )
-        else:
-            await db.execute(
-                "UPDATE players SET magnesia = magnesia - ? WHERE user_id = ?",
-                (price, user_id),
-            )
-
-        level_column = f"business_{business_id}_level"
-        completed_upgrades = sum(1 for v in current_upgrades.values() if v > 0)
-
-        if completed_upgrades >= 5:
-            await db.execute(
-                f"UPDATE players SET {level_column} = {level_column} + 1 WHERE user_id = ?",
-                (user_id,),
-            )
-            for key in current_upgrades:
-                current_upgrades[key] = 0
-            await db.execute(
-                f"UPDATE players SET {upgrades_column} = ? WHERE user_id = ?",
-                (json.dumps(current_upgrades), user_id),
-            )
-
         await db.commit()
     return True
 
 
 async def make_admin(user_id: int, admin_id: int, admin_level: int = 1) -> str:
     """Make a player an admin"""
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         async with db.execute(
             'SELECT MAX(CAST(admin_id AS INTEGER)) FROM players WHERE admin_id IS NOT NULL AND admin_id != ""'
         ) as cur:
@@ -616,7 +945,7 @@ async def make_admin(user_id: int, admin_id: int, admin_level: int = 1) -> str:
             """UPDATE players 
                SET admin_level = ?, admin_since = ?, admin_id = ?
                WHERE user_id = ?""",
-            (admin_level, datetime.now().isoformat(), str(new_admin_id), user_id),
+            (admin_level, now_ts(), str(new_admin_id), user_id),
         )
 
         await db.execute(
@@ -631,6 +960,7 @@ async def make_admin(user_id: int, admin_id: int, admin_level: int = 1) -> str:
         )
 
         await db.commit()
+    _admins.set(user_id, admin_level)
     return str(new_admin_id)
 
 
@@ -640,7 +970,7 @@ async def remove_admin(user_id: int, admin_id: int) -> bool:
     if not player_data:
         return False
 
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         await db.execute(
             """UPDATE players 
                SET admin_level = 0, admin_nickname = NULL, admin_since = NULL, admin_id = NULL,
@@ -662,12 +992,13 @@ async def remove_admin(user_id: int, admin_id: int) -> bool:
         )
 
         await db.commit()
+    _admins.discard(user_id)
     return True
 
 
 async def set_admin_nickname(user_id: int, nickname: str) -> bool:
     """Set admin nickname"""
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         await db.execute(
             "UPDATE players SET admin_nickname = ? WHERE user_id = ?",
             (nickname, user_id),
@@ -676,14 +1007,54 @@ async def set_admin_nickname(user_id: int, nickname: str) -> bool:
     return True
 
 
+async def load_bans() -> None:
+    """Load banned players and their ban expiry times into memory"""
+    async with connect() as db:
+        async with db.execute("SELECT user_id, ban_until FROM players WHERE is_banned = 1") as cur:
+            rows = await cur.fetchall()
+    _bans.load(rows)
+
+
+async def is_banned(user_id: int) -> bool:
+    """Check the in-memory ban registry; expired bans are not counted"""
+    if not _bans.loaded:
+        await load_bans()
+    return _bans.contains(user_id)
+
+
+def pop_expired_bans(now: Optional[float] = None) -> List[int]:
+    """Remove bans that expired by now from memory and return their user ids"""
+    return _bans.pop_expired(now)
+
+
+async def unban_expired_players(user_ids: List[int]) -> int:
+    """Lift expired bans in the database in one transaction"""
+    if not user_ids:
+        return 0
+    now = now_ts()
+    async with connect() as db:
+        await db.executemany(
+            """UPDATE players SET is_banned = 0, ban_reason = NULL, ban_until = NULL
+               WHERE user_id = ? AND is_banned = 1 AND ban_until IS NOT NULL AND ban_until <= ?""",
+            [(user_id, now) for user_id in user_ids],
+        )
+        await db.executemany(
+            """INSERT INTO admin_actions (admin_id, action_type, target_user_id, details) 
+               VALUES (?, ?, ?, ?)""",
+            [(0, "unban", user_id, "Автоматический разбан: срок истёк") for user_id in user_ids],
+        )
+        await db.commit()
+    return len(user_ids)
+
+
 async def ban_player(user_id: int, days: int, reason: str, admin_id: int) -> bool:
     """Ban a player"""
     if days == 0:
         ban_until = None
     else:
-        ban_until = (datetime.now() + timedelta(days=days)).isoformat()
+        ban_until = days_from_now(days)
 
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         await db.execute(
             "UPDATE players SET is_banned = 1, ban_reason = ?, ban_until = ? WHERE user_id = ?",
             (reason, ban_until, user_id),
@@ -696,12 +1067,13 @@ async def ban_player(user_id: int, days: int, reason: str, admin_id: int) -> boo
         )
 
         await db.commit()
+    _bans.add(user_id, ban_until)
     return True
 
 
 async def unban_player(user_id: int, admin_id: int) -> bool:
     """Unban a player"""
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         await db.execute(
             "UPDATE players SET is_banned = 0, ban_reason = NULL, ban_until = NULL WHERE user_id = ?",
             (user_id,),
@@ -712,6 +1084,7 @@ async def unban_player(user_id: int, admin_id: int) -> bool:
             (admin_id, "unban", user_id, "Разбан игрока"),
         )
         await db.commit()
+    _bans.discard(user_id)
     return True
 
 
@@ -721,7 +1094,9 @@ async def delete_player(user_id: int, admin_id: int) -> bool:
     if not player_data:
         return False
 
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
+        if player_data["clan_id"]:
+            await _remove_clan_member(db, user_id, player_data["clan_id"])
         await db.execute("DELETE FROM transactions WHERE user_id = ?", (user_id,))
         await db.execute("DELETE FROM dumbbell_uses WHERE user_id = ?", (user_id,))
         await db.execute("DELETE FROM players WHERE user_id = ?", (user_id,))
@@ -738,6 +1113,9 @@ async def delete_player(user_id: int, admin_id: int) -> bool:
         )
 
         await db.commit()
+    _admins.discard(user_id)
+    _bans.discard(user_id)
+    _players.discard(user_id)
     return True
 
 
@@ -745,7 +1123,7 @@ async def log_dumbbell_use(
     user_id: int, dumbbell_level: int, income: int, power_gained: int
 ) -> bool:
     """Log dumbbell use"""
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         await db.execute(
             """INSERT INTO dumbbell_uses (user_id, dumbbell_level, income, power_gained) 
                VALUES (?, ?, ?, ?)""",
@@ -767,7 +1145,7 @@ async def increment_admin_stat(user_id: int, stat_name: str) -> bool:
 
     if stat_name in stats_map:
         column = stats_map[stat_name]
-        async with aiosqlite.connect(settings.database_path) as db:
+        async with connect() as db:
             await db.execute(
                 f"UPDATE players SET {column} = {column} + 1 WHERE user_id = ?",
                 (user_id,),
@@ -778,7 +1156,7 @@ async def increment_admin_stat(user_id: int, stat_name: str) -> bool:
 
 async def get_top_balance(limit: int = 10) -> List[Tuple]:
     """Get top players by balance"""
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect_replica() as db:
         async with db.execute(
             "SELECT user_id, username, balance, dumbbell_name FROM players WHERE is_banned = 0 ORDER BY balance DESC LIMIT ?",
             (limit,),
@@ -788,7 +1166,7 @@ async def get_top_balance(limit: int = 10) -> List[Tuple]:
 
 async def get_top_lifts(limit: int = 10) -> List[Tuple]:
     """Get top players by total lifts"""
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect_replica() as db:
         async with db.execute(
             "SELECT user_id, username, total_lifts, dumbbell_name FROM players WHERE is_banned = 0 ORDER BY total_lifts DESC LIMIT ?",
             (limit,),
@@ -798,7 +1176,7 @@ async def get_top_lifts(limit: int = 10) -> List[Tuple]:
 
 async def get_top_earners(limit: int = 10) -> List[Tuple]:
     """Get top players by total earned"""
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect_replica() as db:
         async with db.execute(
             "SELECT user_id, username, dumbbell_name, dumbbell_level, total_earned FROM players WHERE is_banned = 0 ORDER BY total_earned DESC LIMIT ?",
             (limit,),
@@ -821,12 +1199,12 @@ async def create_promo_code(
 ) -> bool:
     """Create a promo code"""
     if expires_days:
-        expires_at = (datetime.now() + timedelta(days=expires_days)).isoformat()
+        expires_at = days_from_now(expires_days)
     else:
         expires_at = None
 
     try:
-        async with aiosqlite.connect(settings.database_path) as db:
+        async with connect() as db:
             await db.execute(
                 """
                 INSERT INTO promo_codes (code, uses_total, uses_left, reward_type, reward_amount, created_by, expires_at)
@@ -864,7 +1242,7 @@ async def create_promo_code(
 
 async def delete_promo_code(code: str, admin_id: int) -> bool:
     """Delete a promo code"""
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         async with db.execute(
             "SELECT code FROM promo_codes WHERE code = ?", (code,)
         ) as cur:
@@ -889,7 +1267,7 @@ async def delete_promo_code(code: str, admin_id: int) -> bool:
 
 async def get_promo_info(code: str) -> Optional[Dict[str, Any]]:
     """Get promo code information"""
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         async with db.execute(
             """
             SELECT code, uses_total, uses_left, reward_type, reward_amount, 
@@ -928,15 +1306,14 @@ async def use_promo_code(user_id: int, code: str) -> Dict[str, Any]:
 
     # Check expiration
     if promo_info["expires_at"]:
-        expires_at = datetime.fromisoformat(promo_info["expires_at"])
-        if datetime.now() > expires_at:
+        if now_ts() > promo_info["expires_at"]:
             return {"success": False, "error": "Срок действия промокода истек"}
 
     # Check remaining uses
     if promo_info["uses_left"] <= 0:
         return {"success": False, "error": "Лимит использований исчерпан"}
 
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         # Check if player already used this promo
         async with db.execute(
             "SELECT used_promo_codes FROM players WHERE user_id = ?", (user_id,)
@@ -992,7 +1369,7 @@ async def use_promo_code(user_id: int, code: str) -> Dict[str, Any]:
 
 async def get_all_promo_codes() -> List[Dict[str, Any]]:
     """Get all promo codes"""
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         async with db.execute("""
             SELECT code, uses_total, uses_left, reward_type, reward_amount, 
                    created_at, expires_at, is_active
@@ -1024,7 +1401,7 @@ async def get_all_promo_codes() -> List[Dict[str, Any]]:
 
 async def create_clan(tag: str, name: str, owner_id: int) -> Dict[str, Any]:
     """Create a clan"""
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         # Check tag uniqueness
         async with db.execute(
             "SELECT id FROM clans WHERE tag = ?", (tag.upper(),)
@@ -1052,8 +1429,8 @@ async def create_clan(tag: str, name: str, owner_id: int) -> Dict[str, Any]:
         try:
             # Create clan
             SQL_CREATE_CLAN = """
-                INSERT INTO clans (tag, name, owner_id, level, treasury)
-                VALUES (?, ?, ?, 1, 0)
+                INSERT INTO clans (tag, name, owner_id, level, treasury, member_count)
+                VALUES (?, ?, ?, 1, 0, 1)
             """
             async with db.execute(
                 SQL_CREATE_CLAN, (tag.upper(), name, owner_id)
@@ -1087,11 +1464,11 @@ async def create_clan(tag: str, name: str, owner_id: int) -> Dict[str, Any]:
 
 async def get_clan_by_tag(tag: str) -> Optional[Dict[str, Any]]:
     """Get clan by tag"""
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         async with db.execute(
             """
             SELECT id, tag, name, owner_id, level, treasury, created_at,
-                   total_income_per_hour, total_lifts
+                   total_income_per_hour, total_lifts, member_count
             FROM clans WHERE tag = ?
         """,
             (tag.upper(),),
@@ -1109,17 +1486,18 @@ async def get_clan_by_tag(tag: str) -> Optional[Dict[str, Any]]:
                 "created_at": row[6],
                 "total_income_per_hour": row[7],
                 "total_lifts": row[8],
+                "member_count": row[9],
             }
         return None
 
 
 async def get_clan_by_id(clan_id: int) -> Optional[Dict[str, Any]]:
     """Get clan by ID"""
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         async with db.execute(
             """
             SELECT id, tag, name, owner_id, level, treasury, created_at,
-                   total_income_per_hour, total_lifts
+                   total_income_per_hour, total_lifts, member_count
             FROM clans WHERE id = ?
         """,
             (clan_id,),
@@ -1137,13 +1515,14 @@ async def get_clan_by_id(clan_id: int) -> Optional[Dict[str, Any]]:
                 "created_at": row[6],
                 "total_income_per_hour": row[7],
                 "total_lifts": row[8],
+                "member_count": row[9],
             }
         return None
 
 
 async def get_player_clan(user_id: int) -> Optional[Dict[int, Any]]:
     """Get player's clan"""
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         async with db.execute(
             "SELECT clan_id FROM players WHERE user_id = ?", (user_id,)
         ) as cur:
@@ -1154,26 +1533,31 @@ async def get_player_clan(user_id: int) -> Optional[Dict[int, Any]]:
         return None
 
 
-async def get_clan_members(clan_id: int, limit: int = 100) -> List[Dict[str, Any]]:
-    """Get clan members"""
-    async with aiosqlite.connect(settings.database_path) as db:
-        async with db.execute(
-            """
-            SELECT cm.user_id, p.username, cm.role, cm.contributions, cm.joined_at
-            FROM clan_members cm
-            JOIN players p ON cm.user_id = p.user_id
-            WHERE cm.clan_id = ?
-            ORDER BY 
-                CASE cm.role 
-                    WHEN 'owner' THEN 1
-                    WHEN 'officer' THEN 2
-                    ELSE 3 
-                END,
-                cm.contributions DESC
-            LIMIT ?
-        """,
-            (clan_id, limit),
-        ) as cur:
+async def get_clan_members(
+    clan_id: int, limit: int = 100, after: Optional[Tuple[str, int, int]] = None
+) -> List[Dict[str, Any]]:
+    """Get clan members: owner, officers, then members by contributions.
+
+    Pages are keyset-based: after is (role, contributions, user_id) of the
+    last member of the previous page.
+    """
+    # 'owner' > 'officer' > 'member', поэтому role DESC даёт тот же порядок,
+    # что и CASE по ролям, но идёт по индексу idx_clan_members_order
+    SQL = """
+        SELECT cm.user_id, p.username, cm.role, cm.contributions, cm.joined_at
+        FROM clan_members cm
+        JOIN players p ON cm.user_id = p.user_id
+        WHERE cm.clan_id = ?
+    """
+    params: List[Any] = [clan_id]
+    if after is not None:
+        SQL += " AND (cm.role, cm.contributions, cm.user_id) < (?, ?, ?)"
+        params.extend(after)
+    SQL += " ORDER BY cm.role DESC, cm.contributions DESC, cm.user_id DESC LIMIT ?"
+    params.append(limit)
+
+    async with connect() as db:
+        async with db.execute(SQL, params) as cur:
             rows = await cur.fetchall()
 
     members = []
@@ -1192,7 +1576,7 @@ async def get_clan_members(clan_id: int, limit: int = 100) -> List[Dict[str, Any
 
 async def get_member_clan_role(user_id: int, clan_id: int):
     """Get player's clan"""
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         async with db.execute(
             "SELECT role FROM clan_members WHERE user_id = ? AND clan_id = ?", (user_id, clan_id)
         ) as cur:
@@ -1202,12 +1586,68 @@ async def get_member_clan_role(user_id: int, clan_id: int):
 
 async def get_clan_member_count(clan_id: int) -> int:
     """Get clan member count"""
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         async with db.execute(
-            "SELECT COUNT(*) FROM clan_members WHERE clan_id = ?", (clan_id,)
+            "SELECT member_count FROM clans WHERE id = ?", (clan_id,)
         ) as cur:
             result = await cur.fetchone()
-    return result[0]
+    return result[0] if result else 0
+
+
+async def join_clan(clan_id: int, user_id: int, role: str = "member") -> Dict[str, Any]:
+    """Add a player to a clan"""
+    async with connect() as db:
+        async with db.execute(
+            "SELECT clan_id FROM players WHERE user_id = ?", (user_id,)
+        ) as cur:
+            player_data = await cur.fetchone()
+
+        if not player_data:
+            return {"success": False, "error": "Игрок не найден"}
+        if player_data[0]:
+            return {"success": False, "error": "Вы уже состоите в клане"}
+
+        async with db.execute(
+            "UPDATE clans SET member_count = member_count + 1 WHERE id = ?", (clan_id,)
+        ) as cur:
+            if cur.rowcount == 0:
+                return {"success": False, "error": "Клан не найден"}
+
+        await db.execute(
+            "INSERT INTO clan_members (clan_id, user_id, role, contributions) VALUES (?, ?, ?, 0)",
+            (clan_id, user_id, role),
+        )
+        await db.execute(
+            "UPDATE players SET clan_id = ? WHERE user_id = ?", (clan_id, user_id)
+        )
+        await db.commit()
+    return {"success": True, "clan_id": clan_id}
+
+
+async def leave_clan(user_id: int) -> Dict[str, Any]:
+    """Remove a player from their clan; the owner can't leave"""
+    async with connect() as db:
+        async with db.execute(
+            "SELECT clan_id, role FROM clan_members WHERE user_id = ?", (user_id,)
+        ) as cur:
+            member = await cur.fetchone()
+
+        if not member:
+            return {"success": False, "error": "Вы не состоите в клане"}
+        if member[1] == "owner":
+            return {"success": False, "error": "Владелец не может покинуть клан"}
+
+        await _remove_clan_member(db, user_id, member[0])
+        await db.commit()
+    return {"success": True, "clan_id": member[0]}
+
+
+async def _remove_clan_member(db: aiosqlite.Connection, user_id: int, clan_id: int) -> None:
+    await db.execute("DELETE FROM clan_members WHERE user_id = ?", (user_id,))
+    await db.execute("UPDATE players SET clan_id = NULL WHERE user_id = ?", (user_id,))
+    await db.execute(
+        "UPDATE clans SET member_count = member_count - 1 WHERE id = ?", (clan_id,)
+    )
 
 
 async def deposit_to_clan_treasury(user_id: int, amount: int) -> Dict[str, Any]:
@@ -1223,7 +1663,7 @@ async def deposit_to_clan_treasury(user_id: int, amount: int) -> Dict[str, Any]:
         return {"success": False, "error": "Сумма должна быть положительной"}
 
     try:
-        async with aiosqlite.connect(settings.database_path) as db:
+        async with connect() as db:
             # Deduct from player
             await db.execute(
                 "UPDATE players SET balance = balance - ? WHERE user_id = ?",
@@ -1282,7 +1722,7 @@ async def upgrade_clan(clan_id: int) -> Dict[str, Any]:
         }
 
     try:
-        async with aiosqlite.connect(settings.database_path) as db:
+        async with connect() as db:
             # Deduct from treasury
             await db.execute(
                 "UPDATE clans SET treasury = treasury - ?, level = level + 1 WHERE id = ?",
@@ -1312,47 +1752,53 @@ async def upgrade_clan(clan_id: int) -> Dict[str, Any]:
         return {"success": False, "error": f"Ошибка при улучшении клана: {str(e)}"}
 
 
-async def get_clan_treasury_log(clan_id: int, limit: int = 10) -> List[Dict[str, Any]]:
-    """Get clan treasury log"""
-    async with aiosqlite.connect(settings.database_path) as db:
-        async with db.execute(
-            """
-            SELECT ctl.action_type, ctl.amount, ctl.description, ctl.created_at, p.username
-            FROM clan_treasury_log ctl
-            LEFT JOIN players p ON ctl.user_id = p.user_id
-            WHERE ctl.clan_id = ?
-            ORDER BY ctl.created_at DESC
-            LIMIT ?
-        """,
-            (clan_id, limit),
-        ) as cur:
+async def get_clan_treasury_log(
+    clan_id: int, limit: int = 10, before: Optional[Tuple[int, int]] = None
+) -> List[Dict[str, Any]]:
+    """Get clan treasury log, newest first.
+
+    before is (created_at, id) of the last entry of the previous page.
+    """
+    SQL = """
+        SELECT ctl.id, ctl.action_type, ctl.amount, ctl.description, ctl.created_at, p.username
+        FROM clan_treasury_log ctl
+        LEFT JOIN players p ON ctl.user_id = p.user_id
+        WHERE ctl.clan_id = ?
+    """
+    params: List[Any] = [clan_id]
+    if before is not None:
+        SQL += " AND (ctl.created_at, ctl.id) < (?, ?)"
+        params.extend(before)
+    SQL += " ORDER BY ctl.created_at DESC, ctl.id DESC LIMIT ?"
+    params.append(limit)
+
+    async with connect() as db:
+        async with db.execute(SQL, params) as cur:
             rows = await cur.fetchall()
 
     log = []
     for row in rows:
         log.append(
             {
-                "action_type": row[0],
-                "amount": row[1],
-                "description": row[2],
-                "created_at": row[3],
-                "username": row[4],
+                "id": row[0],
+                "action_type": row[1],
+                "amount": row[2],
+                "description": row[3],
+                "created_at": row[4],
+                "username": row[5],
             }
         )
     return log
 
 
 async def get_top_clans(limit: int = 10) -> List[Dict[str, Any]]:
-    """Get top clans"""
-    async with aiosqlite.connect(settings.database_path) as db:
+    """Get top clans by income per hour, then treasury"""
+    async with connect() as db:
         async with db.execute(
             """
-            SELECT c.tag, c.name, c.level, c.treasury, c.total_income_per_hour,
-                   COUNT(cm.id) as member_count
-            FROM clans c
-            LEFT JOIN clan_members cm ON c.id = cm.clan_id
-            GROUP BY c.id
-            ORDER BY c.total_income_per_hour DESC, c.treasury DESC
+            SELECT id, tag, name, level, treasury, total_income_per_hour, member_count
+            FROM clans
+            ORDER BY total_income_per_hour DESC, treasury DESC
             LIMIT ?
         """,
             (limit,),
@@ -1363,12 +1809,13 @@ async def get_top_clans(limit: int = 10) -> List[Dict[str, Any]]:
     for row in rows:
         clans.append(
             {
-                "tag": row[0],
-                "name": row[1],
-                "level": row[2],
-                "treasury": row[3],
-                "total_income_per_hour": row[4],
-                "member_count": row[5] or 0,
+                "id": row[0],
+                "tag": row[1],
+                "name": row[2],
+                "level": row[3],
+                "treasury": row[4],
+                "total_income_per_hour": row[5],
+                "member_count": row[6] or 0,
             }
         )
     return clans
@@ -1381,18 +1828,15 @@ async def delete_clan(tag: str, admin_id: int) -> Dict[str, Any]:
         return {"success": False, "error": "Клан не найден"}
 
     try:
-        async with aiosqlite.connect(settings.database_path) as db:
-            # Get all clan members
-            async with db.execute(
-                "SELECT user_id FROM clan_members WHERE clan_id = ?", (clan["id"],)
-            ) as cur:
-                members = await cur.fetchall()
-
+        async with connect() as db:
             # Reset clan_id for all members
-            for member in members:
-                await db.execute(
-                    "UPDATE players SET clan_id = NULL WHERE user_id = ?", (member[0],)
-                )
+            await db.execute(
+                """
+                UPDATE players SET clan_id = NULL
+                WHERE user_id IN (SELECT user_id FROM clan_members WHERE clan_id = ?)
+            """,
+                (clan["id"],),
+            )
 
             # Delete members
             await db.execute(
@@ -1425,7 +1869,7 @@ async def delete_clan(tag: str, admin_id: int) -> Dict[str, Any]:
             return {
                 "success": True,
                 "clan_name": clan["name"],
-                "member_count": len(members),
+                "member_count": clan["member_count"],
             }
     except Exception as e:
         return {"success": False, "error": f"Ошибка при удалении клана: {str(e)}"}
@@ -1439,7 +1883,7 @@ async def update_clan_name(tag: str, new_name: str, admin_id: int) -> Dict[str,
 
     try:
         old_name = clan["name"]
-        async with aiosqlite.connect(settings.database_path) as db:
+        async with connect() as db:
             await db.execute(
                 "UPDATE clans SET name = ? WHERE id = ?", (new_name, clan["id"])
             )
@@ -1479,7 +1923,7 @@ async def get_players_with_businesses():
           AND clan_id IS NOT NULL
     """
 
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         async with db.execute(SQL_BUSINESS_PLAYERS) as cur:
             players = await cur.fetchall()
     return players
@@ -1491,7 +1935,7 @@ async def add_treasury(clan_id, amount: int, add_total_lifts: bool = False) -> N
         SQL_TREASURY_LOG += ", total_lifts = total_lifts + 1"
     SQL_TREASURY_LOG += " WHERE id = ?"
 
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         await db.execute(SQL_TREASURY_LOG, (amount, clan_id))
         await db.commit()
 
@@ -1502,7 +1946,7 @@ async def subtract_treasury(clan_id, amount: int, subtract_total_lifts: bool = F
         SQL_TREASURY_LOG += ", total_lifts = total_lifts - 1"
     SQL_TREASURY_LOG += " WHERE id = ?"
 
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         await db.execute(SQL_TREASURY_LOG, (amount, clan_id))
         await db.commit()
 
@@ -1515,7 +1959,7 @@ async def log_collection(
         VALUES (?, ?, ?, ?)
     """
 
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         await db.execute(SQL_TREASURY_LOG, (clan_id, action_type, amount, description))
         await db.commit()
 
@@ -1528,7 +1972,7 @@ async def log_collection_with_user(
         VALUES (?, ?, ?, ?, ?)
     """
 
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         await db.execute(
             SQL_TREASURY_LOG, (clan_id, user_id, action_type, amount, description)
         )
@@ -1547,7 +1991,7 @@ async def count_players(regular_only: bool = True, unbanned_only: bool = False)
         if unbanned_only:
             SQL_COUNT_PLAYERS += "is_banned = 0 "
 
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect_replica() as db:
         async with db.execute(SQL_COUNT_PLAYERS) as cur:
             result = await cur.fetchone()
             return 0 if not result else 0 if not result[0] else result[0]
@@ -1557,7 +2001,7 @@ async def count_banned_players() -> int:
     SQL_COUNT_BANNED = "SELECT COUNT(*) FROM players WHERE is_banned = 1"
     # TODO: Better approach?
 
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect_replica() as db:
         async with db.execute(SQL_COUNT_BANNED) as cur:
             result = await cur.fetchone()
             return 0 if not result else 0 if not result[0] else result[0]
@@ -1566,7 +2010,7 @@ async def count_banned_players() -> int:
 async def count_admins() -> int:
     SQL_COUNT_BANNED = "SELECT COUNT(*) FROM players WHERE admin_level > 0"
 
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect_replica() as db:
         async with db.execute(SQL_COUNT_BANNED) as cur:
             result = await cur.fetchone()
             return 0 if not result else 0 if not result[0] else result[0]
@@ -1575,7 +2019,7 @@ async def count_admins() -> int:
 async def count_clans() -> int:
     SQL_COUNT_CLANS = "SELECT COUNT(*) FROM clans"
 
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect_replica() as db:
         async with db.execute(SQL_COUNT_CLANS) as cur:
             result = await cur.fetchone()
             return 0 if not result else 0 if not result[0] else result[0]
@@ -1584,7 +2028,7 @@ async def count_clans() -> int:
 async def count_total_balance() -> int:
     SQL_COUNT_BALANCE = "SELECT SUM(balance) FROM players WHERE admin_level = 0"
 
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect_replica() as db:
         async with db.execute(SQL_COUNT_BALANCE) as cur:
             result = await cur.fetchone()
             return 0 if not result else 0 if not result[0] else result[0]
@@ -1597,7 +2041,7 @@ async def count_promo_uses(code: str, limit: int = 0):
     if limit > 0:
         SQL += f" LIMIT {limit}"
 
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect() as db:
         async with db.execute(SQL, (code,)) as cur:
             if limit > 0:
                 result = await cur.fetchall()
@@ -1610,16 +2054,54 @@ async def count_promo_uses(code: str, limit: int = 0):
 async def sum_promo_uses() -> int:
     SQL = "SELECT SUM(uses_total - uses_left) FROM promo_codes"
 
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect_replica() as db:
         async with db.execute(SQL) as cur:
             result = await cur.fetchone()
             return 0 if not result else 0 if not result[0] else result[0]
 
 
+async def get_recently_active_player_ids(limit: int = 1000) -> List[int]:
+    """Get ids of players who lifted most recently and remember them as known players"""
+    async with connect() as db:
+        async with db.execute(
+            "SELECT user_id FROM players ORDER BY last_dumbbell_use DESC LIMIT ?", (limit,)
+        ) as cur:
+            user_ids = [row[0] for row in await cur.fetchall()]
+    for user_id in user_ids:
+        _players.add(user_id)
+    return user_ids
+
+
+async def get_unnamed_player_ids(after_user_id: int = 0, limit: int = 1000) -> List[int]:
+    """Get ids of players whose username is still their id, in user_id order after after_user_id"""
+    async with connect() as db:
+        async with db.execute(
+            """SELECT user_id FROM players
+               WHERE user_id > ? AND username = CAST(user_id AS TEXT)
+               ORDER BY user_id LIMIT ?""",
+            (after_user_id, limit),
+        ) as cur:
+            return [row[0] for row in await cur.fetchall()]
+
+
+async def set_usernames(names: List[Tuple[int, str]]) -> int:
+    """Rename players whose username is still their id, in one transaction; returns renamed count"""
+    if not names:
+        return 0
+    async with connect() as db:
+        # Ник, сменённый через /гник, пока шла выгрузка имён, не трогаем
+        cursor = await db.executemany(
+            "UPDATE players SET username = ? WHERE user_id = ? AND username = CAST(user_id AS TEXT)",
+            [(username, user_id) for user_id, username in names],
+        )
+        await db.commit()
+        return cursor.rowcount
+
+
 async def get_recent_players(limit: int = 5):
     SQL = "SELECT username, created_at FROM players ORDER BY created_at DESC LIMIT ?"
 
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect_replica() as db:
         async with db.execute(SQL, (limit,)) as cur:
             return await cur.fetchall()
 
@@ -1627,7 +2109,7 @@ async def get_recent_players(limit: int = 5):
 async def sum_column(table: str, column: str) -> int:
     SQL = f"SELECT SUM({column}) FROM {table}"
 
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect_replica() as db:
         async with db.execute(SQL) as cur:
             result = await cur.fetchone()
             return 0 if not result else 0 if not result[0] else result[0]
@@ -1636,26 +2118,60 @@ async def sum_column(table: str, column: str) -> int:
 async def count_table_rows(table: str) -> int:
     SQL = f"SELECT COUNT(*) FROM {table}"
 
-    async with aiosqlite.connect(settings.database_path) as db:
+    async with connect_replica() as db:
         async with db.execute(SQL) as cur:
             result = await cur.fetchone()
             return 0 if not result else 0 if not result[0] else result[0]
 
 
-async def reset_all() -> None:
-    async with aiosqlite.connect(settings.database_path) as db:
-        # Удаляем обычных игроков
-        await db.execute("DELETE FROM players WHERE admin_level = 0")
+# Таблицы, которые очищает сброс сезона, и какие строки в них удаляются
+SEASON_RESET_TABLES: List[Tuple[str, str]] = [
+    ("players", "admin_level = 0"),
+    ("clans", "1 = 1"),
+    ("transactions", "1 = 1"),
+    ("dumbbell_uses", "1 = 1"),
+    ("promo_uses", "1 = 1"),
+    ("clan_members", "1 = 1"),
+    ("clan_treasury_log", "1 = 1"),
+    ("clan_invites", "1 = 1"),
+]
+
+# progress(table, deleted_so_far) после каждой порции сброса
+ResetProgress = Callable[[str, int], Awaitable[None]]
 
-        # Удаляем кланы (автоматически удалятся из-за внешних ключей)
-        await db.execute("DELETE FROM clans")
 
-        # Очищаем связанные таблицы
-        await db.execute("DELETE FROM transactions")
-        await db.execute("DELETE FROM dumbbell_uses")
-        await db.execute("DELETE FROM promo_uses")
-        await db.execute("DELETE FROM clan_members")
-        await db.execute("DELETE FROM clan_treasury_log")
-        await db.execute("DELETE FROM clan_invites")
+async def reset_all(progress: Optional[ResetProgress] = None) -> Dict[str, int]:
+    """Delete regular players, clans and history in bounded chunks.
 
+    A bare DELETE of a big table holds the write lock for as long as it
+    takes to free every page, so each table is deleted RESET_CHUNK_ROWS rows
+    at a time, every chunk in its own transaction followed by a pause, and
+    handlers keep writing in between. Returns deleted rows per table.
+    """
+    deleted: Dict[str, int] = {}
+    async with connect() as db:
+        for table, condition in SEASON_RESET_TABLES:
+            SQL = f"""
+                DELETE FROM {table} WHERE rowid IN (
+                    SELECT rowid FROM {table} WHERE {condition} LIMIT ?
+                )
+            """
+            deleted[table] = 0
+            while True:
+                async with db.execute(SQL, (settings.RESET_CHUNK_ROWS,)) as cur:
+                    count = cur.rowcount
+                await db.commit()
+                deleted[table] += count
+                if progress is not None:
+                    await progress(table, deleted[table])
+                if count < settings.RESET_CHUNK_ROWS:
+                    break
+                await asyncio.sleep(settings.RESET_CHUNK_PAUSE_SECONDS)
+
+        # Кланов больше нет, администраторы остаются без клана
+        await db.execute("UPDATE players SET clan_id = NULL WHERE clan_id IS NOT NULL")
         await db.commit()
+    # Игроки удалены вместе с банами, реестры перечитаются при первой проверке
+    _bans.invalidate()
+    _players.clear()
+    return deleted
@@ -0,0 +1,614 @@
+"""
+Микробенчмарки для функций bot.db.
+
+Заполняет временную базу реалистичными данными (игроки, кланы, транзакции,
+лог казны, промокоды), замеряет каждую публичную функцию bot.db и сравнивает
+медианы с сохранённым baseline. Если функция стала медленнее порога, скрипт
+завершается с кодом 1 — так изменения слоя данных приходят с цифрами.
+
+Запуск:
+    python -m bot.dbbench --save-baseline              # записать baseline
+    python -m bot.dbbench                              # сравнить с baseline
+    python -m bot.dbbench --players 200000 --only get_player,get_top_balance
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+DEFAULT_BASELINE = Path(__file__).with_name("db_baseline.json")
+
+PLAYER_BASE = 100_000_000
+NEW_PLAYER_BASE = 900_000_000
+ADMIN_PLAYERS = 5
+PROMO_CODES = 20
+# Каждый UNNAMED_EVERY-й игрок без ника: username — это его id, как до выгрузки имён
+UNNAMED_EVERY = 20
+
+
+@dataclass
+class SeedConfig:
+    players: int = 50_000
+    clans: int = 500
+    clan_share: float = 0.4
+    transactions: int = 200_000
+    treasury_log: int = 50_000
+    promo_uses: int = 20_000
+    seed: int = 0
+
+
+@dataclass
+class BenchCase:
+    name: str
+    call: Callable[[int], Awaitable[Any]]
+    # Ограничение числа итераций для тяжёлых/разрушающих функций
+    max_iterations: int | None = None
+    # Перед каждой итерацией восстанавливать базу из снимка (время копирования не учитывается)
+    fresh_db: bool = False
+
+
+@dataclass
+class BenchResult:
+    iterations: int
+    median_ms: float
+    p90_ms: float
+    min_ms: float
+
+
+class SeedLayout:
+    """Раскладка идентификаторов в заполненной базе.
+
+    Первые игроки — участники кланов (кланы идут подряд), за ними свободные
+    игроки, в конце — зарезервированные под удаление.
+    """
+
+    def __init__(self, config: SeedConfig, reserved: int) -> None:
+        self.config = config
+        self.players = config.players
+        self.clans = config.clans
+        self.per_clan = int(config.players * config.clan_share) // config.clans if config.clans else 0
+        self.members = self.per_clan * self.clans
+        self.reserved = reserved
+        self.free_start = self.members
+        self.free_end = self.players - reserved
+        if self.free_end - self.free_start < reserved or (self.clans and self.per_clan < 1):
+            raise ValueError("not enough players for this clan layout, increase --players")
+
+    def player(self, i: int) -> int:
+        return PLAYER_BASE + (i * 7919) % self.free_end
+
+    def member(self, i: int) -> tuple[int, int]:
+        index = (i * 7919) % self.members
+        return PLAYER_BASE + index, index // self.per_clan + 1
+
+    def free_player(self, i: int) -> int:
+        return PLAYER_BASE + self.free_start + i % (self.free_end - self.free_start)
+
+    def unnamed(self, i: int) -> int:
+        return PLAYER_BASE + (i % (self.free_end // UNNAMED_EVERY)) * UNNAMED_EVERY
+
+    def victim(self, i: int) -> int:
+        return PLAYER_BASE + self.players - 1 - i
+
+    def clan(self, i: int) -> int:
+        # Первая половина кланов — для чтения и обновлений, вторая — под удаление
+        return 1 + i % max(1, self.clans // 2)
+
+    def victim_clan_tag(self, i: int) -> str:
+        return f"C{self.clans - i}"
+
+
+def seed_database(path: str, config: SeedConfig, layout: SeedLayout, admin_id: int) -> None:
+    """Заполняет базу (таблицы уже созданы) синхронно через executemany"""
+    rng = random.Random(config.seed)
+    conn = sqlite3.connect(path)
+    try:
+        players = []
+        for i in range(config.players):
+            user_id = PLAYER_BASE + i
+            level = rng.randint(1, 20)
+            clan_id = i // layout.per_clan + 1 if i < layout.members else None
+            is_admin = i < ADMIN_PLAYERS
+            players.append(
+                (
+                    user_id,
+                    str(user_id) if i % UNNAMED_EVERY == 0 else f"player{i}",
+                    rng.randint(0, 1_000_000),
+                    rng.randint(0, 100_000),
+                    rng.randint(0, 50_000),
+                    level,
+                    f"Гантеля {level}кг",
+                    rng.randint(0, 100_000),
+                    rng.randint(0, 5_000_000),
+                    1 if is_admin else 0,
+                    str(1000 + i) if is_admin else None,
+                    1 if rng.random() < 0.3 else 0,
+                    1 if rng.random() < 0.05 else 0,
+                    1 if rng.random() < 0.01 else 0,
+                    clan_id,
+                )
+            )
+        conn.executemany(
+            """
+            INSERT INTO players (
+                user_id, username, balance, power, magnesia, dumbbell_level, dumbbell_name,
+                total_lifts, total_earned, admin_level, admin_id,
+                business_1_level, business_2_level, business_3_level, clan_id
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            players,
+        )
+
+        clans = [
+            (
+                clan_id,
+                f"C{clan_id}",
+                f"Клан {clan_id}",
+                PLAYER_BASE + (clan_id - 1) * layout.per_clan,
+                rng.randint(1, 10),
+                10**12,
+                rng.randint(0, 10_000),
+                rng.randint(0, 1_000_000),
+            )
+            for clan_id in range(1, config.clans + 1)
+        ]
+        conn.executemany(
+            """
+            INSERT INTO clans (id, tag, name, owner_id, level, treasury, total_income_per_hour, total_lifts)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            clans,
+        )
+
+        conn.executemany(
+            """
+            INSERT INTO clan_members (clan_id, user_id, role, contributions)
+            VALUES (?, ?, ?, ?)
+            """,
+            (
+                (
+                    i // layout.per_clan + 1,
+                    PLAYER_BASE + i,
+                    "owner" if i % layout.per_clan == 0 else "member",
+                    rng.randint(0, 10_000),
+                )
+                for i in range(layout.members)
+            ),
+        )
+        conn.execute(
+            "UPDATE clans SET member_count = (SELECT COUNT(*) FROM clan_members WHERE clan_id = clans.id)"
+        )
+
+        conn.executemany(
+            """
+            INSERT INTO transactions (user_id, type, amount, description)
+            VALUES (?, ?, ?, ?)
+            """,
+            (
+                (
+                    PLAYER_BASE + rng.randrange(config.players),
+                    rng.choice(("transfer_in", "transfer_out", "dumbbell", "business", "promo")),
+                    rng.randint(1, 10_000),
+                    "seed",
+                )
+                for _ in range(config.transactions)
+            ),
+        )
+        conn.executemany(
+            """
+            INSERT INTO dumbbell_uses (user_id, dumbbell_level, income, power_gained)
+            VALUES (?, ?, ?, ?)
+            """,
+            (
+                (PLAYER_BASE + rng.randrange(config.players), rng.randint(1, 20), rng.randint(1, 55), 1)
+                for _ in range(config.transactions)
+            ),
+        )
+        if config.clans:
+            conn.executemany(
+                """
+                INSERT INTO clan_treasury_log (clan_id, user_id, action_type, amount, description)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (
+                    (
+                        rng.randint(1, config.clans),
+                        PLAYER_BASE + rng.randrange(max(1, layout.members)),
+                        rng.choice(("deposit", "income", "upgrade")),
+                        rng.randint(1, 10_000),
+                        "seed",
+                    )
+                    for _ in range(config.treasury_log)
+                ),
+            )
+
+        promo_codes = [(f"BENCH{i}", 10**9, 10**9, "монеты", 10, admin_id) for i in range(PROMO_CODES)]
+        promo_codes += [(f"DEL{i}", 10, 10, "монеты", 10, admin_id) for i in range(layout.reserved)]
+        conn.executemany(
+            """
+            INSERT INTO promo_codes (code, uses_total, uses_left, reward_type, reward_amount, created_by)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            promo_codes,
+        )
+        conn.executemany(
+            "INSERT INTO promo_uses (user_id, promo_code) VALUES (?, ?)",
+            (
+                (PLAYER_BASE + rng.randrange(config.players), f"BENCH{rng.randrange(PROMO_CODES)}")
+                for _ in range(config.promo_uses)
+            ),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def build_cases(layout: SeedLayout, admin_id: int) -> list[BenchCase]:
+    """Список замеров; порядок важен — разрушающие функции в конце"""
+    from bot import db
+    from bot.core.config import settings
+
+    L = layout
+    business = settings.BUSINESSES[1]
+
+    async def player_exists_cold(user_id: int) -> bool:
+        # Так проверяет игрока первый вызов после периодического сброса реестра
+        db.forget_player_ids()
+        return await db.player_exists(user_id)
+
+    return [
+        # Игроки
+        BenchCase("create_tables", lambda i: db.create_tables()),
+        BenchCase("initialize_admin_ids", lambda i: db.initialize_admin_ids()),
+        BenchCase("load_admin_levels", lambda i: db.load_admin_levels()),
+        BenchCase("get_admin_levels", lambda i: db.get_admin_levels()),
+        BenchCase("get_player", lambda i: db.get_player(L.player(i))),
+        BenchCase("create_player", lambda i: db.create_player(NEW_PLAYER_BASE + i, f"new{i}")),
+        # Повторная регистрация: ON CONFLICT DO NOTHING и чтение существующей строки
+        BenchCase("create_player_existing", lambda i: db.create_player(L.player(i), f"player{i}")),
+        BenchCase("update_username", lambda i: db.update_username(L.player(i), f"renamed{i}")),
+        # Страница выгрузки имён: keyset-проход с фильтром username = CAST(user_id AS TEXT)
+        BenchCase("get_unnamed_player_ids", lambda i: db.get_unnamed_player_ids(L.player(i))),
+        BenchCase(
+            "set_usernames",
+            lambda i: db.set_usernames([(L.unnamed(i * 100 + k), f"named{i}_{k}") for k in range(100)]),
+        ),
+        BenchCase(
+            "update_player_balance",
+            lambda i: db.update_player_balance(L.player(i), 1, "bench", "benchmark"),
+        ),
+        BenchCase("set_player_balance", lambda i: db.set_player_balance(L.player(i), 1000, admin_id)),
+        BenchCase("add_power", lambda i: db.add_power(L.player(i), 1)),
+        BenchCase("set_power", lambda i: db.set_power(L.player(i), 10, admin_id)),
+        BenchCase("add_magnesia", lambda i: db.add_magnesia(L.player(i), 1)),
+        BenchCase("update_dumbbell_level", lambda i: db.update_dumbbell_level(L.player(i), 2, "Гантеля 2кг")),
+        BenchCase("set_dumbbell_level", lambda i: db.set_dumbbell_level(L.player(i), 3, admin_id)),
+        BenchCase("update_dumbbell_use_time", lambda i: db.update_dumbbell_use_time(L.player(i))),
+        BenchCase("increment_total_lifts", lambda i: db.increment_total_lifts(L.player(i))),
+        BenchCase("set_total_lifts", lambda i: db.set_total_lifts(L.player(i), 10, admin_id)),
+        BenchCase("set_custom_income", lambda i: db.set_custom_income(L.player(i), None, admin_id)),
+        BenchCase("buy_business", lambda i: db.buy_business(L.player(i), 1, business)),
+        BenchCase("upgrade_business", lambda i: db.upgrade_business(L.player(i), 1, i % 5 + 1, 0)),
+        BenchCase("log_dumbbell_use", lambda i: db.log_dumbbell_use(L.player(i), 1, 1, 1)),
+        # Администрирование
+        BenchCase("make_admin", lambda i: db.make_admin(L.free_player(i), admin_id)),
+        BenchCase("remove_admin", lambda i: db.remove_admin(L.free_player(i), admin_id)),
+        BenchCase("set_admin_nickname", lambda i: db.set_admin_nickname(admin_id, f"admin{i}")),
+        BenchCase("ban_player", lambda i: db.ban_player(L.free_player(i), 1, "bench", admin_id)),
+        BenchCase("unban_player", lambda i: db.unban_player(L.free_player(i), admin_id)),
+        BenchCase("load_bans", lambda i: db.load_bans()),
+        BenchCase("is_banned", lambda i: db.is_banned(L.player(i))),
+        BenchCase("unban_expired_players", lambda i: db.unban_expired_players([L.free_player(i)])),
+        BenchCase("player_exists", lambda i: db.player_exists(L.player(i))),
+        BenchCase("player_exists_cold", lambda i: player_exists_cold(L.player(i))),
+        BenchCase("player_exists_miss", lambda i: db.player_exists(NEW_PLAYER_BASE - 1 - i)),
+        BenchCase("increment_admin_stat", lambda i: db.increment_admin_stat(admin_id, "bans")),
+        # Топы и статистика
+        BenchCase("get_top_balance", lambda i: db.get_top_balance()),
+        BenchCase("get_top_lifts", lambda i: db.get_top_lifts()),
+        BenchCase("get_top_earners", lambda i: db.get_top_earners()),
+        BenchCase("get_recently_active_player_ids", lambda i: db.get_recently_active_player_ids()),
+        BenchCase("count_players", lambda i: db.count_players()),
+        BenchCase("count_banned_players", lambda i: db.count_banned_players()),
+        BenchCase("count_admins", lambda i: db.count_admins()),
+        BenchCase("count_clans", lambda i: db.count_clans()),
+        BenchCase("count_total_balance", lambda i: db.count_total_balance()),
+        BenchCase("get_recent_players", lambda i: db.get_recent_players()),
+        BenchCase("sum_column", lambda i: db.sum_column("players", "total_lifts")),
+        BenchCase("count_table_rows", lambda i: db.count_table_rows("transactions")),
+        BenchCase("get_players_with_businesses", lambda i: db.get_players_with_businesses(), max_iterations=30),
+        # Промокоды
+        BenchCase(
+            "create_promo_code",
+            lambda i: db.create_promo_code(f"NEW{i}", 10, "монеты", 10, admin_id),
+        ),
+        BenchCase("get_promo_info", lambda i: db.get_promo_info(f"BENCH{i % PROMO_CODES}")),
+        BenchCase("use_promo_code", lambda i: db.use_promo_code(L.player(i), f"BENCH{i % PROMO_CODES}")),
+        BenchCase("get_all_promo_codes", lambda i: db.get_all_promo_codes()),
+        BenchCase("count_promo_uses", lambda i: db.count_promo_uses(f"BENCH{i % PROMO_CODES}")),
+        BenchCase("sum_promo_uses", lambda i: db.sum_promo_uses()),
+        BenchCase("delete_promo_code", lambda i: db.delete_promo_code(f"DEL{i}", admin_id)),
+        # Кланы
+        BenchCase("create_clan", lambda i: db.create_clan(f"N{i}", f"Новый клан {i}", L.free_player(i))),
+        BenchCase("get_clan_by_tag", lambda i: db.get_clan_by_tag(f"C{L.clan(i)}")),
+        BenchCase("get_clan_by_id", lambda i: db.get_clan_by_id(L.clan(i))),
+        BenchCase("get_player_clan", lambda i: db.get_player_clan(L.member(i)[0])),
+        BenchCase("get_clan_members", lambda i: db.get_clan_members(L.clan(i))),
+        # Вторая страница: курсор после владельца и офицеров
+        BenchCase("get_clan_members_page", lambda i: db.get_clan_members(L.clan(i), 20, ("member", 10**12, 0))),
+        BenchCase("get_member_clan_role", lambda i: db.get_member_clan_role(*L.member(i))),
+        BenchCase("get_clan_member_count", lambda i: db.get_clan_member_count(L.clan(i))),
+        BenchCase("join_clan", lambda i: db.join_clan(L.clan(i), L.free_player(i))),
+        BenchCase("leave_clan", lambda i: db.leave_clan(L.free_player(i))),
+        BenchCase("deposit_to_clan_treasury", lambda i: db.deposit_to_clan_treasury(L.member(i)[0], 1)),
+        BenchCase("upgrade_clan", lambda i: db.upgrade_clan(L.clan(i))),
+        BenchCase("get_clan_treasury_log", lambda i: db.get_clan_treasury_log(L.clan(i))),
+        BenchCase(
+            "get_clan_treasury_log_page",
+            lambda i: db.get_clan_treasury_log(L.clan(i), 10, ("9999-12-31 00:00:00", 0)),
+        ),
+        BenchCase("get_top_clans", lambda i: db.get_top_clans()),
+        BenchCase(
+            "update_clan_name",
+            lambda i: db.update_clan_name(f"C{L.clan(i)}", f"Клан {L.clan(i)} v{i}", admin_id),
+        ),
+        BenchCase("add_treasury", lambda i: db.add_treasury(L.clan(i), 1, True)),
+        BenchCase("subtract_treasury", lambda i: db.subtract_treasury(L.clan(i), 1, True)),
+        BenchCase("log_collection", lambda i: db.log_collection(L.clan(i), "income", 1, "bench")),
+        BenchCase(
+            "log_collection_with_user",
+            lambda i: db.log_collection_with_user(L.clan(i), L.member(i)[0], "income", 1, "bench"),
+        ),
+        # Разрушающие операции
+        BenchCase("delete_player", lambda i: db.delete_player(L.victim(i), admin_id)),
+        BenchCase(
+            "delete_clan",
+            lambda i: db.delete_clan(L.victim_clan_tag(i), admin_id),
+            max_iterations=max(1, L.clans - L.clans // 2 - 1),
+        ),
+        BenchCase("reset_all", lambda i: db.reset_all(), max_iterations=6, fresh_db=True),
+    ]
+
+
+# Функции, которые сознательно не замеряются, и почему
+NOT_BENCHMARKED = {
+    # Переводит базу в WAL насовсем: остальные замеры шли бы уже в другом режиме
+    # журнала, а снимок для fresh_db копирует только основной файл без -wal
+    "enable_wal": "changes journal mode of the benchmark database",
+}
+
+
+def uncovered_functions(cases: list[BenchCase]) -> list[str]:
+    """Публичные корутины bot.db, для которых нет замера и которые не исключены явно"""
+    from bot import db
+
+    names = {
+        name
+        for name, func in inspect.getmembers(db, inspect.iscoroutinefunction)
+        if not name.startswith("_") and func.__module__ == db.__name__
+    }
+    return sorted(names - {case.name for case in cases} - NOT_BENCHMARKED.keys())
+
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run_case(
+    case: BenchCase, iterations: int, offset: int, warmup: bool, db_path: str, snapshot: str
+) -> BenchResult:
+    """Замер одной функции; индексы вызовов offset..offset+iterations-1"""
+    if warmup and not case.fresh_db:
+        # Прогрев: первый вызов открывает файл и прогревает page cache
+        await case.call(-1)
+
+    timings = []
+    for i in range(offset, offset + iterations):
+        if case.fresh_db:
+            shutil.copyfile(snapshot, db_path)
+        started = time.perf_counter()
+        await case.call(i)
+        timings.append(time.perf_counter() - started)
+
+    if case.fresh_db:
+        # Следующим замерам нужна заполненная база, а не результат последней итерации
+        shutil.copyfile(snapshot, db_path)
+
+    timings.sort()
+    return BenchResult(
+        iterations=iterations,
+        median_ms=_percentile(timings, 0.5) * 1000,
+        p90_ms=_percentile(timings, 0.9) * 1000,
+        min_ms=timings[0] * 1000,
+    )
+
+
+async def run(
+    config: SeedConfig, iterations: int, rounds: int, only: set[str] | None, db_path: str
+) -> dict[str, BenchResult]:
+    """Заполняет базу и прогоняет все замеры.
+
+    Замеры идут несколькими раундами вперемешку, для каждой функции берётся
+    раунд с лучшей медианой — так фоновые всплески нагрузки реже дают ложные
+    регрессии.
+    """
+    from bot.core.config import settings
+    from bot.db import create_tables
+
+    admin_id = PLAYER_BASE
+    layout = SeedLayout(config, reserved=iterations * rounds + 1)
+
+    await create_tables()
+    print(
+        f"seeding {config.players} players, {config.clans} clans, {config.transactions} transactions...",
+        file=sys.stderr,
+    )
+    started = time.perf_counter()
+    seed_database(settings.database_path, config, layout, admin_id)
+    print(f"seeded in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    snapshot = db_path + ".seed"
+    shutil.copyfile(db_path, snapshot)
+
+    cases = build_cases(layout, admin_id)
+    missing = uncovered_functions(cases)
+    if missing:
+        print(f"warning: not benchmarked: {', '.join(missing)}", file=sys.stderr)
+    if only:
+        cases = [case for case in cases if case.name in only]
+
+    results: dict[str, BenchResult] = {}
+    for round_num in range(rounds):
+        for case in cases:
+            case_iterations = iterations
+            if case.max_iterations is not None:
+                case_iterations = max(1, min(iterations, case.max_iterations // rounds))
+            result = await run_case(
+                case,
+                case_iterations,
+                round_num * case_iterations,
+                round_num == 0,
+                db_path,
+                snapshot,
+            )
+            best = results.get(case.name)
+            if best is None or result.median_ms < best.median_ms:
+                results[case.name] = result
+        print(f"round {round_num + 1}/{rounds} done", file=sys.stderr)
+    return results
+
+
+def compare(
+    results: dict[str, BenchResult],
+    baseline: dict[str, Any],
+    threshold: float,
+    min_delta_ms: float,
+) -> tuple[list[str], list[str]]:
+    """Возвращает строки отчёта и список регрессий"""
+    base_results = baseline.get("results", {})
+    lines = [f"{'function':<32}{'median ms':>12}{'p90 ms':>10}{'baseline':>12}{'change':>10}"]
+    regressions = []
+    for name, result in results.items():
+        base = base_results.get(name)
+        if base is None:
+            lines.append(f"{name:<32}{result.median_ms:>12.3f}{result.p90_ms:>10.3f}{'-':>12}{'new':>10}")
+            continue
+
+        base_ms = base["median_ms"]
+        change = (result.median_ms - base_ms) / base_ms if base_ms else 0.0
+        regressed = result.median_ms > base_ms * (1 + threshold) and result.median_ms - base_ms > min_delta_ms
+        mark = "  REGRESSION" if regressed else ""
+        lines.append(
+            f"{name:<32}{result.median_ms:>12.3f}{result.p90_ms:>10.3f}{base_ms:>12.3f}{change:>+10.1%}{mark}"
+        )
+        if regressed:
+            regressions.append(name)
+    return lines, regressions
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    defaults = SeedConfig()
+    parser = argparse.ArgumentParser(description="Микробенчмарки функций bot.db")
+    parser.add_argument("--players", type=int, default=defaults.players)
+    parser.add_argument("--clans", type=int, default=defaults.clans)
+    parser.add_argument("--clan-share", type=float, default=defaults.clan_share, help="доля игроков в кланах")
+    parser.add_argument("--transactions", type=int, default=defaults.transactions)
+    parser.add_argument("--treasury-log", type=int, default=defaults.treasury_log)
+    parser.add_argument("--promo-uses", type=int, default=defaults.promo_uses)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--iterations", type=int, default=20, help="замеров на функцию в раунде")
+    parser.add_argument("--rounds", type=int, default=3, help="раундов; для каждой функции берётся лучший")
+    parser.add_argument("--only", default=None, help="список функций через запятую")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE, help="файл baseline (JSON)")
+    parser.add_argument("--save-baseline", action="store_true", help="записать результаты в baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="допустимое замедление медианы (0.25 = 25%%)")
+    parser.add_argument(
+        "--min-delta-ms",
+        type=float,
+        default=0.5,
+        help="игнорировать замедления меньше этого значения (шум таймера)",
+    )
+    args = parser.parse_args(argv)
+    if args.iterations <= 0 or args.rounds <= 0:
+        parser.error("--iterations and --rounds must be positive")
+    if args.clans < 2 or not 0 < args.clan_share <= 1:
+        parser.error("--clans must be at least 2 and --clan-share in (0, 1]")
+    return args
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    config = SeedConfig(
+        players=args.players,
+        clans=args.clans,
+        clan_share=args.clan_share,
+        transactions=args.transactions,
+        treasury_log=args.treasury_log,
+        promo_uses=args.promo_uses,
+        seed=args.seed,
+    )
+    only = {name.strip() for name in args.only.split(",")} if args.only else None
+
+    with tempfile.TemporaryDirectory(prefix="gym_legend_dbbench_") as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        # Настройки читаются при импорте bot.core.config, поэтому окружение готовим заранее
+        os.environ["DB_PATH"] = db_path
+        os.environ.setdefault("BOT_TOKEN", "dbbench")
+        results = asyncio.run(run(config, args.iterations, args.rounds, only, db_path))
+
+    meta = {
+        "seed": asdict(config),
+        "iterations": args.iterations,
+        "rounds": args.rounds,
+        "sqlite": sqlite3.sqlite_version,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+    }
+
+    if args.save_baseline:
+        baseline = {"meta": meta, "results": {name: asdict(r) for name, r in results.items()}}
+        if only and args.baseline.exists():
+            # Частичный прогон обновляет только свои функции
+            previous = json.loads(args.baseline.read_text(encoding="utf-8"))
+            previous["results"].update(baseline["results"])
+            previous["meta"] = meta
+            baseline = previous
+        args.baseline.write_text(json.dumps(baseline, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+        print(f"baseline saved to {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        lines, _ = compare(results, {}, args.threshold, args.min_delta_ms)
+        print("\n".join(lines))
+        print(f"\nno baseline at {args.baseline}, run with --save-baseline to create one")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    if baseline.get("meta", {}).get("seed") != meta["seed"]:
+        print("warning: baseline was recorded with a different seed configuration", file=sys.stderr)
+
+    lines, regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+    print("\n".join(lines))
+    if regressions:
+        print(f"\n{len(regressions)} function(s) regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
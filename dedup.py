@@ -0,0 +1,124 @@
+"""
+Отбрасывание повторно доставленных сообщений VK.
+
+После переподключения long poll или повтора запроса Callback API VK может
+прислать то же сообщение ещё раз, и хендлер заново выполнил бы всю работу —
+для подъёма гантели, перевода или промокода это второе изменение баланса.
+DeduplicationMiddleware стоит перед RegistrationMiddleware и помнит ключи
+(peer_id, conversation_message_id) сообщений за последние DEDUP_TTL_SECONDS,
+не больше DEDUP_MAX_MESSAGES штук. Повтор отбрасывается проверкой словаря в
+памяти, без обращения к базе.
+
+С DEDUP_STATE_PATH ключи сохраняются при остановке и читаются при запуске,
+чтобы повтор сразу после перезапуска тоже отбрасывался. В режиме Callback API
+у каждого воркера свой файл: сообщения одного пользователя всегда попадают в
+один и тот же воркер.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from collections import OrderedDict
+from time import time
+from typing import List, Optional, Tuple
+
+from loguru import logger
+from vkbottle import BaseMiddleware
+from vkbottle.bot import Message
+
+from bot.core.config import settings
+from bot.metrics import record_duplicate
+
+MessageKey = Tuple[int, int]
+
+
+class RecentMessages:
+    """Ключи недавно полученных сообщений с моментом получения, от старых к новым"""
+
+    def __init__(self, ttl: float, max_size: int) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self.seen_at: "OrderedDict[MessageKey, float]" = OrderedDict()
+
+    def _expire(self, now: float) -> None:
+        cutoff = now - self.ttl
+        while self.seen_at:
+            key, seen_at = next(iter(self.seen_at.items()))
+            if seen_at > cutoff:
+                break
+            del self.seen_at[key]
+
+    def check_and_remember(self, key: MessageKey, now: Optional[float] = None) -> bool:
+        """True, если сообщение уже было; иначе запоминает его"""
+        now = time() if now is None else now
+        self._expire(now)
+        if key in self.seen_at:
+            return True
+        self.seen_at[key] = now
+        if len(self.seen_at) > self.max_size:
+            self.seen_at.popitem(last=False)
+        return False
+
+    def dump(self) -> List[Tuple[int, int, float]]:
+        return [(peer_id, message_id, seen_at) for (peer_id, message_id), seen_at in self.seen_at.items()]
+
+    def load(self, entries: List[Tuple[int, int, float]], now: Optional[float] = None) -> int:
+        now = time() if now is None else now
+        for peer_id, message_id, seen_at in sorted(entries, key=lambda entry: entry[2]):
+            if seen_at > now - self.ttl:
+                self.seen_at[(peer_id, message_id)] = seen_at
+        while len(self.seen_at) > self.max_size:
+            self.seen_at.popitem(last=False)
+        return len(self.seen_at)
+
+
+recent_messages = RecentMessages(settings.DEDUP_TTL_SECONDS, settings.DEDUP_MAX_MESSAGES)
+
+# Файл, куда сохранить ключи при остановке (задаётся в load_recent_messages)
+_state_path: Optional[str] = None
+
+
+def message_key(message: Message) -> Optional[MessageKey]:
+    """Одинаков у всех доставок одного сообщения; None, если сообщение не опознать"""
+    message_id = message.conversation_message_id or message.id
+    if not message.peer_id or not message_id:
+        return None
+    return (message.peer_id, message_id)
+
+
+class DeduplicationMiddleware(BaseMiddleware[Message]):
+    async def pre(self):
+        key = message_key(self.event)
+        if key is not None and recent_messages.check_and_remember(key):
+            record_duplicate()
+            logger.info(f"Dropping redelivered message {key}")
+            self.stop("Duplicate message")
+
+
+def load_recent_messages(path: str) -> None:
+    """Читает ключи, сохранённые прошлым запуском; в path же они сохранятся при остановке"""
+    global _state_path
+
+    _state_path = path
+    try:
+        with open(path, encoding="utf-8") as f:
+            entries = json.load(f)
+    except FileNotFoundError:
+        return
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read recent messages from {path}: {e}")
+        return
+    logger.info(f"Loaded {recent_messages.load(entries)} recent message keys from {path}")
+
+
+def save_recent_messages() -> None:
+    if _state_path is None:
+        return
+    directory = os.path.dirname(_state_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    partial_path = _state_path + ".part"
+    with open(partial_path, "w", encoding="utf-8") as f:
+        json.dump(recent_messages.dump(), f)
+    os.replace(partial_path, _state_path)
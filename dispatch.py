@@ -0,0 +1,370 @@
+"""
+Индекс команд для роутера сообщений.
+
+Стандартный BotMessageView проверяет каждое сообщение по очереди всеми
+хендлерами, а значит всеми VBML-шаблонами и всеми auto_rules (у админских
+хендлеров это IsAdmin с запросом к базе). IndexedMessageView заранее
+раскладывает хендлеры по первому слову шаблона (без регистра и без "/") и
+для сообщения проверяет только хендлеры с совпавшим первым словом, плюс
+хендлеры без текстового шаблона. Порядок хендлеров сохраняется, поэтому
+результат маршрутизации тот же, что и при полном переборе.
+
+Нажатия кнопок (см. bot.keyboards) маршрутизируются по коду команды из
+payload: хендлеры с payload_contains={"cmd": ...} лежат в отдельном словаре,
+и для сообщения с известным кодом проверяются только они и хендлеры без
+индекса — ни одного VBML-шаблона. Подпись кнопки командой не считается.
+
+Сравнение с полным перебором на наших шаблонах:
+    python -m bot.dispatch
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from collections import defaultdict
+from typing import TYPE_CHECKING, Any, Optional
+
+from vkbottle.bot import BotLabeler
+from vkbottle.dispatch.rules.base import PayloadContainsRule, PayloadRule, VBMLRule
+from vkbottle.dispatch.views.bot import BotMessageView
+from vkbottle.modules import logger
+
+if TYPE_CHECKING:
+    from vkbottle.dispatch.handlers import ABCHandler
+
+
+def normalize_keyword(word: str) -> str:
+    return word.lower().lstrip("/")
+
+
+def message_keyword(text: Optional[str]) -> Optional[str]:
+    """Первое слово сообщения в том виде, в котором оно лежит в индексе"""
+    if not text:
+        return None
+    parts = text.split(maxsplit=1)
+    return normalize_keyword(parts[0]) if parts else None
+
+
+def pattern_keyword(pattern_text: str) -> Optional[str]:
+    """Первое слово шаблона, если оно целиком задано текстом.
+
+    Шаблон "аксменить <cmd_args>" даёт "аксменить", "/удалить+" — "удалить+".
+    Для "<text>" или "топ<n>" первое слово зависит от аргумента, такие шаблоны
+    не индексируются.
+    """
+    literal = pattern_text.split("<", 1)[0]
+    parts = literal.split(maxsplit=1)
+    if not parts:
+        return None
+    if "<" in pattern_text and len(parts) == 1 and not literal[-1].isspace():
+        # Аргумент приклеен к первому слову
+        return None
+    return normalize_keyword(parts[0]) or None
+
+
+def handler_keywords(handler: "ABCHandler") -> Optional[set[str]]:
+    """Все возможные первые слова сообщения, на которое сработает хендлер.
+
+    None — хендлер нельзя проиндексировать и его надо проверять всегда.
+    """
+    keywords: Optional[set[str]] = None
+    for rule in getattr(handler, "rules", ()):
+        if not isinstance(rule, VBMLRule):
+            continue
+        rule_keywords = set()
+        for pattern in rule.patterns:
+            keyword = pattern_keyword(pattern.text)
+            if keyword is None:
+                rule_keywords = None
+                break
+            rule_keywords.add(keyword)
+        if rule_keywords is None:
+            continue
+        # Несколько текстовых правил должны совпасть одновременно
+        keywords = rule_keywords if keywords is None else keywords & rule_keywords
+    return keywords
+
+
+def payload_command(payload: Optional[str]) -> Optional[str]:
+    """Код команды из payload кнопки ({"cmd": "lift", ...}) или None"""
+    if not payload:
+        return None
+    try:
+        data = json.loads(payload)
+    except (ValueError, TypeError):
+        return None
+    command = data.get("cmd") if isinstance(data, dict) else None
+    return command if isinstance(command, str) else None
+
+
+def handler_commands(handler: "ABCHandler") -> Optional[set[str]]:
+    """Коды команд, на которые срабатывает хендлер; None — хендлер не для кнопок"""
+    commands: Optional[set[str]] = None
+    for rule in getattr(handler, "rules", ()):
+        if isinstance(rule, PayloadContainsRule):
+            command = rule.payload_particular_part.get("cmd")
+            if not isinstance(command, str):
+                continue
+            rule_commands = {command}
+        elif isinstance(rule, PayloadRule):
+            rule_commands = {p.get("cmd") if isinstance(p, dict) else None for p in rule.payload}
+            if not all(isinstance(command, str) for command in rule_commands):
+                continue
+        else:
+            continue
+        commands = rule_commands if commands is None else commands & rule_commands
+    return commands
+
+
+class DispatchIndex:
+    def __init__(self, handlers: list["ABCHandler"]) -> None:
+        self.handlers = list(handlers)
+        self.fallback: list["ABCHandler"] = []
+        by_keyword: dict[str, list[int]] = defaultdict(list)
+        by_command: dict[str, list[int]] = defaultdict(list)
+        fallback_positions: list[int] = []
+
+        for position, handler in enumerate(self.handlers):
+            commands = handler_commands(handler)
+            if commands is not None:
+                # Без payload с этим кодом хендлер не сработает, в текстовые списки не кладём
+                for command in commands:
+                    by_command[command].append(position)
+                continue
+            keywords = handler_keywords(handler)
+            if keywords is None:
+                fallback_positions.append(position)
+                self.fallback.append(handler)
+            else:
+                for keyword in keywords:
+                    by_keyword[keyword].append(position)
+
+        # Для каждого слова и кода сразу храним итоговый список в исходном порядке
+        self.by_keyword: dict[str, list["ABCHandler"]] = {
+            keyword: [self.handlers[i] for i in sorted(positions + fallback_positions)]
+            for keyword, positions in by_keyword.items()
+        }
+        self.by_command: dict[str, list["ABCHandler"]] = {
+            command: [self.handlers[i] for i in sorted(positions + fallback_positions)]
+            for command, positions in by_command.items()
+        }
+
+    def candidates(self, text: Optional[str], payload: Optional[str] = None) -> list["ABCHandler"]:
+        command = payload_command(payload)
+        if command is not None and command in self.by_command:
+            return self.by_command[command]
+        keyword = message_keyword(text)
+        if keyword is None:
+            return self.fallback
+        return self.by_keyword.get(keyword, self.fallback)
+
+
+class IndexedMessageView(BotMessageView):
+    """BotMessageView, который перебирает только подходящие по индексу хендлеры"""
+
+    def __init__(self, error_handler=None) -> None:
+        super().__init__(error_handler)
+        self._index: Optional[DispatchIndex] = None
+
+    @property
+    def index(self) -> DispatchIndex:
+        # Хендлеры добавляются через labeler.load() уже после создания view
+        if self._index is None or len(self._index.handlers) != len(self.handlers):
+            self._index = DispatchIndex(self.handlers)
+        return self._index
+
+    def rebuild_index(self) -> None:
+        self._index = None
+
+    async def handle_event(self, event, ctx_api, state_dispenser) -> None:
+        logger.debug("Handling event ({}) with message view", self.get_event_type(event))
+        context_variables: dict[str, Any] = {}
+        message = await self.get_message(event, ctx_api, self.replace_mention)
+        message.state_peer = await state_dispenser.cast(self.get_state_key(message))
+
+        for text_ax in self.default_text_approximators:
+            message.text = text_ax(message)
+
+        mw_instances = await self.pre_middleware(message, context_variables)
+        if mw_instances is None:
+            logger.debug("Handling stopped, pre_middleware returned error")
+            return
+
+        handle_responses: list[Any] = []
+        handlers: list["ABCHandler"] = []
+
+        for handler in self.index.candidates(message.text, message.payload):
+            result = await handler.filter(message, context_variables)
+            logger.debug("Handler {} returned {}", handler, result)
+
+            if result is False:
+                continue
+
+            elif isinstance(result, dict):
+                context_variables.update(result)
+
+            try:
+                handler_response = await handler.handle(message, **context_variables)
+            except Exception as e:
+                await self.error_handler.handle(e, message, **context_variables)
+                continue
+
+            handle_responses.append(handler_response)
+            handlers.append(handler)
+
+            return_handler = self.handler_return_manager.get_handler(handler_response)
+            if return_handler is not None:
+                await return_handler(
+                    self.handler_return_manager,
+                    handler_response,
+                    message,
+                    context_variables,
+                )
+
+            if handler.blocking:
+                break
+
+        await self.post_middleware(mw_instances, handle_responses, handlers)
+
+
+# ==============================
+# БЕНЧМАРК
+# ==============================
+
+
+class _BenchMessage:
+    def __init__(self, text: str, payload: Optional[str] = None) -> None:
+        self.text = text
+        self.payload = payload
+
+    def get_payload_json(self) -> Any:
+        return json.loads(self.payload) if self.payload is not None else None
+
+
+def _sample_buttons() -> list[tuple[str, str]]:
+    """Подписи и payload кнопок из bot.keyboards, плюс страницы клана и подтверждения"""
+    from bot import keyboards
+
+    buttons = []
+    layouts = [value for value in vars(keyboards).values() if isinstance(value, str) and value.startswith("{")]
+    layouts.append(keyboards.shop_keyboard(2, 3))
+    for layout in layouts:
+        for row in json.loads(layout)["buttons"]:
+            buttons.extend((button["action"]["label"], json.dumps(button["action"]["payload"])) for button in row)
+    for command in (keyboards.CMD_CLAN_MEMBERS, keyboards.CMD_CLAN_LOG):
+        buttons.append(("Дальше ▶", json.dumps(keyboards.payload(command, clan=1, n=11))))
+    for confirm, cancel in (
+        (keyboards.CMD_DELETE_CONFIRM, keyboards.CMD_DELETE_CANCEL),
+        (keyboards.CMD_RESET_CONFIRM, keyboards.CMD_RESET_CANCEL),
+    ):
+        for row in json.loads(keyboards.confirm_keyboard(confirm, cancel))["buttons"]:
+            buttons.extend((button["action"]["label"], json.dumps(button["action"]["payload"])) for button in row)
+    return buttons
+
+
+def _sample_texts(handlers: list["ABCHandler"], noise: int, seed: int) -> list[str]:
+    """Команды из реальных шаблонов (аргументы заменены числами) и обычный текст"""
+    rng = random.Random(seed)
+    texts = []
+    for handler in handlers:
+        for rule in getattr(handler, "rules", ()):
+            if isinstance(rule, VBMLRule):
+                for pattern in rule.patterns:
+                    text = pattern.text
+                    while "<" in text and ">" in text:
+                        start = text.index("<")
+                        text = text[:start] + str(rng.randint(1, 999)) + text[text.index(">", start) + 1 :]
+                    texts.append(text.upper() if rng.random() < 0.2 else text)
+    words = ["привет", "как дела", "кто онлайн", "ахах", "го в зал", "ок", "спасибо", "💪", "+", "лол кек"]
+    texts.extend(rng.choice(words) for _ in range(noise))
+    rng.shuffle(texts)
+    return texts
+
+
+async def _first_text_match(handlers: list["ABCHandler"], message: _BenchMessage) -> tuple[Optional[Any], int]:
+    """Первый хендлер, чьи текстовые и payload-правила совпали, и число проверенных шаблонов"""
+    checked = 0
+    for handler in handlers:
+        matched = True
+        for rule in handler.rules:
+            if isinstance(rule, VBMLRule):
+                checked += len(rule.patterns)
+            elif not isinstance(rule, (PayloadContainsRule, PayloadRule)):
+                continue
+            if await rule.check(message) is False:
+                matched = False
+                break
+        if matched:
+            return handler, checked
+    return None, checked
+
+
+async def _measure(handlers, select, messages: list[_BenchMessage], rounds: int) -> tuple[float, float, list]:
+    chosen = []
+    checked_total = 0
+    best = float("inf")
+    for _ in range(rounds):
+        chosen = []
+        checked_total = 0
+        started = time.perf_counter()
+        for message in messages:
+            handler, checked = await _first_text_match(select(message), message)
+            chosen.append(handler)
+            checked_total += checked
+        best = min(best, time.perf_counter() - started)
+    return best / len(messages), checked_total / len(messages), chosen
+
+
+def benchmark(noise: int, rounds: int, seed: int) -> None:
+    from bot.handlers import get_handlers_labelers
+
+    labeler = BotLabeler(message_view=IndexedMessageView())
+    labeler.load(get_handlers_labelers())
+    handlers = labeler.message_view.handlers
+    index = labeler.message_view.index
+    text_messages = [_BenchMessage(text) for text in _sample_texts(handlers, noise, seed)]
+    button_messages = [_BenchMessage(label, payload) for label, payload in _sample_buttons()]
+
+    def select_indexed(message: _BenchMessage) -> list["ABCHandler"]:
+        return index.candidates(message.text, message.payload)
+
+    print(
+        f"{len(handlers)} handlers, {len(index.by_keyword)} keywords, {len(index.by_command)} button commands, "
+        f"{len(index.fallback)} without keyword"
+    )
+    mismatches = unrouted = 0
+    for name, messages in (("text", text_messages), ("buttons", button_messages)):
+        full_time, full_checked, full_chosen = asyncio.run(_measure(handlers, lambda _: handlers, messages, rounds))
+        index_time, index_checked, index_chosen = asyncio.run(_measure(handlers, select_indexed, messages, rounds))
+        mismatches += sum(1 for a, b in zip(full_chosen, index_chosen) if a is not b)
+        candidates = sum(len(select_indexed(message)) for message in messages) / len(messages)
+        if messages is button_messages:
+            unrouted = sum(1 for handler in index_chosen if handler is None)
+        print(f"{name}, {len(messages)} messages:")
+        print(f"  full scan  {full_time * 1e6:8.1f} us/msg | candidates {len(handlers):5.1f} | patterns {full_checked:5.1f}")
+        print(f"  indexed    {index_time * 1e6:8.1f} us/msg | candidates {candidates:5.1f} | patterns {index_checked:5.1f}")
+        print(f"  speedup x{full_time / index_time:.1f}")
+    print(f"routing mismatches: {mismatches}, buttons without handler: {unrouted}")
+    if mismatches or unrouted:
+        raise SystemExit(1)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Полный перебор хендлеров против индекса по первому слову и коду кнопки")
+    parser.add_argument("--noise", type=int, default=200, help="сообщений, не являющихся командами")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    # Хендлеры импортируют настройки бота, токен для замера не нужен
+    os.environ.setdefault("BOT_TOKEN", "benchmark")
+    benchmark(args.noise, args.rounds, args.seed)
+
+
+if __name__ == "__main__":
+    main()
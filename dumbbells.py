@@ -1,9 +1,8 @@
-from datetime import datetime
-
 from vkbottle.bot import BotLabeler, Message
 
 from bot.core.config import settings
-from bot.db import (
+from bot.keyboards import CMD_LIFT, CMD_UPGRADE, LIFT_KEYBOARD
+from bot.storage import (
     create_player,
     get_player,
     get_player_clan,
@@ -14,7 +13,8 @@ from bot.services.clans import (
     get_clan_bonuses,
     process_dumbbell_lift_with_clan,
 )
-from bot.utils import format_number
+from bot.services.profiles import get_display_name
+from bot.utils import format_number, now_ts
 
 dumbbell_labeler = BotLabeler()
 dumbbell_labeler.vbml_ignore_case = True
@@ -63,6 +63,7 @@ async def get_dumbbell_info_handler(message: Message):
     return info_text
 
 
+@dumbbell_labeler.message(payload_contains={"cmd": CMD_LIFT})
 @dumbbell_labeler.message(text=["поднять", "/поднять"])
 async def use_dumbbell_handler(message: Message):
     """Поднять гантелю"""
@@ -70,13 +71,12 @@ async def use_dumbbell_handler(message: Message):
     player = await get_player(user_id)
 
     # Проверка кулдауна
-    last_use_str = player['last_dumbbell_use']
-    if last_use_str:
-        last_use = datetime.fromisoformat(last_use_str)
-        seconds_passed = (datetime.now() - last_use).total_seconds()
+    last_use = player['last_dumbbell_use']
+    if last_use:
+        seconds_passed = now_ts() - last_use
 
         if seconds_passed < settings.DUMBBELL_COOLDOWN:
-            seconds_left = int(settings.DUMBBELL_COOLDOWN - seconds_passed)
+            seconds_left = settings.DUMBBELL_COOLDOWN - seconds_passed
             return f'⏳ Время отдыха! Подождите {seconds_left} секунд'
 
     # Обрабатываем поднятие с новой системой кланов
@@ -99,9 +99,10 @@ async def use_dumbbell_handler(message: Message):
             f"⭐ Бонус клана: +{income_calculation.get('clan_bonus_coins', 0)} монет"
         )
 
-    return "\n".join(message_parts)
+    await message.answer("\n".join(message_parts), keyboard=LIFT_KEYBOARD)
 
 
+@dumbbell_labeler.message(payload_contains={"cmd": CMD_UPGRADE})
 @dumbbell_labeler.message(text=["прокачаться", "/прокачаться"])
 async def upgrade_dumbbell_handler(message: Message):
     """Прокачать гантелю"""
@@ -109,7 +110,7 @@ async def upgrade_dumbbell_handler(message: Message):
     player = await get_player(user_id)
 
     if not player:
-        player = await create_player(user_id, str(message.from_id))
+        player = await create_player(user_id, await get_display_name(user_id))
 
     current_level = player["dumbbell_level"]
     next_level = current_level + 1
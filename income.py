@@ -0,0 +1,70 @@
+"""
+Доход бизнесов в магнезии.
+
+Фоновой задачи начисления нет. В строке игрока лежат доход всех его бизнесов
+в час (magnesia_per_hour; меняется при покупке бизнеса и повышении его уровня)
+и момент, до которого доход уже зачислен (magnesia_accrued_at). Накопленное с
+тех пор прибавляется к magnesia при каждом чтении игрока и записывается в
+базу тем же UPDATE, который тратит магнезию или меняет доход. Стоимость не
+зависит от числа владельцев бизнесов.
+
+MAGNESIA_MAX_OFFLINE_HOURS ограничивает начисление последними часами перед
+чтением; 0 — без ограничения.
+"""
+
+from __future__ import annotations
+
+from typing import Tuple
+
+from bot.core.config import settings
+
+HOUR_SECONDS = 60 * 60
+
+
+def business_income(business_id: int, level: int) -> int:
+    """Доход бизнеса в час на уровне level; 0 — бизнес не куплен"""
+    if level <= 0:
+        return 0
+    business = settings.BUSINESSES[business_id]
+    return business["base_income"] + (level - 1) * business["income_increase"]
+
+
+def earliest_accrual(now: int) -> int:
+    """Раньше этого момента доход не начисляется"""
+    if settings.MAGNESIA_MAX_OFFLINE_HOURS <= 0:
+        return 0
+    return now - int(settings.MAGNESIA_MAX_OFFLINE_HOURS * HOUR_SECONDS)
+
+
+def owed_magnesia(per_hour: int, accrued_at: int, now: int) -> int:
+    """Магнезия, накопленная с accrued_at и ещё не записанная в magnesia"""
+    start = max(accrued_at or 0, earliest_accrual(now))
+    return (per_hour or 0) * max(now - start, 0) // HOUR_SECONDS
+
+
+def accrual_sql(now: str, earliest: str, greatest: str = "MAX") -> Tuple[str, str]:
+    """SQL-выражения для UPDATE players: накопленная магнезия и новый magnesia_accrued_at.
+
+    now и earliest — параметры запроса (now_ts() и earliest_accrual(now)),
+    greatest — функция максимума двух чисел (MAX в SQLite, GREATEST в PostgreSQL).
+    """
+    start = f"{greatest}(magnesia_accrued_at, {earliest})"
+    owed = f"(magnesia_per_hour * {greatest}({now} - {start}, 0) / {HOUR_SECONDS})"
+    # Остаток меньше одной банки не теряется: момент зачисления сдвигается
+    # ровно на время, за которое набежали зачисленные банки
+    accrued_at = (
+        f"CASE WHEN magnesia_per_hour > 0"
+        f" THEN {start} + ({owed} * {HOUR_SECONDS} + magnesia_per_hour - 1) / magnesia_per_hour"
+        f" ELSE {now} END"
+    )
+    return owed, accrued_at
+
+
+def magnesia_rate_sql() -> str:
+    """SQL-выражение: доход всех бизнесов игрока в час по их уровням"""
+    return " + ".join(
+        f"CASE WHEN COALESCE(business_{business_id}_level, 0) > 0"
+        f" THEN {business['base_income']} + (business_{business_id}_level - 1) * {business['income_increase']}"
+        f" ELSE 0 END"
+        for business_id, business in settings.BUSINESSES.items()
+    )
@@ -0,0 +1,83 @@
+"""
+Клавиатуры с командами в payload.
+
+Кнопка несёт компактный payload {"cmd": <код>, ...аргументы}. Хендлер кнопки
+объявляется через payload_contains={"cmd": <код>}, и IndexedMessageView
+находит его по коду одним обращением к словарю, без VBML-шаблонов (см.
+bot.dispatch). Текстовые команды работают как раньше.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict
+
+from vkbottle import Keyboard, KeyboardButtonColor, Text
+
+CMD_LIFT = "lift"
+CMD_UPGRADE = "upgrade"
+CMD_PROFILE = "profile"
+# {"cmd": "shop", "p": номер страницы}
+CMD_SHOP = "shop"
+# {"cmd": "top", "kind": "balance" | "lifts" | "earners" | "clans"}
+CMD_TOP = "top"
+# {"cmd": "clan_members" | "clan_log", "clan": id, ...курсор страницы}
+CMD_CLAN_MEMBERS = "clan_members"
+CMD_CLAN_LOG = "clan_log"
+CMD_DELETE_CONFIRM = "delete_yes"
+CMD_DELETE_CANCEL = "delete_no"
+CMD_RESET_CONFIRM = "reset_yes"
+CMD_RESET_CANCEL = "reset_no"
+
+
+def payload(cmd: str, **args: Any) -> Dict[str, Any]:
+    return {"cmd": cmd, **args}
+
+
+MAIN_KEYBOARD = (
+    Keyboard()
+    .add(Text("💪 Поднять", payload(CMD_LIFT)), color=KeyboardButtonColor.POSITIVE)
+    .add(Text("⬆️ Прокачаться", payload(CMD_UPGRADE)))
+    .row()
+    .add(Text("👤 Профиль", payload(CMD_PROFILE)))
+    .add(Text("🏪 Магазин", payload(CMD_SHOP)))
+    .add(Text("🏆 Топ", payload(CMD_TOP)))
+    .get_json()
+)
+
+LIFT_KEYBOARD = (
+    Keyboard(inline=True)
+    .add(Text("💪 Ещё подход", payload(CMD_LIFT)), color=KeyboardButtonColor.POSITIVE)
+    .add(Text("⬆️ Прокачаться", payload(CMD_UPGRADE)))
+    .get_json()
+)
+
+TOP_KEYBOARD = (
+    Keyboard(inline=True)
+    .add(Text("💰 Монеты", payload(CMD_TOP, kind="balance")))
+    .add(Text("💪 Поднятия", payload(CMD_TOP, kind="lifts")))
+    .add(Text("📈 Заработок", payload(CMD_TOP, kind="earners")))
+    .row()
+    .add(Text("🏰 Кланы", payload(CMD_TOP, kind="clans")))
+    .get_json()
+)
+
+
+def shop_keyboard(page: int, pages: int) -> str:
+    keyboard = Keyboard(inline=True)
+    if page > 1:
+        keyboard.add(Text("◀ Назад", payload(CMD_SHOP, p=page - 1)))
+    if page < pages:
+        keyboard.add(Text("Дальше ▶", payload(CMD_SHOP, p=page + 1)))
+    keyboard.row()
+    keyboard.add(Text("⬆️ Прокачаться", payload(CMD_UPGRADE)), color=KeyboardButtonColor.POSITIVE)
+    return keyboard.get_json()
+
+
+def confirm_keyboard(confirm_cmd: str, cancel_cmd: str) -> str:
+    return (
+        Keyboard(inline=True)
+        .add(Text("✅ Подтвердить", payload(confirm_cmd)), color=KeyboardButtonColor.NEGATIVE)
+        .add(Text("❌ Отмена", payload(cancel_cmd)))
+        .get_json()
+    )
+
@@ -0,0 +1,90 @@
+import time
+from typing import Any, Dict, List, Tuple
+
+from bot.core.config import settings
+from bot.storage import get_top_balance, get_top_clans, get_top_earners, get_top_lifts
+from bot.metrics import record_cache
+
+TOP_QUERIES = {
+    "balance": get_top_balance,
+    "lifts": get_top_lifts,
+    "earners": get_top_earners,
+}
+
+# (рейтинг, лимит) -> (момент загрузки, строки)
+_top_cache: Dict[Tuple[str, int], Tuple[float, List[Tuple[Any, ...]]]] = {}
+
+
+async def refresh_top(kind: str, limit: int = 10) -> List[Tuple[Any, ...]]:
+    """Перечитывает рейтинг из базы и кладёт его в кеш"""
+    rows = await TOP_QUERIES[kind](limit)
+    _top_cache[(kind, limit)] = (time.monotonic(), rows)
+    return rows
+
+
+async def get_top(kind: str, limit: int = 10) -> List[Tuple[Any, ...]]:
+    """Рейтинг игроков; обновляется не чаще раза в TOP_CACHE_SECONDS"""
+    cached = _top_cache.get((kind, limit))
+    if cached is not None and time.monotonic() - cached[0] < settings.TOP_CACHE_SECONDS:
+        record_cache("leaderboard", True)
+        return cached[1]
+
+    record_cache("leaderboard", False)
+    return await refresh_top(kind, limit)
+
+
+
+# ==============================
+# ТОП КЛАНОВ
+# ==============================
+# Порядок топа зависит только от total_income_per_hour и treasury. Пополнение
+# казны клана из топа обновляет кеш на месте, пополнение клана, который может
+# в топ войти, сбрасывает кеш; остальные записи в казну кеш не трогают.
+
+# лимит -> (момент загрузки, строки)
+_clan_top_cache: Dict[int, Tuple[float, List[Dict[str, Any]]]] = {}
+
+
+def _clan_top_key(clan: Dict[str, Any]) -> Tuple[int, int]:
+    return (clan["total_income_per_hour"], clan["treasury"])
+
+
+async def refresh_clan_top(limit: int = 10) -> List[Dict[str, Any]]:
+    """Перечитывает топ кланов из базы и кладёт его в кеш"""
+    rows = await get_top_clans(limit)
+    _clan_top_cache[limit] = (time.monotonic(), rows)
+    return rows
+
+
+async def get_clan_top(limit: int = 10) -> List[Dict[str, Any]]:
+    """Топ кланов из кеша; перечитывается после сброса или раз в TOP_CACHE_SECONDS"""
+    cached = _clan_top_cache.get(limit)
+    if cached is not None and time.monotonic() - cached[0] < settings.TOP_CACHE_SECONDS:
+        record_cache("clan_top", True)
+        return cached[1]
+
+    record_cache("clan_top", False)
+    return await refresh_clan_top(limit)
+
+
+def invalidate_clan_top() -> None:
+    """Сбросить топ кланов: изменился состав, названия или казна многих кланов"""
+    _clan_top_cache.clear()
+
+
+def note_treasury_change(clan: Dict[str, Any], amount: int) -> None:
+    """Учесть пополнение казны клана; clan — строка клана до пополнения"""
+    new_key = (clan["total_income_per_hour"], clan["treasury"] + amount)
+    for limit, (loaded_at, rows) in list(_clan_top_cache.items()):
+        for row in rows:
+            if row["id"] == clan["id"]:
+                # Остальные кланы не изменились, поэтому состав топа тот же
+                row["treasury"] += amount
+                if amount < 0:
+                    del _clan_top_cache[limit]
+                else:
+                    rows.sort(key=_clan_top_key, reverse=True)
+                break
+        else:
+            if len(rows) < limit or new_key > _clan_top_key(rows[-1]):
+                del _clan_top_cache[limit]
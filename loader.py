@@ -1,6 +1,8 @@
-from vkbottle.bot import Bot
+from vkbottle.bot import Bot, BotLabeler
 
 from bot.core.config import settings
+from bot.dispatch import IndexedMessageView
+from bot.sender import QueuedAPI
 
 token = settings.BOT_TOKEN
-bot = Bot(token=token)
+bot = Bot(api=QueuedAPI(token), labeler=BotLabeler(message_view=IndexedMessageView()))
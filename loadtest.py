@@ -0,0 +1,501 @@
+"""
+Нагрузочный тест бота без ВК.
+
+Собирает те же лейблеры, middleware и return manager, что и on_startup, но
+подменяет HTTP-клиент VK API заглушкой и работает на временной SQLite базе.
+N виртуальных игроков параллельно шлют сообщения из заданной смеси команд,
+в конце печатается пропускная способность, перцентили задержек по хендлерам
+и число SQL-запросов на сообщение. С DB_BACKEND=postgres игроки пишут в
+PostgreSQL из настроек DB_*, SQL-запросы в этом режиме не считаются.
+
+Запуск:
+    python -m bot.loadtest --users 200 --messages 20000
+    python -m bot.loadtest --users 50 --duration 30 --mix lift=70,balance=30 --api-latency-ms 20
+    python -m bot.loadtest --users 100 --messages 5000 --redeliver 0.1
+    python -m bot.loadtest --users 50 --messages 2000 --send-rate 20 --api-rate-limit 20
+    python -m bot.loadtest --users 10000 --messages 10000 --mix start=1 --ramp-seconds 60
+Последний — шторм регистраций после рекламы: 10000 новичков за минуту, каждый
+пишет один раз.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Any
+
+DEFAULT_MIX = {
+    "lift": 40,
+    "balance": 15,
+    "profile": 10,
+    "top": 10,
+    "transfer": 10,
+    "promo": 5,
+    "shop": 5,
+    "admin": 5,
+    # Первое сообщение новичка; по умолчанию выключено, для --mix start=1
+    "start": 0,
+}
+
+LOADTEST_PROMO_CODE = "LOADTEST"
+
+# Счётчик SQL-запросов текущего сообщения (у каждого виртуального игрока свой контекст)
+_message_queries: contextvars.ContextVar[list[int] | None] = contextvars.ContextVar(
+    "loadtest_message_queries", default=None
+)
+
+
+def parse_mix(value: str) -> dict[str, int]:
+    mix: dict[str, int] = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(
+                f"unknown command kind {name!r}, expected one of: {', '.join(DEFAULT_MIX)}"
+            )
+        try:
+            mix[name] = int(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"weight for {name!r} must be an integer") from None
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("mix must have at least one non-zero weight")
+    return mix
+
+
+def make_text(kind: str, user_id: int, users: list[int], rng: random.Random) -> str:
+    """Текст сообщения для команды из смеси"""
+    if kind == "lift":
+        return "поднять"
+    if kind == "balance":
+        return "баланс"
+    if kind == "profile":
+        return "профиль"
+    if kind == "top":
+        return rng.choice(("топ", "топ монет", "топ поднятий", "топ заработка"))
+    if kind == "transfer":
+        target = rng.choice(users)
+        pointer = rng.choice((f"[id{target}|игрок]", str(target), f"vk.com/load{target}"))
+        return f"перевод {pointer} 1"
+    if kind == "promo":
+        return f"промо {LOADTEST_PROMO_CODE}"
+    if kind == "shop":
+        return rng.choice(("магазин", "б", "гантеля"))
+    if kind == "admin":
+        return rng.choice(("админпанель", "статистика", "админ"))
+    if kind == "start":
+        return "начать"
+    raise ValueError(kind)
+
+
+def make_event(user_id: int, text: str, message_id: int) -> dict[str, Any]:
+    """Событие message_new в формате Bots Long Poll"""
+    return {
+        "type": "message_new",
+        "event_id": f"loadtest{message_id}",
+        "v": "5.199",
+        "group_id": 1,
+        "object": {
+            "message": {
+                "id": message_id,
+                "conversation_message_id": message_id,
+                "date": int(time.time()),
+                "peer_id": user_id,
+                "from_id": user_id,
+                "text": text,
+                "out": 0,
+                "attachments": [],
+                "fwd_messages": [],
+                "important": False,
+                "is_hidden": False,
+                "version": message_id,
+            },
+            "client_info": {
+                "button_actions": ["text", "callback"],
+                "keyboard": True,
+                "inline_keyboard": True,
+                "carousel": True,
+                "lang_id": 0,
+            },
+        },
+    }
+
+
+# ==============================
+# ЗАГЛУШКА VK API
+# ==============================
+
+
+def _make_stub_client(api_latency: float, rate_limit: float = 0.0):
+    from vkbottle.http import ABCHTTPClient
+
+    class StubVKClient(ABCHTTPClient):
+        """HTTP-клиент, который отвечает на вызовы VK API локально.
+
+        С rate_limit отвечает ошибкой 6, как VK, на messages.send сверх
+        rate_limit вызовов за последнюю секунду.
+        """
+
+        def __init__(self, latency: float = 0.0, rate_limit: float = 0.0) -> None:
+            self.latency = latency
+            self.rate_limit = rate_limit
+            self.calls: dict[str, int] = defaultdict(int)
+            self._next_id = 0
+            self._recent_sends: deque[float] = deque()
+
+        def _rate_limited(self) -> bool:
+            now = time.monotonic()
+            while self._recent_sends and self._recent_sends[0] <= now - 1:
+                self._recent_sends.popleft()
+            if len(self._recent_sends) >= self.rate_limit:
+                return True
+            self._recent_sends.append(now)
+            return False
+
+        def _respond(self, url: str, data: dict[str, Any] | None) -> dict[str, Any]:
+            method = url.rsplit("/", 1)[-1]
+            self.calls[method] += 1
+            data = data or {}
+
+            if method == "messages.send":
+                if self.rate_limit and self._rate_limited():
+                    self.calls["messages.send:rate_limited"] += 1
+                    return {"error": {"error_code": 6, "error_msg": "Too many requests per second"}}
+                self._next_id += 1
+                if "peer_ids" not in data:
+                    return {"response": self._next_id}
+                return {
+                    "response": [
+                        {"peer_id": int(peer_id), "message_id": self._next_id, "conversation_message_id": self._next_id}
+                        for peer_id in str(data["peer_ids"]).split(",")
+                    ]
+                }
+            if method == "users.get":
+                # Айди и адреса вида loadNNN; остальных адресов «не существует»
+                users = []
+                for key in str(data.get("user_ids", "1")).split(","):
+                    key = key.strip().lower()
+                    user_id = key if key.isdigit() else key[len("load") :] if key.startswith("load") else ""
+                    if user_id.isdigit():
+                        users.append(
+                            {
+                                "id": int(user_id),
+                                "first_name": "Load",
+                                "last_name": f"Test{user_id}",
+                                "screen_name": f"load{user_id}",
+                            }
+                        )
+                if not users:
+                    return {"error": {"error_code": 113, "error_msg": "Invalid user id"}}
+                return {"response": users}
+            if method == "utils.resolveScreenName":
+                return {"response": {"type": "user", "object_id": 1}}
+            return {"response": 1}
+
+        async def request_raw(self, url, method="GET", data=None, **kwargs):
+            return await self.request_json(url, method, data, **kwargs)
+
+        async def request_json(self, url, method="GET", data=None, **kwargs):
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return self._respond(url, data)
+
+        async def request_text(self, url, method="GET", data=None, **kwargs):
+            return json.dumps(await self.request_json(url, method, data, **kwargs))
+
+        async def request_content(self, url, method="GET", data=None, **kwargs):
+            return (await self.request_text(url, method, data, **kwargs)).encode()
+
+        async def close(self) -> None:
+            pass
+
+    return StubVKClient(api_latency, rate_limit)
+
+
+# ==============================
+# СБОР СТАТИСТИКИ
+# ==============================
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+@dataclass
+class LoadTestStats:
+    messages: int = 0
+    errors: int = 0
+    elapsed: float = 0.0
+    message_latencies: list[float] = field(default_factory=list)
+    queries_per_message: list[int] = field(default_factory=list)
+    handler_latencies: dict[str, list[float]] = field(default_factory=lambda: defaultdict(list))
+    handler_errors: dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    api_calls: dict[str, int] = field(default_factory=dict)
+    # Повторные доставки тех же событий и SQL-запросы, которые они вызвали
+    redelivered: int = 0
+    redelivered_queries: int = 0
+
+    def format(self) -> str:
+        lines = []
+        rate = self.messages / self.elapsed if self.elapsed else 0.0
+        lat = sorted(self.message_latencies)
+        queries = self.queries_per_message
+        lines.append(f"messages:        {self.messages} in {self.elapsed:.2f}s ({rate:.1f} msg/s)")
+        lines.append(f"router errors:   {self.errors}")
+        lines.append(
+            "latency ms:      p50={:.2f} p90={:.2f} p99={:.2f} max={:.2f}".format(
+                percentile(lat, 0.5) * 1000,
+                percentile(lat, 0.9) * 1000,
+                percentile(lat, 0.99) * 1000,
+                (lat[-1] if lat else 0.0) * 1000,
+            )
+        )
+        if queries:
+            lines.append(
+                f"sql per message: avg={sum(queries) / len(queries):.2f} max={max(queries)}"
+            )
+        if self.redelivered:
+            lines.append(f"redelivered:     {self.redelivered} events, {self.redelivered_queries} sql queries")
+        lines.append("")
+        lines.append(f"{'handler':<36}{'calls':>8}{'err':>6}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}")
+        for name, values in sorted(self.handler_latencies.items(), key=lambda kv: -len(kv[1])):
+            values = sorted(values)
+            lines.append(
+                f"{name:<36}{len(values):>8}{self.handler_errors.get(name, 0):>6}"
+                f"{percentile(values, 0.5) * 1000:>10.2f}"
+                f"{percentile(values, 0.9) * 1000:>10.2f}"
+                f"{percentile(values, 0.99) * 1000:>10.2f}"
+            )
+        if self.api_calls:
+            lines.append("")
+            lines.append("vk api calls:    " + ", ".join(f"{k}={v}" for k, v in sorted(self.api_calls.items())))
+        return "\n".join(lines)
+
+
+def _instrument_handlers(message_view, stats: LoadTestStats) -> None:
+    """Оборачивает handle() каждого хендлера замером времени"""
+    for handler in message_view.handlers:
+        func = getattr(handler, "handler", None)
+        name = getattr(func, "__name__", type(handler).__name__)
+        original = handler.handle
+
+        async def timed_handle(message, *args, _original=original, _name=name, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await _original(message, *args, **kwargs)
+            except Exception:
+                stats.handler_errors[_name] += 1
+                raise
+            finally:
+                stats.handler_latencies[_name].append(time.perf_counter() - started)
+
+        handler.handle = timed_handle
+
+
+def _count_query(sql: str, parameters, elapsed: float, rowcount: int) -> None:
+    counter = _message_queries.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+# ==============================
+# ПРОГОН
+# ==============================
+
+
+async def run(
+    users: int,
+    messages: int | None,
+    duration: float | None,
+    mix: dict[str, int],
+    api_latency: float,
+    think_time: float,
+    seed: int,
+    redeliver: float = 0.0,
+    send_rate: float = 0.0,
+    api_rate_limit: float = 0.0,
+    ramp: float = 0.0,
+) -> LoadTestStats:
+    from loguru import logger
+
+    from bot.core.config import settings
+    from bot.core.loader import bot
+    from bot.db import add_query_observer, remove_query_observer
+    from bot.handlers import get_handlers_labelers
+    from bot.middlewares.dedup import DeduplicationMiddleware
+    from bot.middlewares.register import BotMessageReturnHandler, RegistrationMiddleware
+    from bot.sender import SendPriorityMiddleware
+    from bot.storage import close_storage, create_promo_code, create_tables
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+    logger.disable("vkbottle")
+
+    await create_tables()
+    admin_id = settings.ADMIN_USERS[0]
+    await create_promo_code(LOADTEST_PROMO_CODE, 10**9, "монеты", 10, admin_id)
+
+    # Та же сборка, что в on_startup
+    bot.labeler.load(get_handlers_labelers())
+    bot.labeler.message_view.register_middleware(DeduplicationMiddleware)
+    bot.labeler.message_view.register_middleware(SendPriorityMiddleware)
+    bot.labeler.message_view.register_middleware(RegistrationMiddleware)
+    bot.labeler.message_view.handler_return_manager = BotMessageReturnHandler()
+
+    stub = _make_stub_client(api_latency, api_rate_limit)
+    bot.api.http_client = stub
+    # Без --send-rate очередь отправок не ограничивает скорость
+    bot.api.start_send_queue(
+        send_rate or 1e9,
+        settings.SEND_BURST if send_rate else 1e9,
+        settings.SEND_CONCURRENCY if send_rate else users,
+        max_attempts=settings.SEND_MAX_ATTEMPTS,
+        retry_base=settings.SEND_RETRY_BASE_SECONDS,
+        retry_cap=settings.SEND_RETRY_MAX_SECONDS,
+    )
+    router = bot.router
+
+    stats = LoadTestStats()
+    _instrument_handlers(bot.labeler.message_view, stats)
+    add_query_observer(_count_query)
+
+    rng = random.Random(seed)
+    user_ids = [10_000_000 + i for i in range(users)]
+    kinds = list(mix)
+    weights = [mix[k] for k in kinds]
+    next_message_id = 0
+    deadline = time.perf_counter() + duration if duration else None
+    remaining = messages if messages is not None else None
+
+    async def virtual_user(user_id: int, joins_after: float) -> None:
+        nonlocal next_message_id, remaining
+        user_rng = random.Random(rng.random())
+        if joins_after:
+            await asyncio.sleep(joins_after)
+        while True:
+            if remaining is not None:
+                if remaining <= 0:
+                    return
+                remaining -= 1
+            if deadline is not None and time.perf_counter() >= deadline:
+                return
+
+            kind = user_rng.choices(kinds, weights)[0]
+            sender = admin_id if kind == "admin" else user_id
+            next_message_id += 1
+            event = make_event(sender, make_text(kind, user_id, user_ids, user_rng), next_message_id)
+
+            counter = [0]
+            token = _message_queries.set(counter)
+            started = time.perf_counter()
+            try:
+                await router.route(event, bot.api)
+            except Exception:
+                stats.errors += 1
+            finally:
+                stats.message_latencies.append(time.perf_counter() - started)
+                _message_queries.reset(token)
+            stats.messages += 1
+            stats.queries_per_message.append(counter[0])
+
+            if redeliver and user_rng.random() < redeliver:
+                # Та же доставка ещё раз, как после переподключения long poll
+                counter = [0]
+                token = _message_queries.set(counter)
+                try:
+                    await router.route(event, bot.api)
+                except Exception:
+                    stats.errors += 1
+                finally:
+                    _message_queries.reset(token)
+                stats.redelivered += 1
+                stats.redelivered_queries += counter[0]
+
+            if think_time:
+                await asyncio.sleep(user_rng.expovariate(1 / think_time))
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(virtual_user(uid, ramp * i / users) for i, uid in enumerate(user_ids)))
+    finally:
+        remove_query_observer(_count_query)
+        await bot.api.stop_send_queue(settings.SEND_SHUTDOWN_TIMEOUT_SECONDS)
+        await close_storage()
+    stats.elapsed = time.perf_counter() - started
+    stats.api_calls = dict(stub.calls)
+    return stats
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест лейблеров бота на заглушке VK API")
+    parser.add_argument("--users", type=int, default=100, help="число одновременных виртуальных игроков")
+    parser.add_argument("--messages", type=int, default=None, help="всего сообщений (по умолчанию 10000)")
+    parser.add_argument("--duration", type=float, default=None, help="длительность в секундах вместо --messages")
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=DEFAULT_MIX,
+        help="веса команд, например lift=50,balance=20,top=10 (виды: %s)" % ", ".join(DEFAULT_MIX),
+    )
+    parser.add_argument("--api-latency-ms", type=float, default=0.0, help="задержка ответа заглушки VK API")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="средняя пауза игрока между сообщениями")
+    parser.add_argument(
+        "--ramp-seconds", type=float, default=0.0, help="игроки приходят равномерно за столько секунд, а не все сразу"
+    )
+    parser.add_argument("--send-rate", type=float, default=0.0, help="лимит очереди отправок, сообщений в секунду")
+    parser.add_argument(
+        "--api-rate-limit", type=float, default=0.0, help="заглушка отвечает ошибкой 6 сверх стольких messages.send в секунду"
+    )
+    parser.add_argument("--redeliver", type=float, default=0.0, help="доля событий, доставляемых повторно")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", default=None, help="файл SQLite (по умолчанию временный)")
+    args = parser.parse_args(argv)
+
+    if args.users <= 0:
+        parser.error("--users must be positive")
+    if args.messages is None and args.duration is None:
+        args.messages = 10_000
+    return args
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="gym_legend_loadtest_") as tmp:
+        # Настройки читаются при импорте bot.core.config, поэтому окружение готовим заранее
+        os.environ["DB_PATH"] = args.db or os.path.join(tmp, "loadtest.db")
+        os.environ.setdefault("BOT_TOKEN", "loadtest")
+
+        stats = asyncio.run(
+            run(
+                users=args.users,
+                messages=args.messages,
+                duration=args.duration,
+                mix=args.mix,
+                api_latency=args.api_latency_ms / 1000,
+                think_time=args.think_ms / 1000,
+                seed=args.seed,
+                redeliver=args.redeliver,
+                send_rate=args.send_rate,
+                api_rate_limit=args.api_rate_limit,
+                ramp=args.ramp_seconds,
+            )
+        )
+
+    print(stats.format())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,418 @@
+"""
+Настройка логирования.
+
+Sink'и не пишут в файл из потока, который логирует: сообщение форматируется
+и кладётся в очередь (queue.SimpleQueue), а фоновый поток забирает записи
+пачками и пишет их одним вызовом. Ротация по размеру и по времени выполняется
+в этом же потоке, а сжатие старых файлов — в отдельном пуле, чтобы не
+задерживать запись новых сообщений. Event loop при ротации не блокируется.
+
+Встроенный enqueue=True у loguru здесь не подходит: он сериализует каждую
+запись через pickle в multiprocessing-очередь, что дороже самой записи в файл.
+
+DEBUG-сообщения можно прореживать по модулям (LOG_DEBUG_SAMPLING), например
+{"vkbottle": 0.01} оставляет каждое сотое отладочное сообщение vkbottle.
+
+Сравнение задержек event loop со старой настройкой (100 KB, zip, синхронно):
+    python -m bot.core.log --messages 50000
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import glob
+import gzip
+import os
+import queue
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional, TextIO
+
+from loguru import logger
+
+LOG_FORMAT = "{time} | {level} | {module}:{function}:{line} | {message}"
+DEBUG_LEVEL_NO = 10
+
+_STOP = object()
+
+# Метка времени в имени ротированного файла: vk_bot.2026-01-31_23-59-59_123456.log
+ROTATED_STAMP_FORMAT = "%Y-%m-%d_%H-%M-%S_%f"
+ROTATED_STAMP_GLOB = "[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]_[0-9][0-9]-[0-9][0-9]-[0-9][0-9]_[0-9]*"
+
+
+class BackgroundCompressor:
+    """Сжимает ротированные файлы в отдельном потоке"""
+
+    def __init__(self, fmt: str = "gz") -> None:
+        if fmt not in ("gz", "zip"):
+            raise ValueError(f"Unsupported log compression: {fmt!r}")
+        self.fmt = fmt
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="log-compress")
+
+    def __call__(self, path: str) -> Future:
+        return self._executor.submit(self._compress, path)
+
+    def _compress(self, path: str) -> None:
+        target = f"{path}.{self.fmt}"
+        try:
+            if self.fmt == "gz":
+                with open(path, "rb") as src, gzip.open(target, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+            else:
+                with zipfile.ZipFile(target, "w", compression=zipfile.ZIP_DEFLATED) as dst:
+                    dst.write(path, os.path.basename(path))
+            os.remove(path)
+        except OSError as e:
+            print(f"Log compression failed for {path}: {e}", file=sys.stderr)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+class _BackgroundSink:
+    """Sink для loguru: write() только ставит сообщение в очередь"""
+
+    def __init__(self, name: str) -> None:
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def write(self, message: str) -> None:
+        self._queue.put(message)
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            messages = [item for item in batch if isinstance(item, str)]
+            if messages:
+                try:
+                    self._write_batch("".join(messages))
+                except Exception as e:
+                    print(f"Log write failed: {e}", file=sys.stderr)
+
+            stop = False
+            for item in batch:
+                if isinstance(item, Future):
+                    item.set_result(None)
+                elif item is _STOP:
+                    stop = True
+            if stop:
+                self._close()
+                return
+
+    def _write_batch(self, data: str) -> None:
+        raise NotImplementedError
+
+    def _close(self) -> None:
+        pass
+
+    async def complete(self) -> None:
+        """Дожидается, пока всё, что уже в очереди, будет записано"""
+        if not self._thread.is_alive():
+            return
+        marker: Future = Future()
+        self._queue.put(marker)
+        await asyncio.wrap_future(marker)
+
+    def stop(self) -> None:
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+
+
+class BackgroundStreamSink(_BackgroundSink):
+    def __init__(self, stream: TextIO) -> None:
+        self._stream = stream
+        super().__init__("log-console")
+
+    def _write_batch(self, data: str) -> None:
+        self._stream.write(data)
+        self._stream.flush()
+
+
+class BackgroundFileSink(_BackgroundSink):
+    """Файл с ротацией по размеру или по времени — что наступит раньше.
+
+    Старый файл переименовывается в <имя>.<дата>.<расширение>, сжимается в
+    фоне, лишние архивы сверх retention удаляются.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int,
+        interval_seconds: float,
+        retention: int,
+        compressor: Optional[BackgroundCompressor] = None,
+    ) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.interval_seconds = interval_seconds
+        self.retention = retention
+        self.compressor = compressor
+        self._file = None
+        self._size = 0
+        self._rotate_at = 0.0
+        super().__init__("log-writer")
+
+    def _open(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._file = open(self.path, "ab")
+        self._size = self._file.tell()
+        self._rotate_at = time.time() + self.interval_seconds
+
+    def _rotate(self) -> None:
+        self._file.close()
+        self._file = None
+
+        root, ext = os.path.splitext(self.path)
+        rotated = f"{root}.{datetime.now():{ROTATED_STAMP_FORMAT}}{ext}"
+        os.rename(self.path, rotated)
+        if self.compressor is not None:
+            self.compressor(rotated)
+        self._apply_retention(root, ext)
+        self._open()
+
+    def _apply_retention(self, root: str, ext: str) -> None:
+        if self.retention <= 0:
+            return
+        # Только файлы этого sink'а: файлы воркеров (vk_bot.worker2.log и их
+        # архивы) тоже начинаются с root, но после точки у них не дата
+        rotated = glob.glob(f"{glob.escape(root)}.{ROTATED_STAMP_GLOB}{glob.escape(ext)}*")
+        rotated.sort(key=lambda p: os.stat(p).st_mtime if os.path.exists(p) else 0, reverse=True)
+        for old in rotated[self.retention :]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+    def _write_batch(self, data: str) -> None:
+        if self._file is None:
+            self._open()
+
+        encoded = data.encode("utf-8")
+        if self._size and (self._size + len(encoded) > self.max_bytes or time.time() >= self._rotate_at):
+            self._rotate()
+
+        self._file.write(encoded)
+        self._file.flush()
+        self._size += len(encoded)
+
+    def _close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class DebugSampler:
+    """Фильтр loguru, пропускающий только долю DEBUG-сообщений модуля.
+
+    Правило выбирается по самому длинному префиксу имени модуля; доля 0
+    отключает DEBUG модуля полностью. Сообщения INFO и выше не трогаются.
+    """
+
+    def __init__(self, rates: dict[str, float]) -> None:
+        self.rates = rates
+        self._every: dict[str, int] = {}
+        self._counters: dict[str, int] = {}
+
+    def _resolve(self, name: str) -> int:
+        # 0 — не пропускать, 1 — пропускать всё, N — каждое N-е
+        rule = None
+        for prefix in self.rates:
+            if (name == prefix or name.startswith(prefix + ".")) and (rule is None or len(prefix) > len(rule)):
+                rule = prefix
+        if rule is None:
+            every = 1
+        else:
+            rate = self.rates[rule]
+            every = 0 if rate <= 0 else max(1, round(1 / rate))
+        self._every[name] = every
+        return every
+
+    def __call__(self, record) -> bool:
+        if record["level"].no > DEBUG_LEVEL_NO:
+            return True
+
+        name = record["name"] or ""
+        every = self._every.get(name)
+        if every is None:
+            every = self._resolve(name)
+        if every <= 1:
+            return every == 1
+
+        count = self._counters.get(name, 0)
+        self._counters[name] = count + 1
+        return count % every == 0
+
+
+_compressor: Optional[BackgroundCompressor] = None
+
+
+def worker_log_path(path: str, worker: Optional[int]) -> str:
+    """Отдельный файл для каждого процесса-воркера: vk_bot.log -> vk_bot.worker2.log.
+
+    Ротацию одного файла из нескольких процессов не согласовать.
+    """
+    if worker is None:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.worker{worker}{ext}"
+
+
+def setup_logging(
+    path: str,
+    level: str = "DEBUG",
+    json_lines: bool = False,
+    rotation_size_mb: float = 100,
+    rotation_hours: float = 24,
+    retention: int = 30,
+    compression: Optional[str] = "gz",
+    debug_sampling: Optional[dict[str, float]] = None,
+    console: bool = True,
+) -> None:
+    """Заменяет sink'и loguru на фоновые: консоль и файл с ротацией"""
+    global _compressor
+
+    sampler = DebugSampler(debug_sampling or {})
+
+    def main_filter(record) -> bool:
+        # У журнала медленных запросов свой файл, см. bot.slow_queries
+        return not record["extra"].get("slow_query") and sampler(record)
+
+    _compressor = BackgroundCompressor(compression) if compression else None
+
+    logger.remove()
+    if console:
+        logger.add(BackgroundStreamSink(sys.stderr), level=level, filter=main_filter, colorize=sys.stderr.isatty())
+    logger.add(
+        BackgroundFileSink(
+            path,
+            max_bytes=int(rotation_size_mb * 1024 * 1024),
+            interval_seconds=rotation_hours * 3600,
+            retention=retention,
+            compressor=_compressor,
+        ),
+        level=level,
+        format=LOG_FORMAT,
+        filter=main_filter,
+        serialize=json_lines,
+    )
+
+
+async def shutdown_logging() -> None:
+    """Дописывает очередь и дожидается сжатия последних файлов"""
+    await logger.complete()
+    if _compressor is not None:
+        await asyncio.to_thread(_compressor.shutdown)
+
+
+# ==============================
+# БЕНЧМАРК ЗАДЕРЖЕК EVENT LOOP
+# ==============================
+
+
+async def _log_workload(messages: int, burst: int) -> tuple[list[float], list[float]]:
+    """Пишет сообщения пачками и меряет время каждого вызова и задержку цикла"""
+    loop = asyncio.get_running_loop()
+    call_times: list[float] = []
+    lags: list[float] = []
+    stop = False
+
+    async def probe() -> None:
+        while not stop:
+            expected = loop.time() + 0.001
+            await asyncio.sleep(0.001)
+            lags.append(max(0.0, loop.time() - expected))
+
+    probe_task = asyncio.create_task(probe())
+    payload = "x" * 120
+    for i in range(messages):
+        started = time.perf_counter()
+        logger.debug("Handling event {} for user {} payload {}", i, i % 1000, payload)
+        call_times.append(time.perf_counter() - started)
+        if i % burst == 0:
+            await asyncio.sleep(0)
+    stop = True
+    await probe_task
+    await logger.complete()
+    return call_times, lags
+
+
+def _summary(name: str, call_times: list[float], lags: list[float], elapsed: float) -> str:
+    call_times = sorted(call_times)
+    lags = sorted(lags) or [0.0]
+
+    def pct(values: list[float], q: float) -> float:
+        return values[min(len(values) - 1, int(q * (len(values) - 1)))] * 1000
+
+    return (
+        f"{name:<10} total {elapsed:6.2f}s | log call p50 {pct(call_times, 0.5):.4f} ms"
+        f" p99 {pct(call_times, 0.99):.4f} ms max {call_times[-1] * 1000:.2f} ms"
+        f" | loop lag p99 {pct(lags, 0.99):.2f} ms max {lags[-1] * 1000:.2f} ms"
+    )
+
+
+def benchmark(messages: int, burst: int, rotation_kb: float) -> None:
+    with tempfile.TemporaryDirectory(prefix="gym_legend_logbench_") as tmp:
+        # Старая настройка из main(): DEBUG, ротация 100 KB, zip в потоке event loop
+        logger.remove()
+        logger.add(
+            os.path.join(tmp, "legacy", "vk_bot.log"),
+            level="DEBUG",
+            format=LOG_FORMAT,
+            rotation="100 KB",
+            compression="zip",
+        )
+        started = time.perf_counter()
+        calls, lags = asyncio.run(_log_workload(messages, burst))
+        legacy = _summary("legacy", calls, lags, time.perf_counter() - started)
+        logger.remove()
+
+        # Новая настройка; размер ротации можно уменьшить, чтобы ротации попали в замер
+        setup_logging(
+            os.path.join(tmp, "pipeline", "vk_bot.log"),
+            level="DEBUG",
+            rotation_size_mb=rotation_kb / 1024,
+            console=False,
+        )
+        started = time.perf_counter()
+        calls, lags = asyncio.run(_log_workload(messages, burst))
+        pipeline = _summary("pipeline", calls, lags, time.perf_counter() - started)
+        logger.remove()
+        if _compressor is not None:
+            _compressor.shutdown()
+
+    print(legacy)
+    print(pipeline)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Задержки event loop при логировании: старая и новая настройка")
+    parser.add_argument("--messages", type=int, default=50_000)
+    parser.add_argument("--burst", type=int, default=50, help="сообщений между уступками event loop")
+    parser.add_argument(
+        "--rotation-kb",
+        type=float,
+        default=100,
+        help="размер ротации новой настройки в бенчмарке (по умолчанию как у старой)",
+    )
+    args = parser.parse_args(argv)
+    benchmark(args.messages, max(1, args.burst), args.rotation_kb)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""
+Метрики бота в формате Prometheus.
+
+Включается настройкой METRICS_ENABLED. Пока метрики выключены, ничего не
+оборачивается и не регистрируется, а record_cache() сводится к одной проверке
+флага, поэтому накладных расходов нет.
+
+Что собирается:
+- число входящих событий (gymlegend_updates_total);
+- гистограмма задержки каждого хендлера, ошибки и число выполняющихся хендлеров;
+- число и длительность SQL-запросов из bot.db по нормализованному тексту;
+- попадания/промахи кешей (record_cache);
+- задержка event loop.
+
+Эндпоинт: http://METRICS_HOST:METRICS_PORT/metrics (по умолчанию 127.0.0.1:9105).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from bisect import bisect_left
+from typing import Iterable, Optional
+
+from loguru import logger
+from vkbottle import BaseMiddleware
+from vkbottle.bot import Message
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_enabled = False
+_runner = None
+_lag_task: Optional[asyncio.Task] = None
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        REGISTRY.append(self)
+
+    def _key(self, labels: tuple) -> tuple[str, ...]:
+        if len(labels) != len(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {labels}")
+        return tuple(str(label) for label in labels)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()) -> None:
+        super().__init__(name, documentation, labels)
+        self.values: dict[tuple[str, ...], float] = {}
+        if not self.label_names:
+            self.values[()] = 0
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, *labels, value: float) -> None:
+        self.values[self._key(labels)] = value
+
+    def dec(self, *labels, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Iterable[str] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # ключ -> [счётчики по бакетам (+Inf последним), сумма, количество]
+        self.values: dict[tuple[str, ...], list] = {}
+
+    def observe(self, *labels, value: float) -> None:
+        key = self._key(labels)
+        state = self.values.get(key)
+        if state is None:
+            state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        for key, (counts, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float("inf")), counts):
+                cumulative += bucket_count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return lines
+
+
+REGISTRY: list[_Metric] = []
+
+UPDATES = Counter("gymlegend_updates_total", "Incoming message events")
+DUPLICATES = Counter("gymlegend_duplicate_updates_total", "Redelivered message events dropped before handlers")
+HANDLER_LATENCY = Histogram(
+    "gymlegend_handler_duration_seconds", "Handler execution time", labels=("module", "handler")
+)
+HANDLER_ERRORS = Counter(
+    "gymlegend_handler_errors_total", "Handlers that raised an exception", labels=("module", "handler")
+)
+HANDLERS_IN_FLIGHT = Gauge("gymlegend_handlers_in_flight", "Handlers currently executing")
+SQL_LATENCY = Histogram(
+    "gymlegend_sql_duration_seconds",
+    "SQL statement time including the aiosqlite queue wait",
+    labels=("statement",),
+    buckets=SQL_BUCKETS,
+)
+CACHE_REQUESTS = Counter("gymlegend_cache_requests_total", "Cache lookups", labels=("cache", "result"))
+LOOP_LAG = Histogram(
+    "gymlegend_event_loop_lag_seconds", "Event loop scheduling delay", buckets=LOOP_LAG_BUCKETS
+)
+LOOP_LAG_LAST = Gauge("gymlegend_event_loop_lag_last_seconds", "Last measured event loop delay")
+SEND_LATENCY = Histogram(
+    "gymlegend_send_duration_seconds", "messages.send time including the send queue wait", labels=("priority",)
+)
+SEND_QUEUE_DEPTH = Gauge("gymlegend_send_queue_depth", "Outgoing messages waiting in the send queue")
+SEND_RETRIES = Counter("gymlegend_send_retries_total", "Retried messages.send calls", labels=("reason",))
+
+
+def render() -> str:
+    """Все метрики в текстовом формате Prometheus"""
+    lines: list[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    """Учитывает обращение к кешу; без включённых метрик ничего не делает"""
+    if _enabled:
+        CACHE_REQUESTS.inc(cache, "hit" if hit else "miss")
+
+
+def record_duplicate() -> None:
+    if _enabled:
+        DUPLICATES.inc()
+
+
+def record_send(priority: str, seconds: float) -> None:
+    if _enabled:
+        SEND_LATENCY.observe(priority, value=seconds)
+
+
+def record_send_queue_depth(depth: int) -> None:
+    if _enabled:
+        SEND_QUEUE_DEPTH.set(value=depth)
+
+
+def record_send_retry(reason: str) -> None:
+    if _enabled:
+        SEND_RETRIES.inc(reason)
+
+
+# ==============================
+# ИНСТРУМЕНТАЦИЯ
+# ==============================
+
+
+class MetricsMiddleware(BaseMiddleware[Message]):
+    async def pre(self):
+        UPDATES.inc()
+
+
+def _observe_query(sql: str, parameters, elapsed: float, rowcount: int) -> None:
+    from bot.db import normalize_sql
+
+    SQL_LATENCY.observe(normalize_sql(sql), value=elapsed)
+
+
+def instrument_handlers(message_view) -> None:
+    """Оборачивает handle() каждого хендлера замером времени"""
+    for handler in message_view.handlers:
+        func = getattr(handler, "handler", None)
+        name = getattr(func, "__name__", type(handler).__name__)
+        module = getattr(func, "__module__", "").rsplit(".", 1)[-1]
+        original = handler.handle
+
+        async def timed_handle(message, *args, _original=original, _labels=(module, name), **kwargs):
+            HANDLERS_IN_FLIGHT.inc()
+            started = time.perf_counter()
+            try:
+                return await _original(message, *args, **kwargs)
+            except Exception:
+                HANDLER_ERRORS.inc(*_labels)
+                raise
+            finally:
+                HANDLER_LATENCY.observe(*_labels, value=time.perf_counter() - started)
+                HANDLERS_IN_FLIGHT.dec()
+
+        handler.handle = timed_handle
+
+
+async def monitor_event_loop_lag(interval: float = 0.5) -> None:
+    """Меряет, насколько позже запланированного просыпается корутина"""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - expected)
+        LOOP_LAG.observe(value=lag)
+        LOOP_LAG_LAST.set(value=lag)
+
+
+async def _metrics_view(request):
+    from aiohttp import web
+
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+
+async def setup_metrics(message_view, host: str, port: int) -> None:
+    """Включает сбор метрик и поднимает HTTP-эндпоинт /metrics"""
+    global _enabled, _runner, _lag_task
+
+    from aiohttp import web
+
+    from bot.db import add_query_observer
+
+    _enabled = True
+    message_view.register_middleware(MetricsMiddleware)
+    instrument_handlers(message_view)
+    add_query_observer(_observe_query)
+    _lag_task = asyncio.create_task(monitor_event_loop_lag())
+
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics_view)
+    _runner = web.AppRunner(app, access_log=None)
+    await _runner.setup()
+    await web.TCPSite(_runner, host, port).start()
+    logger.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+
+
+async def shutdown_metrics() -> None:
+    global _enabled, _runner, _lag_task
+
+    from bot.db import remove_query_observer
+
+    if not _enabled:
+        return
+
+    _enabled = False
+    remove_query_observer(_observe_query)
+    if _lag_task is not None:
+        _lag_task.cancel()
+        _lag_task = None
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
@@ -0,0 +1,1270 @@
+"""
+Хранилище на PostgreSQL (asyncpg, пул соединений).
+
+Схема повторяет SQLite-схему из bot.db (даты — BIGINT, секунды epoch) с одним
+отличием: внешних ключей нет: в SQLite они объявлены, но не проверяются (PRAGMA
+  foreign_keys выключена), и код на это рассчитывает — например, delete_player
+  не чистит promo_uses.
+
+Операции, которые в SQLite шли несколькими запросами на одном соединении,
+здесь выполняются в одной транзакции; чтение-изменение-запись (промокоды,
+улучшение бизнеса) блокирует строку через SELECT ... FOR UPDATE, потому что
+писателей теперь несколько.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import asyncpg
+
+from bot.core.config import settings
+from bot.db import DATE_COLUMNS, SEASON_RESET_TABLES, ResetProgress
+from bot.income import accrual_sql, earliest_accrual, magnesia_rate_sql, owed_magnesia
+from bot.registries import AdminRegistry, BanRegistry, PlayerRegistry
+from bot.storage import Storage
+from bot.utils import days_from_now, now_ts
+
+# Аналог SQL_NOW в bot.db: секунды epoch
+_NOW = "(extract(epoch from now())::bigint)"
+
+SQL_TABLES = [
+    f"""
+    CREATE TABLE IF NOT EXISTS players (
+        user_id BIGINT PRIMARY KEY,
+        username TEXT,
+        balance BIGINT DEFAULT 1,
+        power BIGINT DEFAULT 0,
+        magnesia BIGINT DEFAULT 0,
+        last_dumbbell_use BIGINT DEFAULT 0,
+        created_at BIGINT DEFAULT {_NOW},
+        is_new INTEGER DEFAULT 1,
+        dumbbell_level INTEGER DEFAULT 1,
+        dumbbell_name TEXT DEFAULT 'Гантеля 1кг',
+        total_lifts BIGINT DEFAULT 0,
+        total_earned BIGINT DEFAULT 0,
+        custom_income BIGINT DEFAULT NULL,
+        admin_level INTEGER DEFAULT 0,
+        admin_nickname TEXT DEFAULT NULL,
+        admin_since BIGINT DEFAULT NULL,
+        admin_id TEXT DEFAULT NULL,
+        bans_given INTEGER DEFAULT 0,
+        permabans_given INTEGER DEFAULT 0,
+        deletions_given INTEGER DEFAULT 0,
+        dumbbell_sets_given INTEGER DEFAULT 0,
+        nickname_changes_given INTEGER DEFAULT 0,
+        is_banned INTEGER DEFAULT 0,
+        ban_reason TEXT,
+        ban_until BIGINT DEFAULT NULL,
+        business_1_level INTEGER DEFAULT 0,
+        business_1_upgrades TEXT DEFAULT '{{}}',
+        business_2_level INTEGER DEFAULT 0,
+        business_2_upgrades TEXT DEFAULT '{{}}',
+        business_3_level INTEGER DEFAULT 0,
+        business_3_upgrades TEXT DEFAULT '{{}}',
+        clan_id BIGINT DEFAULT NULL,
+        used_promo_codes TEXT DEFAULT '[]',
+        magnesia_per_hour BIGINT DEFAULT 0,
+        magnesia_accrued_at BIGINT DEFAULT 0
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS transactions (
+        id BIGSERIAL PRIMARY KEY,
+        user_id BIGINT,
+        type TEXT,
+        amount BIGINT,
+        description TEXT,
+        admin_id BIGINT DEFAULT NULL,
+        target_user_id BIGINT DEFAULT NULL,
+        created_at BIGINT DEFAULT {_NOW}
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS dumbbell_uses (
+        id BIGSERIAL PRIMARY KEY,
+        user_id BIGINT,
+        dumbbell_level INTEGER,
+        income BIGINT,
+        power_gained BIGINT,
+        created_at BIGINT DEFAULT {_NOW}
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS admin_actions (
+        id BIGSERIAL PRIMARY KEY,
+        admin_id BIGINT,
+        action_type TEXT,
+        target_user_id BIGINT,
+        details TEXT,
+        created_at BIGINT DEFAULT {_NOW}
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS promo_codes (
+        id BIGSERIAL PRIMARY KEY,
+        code TEXT UNIQUE NOT NULL,
+        uses_total INTEGER DEFAULT 1,
+        uses_left INTEGER DEFAULT 1,
+        reward_type TEXT NOT NULL,
+        reward_amount BIGINT NOT NULL,
+        created_by BIGINT NOT NULL,
+        created_at BIGINT DEFAULT {_NOW},
+        expires_at BIGINT DEFAULT NULL,
+        is_active INTEGER DEFAULT 1
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS promo_uses (
+        id BIGSERIAL PRIMARY KEY,
+        user_id BIGINT NOT NULL,
+        promo_code TEXT NOT NULL,
+        used_at BIGINT DEFAULT {_NOW}
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS clans (
+        id BIGSERIAL PRIMARY KEY,
+        tag TEXT UNIQUE NOT NULL,
+        name TEXT NOT NULL,
+        owner_id BIGINT NOT NULL,
+        level INTEGER DEFAULT 1,
+        treasury BIGINT DEFAULT 0,
+        created_at BIGINT DEFAULT {_NOW},
+        total_income_per_hour BIGINT DEFAULT 0,
+        total_lifts BIGINT DEFAULT 0,
+        member_count INTEGER DEFAULT 0
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS clan_members (
+        id BIGSERIAL PRIMARY KEY,
+        clan_id BIGINT NOT NULL,
+        user_id BIGINT UNIQUE NOT NULL,
+        role TEXT DEFAULT 'member',
+        joined_at BIGINT DEFAULT {_NOW},
+        contributions BIGINT DEFAULT 0
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS clan_treasury_log (
+        id BIGSERIAL PRIMARY KEY,
+        clan_id BIGINT NOT NULL,
+        user_id BIGINT,
+        action_type TEXT,
+        amount BIGINT,
+        description TEXT,
+        created_at BIGINT DEFAULT {_NOW}
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS clan_invites (
+        id BIGSERIAL PRIMARY KEY,
+        clan_id BIGINT NOT NULL,
+        inviter_id BIGINT NOT NULL,
+        invitee_id BIGINT NOT NULL,
+        status TEXT DEFAULT 'pending',
+        created_at BIGINT DEFAULT {_NOW},
+        expires_at BIGINT
+    )
+    """,
+    # Схемы, созданные до появления clans.member_count: добавить столбец и заполнить один раз
+    """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = 'clans' AND column_name = 'member_count'
+        ) THEN
+            ALTER TABLE clans ADD COLUMN member_count INTEGER DEFAULT 0;
+            UPDATE clans SET member_count = (SELECT COUNT(*) FROM clan_members WHERE clan_id = clans.id);
+        END IF;
+    END
+    $$
+    """,
+    # Схемы, созданные до дохода бизнесов (см. bot.income): добавить столбцы и посчитать доход
+    f"""
+    DO $$
+    BEGIN
+        IF NOT EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = 'players' AND column_name = 'magnesia_per_hour'
+        ) THEN
+            ALTER TABLE players ADD COLUMN magnesia_per_hour BIGINT DEFAULT 0;
+            ALTER TABLE players ADD COLUMN magnesia_accrued_at BIGINT DEFAULT 0;
+            UPDATE players SET magnesia_per_hour = {magnesia_rate_sql()}, magnesia_accrued_at = {_NOW};
+        END IF;
+    END
+    $$
+    """,
+    # Частичные индексы для загрузки реестров администраторов и банов
+    "CREATE INDEX IF NOT EXISTS idx_players_admins ON players(user_id) WHERE admin_level > 0",
+    "CREATE INDEX IF NOT EXISTS idx_players_banned ON players(user_id) WHERE is_banned = 1",
+    # Последние зарегистрированные для статистики
+    "CREATE INDEX IF NOT EXISTS idx_players_created_at ON players(created_at)",
+    # Недавно активные для прогрева реестра игроков
+    "CREATE INDEX IF NOT EXISTS idx_players_last_dumbbell_use ON players(last_dumbbell_use)",
+    # Порядок страниц участников и лога казны
+    "CREATE INDEX IF NOT EXISTS idx_clan_members_order ON clan_members(clan_id, role, contributions, user_id)",
+    """
+    CREATE INDEX IF NOT EXISTS idx_clan_treasury_log_order
+    ON clan_treasury_log(clan_id, created_at DESC, id DESC)
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_clans_top ON clans(total_income_per_hour DESC, treasury DESC)",
+]
+
+
+def _epoch_migration_sql(utc_offset: int) -> str:
+    """Перевод столбцов дат, созданных текстовыми, в BIGINT секунды epoch.
+
+    CURRENT_TIMESTAMP писал UTC, isoformat() из кода (с буквой T) — местное
+    время бота, его сдвигаем на utc_offset секунд.
+    """
+    # Значение по умолчанию после перевода, как в SQL_TABLES
+    defaults = {"last_dumbbell_use": "'0'", "admin_since": "NULL", "ban_until": "NULL", "expires_at": "NULL"}
+    columns = ", ".join(
+        f"('{table}', '{column}', {defaults.get(column, repr(_NOW))})"
+        for table, table_columns in DATE_COLUMNS.items()
+        for column in table_columns
+    )
+    return f"""
+    DO $$
+    DECLARE
+        col record;
+    BEGIN
+        FOR col IN
+            SELECT d.table_name, d.column_name, d.default_sql
+            FROM (VALUES {columns}) AS d(table_name, column_name, default_sql)
+            JOIN information_schema.columns c
+              ON c.table_schema = current_schema()
+             AND c.table_name = d.table_name AND c.column_name = d.column_name
+            WHERE c.data_type = 'text'
+        LOOP
+            EXECUTE format('ALTER TABLE %I ALTER COLUMN %I DROP DEFAULT', col.table_name, col.column_name);
+            EXECUTE format(
+                'ALTER TABLE %1$I ALTER COLUMN %2$I TYPE BIGINT USING CASE'
+                ' WHEN %2$I IS NULL OR %2$I = '''' THEN NULL'
+                ' WHEN position(''T'' in %2$I) > 0 THEN extract(epoch from %2$I::timestamp)::bigint - {utc_offset}'
+                ' ELSE extract(epoch from %2$I::timestamp)::bigint END',
+                col.table_name,
+                col.column_name
+            );
+            IF col.default_sql IS NOT NULL THEN
+                EXECUTE format(
+                    'ALTER TABLE %I ALTER COLUMN %I SET DEFAULT %s', col.table_name, col.column_name, col.default_sql
+                );
+            END IF;
+        END LOOP;
+    END
+    $$
+    """
+
+
+SQL_ADMIN_ACTION = """
+    INSERT INTO admin_actions (admin_id, action_type, target_user_id, details)
+    VALUES ($1, $2, $3, $4)
+"""
+
+_PLAYER_COLUMNS = """
+    user_id, username, balance, power, magnesia, last_dumbbell_use, is_new,
+    dumbbell_level, dumbbell_name, total_lifts, total_earned,
+    custom_income, admin_level, admin_nickname, admin_since,
+    admin_id, bans_given, permabans_given, deletions_given,
+    dumbbell_sets_given, nickname_changes_given,
+    is_banned, ban_reason, ban_until, created_at,
+    business_1_level, business_1_upgrades,
+    business_2_level, business_2_upgrades,
+    business_3_level, business_3_upgrades,
+    clan_id, used_promo_codes,
+    magnesia_per_hour, magnesia_accrued_at
+"""
+
+_CLAN_COLUMNS = """
+    id, tag, name, owner_id, level, treasury, created_at,
+    total_income_per_hour, total_lifts, member_count
+"""
+
+_PROMO_COLUMNS = """
+    code, uses_total, uses_left, reward_type, reward_amount,
+    created_by, created_at, expires_at, is_active
+"""
+
+
+def _accrual_sql(now_param: int) -> Tuple[str, str]:
+    """bot.income.accrual_sql: now_ts() в параметре $now_param, earliest_accrual — в следующем"""
+    return accrual_sql(f"${now_param}::bigint", f"${now_param + 1}::bigint", "GREATEST")
+
+
+def _player_from_row(row: asyncpg.Record) -> Dict[str, Any]:
+    player = dict(row)
+    for number in (1, 2, 3):
+        player[f"business_{number}_level"] = player[f"business_{number}_level"] or 0
+        upgrades = player[f"business_{number}_upgrades"]
+        player[f"business_{number}_upgrades"] = json.loads(upgrades if upgrades else "{}")
+    player["used_promo_codes"] = json.loads(player["used_promo_codes"] or "[]")
+    # Вместе с доходом бизнесов, ещё не записанным в базу
+    player["magnesia"] += owed_magnesia(player["magnesia_per_hour"], player["magnesia_accrued_at"], now_ts())
+    return player
+
+
+class PostgresStorage(Storage):
+    def __init__(self, dsn: str, min_size: int = 2, max_size: int = 20, **pool_options) -> None:
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.pool_options = pool_options
+        self._pool: Optional[asyncpg.Pool] = None
+        self._admins = AdminRegistry()
+        self._bans = BanRegistry()
+        self._players = PlayerRegistry()
+
+    async def pool(self) -> asyncpg.Pool:
+        # Пул создаётся в том event loop, где к хранилищу обратились впервые
+        if self._pool is None:
+            self._pool = await asyncpg.create_pool(
+                self.dsn, min_size=self.min_size, max_size=self.max_size, **self.pool_options
+            )
+        return self._pool
+
+    async def close(self) -> None:
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    async def _execute(self, sql: str, *args) -> str:
+        return await (await self.pool()).execute(sql, *args)
+
+    async def _fetch(self, sql: str, *args) -> List[asyncpg.Record]:
+        return await (await self.pool()).fetch(sql, *args)
+
+    async def _fetchrow(self, sql: str, *args) -> Optional[asyncpg.Record]:
+        return await (await self.pool()).fetchrow(sql, *args)
+
+    async def _fetchval(self, sql: str, *args) -> Any:
+        return await (await self.pool()).fetchval(sql, *args)
+
+    async def create_tables(self) -> None:
+        async with (await self.pool()).acquire() as conn:
+            async with conn.transaction():
+                for sql in SQL_TABLES:
+                    await conn.execute(sql)
+                utc_offset = datetime.now().astimezone().utcoffset()
+                await conn.execute(_epoch_migration_sql(int(utc_offset.total_seconds())))
+
+    # ==============================
+    # РЕЕСТРЫ АДМИНИСТРАТОРОВ, БАНОВ И ИГРОКОВ
+    # ==============================
+
+    def forget_player_ids(self) -> None:
+        self._players.clear()
+
+    async def load_admin_levels(self) -> Dict[int, int]:
+        rows = await self._fetch("SELECT user_id, admin_level FROM players WHERE admin_level > 0")
+        return self._admins.load((row[0], row[1]) for row in rows)
+
+    async def get_admin_levels(self) -> Dict[int, int]:
+        if not self._admins.loaded:
+            return await self.load_admin_levels()
+        return self._admins.levels
+
+    async def load_bans(self) -> None:
+        rows = await self._fetch("SELECT user_id, ban_until FROM players WHERE is_banned = 1")
+        self._bans.load((row[0], row[1]) for row in rows)
+
+    async def is_banned(self, user_id: int) -> bool:
+        if not self._bans.loaded:
+            await self.load_bans()
+        return self._bans.contains(user_id)
+
+    def pop_expired_bans(self, now: Optional[float] = None) -> List[int]:
+        return self._bans.pop_expired(now)
+
+    async def unban_expired_players(self, user_ids: List[int]) -> int:
+        if not user_ids:
+            return 0
+        now = now_ts()
+        async with (await self.pool()).acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    """UPDATE players SET is_banned = 0, ban_reason = NULL, ban_until = NULL
+                       WHERE user_id = ANY($1::bigint[]) AND is_banned = 1
+                         AND ban_until IS NOT NULL AND ban_until <= $2""",
+                    user_ids,
+                    now,
+                )
+                await conn.executemany(
+                    SQL_ADMIN_ACTION,
+                    [(0, "unban", user_id, "Автоматический разбан: срок истёк") for user_id in user_ids],
+                )
+        return len(user_ids)
+
+    # ==============================
+    # ИГРОКИ
+    # ==============================
+
+    async def player_exists(self, user_id: int) -> bool:
+        if self._players.contains(user_id):
+            return True
+        found = await self._fetchval("SELECT 1 FROM players WHERE user_id = $1", user_id) is not None
+        if found:
+            self._players.add(user_id)
+        return found
+
+    async def get_player(self, user_id: int) -> Optional[Dict[str, Any]]:
+        row = await self._fetchrow(f"SELECT {_PLAYER_COLUMNS} FROM players WHERE user_id = $1", user_id)
+        return _player_from_row(row) if row else None
+
+    async def create_player(self, user_id: int, username: str) -> Optional[Dict[str, Any]]:
+        row = await self._fetchrow(
+            f"""INSERT INTO players (user_id, username, dumbbell_level, dumbbell_name)
+                VALUES ($1, $2, 1, 'Гантеля 1кг')
+                ON CONFLICT (user_id) DO NOTHING
+                RETURNING {_PLAYER_COLUMNS}""",
+            user_id,
+            username,
+        )
+        if row is None:
+            row = await self._fetchrow(f"SELECT {_PLAYER_COLUMNS} FROM players WHERE user_id = $1", user_id)
+            if row is None:
+                return None
+        self._players.add(user_id)
+        return _player_from_row(row)
+
+    async def update_username(self, user_id: int, new_username: str) -> bool:
+        await self._execute("UPDATE players SET username = $1 WHERE user_id = $2", new_username, user_id)
+        return True
+
+    async def update_player_balance(
+        self,
+        user_id: int,
+        amount: int,
+        transaction_type: str,
+        description: str,
+        admin_id: Optional[int] = None,
+        target_user_id: Optional[int] = None,
+    ) -> bool:
+        async with (await self.pool()).acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    """UPDATE players
+                       SET balance = balance + $1, total_earned = total_earned + GREATEST($1, 0)
+                       WHERE user_id = $2""",
+                    amount,
+                    user_id,
+                )
+                await conn.execute(
+                    """INSERT INTO transactions (user_id, type, amount, description, admin_id, target_user_id)
+                       VALUES ($1, $2, $3, $4, $5, $6)""",
+                    user_id,
+                    transaction_type,
+                    amount,
+                    description,
+                    admin_id,
+                    target_user_id,
+                )
+        return True
+
+    async def add_power(self, user_id: int, amount: int) -> bool:
+        await self._execute("UPDATE players SET power = power + $1 WHERE user_id = $2", amount, user_id)
+        return True
+
+    async def add_magnesia(self, user_id: int, amount: int, admin_id: Optional[int] = None) -> bool:
+        async with (await self.pool()).acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    "UPDATE players SET magnesia = magnesia + $1 WHERE user_id = $2", amount, user_id
+                )
+                if admin_id:
+                    await conn.execute(
+                        SQL_ADMIN_ACTION, admin_id, "add_magnesia", user_id, f"Добавлено банок магнезии: {amount}"
+                    )
+        return True
+
+    async def update_dumbbell_level(self, user_id: int, new_level: int, dumbbell_name: str) -> bool:
+        await self._execute(
+            "UPDATE players SET dumbbell_level = $1, dumbbell_name = $2 WHERE user_id = $3",
+            new_level,
+            dumbbell_name,
+            user_id,
+        )
+        return True
+
+    async def set_dumbbell_level(self, user_id: int, new_level: int, admin_id: int) -> bool:
+        if new_level not in settings.DUMBBELL_LEVELS:
+            return False
+
+        dumbbell_info = settings.DUMBBELL_LEVELS[new_level]
+        async with (await self.pool()).acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    "UPDATE players SET dumbbell_level = $1, dumbbell_name = $2 WHERE user_id = $3",
+                    new_level,
+                    dumbbell_info["name"],
+                    user_id,
+                )
+                await conn.execute(
+                    "UPDATE players SET dumbbell_sets_given = dumbbell_sets_given + 1 WHERE user_id = $1",
+                    admin_id,
+                )
+                await conn.execute(
+                    SQL_ADMIN_ACTION,
+                    admin_id,
+                    "set_dumbbell_level",
+                    user_id,
+                    f"Установлен уровень гантели: {new_level}",
+                )
+        return True
+
+    async def update_dumbbell_use_time(self, user_id: int) -> bool:
+        await self._execute(
+            "UPDATE players SET last_dumbbell_use = $1 WHERE user_id = $2",
+            now_ts(),
+            user_id,
+        )
+        return True
+
+    async def increment_total_lifts(self, user_id: int) -> bool:
+        await self._execute("UPDATE players SET total_lifts = total_lifts + 1 WHERE user_id = $1", user_id)
+        return True
+
+    async def set_total_lifts(self, user_id: int, new_total: int, admin_id: int) -> bool:
+        async with (await self.pool()).acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("UPDATE players SET total_lifts = $1 WHERE user_id = $2", new_total, user_id)
+                await conn.execute(
+                    SQL_ADMIN_ACTION, admin_id, "set_total_lifts", user_id, f"Установлено поднятий: {new_total}"
+                )
+        return True
+
+    async def set_custom_income(self, user_id: int, custom_income: Optional[int], admin_id: int) -> bool:
+        async with (await self.pool()).acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    "UPDATE players SET custom_income = $1 WHERE user_id = $2", custom_income, user_id
+                )
+                await conn.execute(
+                    SQL_ADMIN_ACTION,
+                    admin_id,
+                    "set_custom_income",
+                    user_id,
+                    f"Установлен кастомный доход: {custom_income}",
+                )
+        return True
+
+    async def buy_business(self, user_id: int, business_id: int, business_info: Dict[str, Any]) -> bool:
+        price = business_info["base_price"]
+        coins = price if business_info["currency"] == "монет" else 0
+        level_column = f"business_{business_id}_level"
+        owed_sql, accrued_at_sql = _accrual_sql(5)
+        now = now_ts()
+        # Накопленное по прежнему доходу зачисляется тем же запросом, что меняет доход
+        await self._execute(
+            f"""UPDATE players SET
+                    balance = balance - $1,
+                    magnesia = magnesia + {owed_sql} - $2,
+                    magnesia_accrued_at = {accrued_at_sql},
+                    magnesia_per_hour = magnesia_per_hour + $3,
+                    {level_column} = 1
+                WHERE user_id = $4""",
+            coins,
+            price - coins,
+            business_info["base_income"],
+            user_id,
+            now,
+            earliest_accrual(now),
+        )
+        return True
+
+    async def upgrade_business(self, user_id: int, business_id: int, upgrade_num: int, price: int) -> bool:
+        upgrades_column = f"business_{business_id}_upgrades"
+        level_column = f"business_{business_id}_level"
+        business_info = settings.BUSINESSES[business_id]
+        coins = price if business_info["upgrade_currency"] == "монет" else 0
+
+        async with (await self.pool()).acquire() as conn:
+            async with conn.transaction():
+                row = await conn.fetchrow(
+                    f"SELECT {upgrades_column} FROM players WHERE user_id = $1 FOR UPDATE", user_id
+                )
+                if row is None:
+                    return False
+
+                current_upgrades = json.loads(row[0] if row[0] else "{}")
+                current_upgrades[str(upgrade_num)] = current_upgrades.get(str(upgrade_num), 0) + 1
+
+                level_up = sum(1 for v in current_upgrades.values() if v > 0) >= 5
+                if level_up:
+                    for key in current_upgrades:
+                        current_upgrades[key] = 0
+
+                owed_sql, accrued_at_sql = _accrual_sql(7)
+                now = now_ts()
+                await conn.execute(
+                    f"""UPDATE players
+                        SET {upgrades_column} = $1,
+                            balance = balance - $2,
+                            magnesia = magnesia + {owed_sql} - $3,
+                            magnesia_accrued_at = {accrued_at_sql},
+                            magnesia_per_hour = magnesia_per_hour + $4,
+                            {level_column} = {level_column} + $5
+                        WHERE user_id = $6""",
+                    json.dumps(current_upgrades),
+                    coins,
+                    price - coins,
+                    business_info["income_increase"] if level_up else 0,
+                    1 if level_up else 0,
+                    user_id,
+                    now,
+                    earliest_accrual(now),
+                )
+        return True
+
+    async def log_dumbbell_use(self, user_id: int, dumbbell_level: int, income: int, power_gained: int) -> bool:
+        await self._execute(
+            """INSERT INTO dumbbell_uses (user_id, dumbbell_level, income, power_gained)
+               VALUES ($1, $2, $3, $4)""",
+            user_id,
+            dumbbell_level,
+            income,
+            power_gained,
+        )
+        return True
+
+    async def get_players_with_businesses(self) -> List[Tuple]:
+        rows = await self._fetch(
+            """
+            SELECT user_id,
+                   COALESCE(business_1_level, 0) as b1_level,
+                   COALESCE(business_2_level, 0) as b2_level,
+                   COALESCE(business_3_level, 0) as b3_level,
+                   clan_id
+            FROM players
+            WHERE (business_1_level > 0 OR business_2_level > 0 OR business_3_level > 0)
+              AND clan_id IS NOT NULL
+            """
+        )
+        return [tuple(row) for row in rows]
+
+    async def get_recently_active_player_ids(self, limit: int = 1000) -> List[int]:
+        rows = await self._fetch("SELECT user_id FROM players ORDER BY last_dumbbell_use DESC LIMIT $1", limit)
+        for row in rows:
+            self._players.add(row[0])
+        return [row[0] for row in rows]
+
+    async def get_unnamed_player_ids(self, after_user_id: int = 0, limit: int = 1000) -> List[int]:
+        rows = await self._fetch(
+            """SELECT user_id FROM players
+               WHERE user_id > $1 AND username = user_id::text
+               ORDER BY user_id LIMIT $2""",
+            after_user_id,
+            limit,
+        )
+        return [row[0] for row in rows]
+
+    async def set_usernames(self, names: List[Tuple[int, str]]) -> int:
+        if not names:
+            return 0
+        async with (await self.pool()).acquire() as conn:
+            async with conn.transaction():
+                result = await conn.execute(
+                    """UPDATE players AS p SET username = n.username
+                       FROM unnest($1::bigint[], $2::text[]) AS n(user_id, username)
+                       WHERE p.user_id = n.user_id AND p.username = p.user_id::text""",
+                    [user_id for user_id, _ in names],
+                    [username for _, username in names],
+                )
+        return int(result.split()[-1])
+
+    async def get_recent_players(self, limit: int = 5) -> List[Tuple]:
+        rows = await self._fetch("SELECT username, created_at FROM players ORDER BY created_at DESC LIMIT $1", limit)
+        return [tuple(row) for row in rows]
+
+    # ==============================
+    # АДМИНИСТРИРОВАНИЕ
+    # ==============================
+
+    async def make_admin(self, user_id: int, admin_id: int, admin_level: int = 1) -> str:
+        async with (await self.pool()).acquire() as conn:
+            async with conn.transaction():
+                last_admin_id = await conn.fetchval(
+                    "SELECT MAX(CAST(admin_id AS BIGINT)) FROM players WHERE admin_id IS NOT NULL AND admin_id <> ''"
+                )
+                new_admin_id = 1000 if last_admin_id is None else int(last_admin_id) + 1
+
+                await conn.execute(
+                    """UPDATE players
+                       SET admin_level = $1, admin_since = $2, admin_id = $3
+                       WHERE user_id = $4""",
+                    admin_level,
+                    now_ts(),
+                    str(new_admin_id),
+                    user_id,
+                )
+                await conn.execute(
+                    SQL_ADMIN_ACTION,
+                    admin_id,
+                    "make_admin",
+                    user_id,
+                    f"Назначение администратора уровня {admin_level} с ID {new_admin_id}",
+                )
+        self._admins.set(user_id, admin_level)
+        return str(new_admin_id)
+
+    async def remove_admin(self, user_id: int, admin_id: int) -> bool:
+        player_data = await self.get_player(user_id)
+        if not player_data:
+            return False
+
+        async with (await self.pool()).acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    """UPDATE players
+                       SET admin_level = 0, admin_nickname = NULL, admin_since = NULL, admin_id = NULL,
+                           bans_given = 0, permabans_given = 0, deletions_given = 0,
+                           dumbbell_sets_given = 0, nickname_changes_given = 0
+                       WHERE user_id = $1""",
+                    user_id,
+                )
+                await conn.execute(
+                    SQL_ADMIN_ACTION,
+                    admin_id,
+                    "remove_admin",
+                    user_id,
+                    f"Снятие с должности администратора: {player_data['username']}",
+                )
+        self._admins.discard(user_id)
+        return True
+
+    async def set_admin_nickname(self, user_id: int, nickname: str) -> bool:
+        await self._execute("UPDATE players SET admin_nickname = $1 WHERE user_id = $2", nickname, user_id)
+        return True
+
+    async def increment_admin_stat(self, user_id: int, stat_name: str) -> bool:
+        stats_map = {
+            "bans": "bans_given",
+            "permabans": "permabans_given",
+            "deletions": "deletions_given",
+            "dumbbell_sets": "dumbbell_sets_given",
+            "nickname_changes": "nickname_changes_given",
+        }
+
+        if stat_name in stats_map:
+            column = stats_map[stat_name]
+            await self._execute(f"UPDATE players SET {column} = {column} + 1 WHERE user_id = $1", user_id)
+        return True
+
+    async def ban_player(self, user_id: int, days: int, reason: str, admin_id: int) -> bool:
+        ban_until = None if days == 0 else days_from_now(days)
+
+        async with (await self.pool()).acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    "UPDATE players SET is_banned = 1, ban_reason = $1, ban_until = $2 WHERE user_id = $3",
+                    reason,
+                    ban_until,
+                    user_id,
+                )
+                await conn.execute(
+                    SQL_ADMIN_ACTION, admin_id, "ban", user_id, f"Бан: {days} дней, причина: {reason}"
+                )
+        self._bans.add(user_id, ban_until)
+        return True
+
+    async def unban_player(self, user_id: int, admin_id: int) -> bool:
+        async with (await self.pool()).acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    "UPDATE players SET is_banned = 0, ban_reason = NULL, ban_until = NULL WHERE user_id = $1",
+                    user_id,
+                )
+                await conn.execute(SQL_ADMIN_ACTION, admin_id, "unban", user_id, "Разбан игрока")
+        self._bans.discard(user_id)
+        return True
+
+    async def delete_player(self, user_id: int, admin_id: int) -> bool:
+        player_data = await self.get_player(user_id)
+        if not player_data:
+            return False
+
+        async with (await self.pool()).acquire() as conn:
+            async with conn.transaction():
+                if player_data["clan_id"]:
+                    await self._remove_clan_member(conn, user_id, player_data["clan_id"])
+                await conn.execute("DELETE FROM transactions WHERE user_id = $1", user_id)
+                await conn.execute("DELETE FROM dumbbell_uses WHERE user_id = $1", user_id)
+                await conn.execute("DELETE FROM players WHERE user_id = $1", user_id)
+                await conn.execute(
+                    SQL_ADMIN_ACTION,
+                    admin_id,
+                    "delete_player",
+                    user_id,
+                    f"Удален игрок: {player_data['username']}",
+                )
+        self._admins.discard(user_id)
+        self._bans.discard(user_id)
+        self._players.discard(user_id)
+        return True
+
+    async def reset_all(self, progress: Optional[ResetProgress] = None) -> Dict[str, int]:
+        deleted: Dict[str, int] = {}
+        async with (await self.pool()).acquire() as conn:
+            for table, condition in SEASON_RESET_TABLES:
+                # Порции по ctid: каждая в своей транзакции и блокирует только свои строки
+                sql = f"""
+                    DELETE FROM {table} WHERE ctid = ANY(ARRAY(
+                        SELECT ctid FROM {table} WHERE {condition} LIMIT $1
+                    ))
+                """
+                deleted[table] = 0
+                while True:
+                    status = await conn.execute(sql, settings.RESET_CHUNK_ROWS)
+                    count = int(status.split()[-1])
+                    deleted[table] += count
+                    if progress is not None:
+                        await progress(table, deleted[table])
+                    if count < settings.RESET_CHUNK_ROWS:
+                        break
+                    await asyncio.sleep(settings.RESET_CHUNK_PAUSE_SECONDS)
+
+            await conn.execute("UPDATE players SET clan_id = NULL WHERE clan_id IS NOT NULL")
+        # Игроки удалены вместе с банами, реестры перечитаются при первой проверке
+        self._bans.invalidate()
+        self._players.clear()
+        return deleted
+
+    # ==============================
+    # РЕЙТИНГИ И СТАТИСТИКА
+    # ==============================
+
+    async def get_top_balance(self, limit: int = 10) -> List[Tuple]:
+        rows = await self._fetch(
+            """SELECT user_id, username, balance, dumbbell_name FROM players
+               WHERE is_banned = 0 ORDER BY balance DESC LIMIT $1""",
+            limit,
+        )
+        return [tuple(row) for row in rows]
+
+    async def get_top_lifts(self, limit: int = 10) -> List[Tuple]:
+        rows = await self._fetch(
+            """SELECT user_id, username, total_lifts, dumbbell_name FROM players
+               WHERE is_banned = 0 ORDER BY total_lifts DESC LIMIT $1""",
+            limit,
+        )
+        return [tuple(row) for row in rows]
+
+    async def get_top_earners(self, limit: int = 10) -> List[Tuple]:
+        rows = await self._fetch(
+            """SELECT user_id, username, dumbbell_name, dumbbell_level, total_earned FROM players
+               WHERE is_banned = 0 ORDER BY total_earned DESC LIMIT $1""",
+            limit,
+        )
+        return [tuple(row) for row in rows]
+
+    async def count_players(self, regular_only: bool = True, unbanned_only: bool = False) -> int:
+        conditions = []
+        if regular_only:
+            conditions.append("admin_level = 0")
+        if unbanned_only:
+            conditions.append("is_banned = 0")
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        return await self._fetchval(f"SELECT COUNT(*) FROM players{where}")
+
+    async def count_banned_players(self) -> int:
+        return await self._fetchval("SELECT COUNT(*) FROM players WHERE is_banned = 1")
+
+    async def count_admins(self) -> int:
+        return await self._fetchval("SELECT COUNT(*) FROM players WHERE admin_level > 0")
+
+    async def count_clans(self) -> int:
+        return await self._fetchval("SELECT COUNT(*) FROM clans")
+
+    async def count_total_balance(self) -> int:
+        # SUM(bigint) в PostgreSQL — numeric, приводим обратно к целому
+        return await self._fetchval("SELECT COALESCE(SUM(balance), 0)::bigint FROM players WHERE admin_level = 0")
+
+    async def sum_column(self, table: str, column: str) -> int:
+        return await self._fetchval(f"SELECT COALESCE(SUM({column}), 0)::bigint FROM {table}")
+
+    async def count_table_rows(self, table: str) -> int:
+        return await self._fetchval(f"SELECT COUNT(*) FROM {table}")
+
+    # ==============================
+    # ПРОМОКОДЫ
+    # ==============================
+
+    async def create_promo_code(
+        self,
+        code: str,
+        uses_total: int,
+        reward_type: str,
+        reward_amount: int,
+        created_by: int,
+        expires_days: Optional[int] = None,
+    ) -> bool:
+        expires_at = days_from_now(expires_days) if expires_days else None
+
+        try:
+            async with (await self.pool()).acquire() as conn:
+                async with conn.transaction():
+                    await conn.execute(
+                        """
+                        INSERT INTO promo_codes (code, uses_total, uses_left, reward_type, reward_amount, created_by, expires_at)
+                        VALUES ($1, $2, $2, $3, $4, $5, $6)
+                        """,
+                        code,
+                        uses_total,
+                        reward_type,
+                        reward_amount,
+                        created_by,
+                        expires_at,
+                    )
+                    await conn.execute(
+                        SQL_ADMIN_ACTION,
+                        created_by,
+                        "create_promo",
+                        0,
+                        f"Создан промокод: {code}, награда: {reward_amount} {reward_type}",
+                    )
+            return True
+        except asyncpg.UniqueViolationError:
+            return False
+
+    async def delete_promo_code(self, code: str, admin_id: int) -> bool:
+        async with (await self.pool()).acquire() as conn:
+            async with conn.transaction():
+                deleted = await conn.fetchval("DELETE FROM promo_codes WHERE code = $1 RETURNING code", code)
+                if deleted is None:
+                    return False
+                await conn.execute(SQL_ADMIN_ACTION, admin_id, "delete_promo", 0, f"Удален промокод: {code}")
+        return True
+
+    async def get_promo_info(self, code: str) -> Optional[Dict[str, Any]]:
+        row = await self._fetchrow(f"SELECT {_PROMO_COLUMNS} FROM promo_codes WHERE code = $1", code)
+        return dict(row) if row else None
+
+    async def use_promo_code(self, user_id: int, code: str) -> Dict[str, Any]:
+        async with (await self.pool()).acquire() as conn:
+            async with conn.transaction():
+                row = await conn.fetchrow(
+                    f"SELECT {_PROMO_COLUMNS} FROM promo_codes WHERE code = $1 FOR UPDATE", code
+                )
+                if not row:
+                    return {"success": False, "error": "Промокод не найден"}
+                promo_info = dict(row)
+
+                if promo_info["is_active"] == 0:
+                    return {"success": False, "error": "Промокод неактивен"}
+
+                if promo_info["expires_at"] and now_ts() > promo_info["expires_at"]:
+                    return {"success": False, "error": "Срок действия промокода истек"}
+
+                if promo_info["uses_left"] <= 0:
+                    return {"success": False, "error": "Лимит использований исчерпан"}
+
+                used_promo_codes = await conn.fetchval(
+                    "SELECT used_promo_codes FROM players WHERE user_id = $1 FOR UPDATE", user_id
+                )
+                used_codes = json.loads(used_promo_codes if used_promo_codes else "[]")
+                if code in used_codes:
+                    return {"success": False, "error": "Вы уже использовали этот промокод"}
+
+                await conn.execute("UPDATE promo_codes SET uses_left = uses_left - 1 WHERE code = $1", code)
+
+                if promo_info["reward_type"] == "монеты":
+                    await conn.execute(
+                        "UPDATE players SET balance = balance + $1 WHERE user_id = $2",
+                        promo_info["reward_amount"],
+                        user_id,
+                    )
+                elif promo_info["reward_type"] == "магнезия":
+                    await conn.execute(
+                        "UPDATE players SET magnesia = magnesia + $1 WHERE user_id = $2",
+                        promo_info["reward_amount"],
+                        user_id,
+                    )
+
+                used_codes.append(code)
+                await conn.execute(
+                    "UPDATE players SET used_promo_codes = $1 WHERE user_id = $2", json.dumps(used_codes), user_id
+                )
+                await conn.execute("INSERT INTO promo_uses (user_id, promo_code) VALUES ($1, $2)", user_id, code)
+
+        return {
+            "success": True,
+            "reward_type": promo_info["reward_type"],
+            "reward_amount": promo_info["reward_amount"],
+        }
+
+    async def get_all_promo_codes(self) -> List[Dict[str, Any]]:
+        rows = await self._fetch(
+            """
+            SELECT code, uses_total, uses_left, reward_type, reward_amount,
+                   created_at, expires_at, is_active
+            FROM promo_codes ORDER BY created_at DESC
+            """
+        )
+        return [dict(row) for row in rows]
+
+    async def count_promo_uses(self, code: str, limit: int = 0):
+        if limit > 0:
+            rows = await self._fetch(
+                "SELECT COUNT(*) FROM promo_uses WHERE promo_code = $1 LIMIT $2", code, limit
+            )
+            return [tuple(row) for row in rows]
+        return await self._fetchval("SELECT COUNT(*) FROM promo_uses WHERE promo_code = $1", code)
+
+    async def sum_promo_uses(self) -> int:
+        return await self._fetchval("SELECT COALESCE(SUM(uses_total - uses_left), 0)::bigint FROM promo_codes")
+
+    # ==============================
+    # КЛАНЫ
+    # ==============================
+
+    async def create_clan(self, tag: str, name: str, owner_id: int) -> Dict[str, Any]:
+        async with (await self.pool()).acquire() as conn:
+            if await conn.fetchval("SELECT id FROM clans WHERE tag = $1", tag.upper()):
+                return {"success": False, "error": "Клан с таким тегом уже существует"}
+            if await conn.fetchval("SELECT id FROM clans WHERE name = $1", name):
+                return {"success": False, "error": "Клан с таким названием уже существует"}
+            if await conn.fetchval("SELECT clan_id FROM players WHERE user_id = $1", owner_id):
+                return {"success": False, "error": "Вы уже состоите в клане"}
+
+            try:
+                async with conn.transaction():
+                    clan_id = await conn.fetchval(
+                        """INSERT INTO clans (tag, name, owner_id, level, treasury, member_count)
+                           VALUES ($1, $2, $3, 1, 0, 1) RETURNING id""",
+                        tag.upper(),
+                        name,
+                        owner_id,
+                    )
+                    await conn.execute(
+                        """INSERT INTO clan_members (clan_id, user_id, role, contributions)
+                           VALUES ($1, $2, 'owner', 0)""",
+                        clan_id,
+                        owner_id,
+                    )
+                    await conn.execute("UPDATE players SET clan_id = $1 WHERE user_id = $2", clan_id, owner_id)
+                return {"success": True, "clan_id": clan_id, "tag": tag.upper(), "name": name}
+            except Exception as e:
+                return {"success": False, "error": f"Ошибка при создании клана: {str(e)}"}
+
+    async def get_clan_by_tag(self, tag: str) -> Optional[Dict[str, Any]]:
+        row = await self._fetchrow(f"SELECT {_CLAN_COLUMNS} FROM clans WHERE tag = $1", tag.upper())
+        return dict(row) if row else None
+
+    async def get_clan_by_id(self, clan_id: int) -> Optional[Dict[str, Any]]:
+        row = await self._fetchrow(f"SELECT {_CLAN_COLUMNS} FROM clans WHERE id = $1", clan_id)
+        return dict(row) if row else None
+
+    async def get_player_clan(self, user_id: int) -> Optional[Dict[str, Any]]:
+        row = await self._fetchrow(
+            f"""SELECT {", ".join(f"c.{column.strip()}" for column in _CLAN_COLUMNS.split(","))}
+                FROM players p JOIN clans c ON c.id = p.clan_id
+                WHERE p.user_id = $1""",
+            user_id,
+        )
+        return dict(row) if row else None
+
+    async def get_clan_members(
+        self, clan_id: int, limit: int = 100, after: Optional[Tuple[str, int, int]] = None
+    ) -> List[Dict[str, Any]]:
+        # Порядок как в bot.db: role DESC == owner, officer, member
+        if after is None:
+            rows = await self._fetch(
+                """
+                SELECT cm.user_id, p.username, cm.role, cm.contributions, cm.joined_at
+                FROM clan_members cm
+                JOIN players p ON cm.user_id = p.user_id
+                WHERE cm.clan_id = $1
+                ORDER BY cm.role DESC, cm.contributions DESC, cm.user_id DESC
+                LIMIT $2
+                """,
+                clan_id,
+                limit,
+            )
+        else:
+            rows = await self._fetch(
+                """
+                SELECT cm.user_id, p.username, cm.role, cm.contributions, cm.joined_at
+                FROM clan_members cm
+                JOIN players p ON cm.user_id = p.user_id
+                WHERE cm.clan_id = $1 AND (cm.role, cm.contributions, cm.user_id) < ($2, $3, $4)
+                ORDER BY cm.role DESC, cm.contributions DESC, cm.user_id DESC
+                LIMIT $5
+                """,
+                clan_id,
+                *after,
+                limit,
+            )
+        return [dict(row) for row in rows]
+
+    async def get_clan_member_count(self, clan_id: int) -> int:
+        return await self._fetchval("SELECT member_count FROM clans WHERE id = $1", clan_id) or 0
+
+    async def join_clan(self, clan_id: int, user_id: int, role: str = "member") -> Dict[str, Any]:
+        async with (await self.pool()).acquire() as conn:
+            async with conn.transaction():
+                player_data = await conn.fetchrow(
+                    "SELECT clan_id FROM players WHERE user_id = $1 FOR UPDATE", user_id
+                )
+                if not player_data:
+                    return {"success": False, "error": "Игрок не найден"}
+                if player_data["clan_id"]:
+                    return {"success": False, "error": "Вы уже состоите в клане"}
+
+                updated = await conn.execute(
+                    "UPDATE clans SET member_count = member_count + 1 WHERE id = $1", clan_id
+                )
+                if updated == "UPDATE 0":
+                    return {"success": False, "error": "Клан не найден"}
+
+                await conn.execute(
+                    "INSERT INTO clan_members (clan_id, user_id, role, contributions) VALUES ($1, $2, $3, 0)",
+                    clan_id,
+                    user_id,
+                    role,
+                )
+                await conn.execute("UPDATE players SET clan_id = $1 WHERE user_id = $2", clan_id, user_id)
+        return {"success": True, "clan_id": clan_id}
+
+    async def leave_clan(self, user_id: int) -> Dict[str, Any]:
+        async with (await self.pool()).acquire() as conn:
+            async with conn.transaction():
+                member = await conn.fetchrow(
+                    "SELECT clan_id, role FROM clan_members WHERE user_id = $1 FOR UPDATE", user_id
+                )
+                if not member:
+                    return {"success": False, "error": "Вы не состоите в клане"}
+                if member["role"] == "owner":
+                    return {"success": False, "error": "Владелец не может покинуть клан"}
+                await self._remove_clan_member(conn, user_id, member["clan_id"])
+        return {"success": True, "clan_id": member["clan_id"]}
+
+    @staticmethod
+    async def _remove_clan_member(conn, user_id: int, clan_id: int) -> None:
+        await conn.execute("DELETE FROM clan_members WHERE user_id = $1", user_id)
+        await conn.execute("UPDATE players SET clan_id = NULL WHERE user_id = $1", user_id)
+        await conn.execute("UPDATE clans SET member_count = member_count - 1 WHERE id = $1", clan_id)
+
+    async def get_clan_treasury_log(
+        self, clan_id: int, limit: int = 10, before: Optional[Tuple[int, int]] = None
+    ) -> List[Dict[str, Any]]:
+        if before is None:
+            rows = await self._fetch(
+                """
+                SELECT ctl.id, ctl.action_type, ctl.amount, ctl.description, ctl.created_at, p.username
+                FROM clan_treasury_log ctl
+                LEFT JOIN players p ON ctl.user_id = p.user_id
+                WHERE ctl.clan_id = $1
+                ORDER BY ctl.created_at DESC, ctl.id DESC
+                LIMIT $2
+                """,
+                clan_id,
+                limit,
+            )
+        else:
+            rows = await self._fetch(
+                """
+                SELECT ctl.id, ctl.action_type, ctl.amount, ctl.description, ctl.created_at, p.username
+                FROM clan_treasury_log ctl
+                LEFT JOIN players p ON ctl.user_id = p.user_id
+                WHERE ctl.clan_id = $1 AND (ctl.created_at, ctl.id) < ($2, $3)
+                ORDER BY ctl.created_at DESC, ctl.id DESC
+                LIMIT $4
+                """,
+                clan_id,
+                *before,
+                limit,
+            )
+        return [dict(row) for row in rows]
+
+    async def get_top_clans(self, limit: int = 10) -> List[Dict[str, Any]]:
+        rows = await self._fetch(
+            """
+            SELECT id, tag, name, level, treasury, total_income_per_hour, member_count
+            FROM clans
+            ORDER BY total_income_per_hour DESC, treasury DESC
+            LIMIT $1
+            """,
+            limit,
+        )
+        return [dict(row) for row in rows]
+
+    async def delete_clan(self, tag: str, admin_id: int) -> Dict[str, Any]:
+        clan = await self.get_clan_by_tag(tag)
+        if not clan:
+            return {"success": False, "error": "Клан не найден"}
+
+        try:
+            async with (await self.pool()).acquire() as conn:
+                async with conn.transaction():
+                    await conn.execute(
+                        """UPDATE players SET clan_id = NULL
+                           WHERE user_id IN (SELECT user_id FROM clan_members WHERE clan_id = $1)""",
+                        clan["id"],
+                    )
+                    await conn.execute("DELETE FROM clan_members WHERE clan_id = $1", clan["id"])
+                    await conn.execute("DELETE FROM clan_treasury_log WHERE clan_id = $1", clan["id"])
+                    await conn.execute("DELETE FROM clans WHERE id = $1", clan["id"])
+                    await conn.execute(
+                        SQL_ADMIN_ACTION,
+                        admin_id,
+                        "delete_clan",
+                        clan["owner_id"],
+                        f"Удален клан: {clan['tag']} {clan['name']}",
+                    )
+            return {"success": True, "clan_name": clan["name"], "member_count": clan["member_count"]}
+        except Exception as e:
+            return {"success": False, "error": f"Ошибка при удалении клана: {str(e)}"}
+
+    async def update_clan_name(self, tag: str, new_name: str, admin_id: int) -> Dict[str, Any]:
+        clan = await self.get_clan_by_tag(tag)
+        if not clan:
+            return {"success": False, "error": "Клан не найден"}
+
+        try:
+            old_name = clan["name"]
+            async with (await self.pool()).acquire() as conn:
+                async with conn.transaction():
+                    await conn.execute("UPDATE clans SET name = $1 WHERE id = $2", new_name, clan["id"])
+                    await conn.execute(
+                        SQL_ADMIN_ACTION,
+                        admin_id,
+                        "rename_clan",
+                        clan["owner_id"],
+                        f"Переименован клан {clan['tag']}: {old_name} -> {new_name}",
+                    )
+            return {"success": True, "old_name": old_name, "new_name": new_name}
+        except Exception as e:
+            return {"success": False, "error": f"Ошибка при изменении названия: {str(e)}"}
+
+    async def add_treasury(self, clan_id: int, amount: int, add_total_lifts: bool = False) -> None:
+        lifts = ", total_lifts = total_lifts + 1" if add_total_lifts else ""
+        await self._execute(f"UPDATE clans SET treasury = treasury + $1{lifts} WHERE id = $2", amount, clan_id)
+
+    async def log_collection(self, clan_id: int, action_type: str, amount: int, description: str) -> None:
+        await self._execute(
+            """INSERT INTO clan_treasury_log (clan_id, action_type, amount, description)
+               VALUES ($1, $2, $3, $4)""",
+            clan_id,
+            action_type,
+            amount,
+            description,
+        )
+
+    async def log_collection_with_user(
+        self, clan_id: int, user_id: int, action_type: str, amount: int, description: str
+    ) -> None:
+        await self._execute(
+            """INSERT INTO clan_treasury_log (clan_id, user_id, action_type, amount, description)
+               VALUES ($1, $2, $3, $4, $5)""",
+            clan_id,
+            user_id,
+            action_type,
+            amount,
+            description,
+        )
@@ -0,0 +1,204 @@
+"""
+Имена и короткие адреса пользователей VK.
+
+Хендлеры и регистрация не ходят в VK за каждым именем. Запросы копятся
+PROFILE_BATCH_DELAY_SECONDS и уходят одним users.get на пачку до 1000
+айди или коротких адресов (users.get принимает и то и другое, а
+utils.resolveScreenName — только один адрес за вызов). Ответы хранятся
+PROFILE_CACHE_SECONDS, не больше PROFILE_CACHE_MAX записей. Если тот же
+пользователь уже запрошен и ответа ещё нет, новый запрос ждёт тот же ответ.
+
+Если VK недоступен, вместо имени остаётся айди, как было до резолвера.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+from vkbottle import API, VKAPIError
+from vkbottle_types.objects import UsersFields
+
+from bot.core.config import settings
+from bot.metrics import record_cache
+from bot.utils import pointer_to_screen_name
+
+MAX_IDS_PER_CALL = 1000
+# Ник в игре не длиннее 20 символов, см. /гник
+MAX_NAME_LENGTH = 20
+# users.get: ни одного пользователя с такими айди или адресами
+INVALID_USER_ID = 113
+
+# Пользователь VK: айди, имя, фамилия, короткий адрес
+VKUser = Dict[str, object]
+
+
+def display_name(user: VKUser) -> str:
+    full_name = f"{user.get('first_name') or ''} {user.get('last_name') or ''}".strip()
+    if not full_name:
+        return str(user["id"])
+    if len(full_name) > MAX_NAME_LENGTH:
+        return (str(user.get("first_name") or "") or full_name)[:MAX_NAME_LENGTH].strip()
+    return full_name
+
+
+class UserResolver:
+    """Пачки users.get с кешем и общим ожиданием одинаковых запросов.
+
+    Ключ — то, что передаётся в user_ids: айди строкой или короткий адрес в
+    нижнем регистре. Значение — пользователь или None, если такого нет.
+    """
+
+    def __init__(self, api: API, ttl: float, batch_delay: float, max_cached: int) -> None:
+        self.api = api
+        self.ttl = ttl
+        self.batch_delay = batch_delay
+        self.max_cached = max_cached
+        self._cache: "OrderedDict[str, Tuple[float, Optional[VKUser]]]" = OrderedDict()
+        # Запрошено и ещё не получено: ключ -> общий для всех ожидающих future
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._queue: List[str] = []
+        self._flush_timer: Optional[asyncio.TimerHandle] = None
+
+    def _cached(self, key: str, now: float) -> Tuple[bool, Optional[VKUser]]:
+        entry = self._cache.get(key)
+        if entry is None or entry[0] <= now:
+            return False, None
+        return True, entry[1]
+
+    def _remember(self, key: str, user: Optional[VKUser], now: float) -> None:
+        self._cache[key] = (now + self.ttl, user)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+
+    async def get_users(self, keys: Iterable[str]) -> Dict[str, Optional[VKUser]]:
+        now = time.monotonic()
+        loop = asyncio.get_running_loop()
+        result: Dict[str, Optional[VKUser]] = {}
+        waiting: Dict[str, asyncio.Future] = {}
+
+        for key in keys:
+            hit, user = self._cached(key, now)
+            if hit:
+                record_cache("vk_users", True)
+                result[key] = user
+                continue
+            record_cache("vk_users", False)
+            future = self._pending.get(key)
+            if future is None:
+                future = self._pending[key] = loop.create_future()
+                self._queue.append(key)
+            waiting[key] = future
+
+        if len(self._queue) >= MAX_IDS_PER_CALL:
+            self._flush()
+        elif self._queue and self._flush_timer is None:
+            self._flush_timer = loop.call_later(self.batch_delay, self._flush)
+
+        for key, future in waiting.items():
+            # shield: отмена одного ожидающего не должна отменять ответ остальным
+            result[key] = await asyncio.shield(future)
+        return result
+
+    def _flush(self) -> None:
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        while self._queue:
+            batch, self._queue = self._queue[:MAX_IDS_PER_CALL], self._queue[MAX_IDS_PER_CALL:]
+            asyncio.create_task(self._fetch(batch))
+
+    async def _fetch(self, batch: List[str]) -> None:
+        try:
+            try:
+                response = await self.api.users.get(user_ids=batch, fields=[UsersFields.SCREEN_NAME])
+            except VKAPIError[INVALID_USER_ID]:
+                response = []
+        except Exception as e:
+            for key in batch:
+                future = self._pending.pop(key)
+                if not future.done():
+                    future.set_exception(e)
+                # Ожидающих могло уже не остаться, помечаем ошибку полученной
+                future.exception()
+            return
+
+        found: Dict[str, VKUser] = {}
+        for item in response:
+            user: VKUser = {
+                "id": item.id,
+                "first_name": item.first_name,
+                "last_name": item.last_name,
+                "screen_name": getattr(item, "screen_name", None),
+            }
+            found[str(item.id)] = user
+            found[f"id{item.id}"] = user
+            if user["screen_name"]:
+                found[str(user["screen_name"]).lower()] = user
+
+        now = time.monotonic()
+        for key in batch:
+            user = found.get(key)
+            self._remember(key, user, now)
+            if user is not None:
+                self._remember(str(user["id"]), user, now)
+            future = self._pending.pop(key)
+            if not future.done():
+                future.set_result(user)
+
+
+_resolver: Optional[UserResolver] = None
+
+
+def get_resolver() -> UserResolver:
+    global _resolver
+
+    if _resolver is None:
+        from bot.core.loader import bot
+
+        _resolver = UserResolver(
+            bot.api,
+            settings.PROFILE_CACHE_SECONDS,
+            settings.PROFILE_BATCH_DELAY_SECONDS,
+            settings.PROFILE_CACHE_MAX,
+        )
+    return _resolver
+
+
+async def get_display_names(user_ids: Iterable[int]) -> Dict[int, str]:
+    """Имена для ника в игре; при ошибке VK или неизвестном айди — сам айди"""
+    user_ids = list(user_ids)
+    try:
+        users = await get_resolver().get_users(str(user_id) for user_id in user_ids)
+    except Exception as e:
+        logger.warning(f"Could not fetch names of {len(user_ids)} users: {e}")
+        users = {}
+    return {
+        user_id: display_name(users[str(user_id)]) if users.get(str(user_id)) else str(user_id)
+        for user_id in user_ids
+    }
+
+
+async def get_display_name(user_id: int) -> str:
+    return (await get_display_names([user_id]))[user_id]
+
+
+async def resolve_user_id(user_pointer: str) -> Optional[int]:
+    """Айди из "123", "[id123|...]", ссылки или короткого адреса; None — не найден"""
+    screen_name = pointer_to_screen_name(user_pointer)
+    if screen_name is None:
+        return None
+    if screen_name.isdigit():
+        return int(screen_name)
+
+    key = screen_name.lower()
+    try:
+        user = (await get_resolver().get_users([key]))[key]
+    except Exception as e:
+        logger.warning(f"Could not resolve {screen_name}: {e}")
+        return None
+    return int(user["id"]) if user is not None else None
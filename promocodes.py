@@ -1,9 +1,7 @@
-from datetime import datetime
-
-from bot.utils import format_number
+from bot.utils import format_number, format_ts, now_ts
 from vkbottle.bot import BotLabeler, Message
 
-from bot.db import count_promo_uses, get_player, get_promo_info, use_promo_code
+from bot.storage import count_promo_uses, get_player, get_promo_info, use_promo_code
 from bot.services.users import is_admin
 
 promocode_labeler = BotLabeler()
@@ -30,16 +28,13 @@ async def promo_info_handler(message: Message, code: str):
     creator_name = creator["username"] if creator else f"ID: {promo_info['created_by']}"
 
     # Форматируем даты
-    created_at = datetime.fromisoformat(promo_info["created_at"]).strftime(
-        "%d.%m.%Y %H:%M"
-    )
+    created_at = format_ts(promo_info["created_at"], "%d.%m.%Y %H:%M")
 
     expires_text = "⏳ Срок: Не ограничен"
     if promo_info["expires_at"]:
-        expires_date = datetime.fromisoformat(promo_info["expires_at"])
-        expires_text = f"⏳ Срок: до {expires_date.strftime('%d.%m.%Y')}"
+        expires_text = f"⏳ Срок: до {format_ts(promo_info['expires_at'])}"
 
-        if datetime.now() > expires_date:
+        if now_ts() > promo_info["expires_at"]:
             expires_text += " ⚠️ Истек"
 
     status = "✅ Активен" if promo_info["is_active"] == 1 else "❌ Неактивен"
@@ -1,33 +1,25 @@
-from datetime import datetime
-
 from loguru import logger
 from vkbottle import BaseMiddleware, BaseReturnManager
 from vkbottle.bot import Message
-from vkbottle_types.objects import UsersFields
 
-from bot.core.loader import bot
-from bot.db import create_player, get_player, unban_player
+from bot.services.profiles import get_display_name
+from bot.storage import create_player, get_player, is_banned, player_exists
+from bot.utils import days_until, format_ts
 
 
 class RegistrationMiddleware(BaseMiddleware[Message]):
     async def pre(self):
-        player = await get_player(self.event.from_id)
-        if player and player.get("is_banned", 0) == 1:
-            ban_reason = player.get("ban_reason", "Не указана")
-            ban_until = player.get("ban_until")
+        if await is_banned(self.event.from_id):
+            # Строку игрока читаем только для ответа забаненному
+            player = await get_player(self.event.from_id)
+            ban_reason = (player or {}).get("ban_reason") or "Не указана"
+            ban_until = (player or {}).get("ban_until")
 
             if ban_until:
-                try:
-                    ban_until_date = datetime.fromisoformat(ban_until)
-                    if datetime.now() > ban_until_date:
-                        await unban_player(self.event.from_id, 0)
-                    else:
-                        days_left = (ban_until_date - datetime.now()).days
-                        await self.event.answer(
-                            f"🚫 Вы заблокированы!\n📝 Причина: {ban_reason}\n⏳ Срок: {days_left} дней\n📅 До: {ban_until_date.strftime('%d.%m.%Y')}"
-                        )
-                except:
-                    pass
+                days_left = days_until(ban_until)
+                await self.event.answer(
+                    f"🚫 Вы заблокированы!\n📝 Причина: {ban_reason}\n⏳ Срок: {days_left} дней\n📅 До: {format_ts(ban_until)}"
+                )
             else:
                 await self.event.answer(
                     f"🚫 Вы заблокированы навсегда!\n📝 Причина: {ban_reason}"
@@ -35,9 +27,9 @@ class RegistrationMiddleware(BaseMiddleware[Message]):
 
             self.stop("User is banned")
 
-        if not player:
+        if not await player_exists(self.event.from_id):
             logger.info(f"Creating new player with id {self.event.from_id}")
-            await create_player(self.event.from_id, str(self.event.from_id))
+            await create_player(self.event.from_id, await get_display_name(self.event.from_id))
 
 
 class BotMessageReturnHandler(BaseReturnManager):
@@ -0,0 +1,130 @@
+"""
+Реестры в памяти: уровни администраторов, баны и зарегистрированные игроки.
+
+Первые два меняются только через make_admin/remove_admin/ban_player/
+unban_player/delete_player, поэтому бэкенд хранилища держит их в памяти и
+обновляет в этих функциях, а не читает игрока на каждую проверку. Список
+игроков так же пополняется в create_player и чистится в delete_player и
+reset_all. Классы общие для всех бэкендов, запросы загрузки у каждого свои.
+"""
+
+from __future__ import annotations
+
+import heapq
+from time import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class AdminRegistry:
+    """user_id -> admin_level для игроков с admin_level > 0"""
+
+    def __init__(self) -> None:
+        self.levels: Optional[Dict[int, int]] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.levels is not None
+
+    def load(self, rows: Iterable[Tuple[int, int]]) -> Dict[int, int]:
+        self.levels = {user_id: level for user_id, level in rows}
+        return self.levels
+
+    def set(self, user_id: int, level: int) -> None:
+        if self.levels is not None:
+            self.levels[user_id] = level
+
+    def discard(self, user_id: int) -> None:
+        if self.levels is not None:
+            self.levels.pop(user_id, None)
+
+
+class BanRegistry:
+    """Множество забаненных id и min-heap (срок окончания, user_id) для временных банов.
+
+    Срок — ban_until из базы, секунды epoch; None — бессрочный бан.
+
+    Записи в куче не удаляются при разбане/повторном бане — актуальный срок
+    хранится в deadlines, устаревшие записи пропускаются.
+    """
+
+    def __init__(self) -> None:
+        self.ids: Optional[set] = None
+        self.deadlines: Dict[int, float] = {}
+        self.heap: List[Tuple[float, int]] = []
+
+    @property
+    def loaded(self) -> bool:
+        return self.ids is not None
+
+    def load(self, rows: Iterable[Tuple[int, Optional[int]]]) -> None:
+        self.ids = set()
+        self.deadlines.clear()
+        self.heap.clear()
+        for user_id, ban_until in rows:
+            self._remember(user_id, ban_until or None)
+
+    def invalidate(self) -> None:
+        """Забыть реестр, он перечитается при первой проверке"""
+        self.ids = None
+
+    def _remember(self, user_id: int, deadline: Optional[float]) -> None:
+        self.ids.add(user_id)
+        if deadline is None:
+            self.deadlines.pop(user_id, None)
+        else:
+            self.deadlines[user_id] = deadline
+            heapq.heappush(self.heap, (deadline, user_id))
+
+    def add(self, user_id: int, ban_until: Optional[int]) -> None:
+        if self.ids is not None:
+            self._remember(user_id, ban_until or None)
+
+    def discard(self, user_id: int) -> None:
+        if self.ids is not None:
+            self.ids.discard(user_id)
+        self.deadlines.pop(user_id, None)
+
+    def contains(self, user_id: int) -> bool:
+        """Проверка по загруженному реестру; истёкшие баны не считаются"""
+        if user_id not in self.ids:
+            return False
+        deadline = self.deadlines.get(user_id)
+        return deadline is None or deadline > time()
+
+    def pop_expired(self, now: Optional[float] = None) -> List[int]:
+        if self.ids is None:
+            return []
+        now = time() if now is None else now
+        expired = []
+        while self.heap and self.heap[0][0] <= now:
+            deadline, user_id = heapq.heappop(self.heap)
+            if self.deadlines.get(user_id) != deadline:
+                continue
+            self.discard(user_id)
+            expired.append(user_id)
+        return expired
+
+
+class PlayerRegistry:
+    """Айди игроков, про которых уже известно, что они зарегистрированы.
+
+    Положительный кеш для player_exists: игрок попадает сюда при регистрации
+    или после первой проверки в базе, так что запрос по ключу делается только
+    для новых и ещё не встречавшихся этому процессу игроков. Игрок, удалённый
+    другим процессом, пропадает отсюда после clear().
+    """
+
+    def __init__(self) -> None:
+        self.ids: set = set()
+
+    def add(self, user_id: int) -> None:
+        self.ids.add(user_id)
+
+    def discard(self, user_id: int) -> None:
+        self.ids.discard(user_id)
+
+    def clear(self) -> None:
+        self.ids.clear()
+
+    def contains(self, user_id: int) -> bool:
+        return user_id in self.ids
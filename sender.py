@@ -0,0 +1,275 @@
+"""
+Очередь исходящих сообщений.
+
+messages.send (message.answer в хендлерах и строки, которые хендлеры
+возвращают) не уходит в VK сразу, а встаёт в очередь с приоритетом. Перед
+каждой отправкой берётся токен из ведра на SEND_RATE_PER_SECOND запросов в
+секунду с запасом SEND_BURST, поэтому бот не упирается в лимит VK на запросы
+сообщества: в пик ответы ждут в очереди, а не отбрасываются VK. Хендлер ждёт
+отправки своего сообщения, так что порядок ответов одному игроку сохраняется.
+
+Приоритеты: ответы администраторам, затем ответы на команды, затем массовые
+рассылки (with send_priority(PRIORITY_BULK): ...). Ошибки "слишком много
+запросов" (6), внутренние ошибки VK (10) и сетевые ошибки повторяются до
+SEND_MAX_ATTEMPTS раз с экспоненциальной задержкой со случайным разбросом;
+random_id выставляется заранее, чтобы VK не доставил повтор дважды.
+
+В режиме Callback API у каждого воркера своё ведро на
+SEND_RATE_PER_SECOND / CALLBACK_WORKERS запросов в секунду.
+
+Проверка лимита на заглушке VK API:
+    python -m bot.sender
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+from aiohttp import ClientError
+from loguru import logger
+from vkbottle import API, BaseMiddleware, VKAPIError
+from vkbottle.bot import Message
+
+from bot.metrics import record_send, record_send_queue_depth, record_send_retry
+
+PRIORITY_ADMIN = 0
+PRIORITY_REPLY = 1
+PRIORITY_BULK = 2
+PRIORITY_NAMES = {PRIORITY_ADMIN: "admin", PRIORITY_REPLY: "reply", PRIORITY_BULK: "bulk"}
+
+# 6 — слишком много запросов в секунду, 10 — внутренняя ошибка сервера VK
+RETRY_ERROR_CODES = (6, 10)
+
+_send_priority: ContextVar[int] = ContextVar("send_priority", default=PRIORITY_REPLY)
+
+
+@contextmanager
+def send_priority(priority: int) -> Iterator[None]:
+    """Приоритет сообщений, отправленных внутри блока"""
+    token = _send_priority.set(priority)
+    try:
+        yield
+    finally:
+        _send_priority.reset(token)
+
+
+class TokenBucket:
+    """rate токенов в секунду, не больше burst в запасе"""
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def retry_delay(attempt: int, base: float, cap: float) -> float:
+    """Задержка перед повтором: случайная в пределах base * 2^attempt, не больше cap"""
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+def is_retriable(error: BaseException) -> bool:
+    if isinstance(error, VKAPIError):
+        return error.code in RETRY_ERROR_CODES
+    return isinstance(error, (ClientError, asyncio.TimeoutError, ConnectionError))
+
+
+@dataclass
+class _Outgoing:
+    method: str
+    data: Dict[str, Any]
+    priority: int
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.perf_counter)
+    attempts: int = 0
+
+
+class SendQueue:
+    """Приоритетная очередь отправок и SEND_CONCURRENCY отправителей"""
+
+    def __init__(
+        self,
+        api: "QueuedAPI",
+        rate: float,
+        burst: float,
+        concurrency: int,
+        max_attempts: int,
+        retry_base: float,
+        retry_cap: float,
+    ) -> None:
+        self.api = api
+        self.bucket = TokenBucket(rate, burst)
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_cap = retry_cap
+        self.queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._order = itertools.count()
+        # Поставлено и ещё не отправлено, включая ждущие повтора
+        self.pending = 0
+        self.tasks: List[asyncio.Task] = [asyncio.create_task(self._consume()) for _ in range(concurrency)]
+
+    def submit(self, method: str, data: Dict[str, Any], priority: int) -> asyncio.Future:
+        item = _Outgoing(method, data, priority, asyncio.get_running_loop().create_future())
+        self.pending += 1
+        self._put(item)
+        return item.future
+
+    def _put(self, item: _Outgoing) -> None:
+        self.queue.put_nowait((item.priority, next(self._order), item))
+        record_send_queue_depth(self.queue.qsize())
+
+    async def _consume(self) -> None:
+        while True:
+            # Сначала сообщение, потом токен: свободный отправитель не держит
+            # токен, поэтому за любую секунду уходит не больше rate + burst
+            entry = await self.queue.get()
+            await self.bucket.acquire()
+            # Пока ждали токен, могло встать сообщение с более высоким приоритетом
+            if not self.queue.empty():
+                self.queue.put_nowait(entry)
+                entry = self.queue.get_nowait()
+            _, _, item = entry
+            record_send_queue_depth(self.queue.qsize())
+            if item.future.done():
+                self.pending -= 1
+                continue
+
+            try:
+                response = await self.api.send_now(item.method, item.data)
+            except Exception as e:
+                item.attempts += 1
+                if is_retriable(e) and item.attempts < self.max_attempts:
+                    delay = retry_delay(item.attempts, self.retry_base, self.retry_cap)
+                    record_send_retry(type(e).__name__ if not isinstance(e, VKAPIError) else f"vk{e.code}")
+                    logger.warning(f"{item.method} failed ({e}), retry {item.attempts} in {delay:.2f} s")
+                    asyncio.get_running_loop().call_later(delay, self._put, item)
+                    continue
+                self.pending -= 1
+                item.future.set_exception(e)
+            else:
+                self.pending -= 1
+                item.future.set_result(response)
+            record_send(PRIORITY_NAMES[item.priority], time.perf_counter() - item.enqueued_at)
+
+    async def close(self, timeout: float) -> None:
+        """Дожидается отправки поставленного (не дольше timeout) и останавливает отправителей"""
+        deadline = time.monotonic() + timeout
+        while self.pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self.pending:
+            logger.warning(f"{self.pending} outgoing messages were not sent before shutdown")
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+
+class QueuedAPI(API):
+    """API, у которого messages.send идёт через SendQueue, когда она запущена"""
+
+    send_queue: Optional[SendQueue] = None
+
+    async def request(self, method: str, data: Dict[str, Any], version: Optional[str] = None) -> Dict[str, Any]:
+        if method != "messages.send" or self.send_queue is None or version is not None:
+            return await super().request(method, data, version)
+        if not data.get("random_id"):
+            data = {**data, "random_id": random.randint(1, 2**31 - 1)}
+        return await self.send_queue.submit(method, data, _send_priority.get())
+
+    async def send_now(self, method: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        return await super().request(method, data)
+
+    def start_send_queue(self, rate: float, burst: float, concurrency: int, **retry: Any) -> None:
+        self.send_queue = SendQueue(self, rate, burst, concurrency, **retry)
+
+    async def stop_send_queue(self, timeout: float) -> None:
+        send_queue, self.send_queue = self.send_queue, None
+        if send_queue is not None:
+            await send_queue.close(timeout)
+
+
+class SendPriorityMiddleware(BaseMiddleware[Message]):
+    """Ответы администраторам уходят раньше остальных"""
+
+    async def pre(self):
+        from bot.services.users import is_admin
+
+        # Ставим явно для каждого сообщения: при long polling события могут делить контекст
+        _send_priority.set(PRIORITY_ADMIN if await is_admin(self.event.from_id) else PRIORITY_REPLY)
+
+
+# ==============================
+# ПРОВЕРКА ЛИМИТА
+# ==============================
+
+
+class _StubAPI:
+    """Вместо VK: запоминает моменты отправок"""
+
+    def __init__(self) -> None:
+        self.sent_at: List[float] = []
+
+    async def send_now(self, method: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        self.sent_at.append(time.monotonic())
+        return {}
+
+
+def max_per_window(times: List[float], window: float) -> int:
+    """Наибольшее число отправок за любые window секунд"""
+    best, start = 0, 0
+    for end, moment in enumerate(times):
+        while moment - times[start] >= window:
+            start += 1
+        best = max(best, end - start + 1)
+    return best
+
+
+async def check_rate_limit(
+    rate: float, burst: float, concurrency: int, messages: int, idle_seconds: float
+) -> int:
+    api = _StubAPI()
+    queue = SendQueue(api, rate, burst, concurrency, max_attempts=1, retry_base=0, retry_cap=0)
+    # Простой: отправители ждут сообщений, ведро наполняется
+    await asyncio.sleep(idle_seconds)
+    await asyncio.gather(*(queue.submit("messages.send", {}, PRIORITY_REPLY) for _ in range(messages)))
+    await queue.close(0)
+    return max_per_window(sorted(api.sent_at), 1.0)
+
+
+def main(argv: list[str] | None = None) -> None:
+    from bot.core.config import settings
+
+    parser = argparse.ArgumentParser(description="Не больше rate + burst отправок за любую секунду")
+    parser.add_argument("--rate", type=float, default=settings.SEND_RATE_PER_SECOND)
+    parser.add_argument("--burst", type=float, default=settings.SEND_BURST)
+    parser.add_argument("--concurrency", type=int, default=settings.SEND_CONCURRENCY)
+    parser.add_argument("--messages", type=int, default=60)
+    parser.add_argument("--idle-seconds", type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    peak = asyncio.run(check_rate_limit(args.rate, args.burst, args.concurrency, args.messages, args.idle_seconds))
+    limit = int(args.rate + args.burst)
+    print(f"max sends in 1 s: {peak}, limit {limit}")
+    if peak > limit:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
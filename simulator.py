@@ -0,0 +1,416 @@
+"""
+Offline economy simulator for Gym Legend.
+
+Models a large population of players lifting dumbbells, upgrading them,
+buying and upgrading businesses and feeding clan treasuries, so that price
+changes in GameSettings can be evaluated before they reach production.
+
+All per-player state lives in NumPy arrays and every time step is a handful
+of vectorized operations, which keeps a million players over 30 days within
+seconds on a laptop CPU. Prices, incomes and clan bonuses are read from the
+same `settings` object and `get_clan_bonuses` the bot uses.
+
+Usage:
+    python -m bot.simulator --players 1000000 --days 30
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from bot.core.config import GameSettings, settings
+from bot.services.clans import get_additional_clan_bonus, get_clan_bonuses
+
+# Сколько уровней клана предрасчитывать в таблице бонусов за раз
+CLAN_BONUS_TABLE_CHUNK = 64
+
+# Цена "следующего" уровня после максимального
+_NEVER = np.iinfo(np.int64).max // 2
+
+
+@dataclass
+class SimulationConfig:
+    players: int = 100_000
+    days: int = 30
+    # Шаг симуляции в часах
+    step_hours: int = 1
+    seed: int = 0
+
+    # Активность: доля часов в сутки, когда игрок в игре, и сколько
+    # подходов он делает за активный час (ограничено DUMBBELL_COOLDOWN)
+    active_share_mean: float = 0.15
+    lift_share_mean: float = 0.5
+
+    # Политика прокачки: какой запас монет держать и с какого уровня
+    # гантели начинать вкладываться в бизнесы
+    reserve_share: float = 0.0
+    business_after_level: int = 10
+    # Как часто игрок заглядывает в магазин бизнесов
+    shop_every_hours: int = 12
+
+    # Кланы
+    clan_share: float = 0.4
+    clans: int = 2_000
+
+    # Бизнесы рекламируют доход магнезии в час; отключите, чтобы смоделировать
+    # экономику без начисления дохода с бизнесов
+    business_income: bool = True
+
+
+@dataclass
+class SimulationReport:
+    config: SimulationConfig
+    elapsed: float
+    hours: np.ndarray
+    money_supply: np.ndarray
+    magnesia_supply: np.ndarray
+    clan_treasury: np.ndarray
+    mean_dumbbell_level: np.ndarray
+    # Сколько часов понадобилось 50% / 90% игроков, чтобы дойти до уровня
+    time_to_level: Dict[int, Dict[str, Optional[float]]] = field(default_factory=dict)
+    max_clan_level: int = 1
+
+    def format(self) -> str:
+        lines = [
+            f"Simulated {self.config.players:,} players over {self.config.days} days "
+            f"in {self.elapsed:.2f}s",
+            "",
+            "day | money supply | magnesia supply | clan treasury | mean level",
+        ]
+        steps_per_day = 24 // self.config.step_hours
+        for day in range(1, self.config.days + 1):
+            i = day * steps_per_day - 1
+            lines.append(
+                f"{day:>3} | {int(self.money_supply[i]):>12,} | "
+                f"{int(self.magnesia_supply[i]):>15,} | "
+                f"{int(self.clan_treasury[i]):>13,} | "
+                f"{self.mean_dumbbell_level[i]:>10.2f}"
+            )
+
+        lines += ["", "level | p50 hours | p90 hours"]
+        for level, times in self.time_to_level.items():
+            p50 = "-" if times["p50"] is None else f"{times['p50']:.0f}"
+            p90 = "-" if times["p90"] is None else f"{times['p90']:.0f}"
+            lines.append(f"{level:>5} | {p50:>9} | {p90:>9}")
+
+        lines.append("")
+        lines.append(f"Max clan level: {self.max_clan_level}")
+        return "\n".join(lines)
+
+
+def _dumbbell_tables(game: GameSettings) -> Dict[str, np.ndarray]:
+    """Lookup tables indexed by dumbbell level"""
+    max_level = max(game.DUMBBELL_LEVELS)
+    price = np.zeros(max_level + 2, dtype=np.int64)
+    income = np.zeros(max_level + 2, dtype=np.int64)
+    # Уровень выше максимального недостижим
+    price[max_level + 1] = _NEVER
+
+    for level, info in game.DUMBBELL_LEVELS.items():
+        price[level] = info["price"]
+        income[level] = info["income_per_use"]
+
+    extra_clan = np.array(
+        [get_additional_clan_bonus(level) for level in range(max_level + 2)],
+        dtype=np.int64,
+    )
+    return {
+        "price": price,
+        "income": income,
+        "extra_clan": extra_clan,
+        "max_level": np.int64(max_level),
+    }
+
+
+def _clan_bonus_table(max_level: int) -> Dict[str, np.ndarray]:
+    """Lookup tables indexed by clan level, built from get_clan_bonuses"""
+    size = (max_level // CLAN_BONUS_TABLE_CHUNK + 1) * CLAN_BONUS_TABLE_CHUNK + 1
+    bonuses = [get_clan_bonuses(level) for level in range(1, size)]
+    return {
+        "lift_bonus_coins": np.array(
+            [0] + [b["lift_bonus_coins"] for b in bonuses], dtype=np.int64
+        ),
+        "business_bonus_percent": np.array(
+            [0] + [b["business_bonus_percent"] for b in bonuses], dtype=np.float64
+        ),
+    }
+
+
+def simulate(
+    config: SimulationConfig, game: GameSettings = settings
+) -> SimulationReport:
+    """Run the simulation and return the collected time series"""
+    started = time.perf_counter()
+    rng = np.random.default_rng(config.seed)
+    n = config.players
+    steps = config.days * 24 // config.step_hours
+    shop_every = max(1, config.shop_every_hours // config.step_hours)
+    reserve = 1.0 + config.reserve_share
+
+    tables = _dumbbell_tables(game)
+    max_level = int(tables["max_level"])
+    max_lifts_per_hour = max(1, 3600 // max(1, game.DUMBBELL_COOLDOWN))
+
+    # Кланы: игроки упорядочены так, что участники одного клана идут подряд,
+    # а игроки без клана стоят в начале. Тогда суммы по кланам считаются
+    # через reduceat без сортировок и bincount на каждом шаге.
+    members = int(n * config.clan_share)
+    clan_sizes = np.bincount(
+        rng.integers(0, max(1, config.clans), members), minlength=max(1, config.clans)
+    )
+    clan_sizes = clan_sizes[clan_sizes > 0]
+    clans = len(clan_sizes)
+    first_member = n - members
+    clan_starts = np.cumsum(clan_sizes) - clan_sizes
+    clan_level = np.ones(clans, dtype=np.int64)
+    treasury = np.zeros(clans, dtype=np.float64)
+    clan_table = _clan_bonus_table(1)
+
+    # Профиль активности: ожидаемое число подходов за шаг для каждого игрока
+    active_share = np.clip(rng.exponential(config.active_share_mean, n), 0.0, 1.0)
+    lifts_per_active_hour = np.clip(
+        rng.beta(2, 2, n) * 2 * config.lift_share_mean * max_lifts_per_hour,
+        1,
+        max_lifts_per_hour,
+    )
+    lift_rate = (active_share * lifts_per_active_hour * config.step_hours).astype(
+        np.float32
+    )
+    lift_carry = rng.random(n, dtype=np.float32)
+    lifts = np.zeros(n, dtype=np.int32)
+
+    # Состояние игроков (значения по умолчанию как в SQL_PLAYERS_TABLE)
+    balance = np.ones(n, dtype=np.int64)
+    magnesia = np.zeros(n, dtype=np.int64)
+    level = np.ones(n, dtype=np.int64)
+    level_counts = np.zeros(max_level + 1, dtype=np.int64)
+    level_counts[1] = n
+
+    # Производные от уровня величины пересчитываются только у тех,
+    # чей уровень изменился, а бонусы участников - при улучшении кланов
+    next_price = np.full(n, int(tables["price"][2] * reserve), dtype=np.int64)
+    income_per_lift = np.full(n, tables["income"][1], dtype=np.int32)
+    member_extra = np.full(members, tables["extra_clan"][1], dtype=np.int64)
+    member_bonus = np.repeat(clan_table["lift_bonus_coins"][clan_level], clan_sizes)
+    member_percent = clan_table["business_bonus_percent"][clan_level]
+
+    business_ids = sorted(game.BUSINESSES)
+    business_level = np.zeros((len(business_ids), n), dtype=np.int32)
+    business_upgrades = np.zeros((len(business_ids), n), dtype=np.int32)
+    # Доход бизнесов меняется только в магазине, поэтому магнезия начисляется
+    # игрокам лениво (при заходе в магазин), а на каждом шаге считаются только
+    # суммы по кланам и общая масса магнезии
+    hourly = np.zeros(n, dtype=np.int64)
+    clan_hourly = np.zeros(clans, dtype=np.float64)
+    hourly_total = 0
+    accrued_hours = 0
+    magnesia_total = 0
+
+    money_supply = np.zeros(steps)
+    magnesia_supply = np.zeros(steps)
+    clan_treasury = np.zeros(steps)
+    mean_level = np.zeros(steps)
+    reached = np.zeros((steps, max_level + 1), dtype=np.int64)
+    level_index = np.arange(max_level + 1)
+
+    for step in range(steps):
+        # 1. Подходы к гантеле
+        lift_carry += lift_rate
+        lifts[:] = lift_carry
+        lift_carry -= lifts
+        np.add(balance, lifts * income_per_lift, out=balance, casting="unsafe")
+        member_lifts = lifts[first_member:]
+        balance[first_member:] += member_lifts * member_bonus
+        treasury += _clan_sums(member_lifts * (member_bonus + member_extra), clan_starts)
+
+        # 2. Доход бизнесов (магнезия/час) и процент в казну клана
+        if config.business_income:
+            accrued_hours += config.step_hours
+            magnesia_total += hourly_total * config.step_hours
+            treasury += clan_hourly * config.step_hours * member_percent / 100
+
+        # 3. Прокачка гантели, если хватает денег с учетом запаса
+        upgraders = np.flatnonzero(balance >= next_price)
+        if upgraders.size:
+            old_levels = level[upgraders]
+            new_levels = old_levels + 1
+            balance[upgraders] -= tables["price"][new_levels]
+            level[upgraders] = new_levels
+            level_counts -= np.bincount(old_levels, minlength=max_level + 1)
+            level_counts += np.bincount(new_levels, minlength=max_level + 1)
+
+            next_price[upgraders] = np.minimum(
+                tables["price"][new_levels + 1] * reserve, _NEVER
+            ).astype(np.int64)
+            income_per_lift[upgraders] = tables["income"][new_levels]
+
+            member_upgraders = upgraders >= first_member
+            member_extra[upgraders[member_upgraders] - first_member] = tables[
+                "extra_clan"
+            ][new_levels[member_upgraders]]
+
+        # 4. Раз в несколько часов игроки заходят в магазин бизнесов
+        if step % shop_every == 0:
+            if accrued_hours and hourly_total:
+                magnesia += hourly * accrued_hours
+            accrued_hours = 0
+
+            investor = level >= config.business_after_level
+            if investor.any():
+                for i, business_id in enumerate(business_ids):
+                    business = game.BUSINESSES[business_id]
+                    hourly += _shop_business(
+                        business,
+                        investor,
+                        business_level[i],
+                        business_upgrades[i],
+                        balance,
+                        magnesia,
+                        reserve,
+                    )
+                hourly_total = int(hourly.sum())
+                clan_hourly = _clan_sums(hourly[first_member:], clan_starts)
+            magnesia_total = int(magnesia.sum())
+
+        # 5. Владельцы кланов улучшают клан, как только хватает казны
+        upgrade_cost = game.CLAN_UPGRADE_BASE_COST * clan_level
+        upgraded_clans = np.flatnonzero(treasury >= upgrade_cost)
+        if upgraded_clans.size:
+            treasury[upgraded_clans] -= upgrade_cost[upgraded_clans]
+            clan_level[upgraded_clans] += 1
+            if clan_level.max() >= len(clan_table["lift_bonus_coins"]):
+                clan_table = _clan_bonus_table(int(clan_level.max()))
+            member_bonus = np.repeat(
+                clan_table["lift_bonus_coins"][clan_level], clan_sizes
+            )
+            member_percent = clan_table["business_bonus_percent"][clan_level]
+
+        money_supply[step] = balance.sum()
+        magnesia_supply[step] = magnesia_total
+        clan_treasury[step] = treasury.sum()
+        mean_level[step] = level_counts @ level_index / n
+        reached[step] = level_counts[::-1].cumsum()[::-1]
+
+    hours = (np.arange(steps) + 1) * config.step_hours
+    time_to_level = {}
+    for lvl in range(2, max_level + 1):
+        time_to_level[lvl] = {
+            "p50": _time_to_share(reached[:, lvl], hours, n * 0.5),
+            "p90": _time_to_share(reached[:, lvl], hours, n * 0.9),
+        }
+
+    return SimulationReport(
+        config=config,
+        elapsed=time.perf_counter() - started,
+        hours=hours,
+        money_supply=money_supply,
+        magnesia_supply=magnesia_supply,
+        clan_treasury=clan_treasury,
+        mean_dumbbell_level=mean_level,
+        time_to_level=time_to_level,
+        max_clan_level=int(clan_level.max(initial=1)),
+    )
+
+
+def _clan_sums(values: np.ndarray, clan_starts: np.ndarray) -> np.ndarray:
+    """Per-clan sums of a member-ordered array"""
+    if not clan_starts.size:
+        return np.zeros(0)
+    return np.add.reduceat(values, clan_starts)
+
+
+def _shop_business(
+    business: Dict[str, Any],
+    investor: np.ndarray,
+    levels: np.ndarray,
+    upgrades: np.ndarray,
+    balance: np.ndarray,
+    magnesia: np.ndarray,
+    reserve: float,
+) -> np.ndarray:
+    """Buy or upgrade one business for every investor who can afford it.
+
+    Mirrors buy_business / upgrade_business: the price of the next upgrade
+    grows by 50 per completed stage and five stages raise the business level.
+    Works on whole-population masks, because late in a season almost every
+    investor shops on every visit. Returns the change of hourly income.
+    """
+    wallet = balance if business["currency"] == "монет" else magnesia
+    upgrade_wallet = balance if business["upgrade_currency"] == "монет" else magnesia
+    owned = levels > 0
+
+    buyers = investor & ~owned & (wallet >= business["base_price"] * reserve)
+    wallet -= buyers * business["base_price"]
+    levels += buyers
+
+    price = business["upgrade_price"] + upgrades * 50
+    upgraders = owned & (upgrade_wallet >= (price * reserve if reserve != 1 else price))
+    upgrade_wallet -= upgraders * price
+    upgrades += upgraders
+    # 5 улучшений повышают уровень бизнеса
+    leveled = upgrades >= 5
+    levels += leveled
+    upgrades[leveled] = 0
+
+    return buyers * business["base_income"] + leveled * business["income_increase"]
+
+
+def _time_to_share(
+    reached: np.ndarray, hours: np.ndarray, threshold: float
+) -> Optional[float]:
+    idx = np.searchsorted(reached, threshold)
+    if idx >= len(hours):
+        return None
+    return float(hours[idx])
+
+
+def parse_args(argv: Optional[List[str]] = None) -> SimulationConfig:
+    defaults = SimulationConfig()
+    parser = argparse.ArgumentParser(description="Gym Legend economy simulator")
+    parser.add_argument("--players", type=int, default=defaults.players)
+    parser.add_argument("--days", type=int, default=defaults.days)
+    parser.add_argument("--step-hours", type=int, default=defaults.step_hours)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--active-share", type=float, default=defaults.active_share_mean)
+    parser.add_argument("--lift-share", type=float, default=defaults.lift_share_mean)
+    parser.add_argument("--reserve", type=float, default=defaults.reserve_share)
+    parser.add_argument(
+        "--business-after-level", type=int, default=defaults.business_after_level
+    )
+    parser.add_argument("--clan-share", type=float, default=defaults.clan_share)
+    parser.add_argument("--clans", type=int, default=defaults.clans)
+    parser.add_argument(
+        "--no-business-income", action="store_true", help="не начислять доход бизнесов"
+    )
+    args = parser.parse_args(argv)
+
+    if 24 % args.step_hours:
+        parser.error("--step-hours must divide 24")
+
+    return SimulationConfig(
+        players=args.players,
+        days=args.days,
+        step_hours=args.step_hours,
+        seed=args.seed,
+        active_share_mean=args.active_share,
+        lift_share_mean=args.lift_share,
+        reserve_share=args.reserve,
+        business_after_level=args.business_after_level,
+        clan_share=args.clan_share,
+        clans=args.clans,
+        business_income=not args.no_business_income,
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    report = simulate(parse_args(argv))
+    print(report.format())
+
+
+if __name__ == "__main__":
+    main()
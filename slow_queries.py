@@ -0,0 +1,140 @@
+"""
+Журнал медленных SQL-запросов.
+
+Наблюдатель запросов bot.db замеряет каждый запрос. Если запрос выполнялся
+дольше SLOW_QUERY_THRESHOLD_MS, в отдельный файл (SLOW_QUERY_LOG_PATH)
+пишется нормализованный текст, типы параметров, число строк и вывод
+EXPLAIN QUERY PLAN. Один и тот же нормализованный запрос попадает в журнал
+не чаще раза в SLOW_QUERY_RATE_LIMIT секунд.
+
+Число строк — затронутые запросом или прочитанные вызвавшим его кодом, сам
+запрос повторно не выполняется. План снимается в фоне на отдельном read-only
+соединении, чтобы не задерживать хендлер. Записи журнала идут только в его
+файл, в основной лог и консоль они не попадают.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sqlite3
+import time
+from typing import Any, Optional
+from urllib.parse import quote
+
+from loguru import logger
+
+from bot.core.log import BackgroundFileSink
+from bot.db import add_query_observer, normalize_sql, remove_query_observer
+
+_slow_log = logger.bind(slow_query=True)
+_slow_query_log: Optional["SlowQueryLog"] = None
+_sink_id: Optional[int] = None
+
+
+def describe_parameters(parameters: Any) -> str:
+    """Типы параметров без значений, например (int, str, NoneType)"""
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{k}: {type(v).__name__}" for k, v in parameters.items()) + "}"
+    if isinstance(parameters, (list, tuple)):
+        return "(" + ", ".join(type(v).__name__ for v in parameters) + ")"
+    return f"<{type(parameters).__name__}>"
+
+
+def format_query_plan(rows: list[tuple]) -> str:
+    """Вывод EXPLAIN QUERY PLAN в виде дерева, как в sqlite3 CLI"""
+    depth: dict[int, int] = {}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        level = depth.get(parent, -1) + 1
+        depth[node_id] = level
+        lines.append("  " * level + "|--" + detail)
+    return "\n".join(lines) if lines else "(no plan)"
+
+
+def capture_query_plan(database_path: str, sql: str, parameters: Any) -> str:
+    """План запроса; выполняется в отдельном потоке на read-only соединении"""
+    conn = sqlite3.connect(f"file:{quote(database_path)}?mode=ro", uri=True)
+    try:
+        if not isinstance(parameters, (list, tuple, dict)):
+            parameters = ()
+        return format_query_plan(conn.execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall())
+    finally:
+        conn.close()
+
+
+class SlowQueryLog:
+    def __init__(self, database_path: str, threshold: float, rate_limit: float) -> None:
+        self.database_path = database_path
+        self.threshold = threshold
+        self.rate_limit = rate_limit
+        self._last_logged: dict[str, float] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def observe(self, sql: str, parameters: Any, elapsed: float, rowcount: int) -> None:
+        if elapsed < self.threshold:
+            return
+
+        statement = normalize_sql(sql)
+        now = time.monotonic()
+        last = self._last_logged.get(statement)
+        if last is not None and now - last < self.rate_limit:
+            return
+        self._last_logged[statement] = now
+
+        task = asyncio.get_running_loop().create_task(
+            self._report(statement, sql, parameters, elapsed, rowcount)
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _report(self, statement: str, sql: str, parameters: Any, elapsed: float, rowcount: int) -> None:
+        try:
+            plan = await asyncio.to_thread(capture_query_plan, self.database_path, sql, parameters)
+        except sqlite3.Error as e:
+            plan = f"(EXPLAIN failed: {e})"
+
+        _slow_log.warning(
+            "Slow query {elapsed:.1f} ms | rows: {rows} | params: {params}\n{statement}\n{plan}",
+            elapsed=elapsed * 1000,
+            rows=rowcount if rowcount >= 0 else "?",
+            params=describe_parameters(parameters),
+            statement=statement,
+            plan=plan,
+        )
+
+    async def close(self) -> None:
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+def setup_slow_query_log(database_path: str, threshold_ms: float, rate_limit: float, log_path: str) -> None:
+    """Подключает журнал медленных запросов; threshold_ms <= 0 отключает его"""
+    global _slow_query_log, _sink_id
+
+    if threshold_ms <= 0 or _slow_query_log is not None:
+        return
+
+    _sink_id = logger.add(
+        # Ротация только по размеру
+        BackgroundFileSink(log_path, max_bytes=10 * 1024 * 1024, interval_seconds=float("inf"), retention=5),
+        level="WARNING",
+        format="{time} | {message}",
+        filter=lambda record: record["extra"].get("slow_query", False),
+    )
+    _slow_query_log = SlowQueryLog(database_path, threshold_ms / 1000, rate_limit)
+    add_query_observer(_slow_query_log.observe)
+    logger.info(f"Slow query log enabled: >= {threshold_ms} ms -> {log_path}")
+
+
+async def shutdown_slow_query_log() -> None:
+    global _slow_query_log, _sink_id
+
+    if _slow_query_log is None:
+        return
+
+    remove_query_observer(_slow_query_log.observe)
+    await _slow_query_log.close()
+    _slow_query_log = None
+    if _sink_id is not None:
+        logger.remove(_sink_id)
+        _sink_id = None
@@ -0,0 +1,575 @@
+"""
+Хранилище игры.
+
+Storage — набор операций, которые используют хендлеры и сервисы. Реализации:
+SQLiteStorage (функции bot.db поверх aiosqlite) и PostgresStorage
+(bot.postgres, asyncpg с пулом соединений). Бэкенд выбирается настройкой
+DB_BACKEND, хендлеры импортируют функции этого модуля и от бэкенда не зависят.
+
+Инструменты, которые работают именно с файлом SQLite (dbbench, loadtest,
+журнал медленных запросов), по-прежнему используют bot.db напрямую.
+
+Проверка бэкенда на общем наборе сценариев:
+    python -m bot.storage_conformance --backend postgres --dsn postgresql://...
+"""
+
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+from bot import db
+from bot.core.config import settings
+
+
+class Storage(ABC):
+    async def close(self) -> None:
+        """Release connections held by the backend"""
+
+    @abstractmethod
+    async def create_tables(self) -> None:
+        """Create all database tables if they don't exist and migrate older schemas"""
+
+    # ==============================
+    # РЕЕСТРЫ АДМИНИСТРАТОРОВ И БАНОВ
+    # ==============================
+
+    @abstractmethod
+    async def load_admin_levels(self) -> Dict[int, int]:
+        """Load admin levels of all admins into memory"""
+
+    @abstractmethod
+    async def get_admin_levels(self) -> Dict[int, int]:
+        """Admin levels from memory, loaded from the database on first use"""
+
+    @abstractmethod
+    async def load_bans(self) -> None:
+        """Load banned players and their ban expiry times into memory"""
+
+    @abstractmethod
+    async def is_banned(self, user_id: int) -> bool:
+        """Check the in-memory ban registry; expired bans are not counted"""
+
+    @abstractmethod
+    def pop_expired_bans(self, now: Optional[float] = None) -> List[int]:
+        """Remove bans that expired by now from memory and return their user ids"""
+
+    @abstractmethod
+    async def unban_expired_players(self, user_ids: List[int]) -> int:
+        """Lift expired bans in the database in one transaction"""
+
+    @abstractmethod
+    def forget_player_ids(self) -> None:
+        """Forget known player ids, they are checked in the database again on next use"""
+
+    # ==============================
+    # ИГРОКИ
+    # ==============================
+
+    @abstractmethod
+    async def player_exists(self, user_id: int) -> bool:
+        """Check whether a player is registered"""
+
+    @abstractmethod
+    async def get_player(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Get player data by user_id"""
+
+    @abstractmethod
+    async def create_player(self, user_id: int, username: str) -> Optional[Dict[str, Any]]:
+        """Create a new player"""
+
+    @abstractmethod
+    async def update_username(self, user_id: int, new_username: str) -> bool:
+        """Update player username"""
+
+    @abstractmethod
+    async def update_player_balance(
+        self,
+        user_id: int,
+        amount: int,
+        transaction_type: str,
+        description: str,
+        admin_id: Optional[int] = None,
+        target_user_id: Optional[int] = None,
+    ) -> bool:
+        """Update player balance and log transaction"""
+
+    @abstractmethod
+    async def add_power(self, user_id: int, amount: int) -> bool:
+        """Add power to player"""
+
+    @abstractmethod
+    async def add_magnesia(self, user_id: int, amount: int, admin_id: Optional[int] = None) -> bool:
+        """Add magnesia to player"""
+
+    @abstractmethod
+    async def update_dumbbell_level(self, user_id: int, new_level: int, dumbbell_name: str) -> bool:
+        """Update player dumbbell level"""
+
+    @abstractmethod
+    async def set_dumbbell_level(self, user_id: int, new_level: int, admin_id: int) -> bool:
+        """Set player dumbbell level to a specific value"""
+
+    @abstractmethod
+    async def update_dumbbell_use_time(self, user_id: int) -> bool:
+        """Update the last dumbbell use time"""
+
+    @abstractmethod
+    async def increment_total_lifts(self, user_id: int) -> bool:
+        """Increment total lifts counter"""
+
+    @abstractmethod
+    async def set_total_lifts(self, user_id: int, new_total: int, admin_id: int) -> bool:
+        """Set total lifts to a specific value"""
+
+    @abstractmethod
+    async def set_custom_income(self, user_id: int, custom_income: Optional[int], admin_id: int) -> bool:
+        """Set custom income for player"""
+
+    @abstractmethod
+    async def buy_business(self, user_id: int, business_id: int, business_info: Dict[str, Any]) -> bool:
+        """Buy a business for player"""
+
+    @abstractmethod
+    async def upgrade_business(self, user_id: int, business_id: int, upgrade_num: int, price: int) -> bool:
+        """Upgrade a business"""
+
+    @abstractmethod
+    async def log_dumbbell_use(self, user_id: int, dumbbell_level: int, income: int, power_gained: int) -> bool:
+        """Log dumbbell use"""
+
+    @abstractmethod
+    async def get_players_with_businesses(self) -> List[Tuple]:
+        """Get (user_id, b1_level, b2_level, b3_level, clan_id) of clan members owning businesses"""
+
+    @abstractmethod
+    async def get_recently_active_player_ids(self, limit: int = 1000) -> List[int]:
+        """Get ids of players who lifted most recently and remember them as known players"""
+
+    @abstractmethod
+    async def get_unnamed_player_ids(self, after_user_id: int = 0, limit: int = 1000) -> List[int]:
+        """Get ids of players whose username is still their id, in user_id order after after_user_id"""
+
+    @abstractmethod
+    async def set_usernames(self, names: List[Tuple[int, str]]) -> int:
+        """Rename players whose username is still their id, in one transaction; returns renamed count"""
+
+    @abstractmethod
+    async def get_recent_players(self, limit: int = 5) -> List[Tuple]:
+        """Get (username, created_at) of the newest players"""
+
+    # ==============================
+    # АДМИНИСТРИРОВАНИЕ
+    # ==============================
+
+    @abstractmethod
+    async def make_admin(self, user_id: int, admin_id: int, admin_level: int = 1) -> str:
+        """Make a player an admin"""
+
+    @abstractmethod
+    async def remove_admin(self, user_id: int, admin_id: int) -> bool:
+        """Remove admin status from player"""
+
+    @abstractmethod
+    async def set_admin_nickname(self, user_id: int, nickname: str) -> bool:
+        """Set admin nickname"""
+
+    @abstractmethod
+    async def increment_admin_stat(self, user_id: int, stat_name: str) -> bool:
+        """Increment admin statistic"""
+
+    @abstractmethod
+    async def ban_player(self, user_id: int, days: int, reason: str, admin_id: int) -> bool:
+        """Ban a player"""
+
+    @abstractmethod
+    async def unban_player(self, user_id: int, admin_id: int) -> bool:
+        """Unban a player"""
+
+    @abstractmethod
+    async def delete_player(self, user_id: int, admin_id: int) -> bool:
+        """Delete a player"""
+
+    @abstractmethod
+    async def reset_all(self, progress: Optional[db.ResetProgress] = None) -> Dict[str, int]:
+        """Delete regular players, clans and history in bounded chunks; returns deleted rows per table"""
+
+    # ==============================
+    # РЕЙТИНГИ И СТАТИСТИКА
+    # ==============================
+
+    @abstractmethod
+    async def get_top_balance(self, limit: int = 10) -> List[Tuple]:
+        """Get top players by balance"""
+
+    @abstractmethod
+    async def get_top_lifts(self, limit: int = 10) -> List[Tuple]:
+        """Get top players by total lifts"""
+
+    @abstractmethod
+    async def get_top_earners(self, limit: int = 10) -> List[Tuple]:
+        """Get top players by total earned"""
+
+    @abstractmethod
+    async def count_players(self, regular_only: bool = True, unbanned_only: bool = False) -> int:
+        """Count players, by default without admins"""
+
+    @abstractmethod
+    async def count_banned_players(self) -> int:
+        """Count banned players"""
+
+    @abstractmethod
+    async def count_admins(self) -> int:
+        """Count admins"""
+
+    @abstractmethod
+    async def count_clans(self) -> int:
+        """Count clans"""
+
+    @abstractmethod
+    async def count_total_balance(self) -> int:
+        """Sum balances of regular players"""
+
+    @abstractmethod
+    async def sum_column(self, table: str, column: str) -> int:
+        """Sum a column of a table"""
+
+    @abstractmethod
+    async def count_table_rows(self, table: str) -> int:
+        """Count rows of a table"""
+
+    # ==============================
+    # ПРОМОКОДЫ
+    # ==============================
+
+    @abstractmethod
+    async def create_promo_code(
+        self,
+        code: str,
+        uses_total: int,
+        reward_type: str,
+        reward_amount: int,
+        created_by: int,
+        expires_days: Optional[int] = None,
+    ) -> bool:
+        """Create a promo code"""
+
+    @abstractmethod
+    async def delete_promo_code(self, code: str, admin_id: int) -> bool:
+        """Delete a promo code"""
+
+    @abstractmethod
+    async def get_promo_info(self, code: str) -> Optional[Dict[str, Any]]:
+        """Get promo code information"""
+
+    @abstractmethod
+    async def use_promo_code(self, user_id: int, code: str) -> Dict[str, Any]:
+        """Use a promo code"""
+
+    @abstractmethod
+    async def get_all_promo_codes(self) -> List[Dict[str, Any]]:
+        """Get all promo codes"""
+
+    @abstractmethod
+    async def count_promo_uses(self, code: str, limit: int = 0):
+        """Count uses of a promo code"""
+
+    @abstractmethod
+    async def sum_promo_uses(self) -> int:
+        """Count uses of all promo codes"""
+
+    # ==============================
+    # КЛАНЫ
+    # ==============================
+
+    @abstractmethod
+    async def create_clan(self, tag: str, name: str, owner_id: int) -> Dict[str, Any]:
+        """Create a clan"""
+
+    @abstractmethod
+    async def get_clan_by_tag(self, tag: str) -> Optional[Dict[str, Any]]:
+        """Get clan by tag"""
+
+    @abstractmethod
+    async def get_clan_by_id(self, clan_id: int) -> Optional[Dict[str, Any]]:
+        """Get clan by ID"""
+
+    @abstractmethod
+    async def get_player_clan(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Get player's clan"""
+
+    @abstractmethod
+    async def get_clan_members(
+        self, clan_id: int, limit: int = 100, after: Optional[Tuple[str, int, int]] = None
+    ) -> List[Dict[str, Any]]:
+        """Get clan members ordered by role and contributions, after a clan_member_cursor()"""
+
+    @abstractmethod
+    async def get_clan_member_count(self, clan_id: int) -> int:
+        """Get clan member count from clans.member_count"""
+
+    @abstractmethod
+    async def join_clan(self, clan_id: int, user_id: int, role: str = "member") -> Dict[str, Any]:
+        """Add a player to a clan"""
+
+    @abstractmethod
+    async def leave_clan(self, user_id: int) -> Dict[str, Any]:
+        """Remove a player from their clan; the owner can't leave"""
+
+    @abstractmethod
+    async def get_clan_treasury_log(
+        self, clan_id: int, limit: int = 10, before: Optional[Tuple[int, int]] = None
+    ) -> List[Dict[str, Any]]:
+        """Get clan treasury log newest first, before a treasury_log_cursor()"""
+
+    @abstractmethod
+    async def get_top_clans(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Get top clans by income per hour, then treasury"""
+
+    @abstractmethod
+    async def delete_clan(self, tag: str, admin_id: int) -> Dict[str, Any]:
+        """Delete a clan"""
+
+    @abstractmethod
+    async def update_clan_name(self, tag: str, new_name: str, admin_id: int) -> Dict[str, Any]:
+        """Update clan name"""
+
+    @abstractmethod
+    async def add_treasury(self, clan_id: int, amount: int, add_total_lifts: bool = False) -> None:
+        """Add money (and optionally a lift) to clan treasury"""
+
+    @abstractmethod
+    async def log_collection(self, clan_id: int, action_type: str, amount: int, description: str) -> None:
+        """Add a clan treasury log entry"""
+
+    @abstractmethod
+    async def log_collection_with_user(
+        self, clan_id: int, user_id: int, action_type: str, amount: int, description: str
+    ) -> None:
+        """Add a clan treasury log entry made by a player"""
+
+
+class SQLiteStorage(Storage):
+    """Функции bot.db: по соединению aiosqlite на операцию, один писатель"""
+
+    create_tables = staticmethod(db.create_tables)
+
+    load_admin_levels = staticmethod(db.load_admin_levels)
+    get_admin_levels = staticmethod(db.get_admin_levels)
+    load_bans = staticmethod(db.load_bans)
+    is_banned = staticmethod(db.is_banned)
+    pop_expired_bans = staticmethod(db.pop_expired_bans)
+    unban_expired_players = staticmethod(db.unban_expired_players)
+    forget_player_ids = staticmethod(db.forget_player_ids)
+
+    player_exists = staticmethod(db.player_exists)
+    get_player = staticmethod(db.get_player)
+    create_player = staticmethod(db.create_player)
+    update_username = staticmethod(db.update_username)
+    update_player_balance = staticmethod(db.update_player_balance)
+    add_power = staticmethod(db.add_power)
+    add_magnesia = staticmethod(db.add_magnesia)
+    update_dumbbell_level = staticmethod(db.update_dumbbell_level)
+    set_dumbbell_level = staticmethod(db.set_dumbbell_level)
+    update_dumbbell_use_time = staticmethod(db.update_dumbbell_use_time)
+    increment_total_lifts = staticmethod(db.increment_total_lifts)
+    set_total_lifts = staticmethod(db.set_total_lifts)
+    set_custom_income = staticmethod(db.set_custom_income)
+    buy_business = staticmethod(db.buy_business)
+    upgrade_business = staticmethod(db.upgrade_business)
+    log_dumbbell_use = staticmethod(db.log_dumbbell_use)
+    get_players_with_businesses = staticmethod(db.get_players_with_businesses)
+    get_recently_active_player_ids = staticmethod(db.get_recently_active_player_ids)
+    get_unnamed_player_ids = staticmethod(db.get_unnamed_player_ids)
+    set_usernames = staticmethod(db.set_usernames)
+    get_recent_players = staticmethod(db.get_recent_players)
+
+    make_admin = staticmethod(db.make_admin)
+    remove_admin = staticmethod(db.remove_admin)
+    set_admin_nickname = staticmethod(db.set_admin_nickname)
+    increment_admin_stat = staticmethod(db.increment_admin_stat)
+    ban_player = staticmethod(db.ban_player)
+    unban_player = staticmethod(db.unban_player)
+    delete_player = staticmethod(db.delete_player)
+    reset_all = staticmethod(db.reset_all)
+
+    get_top_balance = staticmethod(db.get_top_balance)
+    get_top_lifts = staticmethod(db.get_top_lifts)
+    get_top_earners = staticmethod(db.get_top_earners)
+    count_players = staticmethod(db.count_players)
+    count_banned_players = staticmethod(db.count_banned_players)
+    count_admins = staticmethod(db.count_admins)
+    count_clans = staticmethod(db.count_clans)
+    count_total_balance = staticmethod(db.count_total_balance)
+    sum_column = staticmethod(db.sum_column)
+    count_table_rows = staticmethod(db.count_table_rows)
+
+    create_promo_code = staticmethod(db.create_promo_code)
+    delete_promo_code = staticmethod(db.delete_promo_code)
+    get_promo_info = staticmethod(db.get_promo_info)
+    use_promo_code = staticmethod(db.use_promo_code)
+    get_all_promo_codes = staticmethod(db.get_all_promo_codes)
+    count_promo_uses = staticmethod(db.count_promo_uses)
+    sum_promo_uses = staticmethod(db.sum_promo_uses)
+
+    create_clan = staticmethod(db.create_clan)
+    get_clan_by_tag = staticmethod(db.get_clan_by_tag)
+    get_clan_by_id = staticmethod(db.get_clan_by_id)
+    get_player_clan = staticmethod(db.get_player_clan)
+    get_clan_members = staticmethod(db.get_clan_members)
+    get_clan_member_count = staticmethod(db.get_clan_member_count)
+    join_clan = staticmethod(db.join_clan)
+    leave_clan = staticmethod(db.leave_clan)
+    get_clan_treasury_log = staticmethod(db.get_clan_treasury_log)
+    get_top_clans = staticmethod(db.get_top_clans)
+    delete_clan = staticmethod(db.delete_clan)
+    update_clan_name = staticmethod(db.update_clan_name)
+    add_treasury = staticmethod(db.add_treasury)
+    log_collection = staticmethod(db.log_collection)
+    log_collection_with_user = staticmethod(db.log_collection_with_user)
+
+
+# ==============================
+# АКТИВНЫЙ БЭКЕНД
+# ==============================
+
+_storage: Optional[Storage] = None
+
+
+def create_storage(backend: str) -> Storage:
+    if backend == "sqlite":
+        return SQLiteStorage()
+    if backend == "postgres":
+        from bot.postgres import PostgresStorage
+
+        return PostgresStorage(
+            settings.postgres_dsn,
+            min_size=settings.DB_POOL_MIN_SIZE,
+            max_size=settings.DB_POOL_MAX_SIZE,
+        )
+    raise ValueError(f"Unknown DB_BACKEND: {backend!r}")
+
+
+def get_storage() -> Storage:
+    """Бэкенд из настроек; создаётся при первом обращении"""
+    global _storage
+    if _storage is None:
+        _storage = create_storage(settings.DB_BACKEND)
+    return _storage
+
+
+def set_storage(storage: Optional[Storage]) -> None:
+    """Подменить активный бэкенд (conformance-набор, инструменты)"""
+    global _storage
+    _storage = storage
+
+
+async def close_storage() -> None:
+    global _storage
+    if _storage is not None:
+        await _storage.close()
+        _storage = None
+
+
+def _delegate(name: str):
+    async def call(*args, **kwargs):
+        return await getattr(get_storage(), name)(*args, **kwargs)
+
+    call.__name__ = call.__qualname__ = name
+    call.__doc__ = getattr(Storage, name).__doc__
+    return call
+
+
+def pop_expired_bans(now: Optional[float] = None) -> List[int]:
+    """Remove bans that expired by now from memory and return their user ids"""
+    return get_storage().pop_expired_bans(now)
+
+
+def forget_player_ids() -> None:
+    """Forget known player ids, they are checked in the database again on next use"""
+    get_storage().forget_player_ids()
+
+
+def clan_member_cursor(member: Dict[str, Any]) -> Tuple[str, int, int]:
+    """Cursor for get_clan_members: the page starts after this member"""
+    return (member["role"], member["contributions"], member["user_id"])
+
+
+def treasury_log_cursor(entry: Dict[str, Any]) -> Tuple[int, int]:
+    """Cursor for get_clan_treasury_log: the page starts after this entry"""
+    return (entry["created_at"], entry["id"])
+
+
+create_tables = _delegate("create_tables")
+
+load_admin_levels = _delegate("load_admin_levels")
+get_admin_levels = _delegate("get_admin_levels")
+load_bans = _delegate("load_bans")
+is_banned = _delegate("is_banned")
+unban_expired_players = _delegate("unban_expired_players")
+
+player_exists = _delegate("player_exists")
+get_player = _delegate("get_player")
+create_player = _delegate("create_player")
+update_username = _delegate("update_username")
+update_player_balance = _delegate("update_player_balance")
+add_power = _delegate("add_power")
+add_magnesia = _delegate("add_magnesia")
+update_dumbbell_level = _delegate("update_dumbbell_level")
+set_dumbbell_level = _delegate("set_dumbbell_level")
+update_dumbbell_use_time = _delegate("update_dumbbell_use_time")
+increment_total_lifts = _delegate("increment_total_lifts")
+set_total_lifts = _delegate("set_total_lifts")
+set_custom_income = _delegate("set_custom_income")
+buy_business = _delegate("buy_business")
+upgrade_business = _delegate("upgrade_business")
+log_dumbbell_use = _delegate("log_dumbbell_use")
+get_players_with_businesses = _delegate("get_players_with_businesses")
+get_recently_active_player_ids = _delegate("get_recently_active_player_ids")
+get_unnamed_player_ids = _delegate("get_unnamed_player_ids")
+set_usernames = _delegate("set_usernames")
+get_recent_players = _delegate("get_recent_players")
+
+make_admin = _delegate("make_admin")
+remove_admin = _delegate("remove_admin")
+set_admin_nickname = _delegate("set_admin_nickname")
+increment_admin_stat = _delegate("increment_admin_stat")
+ban_player = _delegate("ban_player")
+unban_player = _delegate("unban_player")
+delete_player = _delegate("delete_player")
+reset_all = _delegate("reset_all")
+
+get_top_balance = _delegate("get_top_balance")
+get_top_lifts = _delegate("get_top_lifts")
+get_top_earners = _delegate("get_top_earners")
+count_players = _delegate("count_players")
+count_banned_players = _delegate("count_banned_players")
+count_admins = _delegate("count_admins")
+count_clans = _delegate("count_clans")
+count_total_balance = _delegate("count_total_balance")
+sum_column = _delegate("sum_column")
+count_table_rows = _delegate("count_table_rows")
+
+create_promo_code = _delegate("create_promo_code")
+delete_promo_code = _delegate("delete_promo_code")
+get_promo_info = _delegate("get_promo_info")
+use_promo_code = _delegate("use_promo_code")
+get_all_promo_codes = _delegate("get_all_promo_codes")
+count_promo_uses = _delegate("count_promo_uses")
+sum_promo_uses = _delegate("sum_promo_uses")
+
+create_clan = _delegate("create_clan")
+get_clan_by_tag = _delegate("get_clan_by_tag")
+get_clan_by_id = _delegate("get_clan_by_id")
+get_player_clan = _delegate("get_player_clan")
+get_clan_members = _delegate("get_clan_members")
+get_clan_member_count = _delegate("get_clan_member_count")
+join_clan = _delegate("join_clan")
+leave_clan = _delegate("leave_clan")
+get_clan_treasury_log = _delegate("get_clan_treasury_log")
+get_top_clans = _delegate("get_top_clans")
+delete_clan = _delegate("delete_clan")
+update_clan_name = _delegate("update_clan_name")
+add_treasury = _delegate("add_treasury")
+log_collection = _delegate("log_collection")
+log_collection_with_user = _delegate("log_collection_with_user")
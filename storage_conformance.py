@@ -0,0 +1,647 @@
+"""
+Общий набор сценариев для бэкендов хранилища.
+
+Каждый сценарий получает чистую базу (для SQLite — новый файл, для PostgreSQL —
+новая схема, которая удаляется после прогона) и проверяет поведение операций
+Storage так, как на него рассчитывают хендлеры: значения по умолчанию, формат
+строк и словарей, учёт в реестрах, сообщения об ошибках.
+
+    python -m bot.storage_conformance --backend sqlite
+    python -m bot.storage_conformance --backend postgres --dsn postgresql://postgres@127.0.0.1:5432/postgres
+    python -m bot.storage_conformance --backend postgres --only promo,clans
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import traceback
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Awaitable, Callable, Iterator, Optional
+from unittest import mock
+
+ADMIN = 1
+PLAYER = 100
+OTHER = 200
+
+
+def expect(actual, expected, what: str) -> None:
+    if actual != expected:
+        raise AssertionError(f"{what}: expected {expected!r}, got {actual!r}")
+
+
+@contextmanager
+def clock_ahead(seconds: int) -> Iterator[None]:
+    """now_ts() спешит на seconds: доход бизнесов без ожидания"""
+    real_time = time.time
+    with mock.patch("time.time", lambda: real_time() + seconds):
+        yield
+
+
+# ==============================
+# СЦЕНАРИИ
+# ==============================
+
+
+async def check_players(storage) -> None:
+    from bot.utils import now_ts
+
+    expect(await storage.get_player(PLAYER), None, "missing player")
+    expect(await storage.player_exists(PLAYER), False, "player_exists before registration")
+
+    player = await storage.create_player(PLAYER, "Иван")
+    expect(player["user_id"], PLAYER, "user_id")
+    expect(player["username"], "Иван", "username")
+    expect(player["balance"], 1, "default balance")
+    expect(player["dumbbell_level"], 1, "default dumbbell level")
+    expect(player["dumbbell_name"], "Гантеля 1кг", "default dumbbell name")
+    expect(player["business_1_level"], 0, "default business level")
+    expect(player["business_1_upgrades"], {}, "default business upgrades")
+    expect(player["used_promo_codes"], [], "default used promo codes")
+    expect(player["is_banned"], 0, "default is_banned")
+    expect(player["clan_id"], None, "default clan")
+    expect(abs(player["created_at"] - now_ts()) <= 5, True, "created_at is epoch seconds")
+    expect(player["last_dumbbell_use"], 0, "new player has not lifted")
+
+    again = await storage.create_player(PLAYER, "Другой")
+    expect(again["username"], "Иван", "second create_player keeps the player")
+    expect(await storage.player_exists(PLAYER), True, "player_exists after registration")
+
+    await storage.update_username(PLAYER, "Пётр")
+    expect((await storage.get_player(PLAYER))["username"], "Пётр", "updated username")
+
+    for user_id in (OTHER, ADMIN, 9_000_003):
+        await storage.create_player(user_id, str(user_id))
+    unnamed = sorted((OTHER, ADMIN, 9_000_003))
+    expect(await storage.get_unnamed_player_ids(0, 2), unnamed[:2], "first page of unnamed players")
+    expect(await storage.get_unnamed_player_ids(unnamed[1], 2), unnamed[2:], "next page of unnamed players")
+    renamed = await storage.set_usernames([(OTHER, "Олег"), (PLAYER, "Не трогать"), (ADMIN, "Админ")])
+    expect(renamed, 2, "set_usernames renames only players named by id")
+    expect((await storage.get_player(PLAYER))["username"], "Пётр", "set_usernames keeps a chosen name")
+    expect(await storage.get_unnamed_player_ids(0, 10), [9_000_003], "unnamed players after set_usernames")
+
+
+async def check_balance(storage) -> None:
+    await storage.create_player(PLAYER, "Иван")
+    await storage.update_player_balance(PLAYER, 100, "bonus", "Бонус")
+    await storage.update_player_balance(PLAYER, -40, "transfer", "Перевод", target_user_id=OTHER)
+    player = await storage.get_player(PLAYER)
+    expect(player["balance"], 61, "balance")
+    expect(player["total_earned"], 100, "total_earned counts only income")
+    expect(await storage.count_table_rows("transactions"), 2, "transactions logged")
+
+    await storage.add_power(PLAYER, 5)
+    await storage.add_magnesia(PLAYER, 3)
+    await storage.add_magnesia(PLAYER, 2, admin_id=ADMIN)
+    player = await storage.get_player(PLAYER)
+    expect(player["power"], 5, "power")
+    expect(player["magnesia"], 5, "magnesia")
+    expect(await storage.count_table_rows("admin_actions"), 1, "admin magnesia logged")
+
+    # Начисления от одновременных сообщений не должны теряться
+    await asyncio.gather(*(storage.update_player_balance(PLAYER, 1, "lift", "Подъём") for _ in range(50)))
+    expect((await storage.get_player(PLAYER))["balance"], 111, "balance after concurrent updates")
+
+
+async def check_dumbbells(storage) -> None:
+    from bot.core.config import settings
+    from bot.utils import now_ts
+
+    await storage.create_player(ADMIN, "Админ")
+    await storage.create_player(PLAYER, "Иван")
+
+    await storage.update_dumbbell_level(PLAYER, 2, "Гантеля 2кг")
+    player = await storage.get_player(PLAYER)
+    expect((player["dumbbell_level"], player["dumbbell_name"]), (2, "Гантеля 2кг"), "updated dumbbell")
+
+    expect(await storage.set_dumbbell_level(PLAYER, 10_000, ADMIN), False, "unknown dumbbell level")
+    level = max(settings.DUMBBELL_LEVELS)
+    expect(await storage.set_dumbbell_level(PLAYER, level, ADMIN), True, "set_dumbbell_level")
+    expect(
+        (await storage.get_player(PLAYER))["dumbbell_name"],
+        settings.DUMBBELL_LEVELS[level]["name"],
+        "dumbbell name from settings",
+    )
+    expect((await storage.get_player(ADMIN))["dumbbell_sets_given"], 1, "admin dumbbell_sets_given")
+
+    before = (await storage.get_player(PLAYER))["last_dumbbell_use"]
+    await storage.update_dumbbell_use_time(PLAYER)
+    after = (await storage.get_player(PLAYER))["last_dumbbell_use"]
+    expect(after != before and abs(after - now_ts()) <= 5, True, "last_dumbbell_use is epoch seconds")
+
+    await storage.increment_total_lifts(PLAYER)
+    await storage.increment_total_lifts(PLAYER)
+    expect((await storage.get_player(PLAYER))["total_lifts"], 2, "total_lifts")
+    await storage.set_total_lifts(PLAYER, 50, ADMIN)
+    expect((await storage.get_player(PLAYER))["total_lifts"], 50, "set_total_lifts")
+
+    await storage.set_custom_income(PLAYER, 77, ADMIN)
+    expect((await storage.get_player(PLAYER))["custom_income"], 77, "custom_income")
+    await storage.set_custom_income(PLAYER, None, ADMIN)
+    expect((await storage.get_player(PLAYER))["custom_income"], None, "custom_income reset")
+
+    await storage.log_dumbbell_use(PLAYER, 2, 10, 1)
+    expect(await storage.count_table_rows("dumbbell_uses"), 1, "dumbbell use logged")
+    expect(await storage.get_recently_active_player_ids(1), [PLAYER], "recently active player")
+
+
+async def check_businesses(storage) -> None:
+    from bot.core.config import settings
+
+    business = settings.BUSINESSES[1]
+    await storage.create_player(PLAYER, "Иван")
+    await storage.update_player_balance(PLAYER, 10_000, "bonus", "Бонус")
+
+    await storage.buy_business(PLAYER, 1, business)
+    player = await storage.get_player(PLAYER)
+    expect(player["business_1_level"], 1, "business bought")
+    expect(player["balance"], 10_001 - business["base_price"], "business price paid")
+
+    for upgrade in (1, 2, 3, 4):
+        await storage.upgrade_business(PLAYER, 1, upgrade, 10)
+    player = await storage.get_player(PLAYER)
+    expect(player["business_1_upgrades"], {"1": 1, "2": 1, "3": 1, "4": 1}, "business upgrades")
+    expect(player["business_1_level"], 1, "level before the fifth upgrade")
+
+    await storage.upgrade_business(PLAYER, 1, 5, 10)
+    player = await storage.get_player(PLAYER)
+    expect(player["business_1_level"], 2, "level after five upgrades")
+    expect(player["business_1_upgrades"], {str(i): 0 for i in range(1, 6)}, "upgrades reset")
+    expect(player["balance"], 10_001 - business["base_price"] - 50, "upgrade prices paid")
+
+    expect(await storage.upgrade_business(OTHER, 1, 1, 10), False, "upgrade for missing player")
+
+
+async def check_income(storage) -> None:
+    from bot.core.config import settings
+    from bot.income import business_income
+
+    await storage.create_player(PLAYER, "Иван")
+    await storage.update_player_balance(PLAYER, 100_000, "bonus", "Бонус")
+    expect((await storage.get_player(PLAYER))["magnesia_per_hour"], 0, "no income without businesses")
+
+    await storage.buy_business(PLAYER, 1, settings.BUSINESSES[1])
+    for upgrade in range(1, 6):
+        await storage.upgrade_business(PLAYER, 1, upgrade, 10)
+    await storage.buy_business(PLAYER, 2, settings.BUSINESSES[2])
+    per_hour = business_income(1, 2) + business_income(2, 1)
+    player = await storage.get_player(PLAYER)
+    expect(player["magnesia_per_hour"], per_hour, "income of all businesses")
+    expect(player["magnesia"], 0, "nothing accrued yet")
+
+    with clock_ahead(3 * 3600):
+        expect((await storage.get_player(PLAYER))["magnesia"], 3 * per_hour, "income accrued on read")
+        # Трата зачисляет накопленное, и оно не начисляется второй раз
+        await storage.upgrade_business(PLAYER, 1, 1, 10)
+        expect((await storage.get_player(PLAYER))["magnesia"], 3 * per_hour, "income settled on spend")
+        await storage.add_magnesia(PLAYER, 7)
+        expect((await storage.get_player(PLAYER))["magnesia"], 3 * per_hour + 7, "magnesia added on top")
+
+    previous_max_hours = settings.MAGNESIA_MAX_OFFLINE_HOURS
+    settings.MAGNESIA_MAX_OFFLINE_HOURS = 2
+    try:
+        with clock_ahead(13 * 3600):
+            expect((await storage.get_player(PLAYER))["magnesia"], 5 * per_hour + 7, "offline hours clamped")
+            await storage.upgrade_business(PLAYER, 1, 2, 10)
+            expect((await storage.get_player(PLAYER))["magnesia"], 5 * per_hour + 7, "clamped income settled")
+    finally:
+        settings.MAGNESIA_MAX_OFFLINE_HOURS = previous_max_hours
+
+
+async def check_admins(storage) -> None:
+    await storage.create_player(ADMIN, "Админ")
+    await storage.create_player(PLAYER, "Иван")
+    await storage.create_player(OTHER, "Олег")
+    expect(await storage.get_admin_levels(), {}, "no admins")
+
+    expect(await storage.make_admin(PLAYER, ADMIN, 2), "1000", "first admin id")
+    expect(await storage.make_admin(OTHER, ADMIN), "1001", "second admin id")
+    expect(await storage.get_admin_levels(), {PLAYER: 2, OTHER: 1}, "admin registry")
+    expect(await storage.load_admin_levels(), {PLAYER: 2, OTHER: 1}, "admin levels in database")
+    expect(await storage.count_admins(), 2, "count_admins")
+
+    await storage.set_admin_nickname(PLAYER, "Босс")
+    await storage.increment_admin_stat(PLAYER, "bans")
+    await storage.increment_admin_stat(PLAYER, "unknown")
+    player = await storage.get_player(PLAYER)
+    expect((player["admin_nickname"], player["bans_given"]), ("Босс", 1), "admin nickname and stats")
+
+    expect(await storage.remove_admin(OTHER, ADMIN), True, "remove_admin")
+    expect(await storage.remove_admin(999, ADMIN), False, "remove_admin for missing player")
+    expect(await storage.get_admin_levels(), {PLAYER: 2}, "admin registry after removal")
+    other = await storage.get_player(OTHER)
+    expect((other["admin_level"], other["admin_id"]), (0, None), "removed admin fields")
+
+
+async def check_bans(storage) -> None:
+    from bot.utils import DAY_SECONDS, now_ts
+
+    await storage.create_player(ADMIN, "Админ")
+    await storage.create_player(PLAYER, "Иван")
+    await storage.create_player(OTHER, "Олег")
+    expect(await storage.is_banned(PLAYER), False, "not banned")
+
+    await storage.ban_player(PLAYER, 0, "спам", ADMIN)
+    expect(await storage.is_banned(PLAYER), True, "permanent ban")
+    player = await storage.get_player(PLAYER)
+    expect((player["is_banned"], player["ban_reason"], player["ban_until"]), (1, "спам", None), "ban fields")
+    expect(await storage.count_banned_players(), 1, "count_banned_players")
+
+    await storage.unban_player(PLAYER, ADMIN)
+    expect(await storage.is_banned(PLAYER), False, "unbanned")
+
+    # Бан со сроком в прошлом уже истёк: не считается и снимается фоновой задачей
+    await storage.ban_player(OTHER, -1, "тест", ADMIN)
+    expect(await storage.is_banned(OTHER), False, "expired ban")
+    expired = storage.pop_expired_bans()
+    expect(expired, [OTHER], "pop_expired_bans")
+    expect(await storage.unban_expired_players(expired), 1, "unban_expired_players")
+    expect((await storage.get_player(OTHER))["is_banned"], 0, "expired ban lifted in database")
+
+    await storage.ban_player(PLAYER, 7, "тест", ADMIN)
+    await storage.load_bans()
+    expect(await storage.is_banned(PLAYER), True, "temporary ban after reload")
+    ban_until = (await storage.get_player(PLAYER))["ban_until"]
+    expect(round((ban_until - now_ts()) / DAY_SECONDS), 7, "ban_until is epoch seconds")
+
+    expect(await storage.delete_player(PLAYER, ADMIN), True, "delete_player")
+    expect(await storage.delete_player(PLAYER, ADMIN), False, "delete missing player")
+    expect(await storage.is_banned(PLAYER), False, "deleted player is not banned")
+    expect(await storage.player_exists(PLAYER), False, "deleted player")
+
+
+async def check_tops(storage) -> None:
+    for user_id, amount in ((1, 500), (2, 900), (3, 100), (4, 1000)):
+        await storage.create_player(user_id, f"p{user_id}")
+        await storage.update_player_balance(user_id, amount, "bonus", "Бонус")
+    await storage.ban_player(4, 0, "чит", 1)
+
+    expect(
+        await storage.get_top_balance(2),
+        [(2, "p2", 901, "Гантеля 1кг"), (1, "p1", 501, "Гантеля 1кг")],
+        "get_top_balance skips banned",
+    )
+    expect([row[4] for row in await storage.get_top_earners(3)], [900, 500, 100], "get_top_earners")
+    await storage.set_total_lifts(3, 9, 1)
+    expect((await storage.get_top_lifts(1))[0][:3], (3, "p3", 9), "get_top_lifts")
+
+
+async def check_promo(storage) -> None:
+    from bot.utils import DAY_SECONDS, now_ts
+
+    await storage.create_player(ADMIN, "Админ")
+    await storage.create_player(PLAYER, "Иван")
+    await storage.create_player(OTHER, "Олег")
+
+    expect(await storage.create_promo_code("GYM", 1, "монеты", 50, ADMIN), True, "create_promo_code")
+    expect(await storage.create_promo_code("GYM", 5, "монеты", 50, ADMIN), False, "duplicate promo code")
+    expect(await storage.create_promo_code("MAG", 5, "магнезия", 3, ADMIN, expires_days=3), True, "expiring promo")
+
+    info = await storage.get_promo_info("GYM")
+    expect(
+        {key: info[key] for key in ("code", "uses_total", "uses_left", "reward_type", "reward_amount", "is_active")},
+        {"code": "GYM", "uses_total": 1, "uses_left": 1, "reward_type": "монеты", "reward_amount": 50, "is_active": 1},
+        "get_promo_info",
+    )
+    expires_at = (await storage.get_promo_info("MAG"))["expires_at"]
+    expect(round((expires_at - now_ts()) / DAY_SECONDS), 3, "expires_at is epoch seconds")
+    expect(await storage.get_promo_info("NOPE"), None, "missing promo")
+
+    expect(
+        await storage.use_promo_code(PLAYER, "GYM"),
+        {"success": True, "reward_type": "монеты", "reward_amount": 50},
+        "use_promo_code",
+    )
+    expect((await storage.use_promo_code(PLAYER, "MAG"))["success"], True, "magnesia promo")
+    player = await storage.get_player(PLAYER)
+    expect((player["balance"], player["magnesia"]), (51, 3), "promo rewards")
+    expect(player["used_promo_codes"], ["GYM", "MAG"], "used_promo_codes")
+
+    expect(
+        await storage.use_promo_code(PLAYER, "MAG"),
+        {"success": False, "error": "Вы уже использовали этот промокод"},
+        "promo used twice",
+    )
+    expect(
+        await storage.use_promo_code(OTHER, "GYM"),
+        {"success": False, "error": "Лимит использований исчерпан"},
+        "promo without uses left",
+    )
+    expect(
+        await storage.use_promo_code(OTHER, "NOPE"),
+        {"success": False, "error": "Промокод не найден"},
+        "unknown promo",
+    )
+
+    expect(await storage.count_promo_uses("MAG"), 1, "count_promo_uses")
+    expect(await storage.count_promo_uses("MAG", limit=5), [(1,)], "count_promo_uses with limit")
+    expect(await storage.sum_promo_uses(), 2, "sum_promo_uses")
+    expect(sorted(promo["code"] for promo in await storage.get_all_promo_codes()), ["GYM", "MAG"], "all promo codes")
+
+    expect(await storage.delete_promo_code("GYM", ADMIN), True, "delete_promo_code")
+    expect(await storage.delete_promo_code("GYM", ADMIN), False, "delete missing promo code")
+
+
+async def check_clans(storage) -> None:
+    from bot.core.config import settings
+    from bot.storage import clan_member_cursor, treasury_log_cursor
+
+    await storage.create_player(ADMIN, "Админ")
+    await storage.create_player(PLAYER, "Иван")
+    await storage.create_player(OTHER, "Олег")
+
+    created = await storage.create_clan("gym", "Качалка", PLAYER)
+    expect((created["success"], created["tag"], created["name"]), (True, "GYM", "Качалка"), "create_clan")
+    clan_id = created["clan_id"]
+    expect(
+        await storage.create_clan("GYM", "Другой", OTHER),
+        {"success": False, "error": "Клан с таким тегом уже существует"},
+        "duplicate clan tag",
+    )
+    expect(
+        await storage.create_clan("NEW", "Качалка", OTHER),
+        {"success": False, "error": "Клан с таким названием уже существует"},
+        "duplicate clan name",
+    )
+    expect(
+        await storage.create_clan("TWO", "Второй", PLAYER),
+        {"success": False, "error": "Вы уже состоите в клане"},
+        "owner already in a clan",
+    )
+
+    clan = await storage.get_clan_by_tag("gym")
+    expect(
+        {key: clan[key] for key in ("id", "tag", "name", "owner_id", "level", "treasury", "total_lifts")},
+        {"id": clan_id, "tag": "GYM", "name": "Качалка", "owner_id": PLAYER, "level": 1, "treasury": 0, "total_lifts": 0},
+        "get_clan_by_tag",
+    )
+    expect(await storage.get_clan_by_id(clan_id), clan, "get_clan_by_id")
+    expect(await storage.get_player_clan(PLAYER), clan, "get_player_clan")
+    expect(await storage.get_player_clan(OTHER), None, "player without clan")
+    expect(await storage.get_clan_by_tag("NONE"), None, "missing clan")
+
+    members = await storage.get_clan_members(clan_id)
+    expect(
+        [(member["user_id"], member["username"], member["role"], member["contributions"]) for member in members],
+        [(PLAYER, "Иван", "owner", 0)],
+        "get_clan_members",
+    )
+    expect(
+        await storage.get_clan_members(clan_id, after=clan_member_cursor(members[0])),
+        [],
+        "get_clan_members after the last member",
+    )
+    expect(await storage.get_clan_member_count(clan_id), 1, "get_clan_member_count")
+    expect(await storage.count_clans(), 1, "count_clans")
+
+    await storage.add_treasury(clan_id, 10, True)
+    await storage.add_treasury(clan_id, 5)
+    clan = await storage.get_clan_by_id(clan_id)
+    expect((clan["treasury"], clan["total_lifts"]), (15, 1), "add_treasury")
+
+    await storage.log_collection(clan_id, "business_income", 10, "Доход бизнесов")
+    await storage.log_collection_with_user(clan_id, PLAYER, "lift_bonus", 5, "Бонус за подъём")
+    log = await storage.get_clan_treasury_log(clan_id)
+    expect(
+        sorted((entry["action_type"], entry["amount"], entry["username"]) for entry in log),
+        [("business_income", 10, None), ("lift_bonus", 5, "Иван")],
+        "get_clan_treasury_log",
+    )
+
+    # Записи одной секунды различаются только id — страницы не должны терять и повторять их
+    for amount in range(1, 6):
+        await storage.log_collection(clan_id, "deposit", amount, "Пополнение")
+    full = await storage.get_clan_treasury_log(clan_id, 100)
+    pages, before = [], None
+    while True:
+        page = await storage.get_clan_treasury_log(clan_id, 2, before)
+        if not page:
+            break
+        pages.extend(page)
+        before = treasury_log_cursor(page[-1])
+    expect([entry["id"] for entry in pages], [entry["id"] for entry in full], "get_clan_treasury_log pages")
+    expect(len(full), 7, "treasury log size")
+
+    await storage.update_player_balance(PLAYER, 1000, "bonus", "Бонус")
+    await storage.buy_business(PLAYER, 1, settings.BUSINESSES[1])
+    expect(await storage.get_players_with_businesses(), [(PLAYER, 1, 0, 0, clan_id)], "get_players_with_businesses")
+
+    expect(
+        await storage.update_clan_name("GYM", "Железо", ADMIN),
+        {"success": True, "old_name": "Качалка", "new_name": "Железо"},
+        "update_clan_name",
+    )
+    expect(
+        await storage.delete_clan("GYM", ADMIN),
+        {"success": True, "clan_name": "Железо", "member_count": 1},
+        "delete_clan",
+    )
+    expect((await storage.get_player(PLAYER))["clan_id"], None, "member released")
+    expect(await storage.count_clans(), 0, "clan deleted")
+    expect(await storage.delete_clan("GYM", ADMIN), {"success": False, "error": "Клан не найден"}, "delete missing clan")
+
+
+async def check_clan_members(storage) -> None:
+    from bot.storage import clan_member_cursor
+
+    for user_id in range(PLAYER, PLAYER + 8):
+        await storage.create_player(user_id, f"p{user_id}")
+    await storage.create_player(ADMIN, "Админ")
+    await storage.create_player(OTHER, "Олег")
+
+    clan_id = (await storage.create_clan("GYM", "Качалка", PLAYER))["clan_id"]
+    other_id = (await storage.create_clan("TWO", "Второй", OTHER))["clan_id"]
+    expect((await storage.get_clan_by_id(clan_id))["member_count"], 1, "member_count of a new clan")
+
+    for user_id in range(PLAYER + 1, PLAYER + 8):
+        role = "officer" if user_id == PLAYER + 1 else "member"
+        expect(await storage.join_clan(clan_id, user_id, role), {"success": True, "clan_id": clan_id}, "join_clan")
+    expect(
+        await storage.join_clan(other_id, PLAYER + 2),
+        {"success": False, "error": "Вы уже состоите в клане"},
+        "join_clan twice",
+    )
+    expect(await storage.join_clan(10**6, ADMIN), {"success": False, "error": "Клан не найден"}, "join missing clan")
+    expect((await storage.get_player(ADMIN))["clan_id"], None, "failed join leaves no trace")
+    expect(await storage.get_clan_member_count(clan_id), 8, "member_count after joins")
+
+    # Страницы по 3: владелец, офицер, затем участники по user_id (вклады равны)
+    pages, after = [], None
+    while True:
+        page = await storage.get_clan_members(clan_id, 3, after)
+        if not page:
+            break
+        pages.append([member["user_id"] for member in page])
+        after = clan_member_cursor(page[-1])
+    expect(
+        pages,
+        [[PLAYER, PLAYER + 1, PLAYER + 7], [PLAYER + 6, PLAYER + 5, PLAYER + 4], [PLAYER + 3, PLAYER + 2]],
+        "get_clan_members pages",
+    )
+
+    expect(await storage.leave_clan(PLAYER), {"success": False, "error": "Владелец не может покинуть клан"}, "owner leaves")
+    expect(await storage.leave_clan(ADMIN), {"success": False, "error": "Вы не состоите в клане"}, "leave without clan")
+    expect(await storage.leave_clan(PLAYER + 7), {"success": True, "clan_id": clan_id}, "leave_clan")
+    expect((await storage.get_player(PLAYER + 7))["clan_id"], None, "left member released")
+    await storage.delete_player(PLAYER + 6, ADMIN)
+    expect(await storage.get_clan_member_count(clan_id), 6, "member_count after leave and delete_player")
+    expect(len(await storage.get_clan_members(clan_id)), 6, "member rows match member_count")
+
+    await storage.add_treasury(other_id, 50)
+    expect(
+        [(clan["id"], clan["tag"], clan["treasury"], clan["member_count"]) for clan in await storage.get_top_clans()],
+        [(other_id, "TWO", 50, 1), (clan_id, "GYM", 0, 6)],
+        "get_top_clans",
+    )
+    expect(
+        await storage.delete_clan("GYM", ADMIN),
+        {"success": True, "clan_name": "Качалка", "member_count": 6},
+        "delete_clan member_count",
+    )
+
+
+async def check_stats(storage) -> None:
+    from bot.core.config import settings
+
+    for user_id in (1, 2, 3, 4):
+        await storage.create_player(user_id, f"p{user_id}")
+        await storage.update_player_balance(user_id, 10 * user_id, "bonus", "Бонус")
+    await storage.make_admin(1, 1)
+    await storage.ban_player(2, 0, "чит", 1)
+
+    expect(await storage.count_players(), 3, "count_players")
+    expect(await storage.count_players(regular_only=False), 4, "count_players with admins")
+    expect(await storage.count_players(unbanned_only=True), 2, "count_players without banned")
+    expect(await storage.count_players(False, False), 4, "count_players without filters")
+    expect(await storage.count_total_balance(), 21 + 31 + 41, "count_total_balance")
+    expect(await storage.sum_column("players", "total_earned"), 100, "sum_column")
+    expect(await storage.sum_column("clans", "treasury"), 0, "sum_column of an empty table")
+    expect(await storage.count_table_rows("players"), 4, "count_table_rows")
+    recent = await storage.get_recent_players(2)
+    expect((len(recent), len(recent[0])), (2, 2), "get_recent_players")
+
+    # Порции по две строки: игроков три, сброс должен пройти их в несколько транзакций
+    reports = []
+
+    async def progress(table: str, deleted: int) -> None:
+        reports.append((table, deleted))
+
+    chunk_rows = settings.RESET_CHUNK_ROWS
+    settings.RESET_CHUNK_ROWS = 2
+    try:
+        deleted = await storage.reset_all(progress)
+    finally:
+        settings.RESET_CHUNK_ROWS = chunk_rows
+    expect((deleted["players"], deleted["transactions"]), (3, 4), "reset_all deleted rows")
+    expect([deleted for table, deleted in reports if table == "players"], [2, 3], "reset_all progress")
+    expect(await storage.count_players(regular_only=False), 1, "reset_all keeps admins")
+    expect(await storage.count_table_rows("transactions"), 0, "reset_all clears history")
+    expect(await storage.is_banned(2), False, "ban registry after reset_all")
+    expect((await storage.player_exists(1), await storage.player_exists(2)), (True, False), "players after reset_all")
+
+
+CHECKS: dict[str, Callable[..., Awaitable[None]]] = {
+    "players": check_players,
+    "balance": check_balance,
+    "dumbbells": check_dumbbells,
+    "businesses": check_businesses,
+    "income": check_income,
+    "admins": check_admins,
+    "bans": check_bans,
+    "tops": check_tops,
+    "promo": check_promo,
+    "clans": check_clans,
+    "clan_members": check_clan_members,
+    "stats": check_stats,
+}
+
+
+# ==============================
+# БЭКЕНДЫ
+# ==============================
+
+
+@asynccontextmanager
+async def sqlite_storage() -> AsyncIterator:
+    from bot.core.config import settings
+    from bot.storage import SQLiteStorage
+
+    previous_path = settings.DB_PATH
+    with tempfile.TemporaryDirectory() as directory:
+        settings.DB_PATH = os.path.join(directory, "conformance.db")
+        storage = SQLiteStorage()
+        try:
+            await storage.create_tables()
+            # Реестры SQLite-бэкенда общие для процесса, перечитываем их из пустой базы
+            await storage.load_admin_levels()
+            await storage.load_bans()
+            yield storage
+        finally:
+            settings.DB_PATH = previous_path
+
+
+@asynccontextmanager
+async def postgres_storage(dsn: str) -> AsyncIterator:
+    import asyncpg
+
+    from bot.postgres import PostgresStorage
+
+    schema = f"conformance_{uuid.uuid4().hex[:12]}"
+    admin = await asyncpg.connect(dsn)
+    await admin.execute(f"CREATE SCHEMA {schema}")
+    storage = PostgresStorage(dsn, min_size=1, max_size=10, server_settings={"search_path": schema})
+    try:
+        await storage.create_tables()
+        yield storage
+    finally:
+        await storage.close()
+        await admin.execute(f"DROP SCHEMA {schema} CASCADE")
+        await admin.close()
+
+
+async def run(backend: str, dsn: Optional[str], only: Optional[list[str]]) -> int:
+    failed = 0
+    for name, check in CHECKS.items():
+        if only and name not in only:
+            continue
+        factory = sqlite_storage() if backend == "sqlite" else postgres_storage(dsn)
+        started = time.perf_counter()
+        try:
+            async with factory as storage:
+                await check(storage)
+        except Exception:
+            failed += 1
+            print(f"FAIL {name}")
+            traceback.print_exc()
+        else:
+            print(f"ok   {name} ({(time.perf_counter() - started) * 1000:.0f} ms)")
+    return failed
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Общие сценарии для бэкендов хранилища")
+    parser.add_argument("--backend", choices=("sqlite", "postgres"), default="sqlite")
+    parser.add_argument("--dsn", help="PostgreSQL, по умолчанию из настроек DB_*")
+    parser.add_argument("--only", help="сценарии через запятую: " + ",".join(CHECKS))
+    args = parser.parse_args(argv)
+
+    # Настройки импортируются сценариями, токен бота для прогона не нужен
+    os.environ.setdefault("BOT_TOKEN", "conformance")
+    dsn = args.dsn
+    if args.backend == "postgres" and not dsn:
+        from bot.core.config import settings
+
+        dsn = settings.postgres_dsn
+    only = args.only.split(",") if args.only else None
+
+    failed = asyncio.run(run(args.backend, dsn, only))
+    if failed:
+        raise SystemExit(f"{failed} scenario(s) failed")
+
+
+if __name__ == "__main__":
+    main()
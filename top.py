@@ -2,13 +2,10 @@ from bot.utils import format_number
 from vkbottle.bot import BotLabeler, Message
 
 from bot.core.config import settings
-from bot.db import (
-    create_player,
-    get_player,
-    get_top_balance,
-    get_top_earners,
-    get_top_lifts,
-)
+from bot.keyboards import CMD_TOP, TOP_KEYBOARD
+from bot.storage import create_player, get_player
+from bot.services.leaderboards import get_clan_top, get_top
+from bot.services.profiles import get_display_name
 
 top_labeler = BotLabeler()
 top_labeler.vbml_ignore_case = True
@@ -21,7 +18,7 @@ async def get_top_list_handler(message: Message):
     player = await get_player(user_id)
 
     if not player:
-        player = await create_player(user_id, str(message.from_id))
+        player = await create_player(user_id, await get_display_name(user_id))
 
     top_text = (
         "🏆 Система ТОПа Gym Legend\n\n"
@@ -37,13 +34,13 @@ async def get_top_list_handler(message: Message):
         "Выберите нужный топ из списка выше!"
     )
 
-    return top_text
+    await message.answer(top_text, keyboard=TOP_KEYBOARD)
 
 
 @top_labeler.message(text=["топ монет", "/топ монет"])
 async def get_top_balance_handler(message: Message):
     """Топ по монетам"""
-    top_players = await get_top_balance(10)
+    top_players = await get_top("balance", 10)
 
     if not top_players:
         return "🏆 Топ пока пуст. Будьте первым!"
@@ -61,7 +58,7 @@ async def get_top_balance_handler(message: Message):
 @top_labeler.message(text=["топ поднятий", "/топ поднятий"])
 async def get_top_lifts_handler(message: Message):
     """Топ по поднятиям"""
-    top_players = await get_top_lifts(10)
+    top_players = await get_top("lifts", 10)
 
     if not top_players:
         return "🏆 Топ пока пуст. Будьте первым!"
@@ -81,7 +78,7 @@ async def get_top_lifts_handler(message: Message):
 @top_labeler.message(text=["топ заработка", "/топ заработка"])
 async def get_top_earners_handler(message: Message):
     """Топ по заработку"""
-    top_players = await get_top_earners(10)
+    top_players = await get_top("earners", 10)
 
     if not top_players:
         return "🏆 Топ пока пуст. Будьте первым!"
@@ -102,3 +99,42 @@ async def get_top_earners_handler(message: Message):
         top_text += f"   📈 {income_per_lift} монет/подход\n\n"
 
     await message.answer(top_text, disable_mentions=True)
+
+
+@top_labeler.message(text=["к топ", "/к топ"])
+async def get_top_clans_handler(message: Message):
+    """Топ кланов"""
+    top_clans = await get_clan_top(10)
+
+    if not top_clans:
+        return "🏰 Кланов пока нет. Создайте первый!"
+
+    top_text = "🏰 ТОП кланов:\n\n"
+
+    for i, clan in enumerate(top_clans, 1):
+        medal = "🥇" if i == 1 else ("🥈" if i == 2 else ("🥉" if i == 3 else "🔸"))
+        top_text += f"{medal} {i}. [{clan['tag']}] {clan['name']} | уровень {clan['level']}\n"
+        top_text += (
+            f"   📈 {format_number(clan['total_income_per_hour'])}/час"
+            f" | 💰 {format_number(clan['treasury'])} в казне"
+            f" | 👥 {clan['member_count']}\n\n"
+        )
+
+    await message.answer(top_text)
+
+
+# Кнопки TOP_KEYBOARD: {"cmd": "top", "kind": ...}, без kind — список топов
+_TOP_HANDLERS = {
+    "balance": get_top_balance_handler,
+    "lifts": get_top_lifts_handler,
+    "earners": get_top_earners_handler,
+    "clans": get_top_clans_handler,
+}
+
+
+@top_labeler.message(payload_contains={"cmd": CMD_TOP})
+async def top_button_handler(message: Message):
+    """Топ с кнопки"""
+    payload = message.get_payload_json() or {}
+    handler = _TOP_HANDLERS.get(payload.get("kind"), get_top_list_handler)
+    return await handler(message)
@@ -1,10 +1,10 @@
 import re
-from datetime import datetime
 
 from vkbottle.bot import BotLabeler, Message
 
 from bot.core.config import settings
-from bot.db import (
+from bot.keyboards import CMD_PROFILE, CMD_SHOP, MAIN_KEYBOARD, shop_keyboard
+from bot.storage import (
     create_player,
     get_player,
     get_player_clan,
@@ -14,7 +14,8 @@ from bot.db import (
 from bot.services.clans import (
     get_clan_bonuses,
 )
-from bot.utils import format_number, pointer_to_screen_name
+from bot.services.profiles import get_display_name, resolve_user_id
+from bot.utils import format_number, format_ts
 
 user_labeler = BotLabeler()
 user_labeler.vbml_ignore_case = True
@@ -40,10 +41,9 @@ async def transfer_money_handler(message: Message, cmd_args: str):
     if len(parts) < 2:
         return "❌ Укажите айди игрока и сумму перевода!\n📝 Использование: /перевод [айди] [сумма]"
 
-    try:
-        target_id = int(pointer_to_screen_name(parts[0]))
-    except ValueError:
-        return "❌ Айди игрока должно быть числом!"
+    target_id = await resolve_user_id(parts[0])
+    if target_id is None:
+        return "❌ Игрок не найден! Укажите айди, упоминание или ссылку на страницу"
 
     amount_str = parts[1]
     user_id = message.from_id
@@ -128,7 +128,7 @@ async def welcome_handler(message: Message):
 
     player = await get_player(user_id)
     if not player:
-        player = await create_player(user_id, str(user_id))
+        player = await create_player(user_id, await get_display_name(user_id))
 
     welcome_text = (
         "🔥 Привет! Ты попал в Gym Legend 😩🤟"
@@ -145,9 +145,10 @@ async def welcome_handler(message: Message):
         + "\n\n📝 Напиши команду /помощь, чтобы узнать все команды"
     )
 
-    await message.answer(welcome_text, disable_mentions=True)
+    await message.answer(welcome_text, disable_mentions=True, keyboard=MAIN_KEYBOARD)
 
 
+@user_labeler.message(payload_contains={"cmd": CMD_PROFILE})
 @user_labeler.message(text=["профиль", "/профиль"])
 async def get_profile_handler(message: Message):
     """Профиль игрока"""
@@ -176,7 +177,7 @@ async def get_profile_handler(message: Message):
             f"🏰 Бонус клана: +{clan_bonuses['lift_bonus_coins']} монет за поднятие\n"
         )
 
-    created_date = datetime.fromisoformat(player["created_at"]).strftime("%d.%m.%Y")
+    created_date = format_ts(player["created_at"])
 
     admin_level = player.get("admin_level", 0)
     if admin_level > 0:
@@ -259,6 +260,11 @@ async def get_help_handler(message: Message):
     return "\n".join(commands)
 
 
+# Гантелей на одной странице магазина
+SHOP_PAGE_SIZE = 5
+
+
+@user_labeler.message(payload_contains={"cmd": CMD_SHOP})
 @user_labeler.message(text=["магазин", "/магазин"])
 async def get_dumbbell_shop_handler(message: Message):
     """Магазин гантелей"""
@@ -266,12 +272,22 @@ async def get_dumbbell_shop_handler(message: Message):
     player = await get_player(user_id)
 
     if not player:
-        player = await create_player(user_id, str(message.from_id))
+        player = await create_player(user_id, await get_display_name(user_id))
 
     current_level = player["dumbbell_level"]
+    levels = sorted(settings.DUMBBELL_LEVELS)
+    pages = (len(levels) + SHOP_PAGE_SIZE - 1) // SHOP_PAGE_SIZE
+
+    # Без номера страницы открываем ту, где следующая гантеля
+    payload = message.get_payload_json()
+    page = payload.get("p") if isinstance(payload, dict) else None
+    if not isinstance(page, int):
+        next_level = min(current_level + 1, levels[-1])
+        page = levels.index(next_level) // SHOP_PAGE_SIZE + 1 if next_level in levels else 1
+    page = max(1, min(page, pages))
 
     shop_items = []
-    for level in range(1, 21):
+    for level in levels[(page - 1) * SHOP_PAGE_SIZE : page * SHOP_PAGE_SIZE]:
         dumbbell = settings.DUMBBELL_LEVELS[level]
 
         if level == current_level:
@@ -302,13 +318,13 @@ async def get_dumbbell_shop_handler(message: Message):
         "1. Накапливайте монеты (/поднять)\n"
         "2. Купите улучшение (/прокачаться)\n"
         "3. Получайте больше дохода!\n\n"
-        "📊 Доступные гантели:\n"
+        f"📊 Доступные гантели (стр. {page}/{pages}):\n"
         + "\n".join(shop_items)
         + f"\n\n💰 Ваш баланс: {format_number(player['balance'])} монет\n"
         f"🏋️‍♂️ Текущая гантеля: {player['dumbbell_name']}"
     )
 
-    return shop_text
+    await message.answer(shop_text, keyboard=shop_keyboard(page, pages))
 
 
 @user_labeler.message(text=["гник <cmd_args>", "/гник <cmd_args>"])
@@ -1,12 +1,57 @@
+import asyncio
+
+from loguru import logger
+
 from bot.core.config import settings
-from bot.db import get_player
+from bot.storage import (
+    get_admin_levels,
+    forget_player_ids,
+    load_admin_levels,
+    load_bans,
+    pop_expired_bans,
+    unban_expired_players,
+)
 
 
-async def is_admin(user_id: int) -> bool:
+async def get_admin_level(user_id: int) -> int:
     if user_id in settings.ADMIN_USERS:
-        return True
+        # ? We're lying for now, so maybe there's a better approach...?
+        return 2
+    return (await get_admin_levels()).get(user_id, 0)
+
+
+async def is_admin(user_id: int) -> bool:
+    return await get_admin_level(user_id) > 0
+
+
+async def expire_bans_periodically(interval: float = 60) -> None:
+    """Снимает истёкшие временные баны пачкой раз в interval секунд"""
+    while True:
+        await asyncio.sleep(interval)
+        expired = pop_expired_bans()
+        if not expired:
+            continue
+        try:
+            await unban_expired_players(expired)
+        except Exception as e:
+            logger.exception(f"Failed to lift expired bans: {e}")
+        else:
+            logger.info(f"Lifted {len(expired)} expired bans")
+
+
+async def refresh_registries_periodically(interval: float) -> None:
+    """Перечитывает реестры админов и банов из базы и забывает известных игроков.
 
-    player = await get_player(user_id)
-    if player and player.get("admin_level", 0) > 0:
-        return True
-    return False
\ No newline at end of file
+    Нужно, когда бот работает в нескольких процессах: бан, назначение или
+    удаление игрока, сделанные в одном процессе, другие увидят не позже чем
+    через interval. Айди игроков не перечитываются целиком: после очистки
+    каждый активный игрок один раз проверяется запросом по ключу.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await load_admin_levels()
+            await load_bans()
+            forget_player_ids()
+        except Exception as e:
+            logger.exception(f"Failed to refresh admin/ban/player registries: {e}")
@@ -1,4 +1,35 @@
 import re
+import time
+from datetime import datetime
+
+# Даты в базе — целые секунды Unix epoch (UTC)
+DAY_SECONDS = 24 * 60 * 60
+
+
+def now_ts() -> int:
+    """Текущее время в формате базы"""
+    return int(time.time())
+
+
+def days_from_now(days: float) -> int:
+    """Момент через days дней, например срок бана или промокода"""
+    return now_ts() + int(days * DAY_SECONDS)
+
+
+def days_since(ts: int) -> int:
+    """Полных дней с момента ts"""
+    return (now_ts() - ts) // DAY_SECONDS
+
+
+def days_until(ts: int) -> int:
+    """Полных дней до момента ts"""
+    return (ts - now_ts()) // DAY_SECONDS
+
+
+def format_ts(ts: int, fmt: str = "%d.%m.%Y") -> str:
+    """Дата для сообщений, по местному времени сервера"""
+    return datetime.fromtimestamp(ts).strftime(fmt)
+
 
 def format_number(number):
     """Форматирует число с разделителями тысяч"""
@@ -6,20 +37,28 @@ def format_number(number):
 
 
 def pointer_to_screen_name(user_pointer: str) -> str | None:
-    # Remove leading 'vk.com/' from the URL
-    if user_pointer.startswith('vk.com/'):
-        user_pointer = user_pointer[6:]
+    """Айди или короткий адрес из ссылки, упоминания или самого адреса.
+
+    "123", "id123", "[id123|@durov]" и "https://vk.com/id123" дают "123";
+    "@durov", "vk.com/durov" и "durov" дают "durov". Превратить адрес в айди
+    можно через bot.services.profiles.resolve_user_id.
+    """
+    user_pointer = user_pointer.strip()
 
-    # Match VK links in the format https://vk.com/idXXX or vk.com/idXXX
-    vk_link_match = re.match(r'https?:\/\/(?:www\.)?vk\.com\/(.*?)(?:\/|$)', user_pointer)
+    # Упоминание в формате [idXXX|@mention]
+    mention_match = re.fullmatch(r'\[(?:id)?(\d+)\|[^\]]*\]', user_pointer)
+    if mention_match:
+        return mention_match.group(1)
 
-    # If it's a VK link, extract the ID
+    # Ссылка в формате https://vk.com/XXX или vk.com/XXX
+    vk_link_match = re.fullmatch(r'(?:https?://)?(?:www\.|m\.)?vk\.com/([^/?#]+)/?(?:[?#].*)?', user_pointer)
     if vk_link_match:
-        return vk_link_match.group(1)
-
-    try:
-        # Match mentions in the format [idXXX|@mention]
-        mention_match = user_pointer.split("|")[0][1:].replace("id", "")
-        return mention_match
-    except Exception:
-        return
+        user_pointer = vk_link_match.group(1)
+
+    user_pointer = user_pointer.lstrip('@')
+    id_match = re.fullmatch(r'(?:id)?(\d+)', user_pointer)
+    if id_match:
+        return id_match.group(1)
+    if re.fullmatch(r'[A-Za-z0-9_.]+', user_pointer):
+        return user_pointer
+    return None
@@ -0,0 +1,88 @@
+"""
+Прогрев при запуске.
+
+До начала polling параллельно заполняет то, что иначе собиралось бы на первых
+сообщениях: реестр администраторов, реестр банов, реестр игроков (недавно
+активные игроки), кеш рейтингов игроков и топ кланов. Промокоды просто
+читаются из базы, чтобы первые запросы к ним шли по уже прогретым страницам
+файла базы.
+
+Время каждого шага пишется в лог. Шаги, не успевшие за
+WARMUP_BUDGET_SECONDS, отменяются — бот запускается без них, а реестры
+дозагрузятся сами при первом обращении.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional
+
+from loguru import logger
+
+from bot.storage import get_all_promo_codes, get_recently_active_player_ids, load_admin_levels, load_bans
+from bot.services.leaderboards import TOP_QUERIES, refresh_clan_top, refresh_top
+
+
+@dataclass
+class WarmupStep:
+    name: str
+    run: Callable[[], Awaitable[Any]]
+
+
+def default_steps(recent_players: int) -> list[WarmupStep]:
+    steps = [
+        WarmupStep("admins", load_admin_levels),
+        WarmupStep("bans", load_bans),
+        WarmupStep("promo_codes", get_all_promo_codes),
+        WarmupStep("recent_players", lambda: get_recently_active_player_ids(recent_players)),
+    ]
+    for kind in TOP_QUERIES:
+        steps.append(WarmupStep(f"top_{kind}", lambda kind=kind: refresh_top(kind)))
+    steps.append(WarmupStep("top_clans", refresh_clan_top))
+    return steps
+
+
+def _describe(result: Any) -> str:
+    if isinstance(result, (list, dict, set, tuple)):
+        return f"{len(result)} items"
+    return "done"
+
+
+async def _run_step(step: WarmupStep) -> float:
+    started = time.perf_counter()
+    result = await step.run()
+    elapsed = time.perf_counter() - started
+    logger.info(f"Warm-up {step.name}: {elapsed * 1000:.1f} ms ({_describe(result)})")
+    return elapsed
+
+
+async def run_warmup(steps: list[WarmupStep], budget: float) -> dict[str, Optional[float]]:
+    """Выполняет шаги параллельно; возвращает время каждого (None — не выполнен)"""
+    started = time.perf_counter()
+    tasks = {asyncio.create_task(_run_step(step)): step for step in steps}
+    done, pending = await asyncio.wait(tasks, timeout=budget if budget > 0 else None)
+
+    timings: dict[str, Optional[float]] = {}
+    for task in pending:
+        task.cancel()
+        timings[tasks[task].name] = None
+        logger.warning(f"Warm-up {tasks[task].name} did not finish in {budget:.1f} s, skipped")
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    for task in done:
+        name = tasks[task].name
+        if task.exception() is not None:
+            timings[name] = None
+            logger.opt(exception=task.exception()).error(f"Warm-up {name} failed")
+        else:
+            timings[name] = task.result()
+
+    finished = sum(1 for elapsed in timings.values() if elapsed is not None)
+    logger.info(
+        f"Warm-up finished in {(time.perf_counter() - started) * 1000:.1f} ms: "
+        f"{finished}/{len(steps)} steps"
+    )
+    return timings